@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from asgiref.sync import sync_to_async
 from bkapi_client_core.base import Operation, OperationGroup
 from bkapi_client_core.client import BaseClient
 from bkapi_client_core.property import bind_property
@@ -119,3 +120,7 @@ class Client(BaseClient):
     def knowledge_query(self, data: dict):
         result = self.api.create_knowledgebase_query(data=data)
         return result.get("data", {})
+
+    async def aknowledge_query(self, data: dict):
+        """knowledge_query 的异步版本：沿用 bkapi 客户端的请求（地址、鉴权、超时），在线程中执行，不阻塞事件循环"""
+        return await sync_to_async(self.knowledge_query, thread_sensitive=False)(data)
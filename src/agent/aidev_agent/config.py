@@ -122,6 +122,83 @@ APP_CODE = env.str("BKPAAS_APP_ID", "") or env.str("APP_ID", "")
 SECRET_KEY = env.str("BKPAAS_APP_SECRET", "") or env.str("APP_TOKEN", "")
 BK_AIDEV_GATEWAY_NAME = env.str("AIDEV_GATEWAY_NAME", "bkaidev")
 BK_APIGW_STAGE = env.str("BK_APIGW_STAGE", "") or env.str("BKAIDEV_RESOURCE_STAGE", "prod")
+# SSE 帧编码使用的 json 库：orjson（未安装时自动退回）或 json
+SSE_JSON_BACKEND = env.str("SSE_JSON_BACKEND", "orjson")
+# 将多个 SSE 帧合并后再发送：累计超过 SSE_BATCH_MAX_BYTES（UTF-8 字节数）或等待超过 SSE_BATCH_MAX_DELAY_MS 时发送，为 0 时不合并
+SSE_BATCH_MAX_BYTES = env.int("SSE_BATCH_MAX_BYTES", 0)
+SSE_BATCH_MAX_DELAY_MS = env.int("SSE_BATCH_MAX_DELAY_MS", 50)
+# 远程分词（ChatModel.remote_tokenizer）：请求超时（秒）和单次请求最多包含的文本数；
+# 请求失败或超时后改用本地估算，并在 REMOTE_TOKENIZER_COOLDOWN 秒内不再请求
+REMOTE_TOKENIZER_TIMEOUT = env.float("REMOTE_TOKENIZER_TIMEOUT", 3.0)
+REMOTE_TOKENIZER_BATCH_SIZE = env.int("REMOTE_TOKENIZER_BATCH_SIZE", 64)
+REMOTE_TOKENIZER_COOLDOWN = env.float("REMOTE_TOKENIZER_COOLDOWN", 30.0)
+# 本地分词器：LOCAL_TOKENIZER_DIR 下按模型系列存放 <系列>/tokenizer.json、<系列>.json 或 <系列>.tiktoken；
+# 也可以通过 LOCAL_TOKENIZERS 直接指定模型名称前缀与文件的对应关系，如 "hunyuan=/path/tokenizer.json,qwen=/path/qwen.json"
+LOCAL_TOKENIZER_DIR = env.str("LOCAL_TOKENIZER_DIR", "")
+LOCAL_TOKENIZERS = env.dict("LOCAL_TOKENIZERS", {})
+# LLM 网关客户端连接池：按 base_url 在进程内共享 httpx 客户端，复用 keep-alive 连接
+# LLM_HTTP2 需要安装 h2，未安装时使用 HTTP/1.1
+LLM_HTTP_POOL_ENABLED = env.bool("LLM_HTTP_POOL_ENABLED", True)
+LLM_HTTP2 = env.bool("LLM_HTTP2", True)
+LLM_HTTP_MAX_CONNECTIONS = env.int("LLM_HTTP_MAX_CONNECTIONS", 100)
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = env.int("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+LLM_HTTP_KEEPALIVE_EXPIRY = env.float("LLM_HTTP_KEEPALIVE_EXPIRY", 30.0)
+# 意图识别辅助 LLM 调用的响应缓存，默认关闭
+# 后端：memory://（进程内 LRU）、sqlite:///path/to/cache.db（磁盘）、redis://host:port/db（需要安装 redis）
+LLM_RESPONSE_CACHE_ENABLED = env.bool("LLM_RESPONSE_CACHE_ENABLED", False)
+LLM_RESPONSE_CACHE_BACKEND = env.str("LLM_RESPONSE_CACHE_BACKEND", "memory://")
+LLM_RESPONSE_CACHE_TTL = env.int("LLM_RESPONSE_CACHE_TTL", 3600)
+LLM_RESPONSE_CACHE_MAXSIZE = env.int("LLM_RESPONSE_CACHE_MAXSIZE", 1024)
+# 语义答案缓存，默认关闭；开启时需要指定 embedding 模型
+# 无对话历史的知识库问答，与已回答问题的相似度不低于阈值时直接返回之前的答案
+SEMANTIC_CACHE_ENABLED = env.bool("SEMANTIC_CACHE_ENABLED", False)
+SEMANTIC_CACHE_EMBEDDING_MODEL = env.str("SEMANTIC_CACHE_EMBEDDING_MODEL", "")
+SEMANTIC_CACHE_THRESHOLD = env.float("SEMANTIC_CACHE_THRESHOLD", 0.95)
+# 每个作用域（agent 配置 + 知识库集合）最多缓存的问题数，以及最多保留的作用域数
+SEMANTIC_CACHE_CAPACITY = env.int("SEMANTIC_CACHE_CAPACITY", 1024)
+SEMANTIC_CACHE_MAX_SCOPES = env.int("SEMANTIC_CACHE_MAX_SCOPES", 128)
+# 知识库多路召回（含翻译、关键词提取）的整体耗时预算（秒），超时后只融合已完成的召回支路，为 0 时不限制
+BKAIDEV_KNOWLEDGE_RECALL_TIMEOUT = env.float("BKAIDEV_KNOWLEDGE_RECALL_TIMEOUT", 0)
+# LLM 判断知识相关性的耗时预算（秒），超时未完成判断的知识使用召回分数，为 0 时不限制
+BKAIDEV_RELEVANCE_DEADLINE = env.float("BKAIDEV_RELEVANCE_DEADLINE", 0)
+# 确认相关的知识数达到该值时提前结束相关性判断，其余未完成判断的知识视为不相关，为 0 时不提前结束
+BKAIDEV_RELEVANCE_EARLY_STOP_COUNT = env.int("BKAIDEV_RELEVANCE_EARLY_STOP_COUNT", 0)
+# 细粒度分数类型为 LLM_BATCH 时，每次 LLM 调用最多判断的知识数，以及知识内容的 token 预算（本地估算）
+BKAIDEV_LLM_BATCH_RELEVANCE_MAX_DOCS = env.int("BKAIDEV_LLM_BATCH_RELEVANCE_MAX_DOCS", 20)
+BKAIDEV_LLM_BATCH_RELEVANCE_MAX_TOKENS = env.int("BKAIDEV_LLM_BATCH_RELEVANCE_MAX_TOKENS", 12000)
+# 细粒度分数类型为 EXCLUSIVE_SIMILARITY_MODEL 时使用的相关性模型：remote（远程 GPU 模型服务）或 local（进程内 CPU 推理）
+SIMILARITY_MODEL_BACKEND = env.str("SIMILARITY_MODEL_BACKEND", "remote")
+# 本地 cross-encoder 的 ONNX 模型文件和 tokenizer.json（为空时使用模型同目录下的 tokenizer.json），需要安装 onnxruntime 和 tokenizers
+CROSS_ENCODER_MODEL_PATH = env.str("CROSS_ENCODER_MODEL_PATH", "")
+CROSS_ENCODER_TOKENIZER_PATH = env.str("CROSS_ENCODER_TOKENIZER_PATH", "")
+CROSS_ENCODER_MAX_SEQ_LENGTH = env.int("CROSS_ENCODER_MAX_SEQ_LENGTH", 512)
+CROSS_ENCODER_BATCH_SIZE = env.int("CROSS_ENCODER_BATCH_SIZE", 16)
+# onnxruntime 的推理线程数，为 0 时使用默认值
+CROSS_ENCODER_NUM_THREADS = env.int("CROSS_ENCODER_NUM_THREADS", 0)
+# 知识库召回结果缓存，默认关闭；相同的查询并发进行时只请求一次知识库
+# 后端与 LLM_RESPONSE_CACHE_BACKEND 相同；知识（库）更新后可调用 recall_cache.invalidate 使其缓存失效
+RECALL_CACHE_ENABLED = env.bool("RECALL_CACHE_ENABLED", False)
+RECALL_CACHE_BACKEND = env.str("RECALL_CACHE_BACKEND", "memory://")
+RECALL_CACHE_TTL = env.int("RECALL_CACHE_TTL", 300)
+RECALL_CACHE_MAXSIZE = env.int("RECALL_CACHE_MAXSIZE", 1024)
+# 进程内混合检索（LocalIntentRecognition）：索引目录（为空时只保存在内存中）和向量检索使用的 embedding 模型（为空时只使用 BM25）
+# 中文分词在安装了 jieba 时使用 jieba，否则按相邻两个汉字切分
+LOCAL_RETRIEVAL_DIR = env.str("LOCAL_RETRIEVAL_DIR", "")
+LOCAL_RETRIEVAL_EMBEDDING_MODEL = env.str("LOCAL_RETRIEVAL_EMBEDDING_MODEL", "")
+# 内存映射的向量存储（VectorStoreIntentRecognition）：存储目录、写入和检索使用的 embedding 模型、向量存储类型（float16/int8），
+# 检索方式（BRUTE_FORCE/IVF，IVF 需要先调用 MmapVectorStore.train_ivf）和 IVF 检索的聚类数量
+VECTOR_STORE_DIR = env.str("VECTOR_STORE_DIR", "")
+VECTOR_STORE_EMBEDDING_MODEL = env.str("VECTOR_STORE_EMBEDDING_MODEL", "")
+VECTOR_STORE_DTYPE = env.str("VECTOR_STORE_DTYPE", "float16")
+VECTOR_STORE_SEARCH_MODE = env.str("VECTOR_STORE_SEARCH_MODE", "BRUTE_FORCE")
+VECTOR_STORE_IVF_NPROBE = env.int("VECTOR_STORE_IVF_NPROBE", 8)
+# 异步转同步（async_to_sync_generator）共享的后台事件循环数，以及异步生成器最多可以领先同步消费方的条目数
+ASYNC_TO_SYNC_EVENT_LOOP_POOL_SIZE = env.int("ASYNC_TO_SYNC_EVENT_LOOP_POOL_SIZE", 4)
+ASYNC_TO_SYNC_MAX_QUEUE_SIZE = env.int("ASYNC_TO_SYNC_MAX_QUEUE_SIZE", 64)
+# 进程内缓存的 agent 不可变组件（prompt 模板、绑定了工具的 runnable 等）的最大条目数
+AGENT_COMPONENT_CACHE_SIZE = env.int("AGENT_COMPONENT_CACHE_SIZE", 256)
+# 按消息缓存 token 数的最大条目数，为 0 时不缓存
+TOKEN_COUNT_CACHE_SIZE = env.int("TOKEN_COUNT_CACHE_SIZE", 4096)
 # end: 配置
 
 
@@ -212,8 +212,9 @@ def create_enhanced_structured_chat_agent(
 
     if "beijing_now" in prompt.input_variables:
         main_vars.add("beijing_now")
+        # 传入函数而不是当前时间，每次格式化 prompt 时再取值，使得构建好的 agent 可以被缓存复用
         prompt = prompt.partial(
-            beijing_now=get_beijing_now(),
+            beijing_now=get_beijing_now,
         )
 
     if stop_sequence:
@@ -258,8 +259,9 @@ def create_enhanced_tool_calling_agent(
 
     if "beijing_now" in prompt.input_variables:
         main_vars.add("beijing_now")
+        # 传入函数而不是当前时间，每次格式化 prompt 时再取值，使得构建好的 agent 可以被缓存复用
         prompt = prompt.partial(
-            beijing_now=get_beijing_now(),
+            beijing_now=get_beijing_now,
         )
 
     if tools:
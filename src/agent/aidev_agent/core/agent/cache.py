@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import hashlib
+import json
+from threading import RLock
+from typing import Any, Callable, Hashable, Optional, Sequence, Tuple, TypeVar
+from weakref import WeakKeyDictionary
+
+from cachetools import LRUCache
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.tools import BaseTool
+from pydantic import SecretStr
+
+from aidev_agent.config import settings
+
+T = TypeVar("T")
+
+# 不参与模型指纹计算的字段：客户端实例与运行时回调，不影响请求内容
+LLM_FINGERPRINT_EXCLUDE = {
+    "client",
+    "async_client",
+    "root_client",
+    "root_async_client",
+    "http_client",
+    "http_async_client",
+    "callbacks",
+    "callback_manager",
+    "cache",
+    "metadata",
+    "tags",
+}
+
+
+def _fingerprint_default(obj: Any) -> Any:
+    if isinstance(obj, SecretStr):
+        return obj.get_secret_value()
+    return repr(obj)
+
+
+def _digest(data: Any) -> str:
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False, default=_fingerprint_default)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def llm_fingerprint(llm: BaseLanguageModel) -> str:
+    """
+    模型指纹：模型类型以及所有会影响请求内容的配置（包括地址、请求头和密钥）
+    配置完全相同的模型实例可以共享绑定了该模型的 runnable
+    """
+    data = llm.model_dump(exclude=LLM_FINGERPRINT_EXCLUDE)
+    # 模型上直接设置的回调无法在不同实例间共享，使用其标识区分
+    callbacks = [id(callback) for callback in llm.callbacks] if isinstance(llm.callbacks, list) else None
+    # tags 和 metadata（如每个会话的 tracing 信息）会随绑定的 runnable 一起被缓存，需要区分
+    return _digest([f"{type(llm).__module__}.{type(llm).__qualname__}", data, callbacks, llm.tags, llm.metadata])
+
+
+# 参数定义生成 json schema 的开销较大，按参数定义的类缓存其指纹
+_args_schema_fingerprints: "WeakKeyDictionary[type, str]" = WeakKeyDictionary()
+
+
+def _tool_args_fingerprint(tool: BaseTool) -> str:
+    args_schema = tool.args_schema
+    if not isinstance(args_schema, type):
+        return _digest(tool.args)
+    fingerprint = _args_schema_fingerprints.get(args_schema)
+    if fingerprint is None:
+        fingerprint = _args_schema_fingerprints[args_schema] = _digest(tool.args)
+    return fingerprint
+
+
+def tools_fingerprint(tools: Sequence[BaseTool]) -> str:
+    """工具集指纹：只与提供给模型的名称、描述和参数定义有关，与工具的具体实现无关"""
+    return _digest([[tool.name, tool.description, _tool_args_fingerprint(tool)] for tool in tools])
+
+
+class AgentComponentCache:
+    """
+    agent 中不可变组件（prompt 模板、绑定了工具的 runnable 等）的缓存
+
+    这些组件只依赖 agent 类、模型配置、工具集和提示词，不包含任何请求相关的状态，可以在请求之间安全地共享；
+    请求相关的状态（memory、request_local 等）仍然每次重新创建。
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache: LRUCache = LRUCache(maxsize=maxsize)
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache.maxsize > 0
+
+    def get_or_create(self, key: Optional[Hashable], factory: Callable[[], T]) -> T:
+        if key is None or not self.enabled:
+            return factory()
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        # 创建过程可能比较耗时，不在锁内执行；并发时最多重复创建一次，结果等价
+        value = factory()
+        with self._lock:
+            return self._cache.setdefault(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+def make_agent_cache_key(
+    agent_cls: type, llm: BaseLanguageModel, tools: Sequence[BaseTool], *parts: Hashable
+) -> Optional[Tuple]:
+    """生成缓存 key，无法计算指纹时返回 None 表示不缓存"""
+    try:
+        return (agent_cls, llm_fingerprint(llm), tools_fingerprint(tools), *parts)
+    except Exception:  # noqa
+        return None
+
+
+agent_component_cache = AgentComponentCache(maxsize=settings.AGENT_COMPONENT_CACHE_SIZE)
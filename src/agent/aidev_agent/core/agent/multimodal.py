@@ -18,7 +18,7 @@ to the current version of the project delivered to anyone in the future.
 
 import os
 from abc import ABC, abstractmethod
-from copy import deepcopy
+from functools import lru_cache
 from typing import (
     Any,
     AsyncGenerator,
@@ -42,7 +42,6 @@ from langchain.agents.agent import RunnableAgent, RunnableMultiActionAgent
 from langchain.agents.structured_chat.base import StructuredChatAgent
 from langchain.agents.structured_chat.prompt import FORMAT_INSTRUCTIONS
 from langchain.memory.chat_memory import BaseChatMemory
-from langchain.memory.token_buffer import ConversationTokenBufferMemory
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.agents import AgentAction, AgentFinish
 from langchain_core.callbacks import BaseCallbackHandler, Callbacks
@@ -64,12 +63,21 @@ from pydantic import BaseModel, Field
 from typing_extensions import Literal, Self
 
 from aidev_agent.core.extend.intent.prompts import general_qa_prompt_structured_chat
-from aidev_agent.core.utils.async_utils import async_generator_with_timeout, async_to_sync_generator
+from aidev_agent.core.utils.async_utils import (
+    CancellationToken,
+    async_generator_with_timeout,
+    async_to_sync_generator,
+    reset_cancellation_token,
+    set_cancellation_token,
+)
 from aidev_agent.core.utils.local import request_local
+from aidev_agent.core.utils.token_counter import CachedTokenBufferMemory
 from aidev_agent.packages.langchain.tools.builtin import add_image_to_chat_context
 from aidev_agent.services.pydantic_models import AgentOptions
 
 from .agents import create_enhanced_structured_chat_agent, create_enhanced_tool_calling_agent
+from .cache import agent_component_cache, make_agent_cache_key
+from .overlay import with_prompt_messages, with_tool_flags
 from .patches import apply_patches
 from .prompts import (
     MULTI_MODAL_PREFIX,
@@ -81,10 +89,15 @@ from .prompts import (
 apply_patches()
 
 
+@lru_cache(maxsize=128)
+def compile_j2_template(source: str) -> Template:
+    return Template(source)
+
+
 class J2PromptMixin:
     @classmethod
     def get_prefix(cls, prefix: str, **kwargs) -> str:
-        return Template(prefix).render(**kwargs)
+        return compile_j2_template(prefix).render(**kwargs)
 
 
 class LiteEnhancedAgentExecutor(AgentExecutor):
@@ -132,6 +145,15 @@ class EnhancedAgentExecutor(LiteEnhancedAgentExecutor):
             ret["reference_doc"] = reference_doc
         return ret
 
+    async def ainvoke(self, input: Dict[str, str], *args, **kwargs) -> Dict[str, Any]:
+        """异步执行"""
+        self._setup_execute_context(input)
+        ret = await super().ainvoke(input, *args, **kwargs)
+        reference_doc = request_local.current_user_store["reference_doc"]
+        if reference_doc:
+            ret["reference_doc"] = reference_doc
+        return ret
+
     def stream(
         self,
         input: Union[Dict[str, Any], Any],
@@ -155,20 +177,30 @@ class EnhancedAgentExecutor(LiteEnhancedAgentExecutor):
         exclude_tags: Optional[Sequence[str]] = None,
         **kwargs: Any,
     ) -> AsyncGenerator[Any, Any]:
+        # 未正常结束（调用方断开、被取消或出错）时取消令牌，让线程池中的意图识别等任务尽快停止
+        cancellation_token = CancellationToken()
+        reset_token = set_cancellation_token(cancellation_token)
         self._setup_execute_context(input)
-        async for each in super().astream_events(
-            input,
-            config,
-            version=version,
-            include_names=include_names,
-            include_types=include_types,
-            include_tags=include_tags,
-            exclude_names=exclude_names,
-            exclude_types=exclude_types,
-            exclude_tags=exclude_tags,
-            **kwargs,
-        ):
-            yield each
+        completed = False
+        try:
+            async for each in super().astream_events(
+                input,
+                config,
+                version=version,
+                include_names=include_names,
+                include_types=include_types,
+                include_tags=include_tags,
+                exclude_names=exclude_names,
+                exclude_types=exclude_types,
+                exclude_tags=exclude_tags,
+                **kwargs,
+            ):
+                yield each
+            completed = True
+        finally:
+            if not completed:
+                cancellation_token.cancel()
+            reset_cancellation_token(reset_token)
 
     def _setup_execute_context(self, input: Dict[str, Any]) -> None:
         """设置执行上下文"""
@@ -230,7 +262,8 @@ class CommonAgentMixIn(BaseModel, ABC):
     ) -> Tuple[AgentExecutor, RunnableConfig]:
         """获得multimodal agent执行实例"""
         callbacks = callbacks or []
-        tools: List[BaseTool] = deepcopy(cls.builtin_tools)
+        # NOTE: 内置工具不会被原地修改（见 overlay.py），只需复制列表
+        tools: List[BaseTool] = list(cls.builtin_tools)
         query_knowledgebase = False
         if any((knowledge_items, knowledge_bases)):
             query_knowledgebase = True
@@ -258,7 +291,7 @@ class CommonAgentMixIn(BaseModel, ABC):
         history = ChatMessageHistory()
         if chat_history:
             history.add_messages(chat_history)
-        memory = memory or ConversationTokenBufferMemory(
+        memory = memory or CachedTokenBufferMemory(
             memory_key="chat_history",
             return_messages=True,
             input_key="input",
@@ -314,10 +347,17 @@ class CommonAgentMixIn(BaseModel, ABC):
             )
             messages.insert(-1, image_template)
 
+    def copy_prompt_with_images(self, prompt: ChatPromptTemplate) -> ChatPromptTemplate:
+        """在 prompt 的浅拷贝上添加图片，原 prompt 保持不变"""
+        messages = list(prompt.messages)
+        self.add_image_to_messages(messages)
+        return with_prompt_messages(prompt, messages)
+
     def _setup_runnable(self, **kwargs):
         if request_local.current_user_store["image"] and self.chat_prompt_template:
-            self.add_image_to_messages(self.chat_prompt_template.messages)
-            agent_runnable = self.create_agent_func(self.llm, self.tools, self.chat_prompt_template)
+            # NOTE: chat_prompt_template 可能在多个请求之间共享，不能原地修改，需要在副本上添加图片
+            chat_prompt_template = self.copy_prompt_with_images(self.chat_prompt_template)
+            agent_runnable = self.create_agent_func(self.llm, self.tools, chat_prompt_template)
             self.runnable = agent_runnable
         else:
             if not kwargs.get("runnable_has_been_modified"):
@@ -344,11 +384,10 @@ class StructuredCommonAgent(CommonAgentMixIn, StructuredChatAgent):
         """添加多模态支持"""
         full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
         if not getattr(self, "raw_prompt", None):
-            self.raw_prompt = deepcopy(self.llm_chain.prompt)  # type: ignore
+            self.raw_prompt = self.llm_chain.prompt  # type: ignore
         current_user_store_image = request_local.current_user_store.get("image")
         if current_user_store_image:
-            self.llm_chain.prompt = deepcopy(self.raw_prompt)
-            self.add_image_to_messages(self.llm_chain.prompt.messages)  # type: ignore
+            self.llm_chain.prompt = self.copy_prompt_with_images(self.raw_prompt)
         else:
             self.llm_chain.prompt = self.raw_prompt
         full_output = self.llm_chain.predict(callbacks=callbacks, **full_inputs)
@@ -406,6 +445,31 @@ class ToolCallCommonAgentMixIn(J2PromptMixin, CommonAgentMixIn):
         role_prompt: Optional[str] = None,
         **kwargs,
     ) -> Self:
+        query_knowledgebase = bool(kwargs.get("query_knowledgebase"))
+        agent_runnable, chat_prompt_template = agent_component_cache.get_or_create(
+            make_agent_cache_key(cls, llm, tools, prefix, role_prompt, query_knowledgebase),
+            lambda: cls.create_agent_components(llm, tools, prefix, role_prompt, query_knowledgebase),
+        )
+        agent = cls(runnable=agent_runnable, callbacks=[])  # type: ignore
+        agent.raw_runnable = agent_runnable
+        agent.llm = llm
+        agent.tools = tools
+        agent.prefix = prefix
+        agent.role_prompt = role_prompt
+        agent.chat_prompt_template = chat_prompt_template
+        agent = cast(Self, agent)
+        return agent
+
+    @classmethod
+    def create_agent_components(
+        cls,
+        llm: BaseChatModel,
+        tools: List[BaseTool],
+        prefix: Optional[str] = None,
+        role_prompt: Optional[str] = None,
+        query_knowledgebase: bool = False,
+    ) -> Tuple[Runnable, ChatPromptTemplate]:
+        """构建 agent 中与请求无关的部分：prompt 模板以及绑定了工具的 runnable，结果会被缓存复用，不能包含请求相关的状态"""
         messages = [
             (
                 "system",
@@ -415,7 +479,7 @@ class ToolCallCommonAgentMixIn(J2PromptMixin, CommonAgentMixIn):
             ("human", "{input}"),
             ("placeholder", "{agent_scratchpad}"),
         ]
-        if kwargs.get("query_knowledgebase"):
+        if query_knowledgebase:
             messages.insert(
                 -2,
                 (
@@ -438,15 +502,7 @@ class ToolCallCommonAgentMixIn(J2PromptMixin, CommonAgentMixIn):
         # Note: if you intended {role_prompt} to be part of the string and not a variable,
         # please escape it with double curly braces like: '{{role_prompt}}'."
         agent_runnable = create_enhanced_tool_calling_agent(llm, tools, chat_prompt_template)
-        agent = cls(runnable=agent_runnable, callbacks=[])  # type: ignore
-        agent.raw_runnable = agent_runnable
-        agent.llm = llm
-        agent.tools = tools
-        agent.prefix = prefix
-        agent.role_prompt = role_prompt
-        agent.chat_prompt_template = chat_prompt_template
-        agent = cast(Self, agent)
-        return agent
+        return agent_runnable, chat_prompt_template
 
 
 class StructuredChatCommonAgentMixIn(ToolCallCommonAgentMixIn):
@@ -463,16 +519,18 @@ class StructuredChatCommonAgentMixIn(ToolCallCommonAgentMixIn):
         format_instructions: Optional[str] = None,
         **kwargs,
     ) -> Self:
-        chat_prompt_template = deepcopy(general_qa_prompt_structured_chat)
-        agent_runnable = create_enhanced_structured_chat_agent(llm, tools, chat_prompt_template)
+        agent_runnable, chat_prompt_template = agent_component_cache.get_or_create(
+            make_agent_cache_key(cls, llm, tools),
+            lambda: cls.create_agent_components(llm, tools),
+        )
         agent = cls(runnable=agent_runnable, callbacks=[])  # type: ignore
         agent.raw_runnable = agent_runnable
         agent.llm = llm
         # NOTE: 在 StructuredChatAgent 中修改 tools 中的参数
         # 使得如果 LLM 调用工具时如果出现以下类型的错误，可以重新尝试，继续进行而不阻碍过程
+        # 工具可能在多个请求之间共享，替换为覆盖层而不是原地修改
         for i in range(len(tools)):
-            tools[i].handle_validation_error = True
-            tools[i].handle_tool_error = True
+            tools[i] = with_tool_flags(tools[i], handle_validation_error=True, handle_tool_error=True)
         agent.tools = tools
         agent.prefix = prefix
         agent.role_prompt = role_prompt
@@ -480,6 +538,20 @@ class StructuredChatCommonAgentMixIn(ToolCallCommonAgentMixIn):
         agent = cast(Self, agent)
         return agent
 
+    @classmethod
+    def create_agent_components(
+        cls,
+        llm: BaseChatModel,
+        tools: List[BaseTool],
+        prefix: Optional[str] = None,
+        role_prompt: Optional[str] = None,
+        query_knowledgebase: bool = False,
+    ) -> Tuple[Runnable, ChatPromptTemplate]:
+        # NOTE: prompt 模板不会被原地修改，可以直接共享
+        chat_prompt_template = general_qa_prompt_structured_chat
+        agent_runnable = create_enhanced_structured_chat_agent(llm, tools, chat_prompt_template)
+        return agent_runnable, chat_prompt_template
+
 
 class ToolCallCommonAgent(ToolCallCommonAgentMixIn, RunnableAgent):
     stream_runnable: bool = True
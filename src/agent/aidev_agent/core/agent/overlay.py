@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+from typing import Any, Dict, List, TypeVar
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import BaseTool
+
+# 写时复制（copy-on-write）：工具、prompt 模板在多个请求之间共享（见 cache.py），
+# 需要修改时只生成浅拷贝的覆盖层，而不是深拷贝整个对象
+
+T = TypeVar("T", bound=BaseTool)
+
+
+def with_tool_flags(tool: T, **flags: Any) -> T:
+    """返回设置了指定属性的工具：属性已一致时直接复用原工具，否则生成浅拷贝覆盖层"""
+    if all(getattr(tool, name) == value for name, value in flags.items()):
+        return tool
+    return tool.model_copy(update=flags)
+
+
+def with_prompt_messages(prompt: ChatPromptTemplate, messages: List[Any]) -> ChatPromptTemplate:
+    """返回替换了 messages 的 prompt 模板浅拷贝，原模板保持不变"""
+    return prompt.model_copy(update={"messages": messages})
+
+
+def snapshot_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    kwargs 的快照：复制字典以及其中的列表、字典值
+    后续对返回值的增删改（如 chat_history.pop、kwargs["context"] = ...）不会影响快照，元素本身仍然共享
+    """
+    snapshot = {}
+    for key, value in kwargs.items():
+        if isinstance(value, (list, dict)):
+            value = value.copy()
+        snapshot[key] = value
+    return snapshot
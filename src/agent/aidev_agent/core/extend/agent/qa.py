@@ -17,12 +17,12 @@ to the current version of the project delivered to anyone in the future.
 """
 
 import enum
-import json
 import time
-from collections import defaultdict, deque
+from collections import defaultdict
+from contextlib import aclosing, closing
 from copy import deepcopy
 from logging import getLogger
-from typing import Any, ClassVar, Dict, List, Optional, Tuple, Union
+from typing import Any, AsyncGenerator, ClassVar, Dict, Iterator, List, Optional, Tuple, Union
 
 from asgiref.sync import sync_to_async
 from langchain.agents.format_scratchpad.tools import format_to_tool_messages
@@ -31,11 +31,11 @@ from langchain_community.adapters.openai import convert_dict_to_message, convert
 from langchain_core.agents import AgentAction, AgentFinish
 from langchain_core.callbacks import Callbacks
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import BaseMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables.config import _set_config_context
 from langchain_core.tools import BaseTool
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from aidev_agent.config import settings
 from aidev_agent.core.agent.agents import (
@@ -45,18 +45,33 @@ from aidev_agent.core.agent.agents import (
     get_beijing_now,
 )
 from aidev_agent.core.agent.multimodal import MultiToolCallCommonAgent, StructuredChatCommonAgent
+from aidev_agent.core.agent.overlay import snapshot_kwargs
+from aidev_agent.core.utils.async_utils import async_generator_with_timeout
 from aidev_agent.core.utils.local import request_local
+from aidev_agent.core.utils.streaming import (
+    ChunkCoalescer,
+    SSEEncoder,
+    SSEFrameBatcher,
+    StreamingPatternFilter,
+    StreamingPatternFilterChain,
+    get_sse_encoder,
+)
+from aidev_agent.core.utils.token_counter import token_counter
 from aidev_agent.utils import Empty
 
+from .semantic_cache import CachedAnswer, SemanticAnswerCache, SemanticCacheScope, semantic_answer_cache
 from ..intent.intent_recognition import Decision, FineGrainedScoreType, IntentRecognition, IntentStatus
 from ..intent.prompts import DEFAULT_QA_PROMPT_TEMPLATES
+from ..intent.retrieval_plan import RetrievalPlan
 from ..intent.utils import (
     FINAL_ANSWER_PREFIXES,
     FINAL_ANSWER_SUFFIXES,
+    aconditional_dispatch_custom_event,
     conditional_dispatch_custom_event,
     deduplicate_knowledge_file_paths,
     deduplicate_tools,
     filter_and_select_topk,
+    install_sync_fallbacks,
     is_deepseek_r1_series_models,
     is_structured_data,
     query_clarification_enabled,
@@ -65,6 +80,8 @@ from ..intent.utils import (
 
 _logger = getLogger(__name__)
 
+TOOL_OUTPUT_COMPRESS_LOG = "\n```text\n工具调用结果过长，尝试压缩工具调用结果以减少 token 使用。\n```\n"
+
 
 class EventType(enum.Enum):
     LOADING = "loading"
@@ -78,12 +95,28 @@ class EventType(enum.Enum):
 class IntentRecognitionMixin(BaseModel):
     qa_prompt_templates: ClassVar[Dict[str, Any]] = DEFAULT_QA_PROMPT_TEMPLATES
     intent_recognition_instance: ClassVar[IntentRecognition] = IntentRecognition()
+    semantic_answer_cache: ClassVar[SemanticAnswerCache] = semantic_answer_cache
+    # 根据意图识别结果构建的 runnable 及其对应的 (llm, prompt, *tools)
+    intent_agent_runnable: Optional[Tuple[Tuple, Any]] = Field(default=None, exclude=True)
+    # 知识库 index_specific 检索的检索计划（RetrievalPlan），同一个 agent 的知识（库）不变时复用
+    knowledge_retrieval_plan: Optional[Any] = Field(default=None, exclude=True)
+    # 有异步版本的扩展点，子类只重写同步版本时异步流程也使用子类的逻辑（见 install_sync_fallbacks）；
+    # custom_plan 由 acustom_plan 自行处理
+    sync_fallback_hooks: ClassVar[Tuple[str, ...]] = (
+        "intent_recognition_pipeline",
+        "context_compressor_pipeline",
+        "intent_recognition_with_context_compressor",
+        "semantic_cache_pipeline",
+        "ensure_agent_token_limit",
+        "intent_recognition",
+    )
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         parent_factory = getattr(super(cls, cls), "qa_prompt_templates", {})
         current_factory = getattr(cls, "qa_prompt_templates", {})
         cls.qa_prompt_templates = {**parent_factory, **current_factory}
+        install_sync_fallbacks(cls, cls.sync_fallback_hooks)
 
     def intent_recognition_pipeline(
         self,
@@ -93,24 +126,38 @@ class IntentRecognitionMixin(BaseModel):
     ):
         if hasattr(request_local, "intent_recognition_results"):
             # 防止意图识别流程重复跑
-            llm = request_local.intent_recognition_results["llm"]
-            chat_prompt_template = request_local.intent_recognition_results["chat_prompt_template"]
-            candidate_tools = request_local.intent_recognition_results["candidate_tools"]
-            intermediate_steps = request_local.intent_recognition_results["intermediate_steps"]
-            callbacks = request_local.intent_recognition_results["callbacks"]
-            # 更新覆盖，而不是将整个kwargs替换，防止某些 key 可能被丢失了
-            kwargs = {**kwargs, **request_local.intent_recognition_results["kwargs"]}
+            results = self._load_intent_recognition_results(kwargs)
         else:
             if self.intent_recognition_kwargs:
                 kwargs = {**kwargs, **self.intent_recognition_kwargs}
-            (
-                llm,
-                chat_prompt_template,
-                candidate_tools,
+            kwargs = {**kwargs, "knowledge_retrieval_plan": self.get_knowledge_retrieval_plan(kwargs)}
+            results = self.__class__.intent_recognition(
+                self.llm,
+                self.prefix,
+                self.role_prompt or "",
+                self.tools,
                 intermediate_steps,
                 callbacks,
-                kwargs,
-            ) = self.__class__.intent_recognition(
+                force_process_by_agent=False,
+                **kwargs,
+            )
+            self._save_intent_recognition_results(*results)
+        return self._intent_recognition_pipeline_postproc(*results)
+
+    async def aintent_recognition_pipeline(
+        self,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        callbacks: Callbacks = None,
+        kwargs: Any = None,
+    ):
+        """intent_recognition_pipeline 的异步版本"""
+        if hasattr(request_local, "intent_recognition_results"):
+            results = self._load_intent_recognition_results(kwargs)
+        else:
+            if self.intent_recognition_kwargs:
+                kwargs = {**kwargs, **self.intent_recognition_kwargs}
+            kwargs = {**kwargs, "knowledge_retrieval_plan": self.get_knowledge_retrieval_plan(kwargs)}
+            results = await self.__class__.aintent_recognition(
                 self.llm,
                 self.prefix,
                 self.role_prompt or "",
@@ -120,20 +167,44 @@ class IntentRecognitionMixin(BaseModel):
                 force_process_by_agent=False,
                 **kwargs,
             )
-            # NOTE: 需要格外注意此处的深拷贝和浅拷贝逻辑
-            # 1. 对于 chat_prompt_template，candidate_tools 和 kwargs 这类希望只在首次调用 intent_recognition 时修改的
-            # 需要进行深拷贝。
-            # 2. 对于 intermediate_steps 这类在 agent 过程中需要不断修改的，需要进行浅拷贝，通过引用的方式，使得可以一直被根据需要修改。
-            request_local.intent_recognition_results = {
-                "llm": llm,
-                "chat_prompt_template": deepcopy(chat_prompt_template),
-                "candidate_tools": deepcopy(candidate_tools),
-                # NOTE：intermediate_steps 在 agent 过程中需要一直能变，因此千万不能 deepcopy！
-                "intermediate_steps": intermediate_steps,
-                "callbacks": callbacks,
-                "kwargs": deepcopy(kwargs),
-            }
+            self._save_intent_recognition_results(*results)
+        return self._intent_recognition_pipeline_postproc(*results)
 
+    @staticmethod
+    def _load_intent_recognition_results(kwargs: Any):
+        return (
+            request_local.intent_recognition_results["llm"],
+            request_local.intent_recognition_results["chat_prompt_template"],
+            request_local.intent_recognition_results["candidate_tools"],
+            request_local.intent_recognition_results["intermediate_steps"],
+            request_local.intent_recognition_results["callbacks"],
+            # 更新覆盖，而不是将整个kwargs替换，防止某些 key 可能被丢失了
+            {**kwargs, **request_local.intent_recognition_results["kwargs"]},
+        )
+
+    @staticmethod
+    def _save_intent_recognition_results(
+        llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
+    ):
+        # NOTE: 需要格外注意此处的拷贝逻辑
+        # 1. chat_prompt_template 和 candidate_tools 不会被原地修改（见 aidev_agent.core.agent.overlay），直接共享；
+        # candidate_tools 复制列表即可。
+        # 2. kwargs 希望只在首次调用 intent_recognition 时修改，保存其快照，后续对返回值的修改不影响快照。
+        # 3. 对于 intermediate_steps 这类在 agent 过程中需要不断修改的，需要进行浅拷贝，通过引用的方式，使得可以一直被根据需要修改。
+        request_local.intent_recognition_results = {
+            "llm": llm,
+            "chat_prompt_template": chat_prompt_template,
+            "candidate_tools": list(candidate_tools),
+            # NOTE：intermediate_steps 在 agent 过程中需要一直能变，因此千万不能拷贝！
+            "intermediate_steps": intermediate_steps,
+            "callbacks": callbacks,
+            "kwargs": snapshot_kwargs(kwargs),
+        }
+
+    @staticmethod
+    def _intent_recognition_pipeline_postproc(
+        llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
+    ):
         # 根据 deepseek 官方建议 https://github.com/deepseek-ai/DeepSeek-R1?tab=readme-ov-file#usage-recommendations
         # deepseek-r1 系列模型需要避免使用 system prompt
         # 这里统一转一下（否则用户选择“预设角色”可能包含 system prompt）
@@ -148,19 +219,28 @@ class IntentRecognitionMixin(BaseModel):
         _logger.info(f"intent recognition results: {request_local.intent_recognition_results}")
         return llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
 
+    @staticmethod
+    def _provided_chat_history(kwargs: Any) -> List[BaseMessage]:
+        if "chat_history" in kwargs and kwargs["chat_history"]:
+            # 用来压缩知识库知识/工具调用结果所需提供的 chat history（倒数取最新的）
+            return kwargs["chat_history"][-kwargs.get("max_n_chat_history_for_compress", 5) :]
+        return []
+
+    def _is_tool_output_too_long(self, intermediate_steps: List[Tuple[AgentAction, str]], kwargs: Any) -> bool:
+        # 对于工具调用结果，直接再加个特殊判断
+        # 且使用字符串长度而不使用 token 计数，减少计算 token 的耗时
+        if isinstance(self, ToolCallingCommonQAAgent):
+            agent_scratchpad = format_to_tool_messages(intermediate_steps)
+        elif isinstance(self, StructuredChatCommonQAAgent):
+            agent_scratchpad = enhanced_format_log_to_str(intermediate_steps)
+        return len(agent_scratchpad) > kwargs.get("tool_output_compress_thrd", 5000)
+
     def context_compressor_pipeline(
         self, llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
     ):
         # NOTE: 目前只对 StructuredChatCommonQAAgent 进行处理
         if isinstance(self, StructuredChatCommonQAAgent):
-            if "chat_history" in kwargs and kwargs["chat_history"]:
-                # 用来压缩知识库知识/工具调用结果所需提供的 chat history（倒数取最新的）
-                provided_chat_history = deepcopy(kwargs["chat_history"])[
-                    -kwargs.get("max_n_chat_history_for_compress", 5) :
-                ]
-            else:
-                provided_chat_history = []
-
+            provided_chat_history = self._provided_chat_history(kwargs)
             self.ensure_agent_token_limit(
                 llm,
                 chat_prompt_template,
@@ -169,20 +249,36 @@ class IntentRecognitionMixin(BaseModel):
                 provided_chat_history,
                 kwargs,
             )
+            if self._is_tool_output_too_long(intermediate_steps, kwargs):
+                conditional_dispatch_custom_event("custom_event", {"compress_log": TOOL_OUTPUT_COMPRESS_LOG}, **kwargs)
+                self.__class__.intent_recognition_instance.llm_intermediate_step_compressor_parallel(
+                    provided_chat_history,
+                    kwargs["query"],
+                    intermediate_steps,
+                    llm,
+                )
 
-            # 对于工具调用结果，直接再加个特殊判断
-            # 且使用字符串长度而不使用 token 计数，减少计算 token 的耗时
-            if isinstance(self, ToolCallingCommonQAAgent):
-                agent_scratchpad = format_to_tool_messages(intermediate_steps)
-            elif isinstance(self, StructuredChatCommonQAAgent):
-                agent_scratchpad = enhanced_format_log_to_str(intermediate_steps)
-            if len(agent_scratchpad) > kwargs.get("tool_output_compress_thrd", 5000):
-                conditional_dispatch_custom_event(
-                    "custom_event",
-                    {"compress_log": "\n```text\n工具调用结果过长，尝试压缩工具调用结果以减少 token 使用。\n```\n"},
-                    **kwargs,
+        return llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
+
+    async def acontext_compressor_pipeline(
+        self, llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
+    ):
+        """context_compressor_pipeline 的异步版本"""
+        if isinstance(self, StructuredChatCommonQAAgent):
+            provided_chat_history = self._provided_chat_history(kwargs)
+            await self.aensure_agent_token_limit(
+                llm,
+                chat_prompt_template,
+                candidate_tools,
+                intermediate_steps,
+                provided_chat_history,
+                kwargs,
+            )
+            if self._is_tool_output_too_long(intermediate_steps, kwargs):
+                await aconditional_dispatch_custom_event(
+                    "custom_event", {"compress_log": TOOL_OUTPUT_COMPRESS_LOG}, **kwargs
                 )
-                self.__class__.intent_recognition_instance.llm_intermediate_step_compressor_parallel(
+                await self.__class__.intent_recognition_instance.allm_intermediate_step_compressor_parallel(
                     provided_chat_history,
                     kwargs["query"],
                     intermediate_steps,
@@ -219,6 +315,120 @@ class IntentRecognitionMixin(BaseModel):
 
         return llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
 
+    async def aintent_recognition_with_context_compressor(
+        self,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        callbacks: Callbacks = None,
+        kwargs: Any = None,
+    ):
+        results = await self.aintent_recognition_pipeline(intermediate_steps, callbacks, kwargs)
+        return await self.acontext_compressor_pipeline(*results)
+
+    def _semantic_cache_scope(
+        self,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        kwargs: Any,
+    ) -> Optional[Tuple[SemanticCacheScope, str]]:
+        """
+        语义缓存：在意图识别之前，使用相似问题之前的答案直接回复
+        只对请求的首轮 plan 且没有对话历史的问题生效（此时用户输入即为独立问题，无需 LLM 改写）
+        返回 (scope, query)，不适用语义缓存时返回 None
+        """
+        if intermediate_steps or hasattr(request_local, "intent_recognition_results"):
+            return None
+        if hasattr(request_local, "semantic_cache_query"):
+            del request_local.semantic_cache_query
+        if not self.__class__.semantic_answer_cache.enabled:
+            return None
+        kwargs = {**kwargs, **self.intent_recognition_kwargs}
+        chat_history: List[BaseMessage] = kwargs.get("chat_history") or []
+        query = kwargs.get("input")
+        if (
+            not isinstance(query, str)
+            or kwargs.get("files_list")
+            or not all(isinstance(message, SystemMessage) for message in chat_history)
+        ):
+            return None
+
+        scope = self.__class__.semantic_answer_cache.make_scope(
+            self.__class__.__qualname__,
+            getattr(self.llm, "model_name", None),
+            self.prefix,
+            self.role_prompt or "",
+            [message.content for message in chat_history],
+            knowledge_bases=kwargs.get("knowledge_bases"),
+            knowledge_items=kwargs.get("knowledge_items"),
+        )
+        return scope, query
+
+    def _semantic_cache_lookup(self, scope: SemanticCacheScope, query: str, vector) -> Optional[CachedAnswer]:
+        cached = self.__class__.semantic_answer_cache.lookup(scope, vector)
+        if cached is None:
+            if vector is not None:
+                # 记录下来，得到最终答案后写入缓存
+                request_local.semantic_cache_query = (scope, vector, query)
+            return None
+
+        _logger.info(f"semantic cache hit: {query} -> {cached.query}")
+        if cached.reference_doc and hasattr(request_local, "current_user_store"):
+            request_local.current_user_store["reference_doc"] = cached.reference_doc
+        return cached
+
+    def semantic_cache_pipeline(
+        self,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        kwargs: Any,
+    ) -> Optional[AgentFinish]:
+        if (scope_and_query := self._semantic_cache_scope(intermediate_steps, kwargs)) is None:
+            return None
+        scope, query = scope_and_query
+        cached = self._semantic_cache_lookup(scope, query, self.__class__.semantic_answer_cache.embed(query))
+        if cached is None:
+            return None
+        if cached.reference_doc:
+            conditional_dispatch_custom_event("custom_event", {"reference_doc": cached.reference_doc}, **kwargs)
+        conditional_dispatch_custom_event("custom_event", {"custom_agent_finish": cached.answer}, **kwargs)
+        return AgentFinish(return_values={"output": cached.answer}, log="命中语义缓存")
+
+    async def asemantic_cache_pipeline(
+        self,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        kwargs: Any,
+    ) -> Optional[AgentFinish]:
+        """semantic_cache_pipeline 的异步版本"""
+        if (scope_and_query := self._semantic_cache_scope(intermediate_steps, kwargs)) is None:
+            return None
+        scope, query = scope_and_query
+        cached = self._semantic_cache_lookup(scope, query, await self.__class__.semantic_answer_cache.aembed(query))
+        if cached is None:
+            return None
+        if cached.reference_doc:
+            await aconditional_dispatch_custom_event("custom_event", {"reference_doc": cached.reference_doc}, **kwargs)
+        await aconditional_dispatch_custom_event("custom_event", {"custom_agent_finish": cached.answer}, **kwargs)
+        return AgentFinish(return_values={"output": cached.answer}, log="命中语义缓存")
+
+    def save_semantic_cache(self, result: Union[AgentAction, AgentFinish], intermediate_steps: List):
+        """只缓存基于知识库直接回答（中间没有调用过工具）的最终答案"""
+        if not isinstance(result, AgentFinish) or not hasattr(request_local, "semantic_cache_query"):
+            return
+        scope, vector, query = request_local.semantic_cache_query
+        del request_local.semantic_cache_query
+        if intermediate_steps or not hasattr(request_local, "intent_recognition_results"):
+            return
+        recog_results = request_local.intent_recognition_results["kwargs"].get("recog_results") or {}
+        if not (
+            recog_results.get("status") == IntentStatus.QA_WITH_RETRIEVED_KNOWLEDGE_RESOURCES
+            or recog_results.get("decision") == Decision.PRIVATE_QA
+        ):
+            return
+        answer = result.return_values.get("output")
+        if not isinstance(answer, str) or not answer:
+            return
+        reference_doc = getattr(request_local, "current_user_store", {}).get("reference_doc") or []
+        self.__class__.semantic_answer_cache.add(
+            scope, vector, CachedAnswer(query=query, answer=answer, reference_doc=reference_doc)
+        )
+
     def custom_plan(
         self,
         intermediate_steps: List[Tuple[AgentAction, str]],
@@ -234,16 +444,34 @@ class IntentRecognitionMixin(BaseModel):
         )
         ```
         """
+        if cached_finish := self.semantic_cache_pipeline(intermediate_steps, kwargs):
+            return cached_finish
 
-        (
-            llm,
-            chat_prompt_template,
-            candidate_tools,
-            intermediate_steps,
-            callbacks,
-            kwargs,
-        ) = self.intent_recognition_with_context_compressor(intermediate_steps, callbacks, kwargs)
+        return self._intent_recognition_action(
+            *self.intent_recognition_with_context_compressor(intermediate_steps, callbacks, kwargs)
+        )
+
+    async def acustom_plan(
+        self,
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        callbacks: Callbacks = None,
+        **kwargs: Any,
+    ) -> Union[AgentAction, AgentFinish, None]:
+        """custom_plan 的异步版本。子类只重写了 custom_plan 时，放到线程中执行子类的逻辑"""
+        if type(self).custom_plan is not IntentRecognitionMixin.custom_plan:
+            return await sync_to_async(self.custom_plan)(intermediate_steps, callbacks, **kwargs)
+
+        if cached_finish := await self.asemantic_cache_pipeline(intermediate_steps, kwargs):
+            return cached_finish
 
+        return self._intent_recognition_action(
+            *await self.aintent_recognition_with_context_compressor(intermediate_steps, callbacks, kwargs)
+        )
+
+    @staticmethod
+    def _intent_recognition_action(
+        llm, chat_prompt_template, candidate_tools, intermediate_steps, callbacks, kwargs
+    ) -> AgentAction:
         return AgentAction(
             tool="intent_recognition_tool",
             tool_input={
@@ -268,21 +496,42 @@ class IntentRecognitionMixin(BaseModel):
             if isinstance(custom_ret, AgentAction) and custom_ret.tool == "intent_recognition_tool":
                 self.llm, self.chat_prompt_template, self.tools, intermediate_steps, callbacks, kwargs = (
                     custom_ret.tool_input["llm"],
-                    deepcopy(custom_ret.tool_input["prompt"]),
+                    custom_ret.tool_input["prompt"],
                     custom_ret.tool_input["tools"],
                     custom_ret.tool_input["intermediate_steps"],
                     custom_ret.tool_input["callbacks"],
                     custom_ret.tool_input["kwargs"],
                 )
-                agent_runnable = self.create_agent_func(self.llm, self.tools, self.chat_prompt_template)
                 kwargs["runnable_has_been_modified"] = True
-                self.runnable = agent_runnable
+                self.runnable = self.get_intent_agent_runnable(self.llm, self.chat_prompt_template, self.tools)
             else:
                 kwargs["runnable_has_been_modified"] = True
                 self.runnable = self.raw_runnable
                 return custom_ret, intermediate_steps, callbacks, kwargs
         return None, intermediate_steps, callbacks, kwargs
 
+    def get_intent_agent_runnable(self, llm: BaseChatModel, prompt: ChatPromptTemplate, tools: List[BaseTool]):
+        """
+        意图识别的结果在同一请求的多轮 plan 之间保持不变（见 intent_recognition_pipeline），
+        llm、prompt、tools 都是同一批对象时复用上一轮构建好的 runnable
+        """
+        key = (llm, prompt, *tools)
+        cached = self.intent_agent_runnable
+        if cached and len(cached[0]) == len(key) and all(a is b for a, b in zip(cached[0], key)):
+            return cached[1]
+        agent_runnable = self.create_agent_func(llm, tools, prompt)
+        self.intent_agent_runnable = (key, agent_runnable)
+        return agent_runnable
+
+    def get_knowledge_retrieval_plan(self, kwargs: Dict[str, Any]) -> RetrievalPlan:
+        """知识（库）和自定义索引都是同一批对象时复用之前构建的检索计划，否则重新构建"""
+        knowledge_items, knowledge_bases = kwargs.get("knowledge_items"), kwargs.get("knowledge_bases")
+        retrieval_plan = self.knowledge_retrieval_plan
+        if retrieval_plan is None or not retrieval_plan.matches(knowledge_items, knowledge_bases, **kwargs):
+            retrieval_plan = RetrievalPlan.from_kwargs(knowledge_items, knowledge_bases, **kwargs)
+            self.knowledge_retrieval_plan = retrieval_plan
+        return retrieval_plan
+
     def plan(
         self,
         intermediate_steps: List[Tuple[AgentAction, str]],
@@ -295,7 +544,9 @@ class IntentRecognitionMixin(BaseModel):
         )
         if result is not None:
             return result
-        return super().plan(intermediate_steps, callbacks, **kwargs)
+        result = super().plan(intermediate_steps, callbacks, **kwargs)
+        self.save_semantic_cache(result, intermediate_steps)
+        return result
 
     async def aplan(
         self,
@@ -303,13 +554,15 @@ class IntentRecognitionMixin(BaseModel):
         callbacks: Callbacks = None,
         **kwargs: Any,
     ) -> Union[AgentAction, AgentFinish]:
-        custom_ret = await sync_to_async(self.custom_plan)(intermediate_steps, callbacks, **kwargs)
+        custom_ret = await self.acustom_plan(intermediate_steps, callbacks, **kwargs)
         result, intermediate_steps, callbacks, kwargs = self._handle_custom_plan(
             custom_ret, intermediate_steps, callbacks, kwargs
         )
         if result is not None:
             return result
-        return await super().aplan(intermediate_steps, callbacks, **kwargs)
+        result = await super().aplan(intermediate_steps, callbacks, **kwargs)
+        self.save_semantic_cache(result, intermediate_steps)
+        return result
 
     def format_and_check_token_length(
         self,
@@ -341,18 +594,21 @@ class IntentRecognitionMixin(BaseModel):
             inner_input["chat_history"] = kwargs["chat_history"]
 
         formated_prompts = chat_prompt_template._format_prompt_with_error_handling(inner_input)
-        cur_token_len = llm.get_num_tokens_from_messages(formated_prompts.messages)
+        cur_token_len = token_counter.count_messages(llm, formated_prompts.messages)
         return cur_token_len, formated_prompts
 
-    def ensure_agent_token_limit(
+    def _iter_token_limit_compress_steps(
         self,
         llm,
         chat_prompt_template,
         candidate_tools,
         intermediate_steps,
-        provided_chat_history,
         kwargs,
-    ):
+    ) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+        """
+        按优先级压缩上下文直到不超过 token 限制
+        需要调用 LLM 压缩的步骤以 (压缩对象, 压缩日志) 的形式交给调用方执行，使同步、异步流程共用同一套逻辑
+        """
         cur_token_len, formated_prompts = self.format_and_check_token_length(
             llm,
             chat_prompt_template,
@@ -365,47 +621,28 @@ class IntentRecognitionMixin(BaseModel):
         has_executed_intermediate_step_compressor = False
         token_limit_margin = kwargs.get("token_limit_margin", 100)
         llm_token_limit = getattr(self, "llm_token_limit", 28000)
+        # chat history 原样出现在格式化后的 prompt 中时，抛除一条历史只需扣减其 token 数，无需重新格式化和统计
+        chat_history_in_prompt = "chat_history" in chat_prompt_template.partial_variables
         while cur_token_len > llm_token_limit - token_limit_margin:
             # 优先级 1: 压缩召回的知识的内容
             if "context" in kwargs and kwargs["context"] and not has_executed_context_compressor:
-                conditional_dispatch_custom_event(
-                    "custom_event",
-                    {"compress_log": "\n```text\nToken 超限，尝试压缩知识库知识内容以减少 token 使用。\n```\n"},
-                    **kwargs,
-                )
-                kwargs["context"] = self.__class__.intent_recognition_instance.llm_context_compressor_parallel(
-                    provided_chat_history,
-                    kwargs["query"],
-                    kwargs["context"],
-                    llm,
-                )
+                yield "context", "\n```text\nToken 超限，尝试压缩知识库知识内容以减少 token 使用。\n```\n"
                 has_executed_context_compressor = True
             # 优先级 2: 压缩 intermediate steps 的内容
             elif intermediate_steps and not has_executed_intermediate_step_compressor:
                 if not isinstance(self, StructuredChatCommonQAAgent):
                     raise RuntimeError("当前仅支持对 StructuredChatCommonQAAgent 进行工具调用中间结果总结压缩！")
-                conditional_dispatch_custom_event(
-                    "custom_event",
-                    {"compress_log": "\n```text\nToken 超限，尝试压缩工具调用结果以减少 token 使用。\n```\n"},
-                    **kwargs,
-                )
-                self.__class__.intent_recognition_instance.llm_intermediate_step_compressor_parallel(
-                    provided_chat_history,
-                    kwargs["query"],
-                    intermediate_steps,
-                    llm,
-                )
+                yield "intermediate_steps", "\n```text\nToken 超限，尝试压缩工具调用结果以减少 token 使用。\n```\n"
                 has_executed_intermediate_step_compressor = True
             # 优先级 3: 依次抛除 chat history 内容
             elif "chat_history" in kwargs and kwargs["chat_history"]:
                 if first_entry:
-                    conditional_dispatch_custom_event(
-                        "custom_event",
-                        {"compress_log": "\n```text\nToken 超限，尝试抛除会话历史以减少 token 使用。\n```\n"},
-                        **kwargs,
-                    )
-                kwargs["chat_history"].pop(0)
+                    yield None, "\n```text\nToken 超限，尝试抛除会话历史以减少 token 使用。\n```\n"
+                dropped_message = kwargs["chat_history"].pop(0)
                 first_entry = False
+                if chat_history_in_prompt:
+                    cur_token_len -= token_counter.count_message(llm, dropped_message)
+                    continue
             else:
                 err_msg = (
                     "已尝试按优先级压缩上下文，但还是超过 token 限制，无法回答问题，请尝试其他 LLM。"
@@ -424,6 +661,57 @@ class IntentRecognitionMixin(BaseModel):
                 kwargs,
             )
 
+    def ensure_agent_token_limit(
+        self,
+        llm,
+        chat_prompt_template,
+        candidate_tools,
+        intermediate_steps,
+        provided_chat_history,
+        kwargs,
+    ):
+        instance = self.__class__.intent_recognition_instance
+        for target, compress_log in self._iter_token_limit_compress_steps(
+            llm, chat_prompt_template, candidate_tools, intermediate_steps, kwargs
+        ):
+            conditional_dispatch_custom_event("custom_event", {"compress_log": compress_log}, **kwargs)
+            if target == "context":
+                kwargs["context"] = instance.llm_context_compressor_parallel(
+                    provided_chat_history, kwargs["query"], kwargs["context"], llm
+                )
+            elif target == "intermediate_steps":
+                instance.llm_intermediate_step_compressor_parallel(
+                    provided_chat_history, kwargs["query"], intermediate_steps, llm
+                )
+
+    async def aensure_agent_token_limit(
+        self,
+        llm,
+        chat_prompt_template,
+        candidate_tools,
+        intermediate_steps,
+        provided_chat_history,
+        kwargs,
+    ):
+        """ensure_agent_token_limit 的异步版本"""
+        instance = self.__class__.intent_recognition_instance
+        steps = self._iter_token_limit_compress_steps(
+            llm, chat_prompt_template, candidate_tools, intermediate_steps, kwargs
+        )
+        # 每一步都要格式化 prompt 并统计 token 数（可能请求远程分词接口），在线程中推进，不阻塞事件循环
+        anext_step = sync_to_async(next, thread_sensitive=False)
+        while (step := await anext_step(steps, None)) is not None:
+            target, compress_log = step
+            await aconditional_dispatch_custom_event("custom_event", {"compress_log": compress_log}, **kwargs)
+            if target == "context":
+                kwargs["context"] = await instance.allm_context_compressor_parallel(
+                    provided_chat_history, kwargs["query"], kwargs["context"], llm
+                )
+            elif target == "intermediate_steps":
+                await instance.allm_intermediate_step_compressor_parallel(
+                    provided_chat_history, kwargs["query"], intermediate_steps, llm
+                )
+
     @classmethod
     def knowledge_resources_postproc(cls, kwargs, recog_results, knowledge_resource_type):
         # NOTE: 如果有 index_content 且是结构化数据则取 index_content，否则才取 page_content（兼容写法）。
@@ -468,31 +756,76 @@ class IntentRecognitionMixin(BaseModel):
         """
         if config:
             _set_config_context(config)
-        query = kwargs["input"]
+        tools_for_intent_recog, recog_kwargs = cls._intent_recognition_inputs(tools, force_process_by_agent, kwargs)
+        recog_results = cls.intent_recognition_instance.exec_intent_recognition(
+            kwargs["input"], llm, tools_for_intent_recog, callbacks, **recog_kwargs, **kwargs
+        )
+        return cls._intent_recognition_postproc(
+            llm, role_prompt, tools, intermediate_steps, callbacks, force_process_by_agent, recog_results, kwargs
+        )
+
+    @classmethod
+    async def aintent_recognition(
+        cls,
+        llm: BaseChatModel,
+        prefix: str,
+        role_prompt: str,
+        tools: List[BaseTool],
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        callbacks: Callbacks = None,
+        force_process_by_agent=False,
+        config=None,
+        **kwargs: Any,
+    ) -> Tuple[BaseChatModel, ChatPromptTemplate, List[BaseTool], List[Tuple[AgentAction, str]], Callbacks, Any]:
+        """intent_recognition 的异步版本，参数含义同 intent_recognition"""
+        if config:
+            _set_config_context(config)
+        tools_for_intent_recog, recog_kwargs = cls._intent_recognition_inputs(tools, force_process_by_agent, kwargs)
+        recog_results = await cls.intent_recognition_instance.aexec_intent_recognition(
+            kwargs["input"], llm, tools_for_intent_recog, callbacks, **recog_kwargs, **kwargs
+        )
+        return cls._intent_recognition_postproc(
+            llm, role_prompt, tools, intermediate_steps, callbacks, force_process_by_agent, recog_results, kwargs
+        )
+
+    @classmethod
+    def _intent_recognition_inputs(
+        cls, tools: List[BaseTool], force_process_by_agent: bool, kwargs: Dict[str, Any]
+    ) -> Tuple[List[BaseTool], Dict[str, Any]]:
+        """意图识别所需的工具和参数，参数会从 kwargs 中 pop 出来，防止跟后续的 **kwargs 重复"""
         # NOTE: 加上意图识别流程后，需要把默认自带的 `knowledge_query` 去掉
-        tools_for_intent_recog = deduplicate_tools([tool for tool in deepcopy(tools) if tool.name != "knowledge_query"])
+        tools_for_intent_recog = deduplicate_tools([tool for tool in tools if tool.name != "knowledge_query"])
         reject_threshold = tuple(map(float, settings.BKAIDEV_KNOWLEDGE_RESOURCE_REJECT_THRESHOLD.split(",")))
-        recog_results = cls.intent_recognition_instance.exec_intent_recognition(
-            query,
-            llm,
-            tools_for_intent_recog,
-            callbacks,
-            force_process_by_agent=force_process_by_agent,
-            with_structured_data=kwargs.pop("with_structured_data", False),  # pop 防止跟后续的 **kwargs 重复。下同
-            knowledge_bases=kwargs.pop("knowledge_bases", []),
-            knowledge_items=kwargs.pop("knowledge_items", []),
-            knowledge_resource_rough_recall_topk=kwargs.pop("topk", settings.BKAIDEV_TOP_K),
-            knowledge_resource_reject_threshold=kwargs.pop(
-                "knowledge_resource_reject_threshold",
-                reject_threshold,
-            ),
-            knowledge_resource_fine_grained_score_type=kwargs.pop(
+        recog_kwargs = {
+            "force_process_by_agent": force_process_by_agent,
+            "with_structured_data": kwargs.pop("with_structured_data", False),
+            "knowledge_bases": kwargs.pop("knowledge_bases", []),
+            "knowledge_items": kwargs.pop("knowledge_items", []),
+            "knowledge_resource_rough_recall_topk": kwargs.pop("topk", settings.BKAIDEV_TOP_K),
+            "knowledge_resource_reject_threshold": kwargs.pop("knowledge_resource_reject_threshold", reject_threshold),
+            "knowledge_resource_fine_grained_score_type": kwargs.pop(
                 "knowledge_resource_fine_grained_score_type",
                 FineGrainedScoreType(settings.BKAIDEV_FINE_GRAINED_SCORE_TYPE),
             ),
-            tool_resource_base_ids=None,  # 待工具类资源注册表支持后，改成从kwargs中取
-            **kwargs,
-        )
+            "tool_resource_base_ids": None,  # 待工具类资源注册表支持后，改成从kwargs中取
+            "knowledge_retrieval_plan": kwargs.pop("knowledge_retrieval_plan", None),
+        }
+        return tools_for_intent_recog, recog_kwargs
+
+    @classmethod
+    def _intent_recognition_postproc(
+        cls,
+        llm: BaseChatModel,
+        role_prompt: str,
+        tools: List[BaseTool],
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        callbacks: Callbacks,
+        force_process_by_agent: bool,
+        recog_results: Dict[str, Any],
+        kwargs: Dict[str, Any],
+    ) -> Tuple[BaseChatModel, ChatPromptTemplate, List[BaseTool], List[Tuple[AgentAction, str]], Callbacks, Any]:
+        """根据意图识别结果选择 prompt 模板和候选工具，并补充 kwargs"""
+        query = kwargs["input"]
         if force_process_by_agent and recog_results["status"] != IntentStatus.PROCESS_BY_AGENT:
             raise RuntimeError(
                 "force_process_by_agent 的情况下状态值必须是 IntentStatus.PROCESS_BY_AGENT"
@@ -561,7 +894,7 @@ class IntentRecognitionMixin(BaseModel):
             candidate_tools = deduplicate_tools(candidate_tools)
         else:
             candidate_tools = deduplicate_tools(
-                [tool for tool in deepcopy(candidate_tools) if tool.name != "add_image_to_chat_context"]
+                [tool for tool in candidate_tools if tool.name != "add_image_to_chat_context"]
             )
 
         # 补充/修改 kwargs 的值
@@ -596,104 +929,27 @@ class CommonQAStreamingMixIn:
     final_answer_suffixes: List[str] = deepcopy(FINAL_ANSWER_SUFFIXES)
     # NOTE: 人工定义结束标志，用于去除 final_answer_suffix 时往后判断是否已经到达末尾
     # 这是因为 Final Answer 内部本身可能刚好有 final_answer_suffix 这种模式，直接过滤有误删风险。
-    # 因此使用缓冲队列，往后读到结束标志，再进行以下剔除操作。
+    # 因此将 final_answer_suffix 与结束标志拼接后作为需要剔除的模式，读到结束标志时才会命中。
     end_content = "<｜end▁of▁sentence｜>"
 
-    def common_filter(self, cache, filter_symbols, event_type):
-        hit = False
-        recall_event = None
-        combined_content = "".join(
-            [item["content"] for item in cache if "content" in item and item.get("event") == event_type]
-        )
-        for symbol in filter_symbols:
-            if symbol in combined_content:
-                # 如果是 final_answer_prefix 这种特殊情况，外层逻辑会补充一个 recall_ret 回来
-                # 因此这里可以放心地从 think 中去除末尾的那个需要归属 text 的块
-                if symbol in self.final_answer_prefixes and not combined_content.endswith(symbol):
-                    start_index = combined_content.find(symbol)
-                    combined_content = combined_content[:start_index]
-                else:
-                    combined_content = combined_content.replace(symbol, "")
-                hit = True
-                break
-        if hit:
-            if combined_content:
-                recall_event = {"event": event_type, "content": combined_content, "cover": False}
-            # think 类型有个特殊处理：需要保证在最后一个 think event 上带上 elapsed_time
-            if event_type == EventType.THINK.value:
-                for item in cache:
-                    if elapsed_time := item.get("elapsed_time"):
-                        if recall_event:
-                            recall_event["elapsed_time"] = elapsed_time
-                        else:
-                            recall_event = {
-                                "event": event_type,
-                                "content": "",
-                                "cover": False,
-                                "elapsed_time": elapsed_time,
-                            }
-                        break
-        return hit, recall_event
-
-    def cache_filter(self, cache, final_answer_prefix_to_filter=None, final_answer_suffix_to_filter=None):
-        """
-        注意！对于类似以下格式的内容，需要把"好的"留下！
-        ```
-        cache = deque(
-            [
-                {"event": "think", "content": "<th", "cover": False},
-                {"event": "think", "content": "in", "cover": False},
-                {"event": "think", "content": "k>", "cover": False},
-                {"event": "think", "content": "\n好的", "cover": False},
-            ]
-        )
-        ```
-        """
-        # 针对 think event 的过滤
-        think_event_filter_symbols = deepcopy(self.think_symbols)
-        if final_answer_prefix_to_filter:
-            think_event_filter_symbols.append(final_answer_prefix_to_filter)
-        hit_think, recall_event_think = self.common_filter(cache, think_event_filter_symbols, EventType.THINK.value)
-
-        # 针对 final answer JSON BLOB 后缀的过滤
-        if final_answer_suffix_to_filter:
-            hit_suffix, recall_event_suffix = self.common_filter(
-                cache, [final_answer_suffix_to_filter], EventType.TEXT.value
-            )
-        else:
-            hit_suffix = False
-            recall_event_suffix = None
-
-        if hit_think or hit_suffix:
-            init_events = list(deepcopy(cache))
-            if hit_think:
-                # 去除 think 的 event，因为已经合并和过滤了
-                # 需保证 think 在 text 前面
-                remain_events = []
-                have_appended_recall_event_think = False
-                for event in init_events:
-                    if event.get("event") == EventType.THINK.value:
-                        if recall_event_think and not have_appended_recall_event_think:
-                            remain_events.append(recall_event_think)
-                            have_appended_recall_event_think = True
-                    else:
-                        remain_events.append(event)
-            else:
-                remain_events = init_events
+    def get_stream_event_processor(self, skip_thought: bool = True) -> "StandardEventProcessor":
+        return StandardEventProcessor(self, skip_thought=skip_thought)
 
-            if hit_suffix:
-                # 去除 text 的 event，因为已经合并和过滤了
-                # 需保证 think 在 text 前面
-                # 因为认为 cache 中原始的 think 一定在 text 前面，所以这样处理即可：
-                remain_events = [event for event in remain_events if event.get("event") != EventType.TEXT.value]
-                if recall_event_suffix:
-                    remain_events.append(recall_event_suffix)
+    def get_sse_encoder(self) -> SSEEncoder:
+        return get_sse_encoder()
 
-            cache = deque(remain_events)
+    def get_sse_frame_batcher(self) -> SSEFrameBatcher:
+        return SSEFrameBatcher.from_settings()
 
-        return cache
-
-    def stream_standard_event(self, agent_e, cfg, input_, skip_thought=True, timeout: Optional[int] = None):
+    def stream_standard_event(
+        self,
+        agent_e,
+        cfg,
+        input_,
+        skip_thought=True,
+        timeout: Optional[int] = None,
+        coalescer: Optional[ChunkCoalescer] = None,
+    ):
         """
         如果 is_deepseek_r1_series_models(self.llm)，则需要：
            统一：去除 think 标识位
@@ -704,337 +960,446 @@ class CommonQAStreamingMixIn:
            b) 如果 isinstance(self, ToolCallingCommonQAAgent)，则需要：
               将 think 过程作为 think event 发送
               用 reasoning content 来判断
+
+        传入 coalescer 时会先合并连续的同类型内容 event 再发送
+        """
+        yield from self.get_sse_frame_batcher().batch(
+            self._iter_standard_frames(
+                agent_e, cfg, input_, skip_thought=skip_thought, timeout=timeout, coalescer=coalescer
+            )
+        )
+
+    async def astream_standard_event(
+        self,
+        agent_e,
+        cfg,
+        input_,
+        skip_thought=True,
+        timeout: Optional[int] = None,
+        coalescer: Optional[ChunkCoalescer] = None,
+    ) -> AsyncGenerator[str, None]:
         """
-        run_info = defaultdict(dict)
-        first_chunk = True
-        final_result = ""
-        last_ret_is_empty = False
-        front_end_display = True
-        if is_deepseek_r1_series_models(self.llm) or "deepseek-v3" in self.llm.model_name:
-            # 用于去除 think 标识位
-            max_cache_length = 50
-            cache = deque(maxlen=max_cache_length)
-            agent_think_start_time = time.time()
-            # 用于判断 done 之前的最后一个 event 类型
-            last_event_type = None
-            final_answer_prefix_to_filter = None
-            final_answer_suffix_to_filter = None
-            if isinstance(self, StructuredChatCommonQAAgent):
+        stream_standard_event 的原生 asyncio 版本
+        直接在调用方的事件循环上消费 astream_events，不再额外起线程和事件循环做同步桥接
+        """
+        frames = self.get_sse_frame_batcher().abatch(
+            self._aiter_standard_frames(
+                agent_e, cfg, input_, skip_thought=skip_thought, timeout=timeout, coalescer=coalescer
+            )
+        )
+        async with aclosing(frames):
+            async for frame in frames:
+                yield frame
+
+    def _iter_standard_frames(
+        self, agent_e, cfg, input_, skip_thought=True, timeout=None, coalescer: Optional[ChunkCoalescer] = None
+    ):
+        encoder = self.get_sse_encoder()
+        rets = self._iter_standard_events(agent_e, cfg, input_, skip_thought=skip_thought, timeout=timeout)
+        with closing((coalescer or ChunkCoalescer()).coalesce(rets)) as rets:
+            for ret in rets:
+                yield encoder.encode(ret)
+        yield encoder.DONE_FRAME
+
+    async def _aiter_standard_frames(
+        self, agent_e, cfg, input_, skip_thought=True, timeout=None, coalescer: Optional[ChunkCoalescer] = None
+    ) -> AsyncGenerator[str, None]:
+        encoder = self.get_sse_encoder()
+        rets = self._aiter_standard_events(agent_e, cfg, input_, skip_thought=skip_thought, timeout=timeout)
+        async with aclosing((coalescer or ChunkCoalescer()).acoalesce(rets)) as rets:
+            async for ret in rets:
+                yield encoder.encode(ret)
+        yield encoder.DONE_FRAME
+
+    def _iter_standard_events(self, agent_e, cfg, input_, skip_thought=True, timeout=None) -> Iterator[Dict]:
+        processor = self.get_stream_event_processor(skip_thought=skip_thought)
+        try:
+            # NOTE: 客户端断开时外层会 close 当前生成器，需要同步关闭 stream_events 以取消底层的异步任务
+            with closing(agent_e.stream_events(input_, config=cfg, version="v2", timeout=timeout)) as events:
+                for item in events:
+                    yield from processor.process(item)
+            yield from processor.finish()
+        except Exception as exception:
+            yield processor.error(exception)
+
+    async def _aiter_standard_events(
+        self, agent_e, cfg, input_, skip_thought=True, timeout=None
+    ) -> AsyncGenerator[Dict, None]:
+        processor = self.get_stream_event_processor(skip_thought=skip_thought)
+        try:
+            aiter = agent_e.astream_events(input_, config=cfg, version="v2")
+            if timeout:
+                aiter = async_generator_with_timeout(aiter, timeout=timeout)
+            async with aclosing(aiter) as events:
+                async for item in events:
+                    for ret in processor.process(item):
+                        yield ret
+            for ret in processor.finish():
+                yield ret
+        except Exception as exception:
+            yield processor.error(exception)
+
+
+class ThinkTextSplitter:
+    """
+    将 deepseek 系列模型的 think/text event 流增量地过滤后输出
+
+    think 和 text 各自使用一个 StreamingPatternFilter 剔除标识位，每个 chunk 只需要处理本身以及不超过最长模式长度的暂存内容，
+    不再需要在每个 chunk 到来时把缓冲队列中的全部内容重新拼接匹配。
+    """
+
+    THINK: ClassVar[str] = EventType.THINK.value
+    TEXT: ClassVar[str] = EventType.TEXT.value
+
+    def __init__(self, think_filter: StreamingPatternFilter):
+        # 出现 Final Answer 模式之前 text 不需要过滤
+        self._filters = {self.THINK: think_filter, self.TEXT: StreamingPatternFilter({})}
+        self._pending_cover = {self.THINK: False, self.TEXT: False}
+        self.last_event_type: Optional[str] = None
+
+    @property
+    def text_filter(self) -> Union[StreamingPatternFilter, StreamingPatternFilterChain]:
+        return self._filters[self.TEXT]
+
+    @text_filter.setter
+    def text_filter(self, value: Union[StreamingPatternFilter, StreamingPatternFilterChain]):
+        self._filters[self.TEXT] = value
+
+    def process(self, ret: Dict) -> Iterator[Dict]:
+        """处理一条 event，产出过滤后可以发送的 event"""
+        event_type = ret.get("event")
+        if "content" not in ret or event_type not in self._filters:
+            # reference_doc 等非内容 event 需要保持与前后内容的顺序
+            yield from self.flush()
+            yield self._emit(ret)
+            return
+        # event 类型切换时，上一种类型暂存的内容不会再有后续，直接输出
+        other_type = self.TEXT if event_type == self.THINK else self.THINK
+        if self._filters[other_type].pending:
+            yield from self._flush_type(other_type)
+
+        pattern_filter = self._filters[event_type]
+        if ret.get("cover"):
+            self._pending_cover[event_type] = True
+        content = pattern_filter.feed(ret["content"])
+        if elapsed_time := ret.get("elapsed_time"):
+            # 带 elapsed_time 的 think event 意味着思考结束，需要将暂存的内容一并带上
+            content += pattern_filter.flush()
+            yield self._emit_content(event_type, content, elapsed_time=elapsed_time)
+        elif content:
+            yield self._emit_content(event_type, content)
+
+    def flush(self) -> Iterator[Dict]:
+        """输出全部暂存的内容"""
+        yield from self._flush_type(self.THINK)
+        yield from self._flush_type(self.TEXT)
+
+    def finish(self, end_content: str) -> Iterator[Dict]:
+        """
+        输入结束：拼接结束标志后输出剩余内容
+        如果结束标志没有连同 final_answer_suffix 一起被剔除，则需要手工去除
+        """
+        yield from self._flush_type(self.THINK)
+        content = self.text_filter.feed(end_content) + self.text_filter.flush()
+        if content.endswith(end_content):
+            content = content[: -len(end_content)]
+        if content:
+            yield self._emit_content(self.TEXT, content)
+
+    def _flush_type(self, event_type: str) -> Iterator[Dict]:
+        if content := self._filters[event_type].flush():
+            yield self._emit_content(event_type, content)
+
+    def _emit_content(self, event_type: str, content: str, **extra) -> Dict:
+        ret = {"event": event_type, "content": content, "cover": self._pending_cover[event_type], **extra}
+        self._pending_cover[event_type] = False
+        self.last_event_type = event_type
+        return ret
+
+    def _emit(self, ret: Dict) -> Dict:
+        self.last_event_type = ret["event"]
+        return ret
+
+
+class StandardEventProcessor:
+    """
+    将 agent 的 stream event 转换为前端使用的标准 event
+
+    只负责逐条处理 event 并维护处理过程中的状态，与 event 的来源（同步/异步）无关，
+    供 stream_standard_event 和 astream_standard_event 共用
+    """
+
+    def __init__(self, agent: CommonQAStreamingMixIn, skip_thought: bool = True):
+        self.agent = agent
+        self.skip_thought = skip_thought
+        self.run_info = defaultdict(dict)
+        self.first_chunk = True
+        self.final_result = ""
+        self.last_ret_is_empty = False
+        self.front_end_display = True
+        self.cover = False
+        self.is_deepseek = is_deepseek_r1_series_models(agent.llm) or "deepseek-v3" in agent.llm.model_name
+        self.is_structured_chat = isinstance(agent, StructuredChatCommonQAAgent)
+        self.is_tool_calling = isinstance(agent, ToolCallingCommonQAAgent)
+        if self.is_deepseek:
+            # 用于去除 think 标识位，StructuredChatCommonQAAgent 还需要从 think 中去除 final_answer_prefix
+            think_symbols = {symbol: "" for symbol in agent.think_symbols}
+            if self.is_structured_chat:
+                think_symbols.update({prefix: "" for prefix in agent.final_answer_prefixes})
+            self.splitter = ThinkTextSplitter(StreamingPatternFilter(think_symbols))
+            self.agent_think_start_time = time.time()
+            if self.is_structured_chat:
                 # 在 StructuredChatCommonQAAgent 中用于合并 agent action 中间过程
                 # 在出现 Final Answer 模式之前的所有过程都视为 agent 的 think 过程，因此初始化为 EventType.THINK.value
-                cur_event_type = EventType.THINK.value
-                final_answer_occurred = False
-                first_time_final_answer = True
-            elif isinstance(self, ToolCallingCommonQAAgent):
-                has_sent_elapsed_time = False
-        try:
-            for item in agent_e.stream_events(input_, config=cfg, version="v2", timeout=timeout):
-                ret = {}
-                recall_ret = {}
-                if item == Empty:
-                    if last_ret_is_empty or first_chunk:
+                self.cur_event_type = EventType.THINK.value
+                self.final_answer_occurred = False
+            elif self.is_tool_calling:
+                self.has_sent_elapsed_time = False
+
+    def process(self, item) -> Iterator[Dict]:
+        """处理一条 stream event，产出需要发送给前端的 event"""
+        agent = self.agent
+        ret = {}
+        recall_ret = {}
+        if item == Empty:
+            if self.last_ret_is_empty or self.first_chunk:
+                ret = {
+                    "event": EventType.TEXT.value,
+                    "content": agent.LOADING_AGENT_MESSAGE,
+                    "cover": self.last_ret_is_empty,
+                }
+        else:
+            cover = self.cover = bool(self.last_ret_is_empty)
+            if item["event"] == "on_chat_model_stream" and self.front_end_display:
+                if item["data"]["chunk"].tool_calls:
+                    self.run_info[item["run_id"]]["tool_call"] = True
+                is_tool_call = self.run_info[item["run_id"]].get("tool_call")
+                if self.skip_thought and is_tool_call:
+                    return
+                if not item["data"]["chunk"].content and not item["data"]["chunk"].additional_kwargs.get(
+                    "reasoning_content", None
+                ):
+                    return
+                if self.is_deepseek:
+                    if self.is_structured_chat:
+                        # 如果是 StructuredChatCommonQAAgent，则会将所有中间 action 步骤也归为 think
+                        # 判断最终答案的逻辑在后面，所以这里先统一成 text
+                        if reasoning_content := item["data"]["chunk"].additional_kwargs.get("reasoning_content", None):
+                            content = reasoning_content
+                        else:
+                            content = item["data"]["chunk"].content
                         ret = {
                             "event": EventType.TEXT.value,
-                            "content": self.LOADING_AGENT_MESSAGE,
-                            "cover": last_ret_is_empty,
+                            "content": content,
+                            "cover": cover,
                         }
-                else:
-                    cover = bool(last_ret_is_empty)
-                    if item["event"] == "on_chat_model_stream" and front_end_display:
-                        if item["data"]["chunk"].tool_calls:
-                            run_info[item["run_id"]]["tool_call"] = True
-                        is_tool_call = run_info[item["run_id"]].get("tool_call")
-                        if skip_thought and is_tool_call:
-                            continue
-                        if not item["data"]["chunk"].content and not item["data"]["chunk"].additional_kwargs.get(
-                            "reasoning_content", None
-                        ):
-                            continue
-                        if is_deepseek_r1_series_models(self.llm) or "deepseek-v3" in self.llm.model_name:
-                            if isinstance(self, StructuredChatCommonQAAgent):
-                                # 如果是 StructuredChatCommonQAAgent，则会将所有中间 action 步骤也归为 think
-                                # 判断最终答案的逻辑在后面，所以这里先统一成 text
-                                if reasoning_content := item["data"]["chunk"].additional_kwargs.get(
-                                    "reasoning_content", None
-                                ):
-                                    content = reasoning_content
-                                else:
-                                    content = item["data"]["chunk"].content
-                                ret = {
-                                    "event": EventType.TEXT.value,
-                                    "content": content,
-                                    "cover": cover,
-                                }
-                            elif isinstance(self, ToolCallingCommonQAAgent):
-                                # 如果是 CommonQAAgent，则判断最终答案的逻辑在这里
-                                if reasoning_content := item["data"]["chunk"].additional_kwargs.get(
-                                    "reasoning_content", None
-                                ):
-                                    ret = {
-                                        "event": EventType.THINK.value,
-                                        "content": reasoning_content,
-                                        "cover": cover,
-                                    }
-                                else:
-                                    # 如果首次收到 text 内容，说明是从 think 逻辑切过来的，需要先补发一条带 elapsed_time
-                                    # 的 think event 以供识别
-                                    if not has_sent_elapsed_time:
-                                        has_sent_elapsed_time = True
-                                        ret = {
-                                            "event": EventType.THINK.value,
-                                            "content": "\n",
-                                            "cover": False,
-                                            "elapsed_time": (time.time() - agent_think_start_time) * 1000,
-                                        }
-                                        cache.append(ret)
-                                    ret = {
-                                        "event": EventType.TEXT.value,
-                                        "content": item["data"]["chunk"].content,
-                                        "cover": cover,
-                                    }
-                        else:
-                            ret = {
-                                "event": EventType.TEXT.value,
-                                "content": item["data"]["chunk"].content,
-                                "cover": cover,
-                            }
-                        final_result += ret["content"]
-                    elif item["event"] == "on_custom_event":
-                        if "front_end_display" in item["data"]:
-                            # 如果接收到 front_end_display 标识位的信息，则更新 front_end_display
-                            front_end_display = item["data"]["front_end_display"]
-                        elif "custom_return_chunk" in item["data"] and front_end_display:
-                            ret = {
-                                "event": EventType.TEXT.value,
-                                "content": item["data"]["custom_return_chunk"],
-                                "cover": cover,
-                            }
-                            final_result += ret["content"]
-                        elif "reference_doc" in item["data"] and front_end_display:
-                            ret = {
-                                "event": EventType.REFERENCE_DOC.value,
-                                "documents": item["data"]["reference_doc"],
-                                "cover": cover,
-                            }
-                        elif "compress_log" in item["data"] and front_end_display:
+                    elif self.is_tool_calling:
+                        # 如果是 CommonQAAgent，则判断最终答案的逻辑在这里
+                        if reasoning_content := item["data"]["chunk"].additional_kwargs.get("reasoning_content", None):
                             ret = {
                                 "event": EventType.THINK.value,
-                                "content": item["data"]["compress_log"],
+                                "content": reasoning_content,
                                 "cover": cover,
                             }
-                        elif "custom_agent_finish" in item["data"] and front_end_display:
-                            # 专为用户需自定义 agent finish 逻辑且需要使用 stream 调用的情况设计
+                        else:
+                            # 如果首次收到 text 内容，说明是从 think 逻辑切过来的，需要先补发一条带 elapsed_time
+                            # 的 think event 以供识别
+                            if not self.has_sent_elapsed_time:
+                                self.has_sent_elapsed_time = True
+                                yield from self.splitter.process(
+                                    {
+                                        "event": EventType.THINK.value,
+                                        "content": "\n",
+                                        "cover": False,
+                                        "elapsed_time": (time.time() - self.agent_think_start_time) * 1000,
+                                    }
+                                )
                             ret = {
                                 "event": EventType.TEXT.value,
-                                "content": item["data"]["custom_agent_finish"],
+                                "content": item["data"]["chunk"].content,
                                 "cover": cover,
                             }
-                            final_result += item["data"]["custom_agent_finish"]
-                    elif isinstance(self, StructuredChatCommonQAAgent) and item["event"] == "on_tool_end":
-                        # TODO: 可能需要考虑异步是否会导致event的乱序问题
-                        # 打印工具输出
-                        tool_output_content = str(item["data"]["output"])
-                        # 报错信息封装
-                        if " is not a valid tool, try one of " in tool_output_content:
-                            err_tool = tool_output_content.split(" is not a valid tool, try one of ")[0]
-                            tool_output_content = f"LLM 选择的工具“{err_tool}”超出了给定工具的范围，本次工具调用失败。"
-                        elif tool_output_content == ACTION_INPUT_ERR_MSG:
-                            tool_output_content = "LLM 生成的工具调用参数不正确，本次工具调用失败。"
-                        elif tool_output_content == OUTPUT_PARSER_ERR_MSG:
-                            tool_output_content = OUTPUT_PARSER_ERR_MSG
-
-                        max_tool_output_len = 500
-                        if len(tool_output_content) > max_tool_output_len:
-                            tool_output_content = tool_output_content[:max_tool_output_len] + "（内容过长，已截断）"
-                        # NOTE: 重要操作！
-                        # 由于 LLM 输出结果不可控，为了防止 stream 过程中输出的 JSON BLOB 中有开始的 ``` 而没有结束的 ```
-                        # 这里在返回工具调用结果之前，前判断当前 final_result 中 ``` 已经出现的次数
-                        # 如果是奇数次，则手工拼接一个 ``` 防止前端渲染的时候乱了
-                        log_prefix = "\n```\n" if final_result.count("```") % 2 == 1 else ""
-                        ret = {
-                            "event": EventType.TEXT.value,
-                            "content": (
-                                f"{log_prefix}\n\n以下是该 Agent Action 的结果："
-                                f"\n```text\n{tool_output_content}\n```\n\n"
-                            ),
-                            "cover": cover,
-                        }
-                        final_result += ret["content"]
-                    if isinstance(self, StructuredChatCommonQAAgent):
-                        if "content" in ret:
-                            ret["event"] = cur_event_type
-                        # 一旦出现 Final Answer 模式，之后的所有过程都视为 agent 的正式回答过程
-                        if not final_answer_occurred:
-                            for final_answer_prefix, final_answer_suffix in zip(
-                                self.final_answer_prefixes, self.final_answer_suffixes
-                            ):
-                                if final_answer_prefix in final_result:
-                                    final_answer_occurred = True
-                                    final_answer_prefix_to_filter = final_answer_prefix
-                                    # 注：后续放到 cache 前的 ret 内容从出现 final answer 的下一次开始进行了针对 \n 的转义操作
-                                    # 为了不影响命中，此处也同步进行相同的转义操作
-                                    final_answer_suffix_to_filter = final_answer_suffix.replace("\\n", "\n")
-                                    # 需要加上特殊的 end_content 才能作为最终的 final_answer_suffix
-                                    final_answer_suffix_to_filter += deepcopy(self.end_content)
-                                    if not final_result.endswith(final_answer_prefix):
-                                        # 这种情况下说明最终答案有一小块跟在了 final_answer_prefix 最后一个块的后面
-                                        # 需要将这块内容补回来，并将 think 末尾的那段内容截掉
-                                        start_index = final_result.find(final_answer_prefix)
-                                        if start_index == -1:
-                                            raise RuntimeError(
-                                                f"结果子串提取有误。\nfinal_result: {final_result}\n"
-                                                f"final_answer_prefix: {final_answer_prefix}\n"
-                                            )
-                                        end_index = start_index + len(final_answer_prefix)
-                                        recall_ret_prefix_content = final_result[end_index:]
-                                        try:
-                                            ret["content"] = ret["content"][: -len(recall_ret_prefix_content)]
-                                        except Exception:
-                                            raise RuntimeError(
-                                                f"子串去除有误。\nret: {ret}\n"
-                                                f"recall_ret_prefix_content: {recall_ret_prefix_content}\n"
-                                            )
-                                        # 处理 json 格式内的 final answer 的内容（包含被转义的情况）以供 markdown 渲染。
-                                        # TODO: 同步更新 final_result
-                                        # NOTE: 需要在上述 ret["content"][: -len(recall_ret_prefix_content)] 之后
-                                        # 执行这个动作！否则会把 ret["content"] 多去了一个字符
-                                        recall_ret_prefix_content = recall_ret_prefix_content.replace("\\n", "\n")
-                                        recall_ret = {
-                                            "event": EventType.TEXT.value,
-                                            "content": recall_ret_prefix_content,
-                                            "cover": cover,
-                                        }
-                                    cur_event_type = EventType.TEXT.value
-                                    ret["elapsed_time"] = (time.time() - agent_think_start_time) * 1000
-                                    break
-                        if final_answer_occurred and not first_time_final_answer:  # noqa: SIM102
-                            # NOTE: final_answer_suffix 有可能不在同一个 ret 的 content 中，
-                            # 所以 final_answer_suffix 不能在此处原地剔除，
-                            # 需要在 cache 中合并判断和剔除。例子如下所示：
-                            # =====> {'event': 'text', 'content': '）。', 'cover': False}
-                            # =====> {'event': 'text', 'content': '"\n', 'cover': False}
-                            # =====> {'event': 'text', 'content': '}\n', 'cover': False}
-                            # =====> {'event': 'text', 'content': '```', 'cover': False}
-                            # NOTE: 如果 first_time_final_answer 为 True，则是刚从 think 变成 text 的时候，
-                            # 当前的 ret 就还不属于 final answer 类型，因此不能进入本分支
-
-                            # 以下内容用于处理 json 格式内的 final answer 的内容（包含被转义的情况）以供 markdown 渲染。
-                            # TODO: 同步更新 final_result
-                            # 目前仅支持处理换行符：\\n --> \n
-                            if "content" in ret:
-                                ret["content"] = ret["content"].replace("\\n", "\n")
-                                if (
-                                    cache
-                                    and cache[-1].get("content", "").endswith("\\")
-                                    and ret["content"].startswith("n")
-                                ):
-                                    # 处理这样的case：
-                                    # data: {"event": "text", "content": "如下", "cover": false}
-                                    # data: {"event": "text", "content": "：", "cover": false}
-                                    # data: {"event": "text", "content": "\\", "cover": false}
-                                    # data: {"event": "text", "content": "n1", "cover": false}
-                                    # data: {"event": "text", "content": ".", "cover": false}
-                                    # data: {"event": "text", "content": " 下", "cover": false}
-                                    # data: {"event": "text", "content": "载", "cover": false}
-                                    cache[-1]["content"] = cache[-1]["content"][:-1]
-                                    ret["content"] = "\n" + ret["content"][1:]
-                        # 更新标识变量
-                        if final_answer_occurred:
-                            first_time_final_answer = False
-                if ret:
-                    first_chunk = False
-                    last_ret_is_empty = ret.get("content", "") == self.LOADING_AGENT_MESSAGE
-                    if is_deepseek_r1_series_models(self.llm) or "deepseek-v3" in self.llm.model_name:
-                        if ret.get("content", "") == self.LOADING_AGENT_MESSAGE:
-                            last_event_type = ret["event"]
-                            yield f"data: {json.dumps(ret)}\n\n"
-                        else:
-                            # NOTE: 只有非 self.LOADING_AGENT_MESSAGE 的 event 可以放到 cache 中
-                            cache.append(ret)
-                            if recall_ret:
-                                # 如果 cache 非空，先 pop 最开始的元素，再将补充的 recall_ret 给添加进来
-                                if cache:
-                                    ret = cache.popleft()
-                                    last_event_type = ret["event"]
-                                    yield f"data: {json.dumps(ret)}\n\n"
-                                cache.append(recall_ret)
-                            cache = self.cache_filter(
-                                cache, final_answer_prefix_to_filter, final_answer_suffix_to_filter
-                            )
-                            if len(cache) == max_cache_length:
-                                ret = cache.popleft()
-                                last_event_type = ret["event"]
-                                yield f"data: {json.dumps(ret)}\n\n"
-                    else:
-                        yield f"data: {json.dumps(ret)}\n\n"
-            if is_deepseek_r1_series_models(self.llm) or "deepseek-v3" in self.llm.model_name:
-                if isinstance(self, StructuredChatCommonQAAgent):
-                    # 以下逻辑用于利用 self.end_content 标志跟 final_answer_suffix_to_filter 拼接后进行尾部去除
-                    if len(cache) == max_cache_length:
-                        ret = cache.popleft()
-                        last_event_type = ret["event"]
-                        yield f"data: {json.dumps(ret)}\n\n"
-                    end_ret = {
+                else:
+                    ret = {
                         "event": EventType.TEXT.value,
-                        "content": deepcopy(self.end_content),
-                        "cover": False,
+                        "content": item["data"]["chunk"].content,
+                        "cover": cover,
                     }
-                    cache.append(end_ret)
-                    len_before_filtering = len(cache)
-                    cache = self.cache_filter(cache, final_answer_prefix_to_filter, final_answer_suffix_to_filter)
-                    if len(cache) == len_before_filtering:
-                        # 如果没 filter 到，则还是将 end_ret 剔除
-                        cache.pop()
-
-                while cache:
-                    ret = cache.popleft()
-                    last_event_type = ret["event"]
-                    yield f"data: {json.dumps(ret)}\n\n"
-                for think_symbol in self.think_symbols:
-                    final_result = final_result.replace(think_symbol, "")
-                # 如果 done 之前的最后一个 event 是 think 类型，则说明从 think 内容中解析结论失败，需额外发送一条 text event，
-                # 防止报错：
-                # {\"result\":false,\"data\":null,\"code\":\"1500400\",\"message\":\"content: 该字段不能为空。\"}" }
-                if last_event_type == EventType.THINK.value:
-                    # 先发一个确保带 elapsed_time 的 think ret
+                self.final_result += ret["content"]
+            elif item["event"] == "on_custom_event":
+                if "front_end_display" in item["data"]:
+                    # 如果接收到 front_end_display 标识位的信息，则更新 front_end_display
+                    self.front_end_display = item["data"]["front_end_display"]
+                elif "custom_return_chunk" in item["data"] and self.front_end_display:
+                    ret = {
+                        "event": EventType.TEXT.value,
+                        "content": item["data"]["custom_return_chunk"],
+                        "cover": cover,
+                    }
+                    self.final_result += ret["content"]
+                elif "reference_doc" in item["data"] and self.front_end_display:
+                    ret = {
+                        "event": EventType.REFERENCE_DOC.value,
+                        "documents": item["data"]["reference_doc"],
+                        "cover": cover,
+                    }
+                elif "compress_log" in item["data"] and self.front_end_display:
                     ret = {
                         "event": EventType.THINK.value,
-                        "content": "\n",
-                        "cover": False,
-                        "elapsed_time": (time.time() - agent_think_start_time) * 1000,
+                        "content": item["data"]["compress_log"],
+                        "cover": cover,
                     }
-                    yield f"data: {json.dumps(ret)}\n\n"
-                    # 再发一个确保为 text 的 ret
-                    _logger.warning(
-                        "Fail to derive the final answer from the thinking process. "
-                        f"The final result is: \n{final_result}\n"
-                    )
+                elif "custom_agent_finish" in item["data"] and self.front_end_display:
+                    # 专为用户需自定义 agent finish 逻辑且需要使用 stream 调用的情况设计
                     ret = {
                         "event": EventType.TEXT.value,
-                        "content": "尝试从思考内容中解析最终结论失败。",
+                        "content": item["data"]["custom_agent_finish"],
                         "cover": cover,
                     }
-                    yield f"data: {json.dumps(ret)}\n\n"
-            # cover 为 True 时，final_result 为 stream 结束后需要最终显示的结果，可根据需要重新拼接
-            # cover 为 False 时不进行覆盖
-            cover = False
-
-            ret = {
-                "event": EventType.DONE.value,
-                "content": final_result,
-                "cover": cover,
-            }
-            yield f"data: {json.dumps(ret)}\n\n"
-        except Exception as exception:
-            ret = {
-                "event": "error",
-                "code": exception.code if hasattr(exception, "code") else 400,
-                "message": exception.response_data() if hasattr(exception, "response_data") else str(exception),
-            }
-            _logger.exception(exception)
-            yield f"data: {json.dumps(ret)}\n\n"
-        finally:
-            yield "data: [DONE]\n\n"
+                    self.final_result += item["data"]["custom_agent_finish"]
+            elif self.is_structured_chat and item["event"] == "on_tool_end":
+                # TODO: 可能需要考虑异步是否会导致event的乱序问题
+                # 打印工具输出
+                tool_output_content = str(item["data"]["output"])
+                # 报错信息封装
+                if " is not a valid tool, try one of " in tool_output_content:
+                    err_tool = tool_output_content.split(" is not a valid tool, try one of ")[0]
+                    tool_output_content = f"LLM 选择的工具“{err_tool}”超出了给定工具的范围，本次工具调用失败。"
+                elif tool_output_content == ACTION_INPUT_ERR_MSG:
+                    tool_output_content = "LLM 生成的工具调用参数不正确，本次工具调用失败。"
+                elif tool_output_content == OUTPUT_PARSER_ERR_MSG:
+                    tool_output_content = OUTPUT_PARSER_ERR_MSG
+
+                max_tool_output_len = 500
+                if len(tool_output_content) > max_tool_output_len:
+                    tool_output_content = tool_output_content[:max_tool_output_len] + "（内容过长，已截断）"
+                # NOTE: 重要操作！
+                # 由于 LLM 输出结果不可控，为了防止 stream 过程中输出的 JSON BLOB 中有开始的 ``` 而没有结束的 ```
+                # 这里在返回工具调用结果之前，前判断当前 final_result 中 ``` 已经出现的次数
+                # 如果是奇数次，则手工拼接一个 ``` 防止前端渲染的时候乱了
+                log_prefix = "\n```\n" if self.final_result.count("```") % 2 == 1 else ""
+                ret = {
+                    "event": EventType.TEXT.value,
+                    "content": (
+                        f"{log_prefix}\n\n以下是该 Agent Action 的结果：\n```text\n{tool_output_content}\n```\n\n"
+                    ),
+                    "cover": cover,
+                }
+                self.final_result += ret["content"]
+            if self.is_structured_chat:
+                recall_ret = self._detect_final_answer(ret, cover)
+        if not ret:
+            return
+        self.first_chunk = False
+        self.last_ret_is_empty = ret.get("content", "") == agent.LOADING_AGENT_MESSAGE
+        if not self.is_deepseek or ret.get("content", "") == agent.LOADING_AGENT_MESSAGE:
+            # NOTE: self.LOADING_AGENT_MESSAGE 的 event 不需要经过过滤
+            if self.is_deepseek:
+                self.splitter.last_event_type = ret["event"]
+            yield ret
+        else:
+            yield from self.splitter.process(ret)
+            if recall_ret:
+                yield from self.splitter.process(recall_ret)
+
+    def _detect_final_answer(self, ret: Dict, cover: bool) -> Dict:
+        """StructuredChatCommonQAAgent 专用：判断是否出现 Final Answer 模式，返回需要补发的 recall_ret"""
+        agent = self.agent
+        recall_ret = {}
+        if "content" in ret:
+            ret["event"] = self.cur_event_type
+        # 一旦出现 Final Answer 模式，之后的所有过程都视为 agent 的正式回答过程
+        if not self.final_answer_occurred:
+            for final_answer_prefix, final_answer_suffix in zip(
+                agent.final_answer_prefixes, agent.final_answer_suffixes
+            ):
+                if final_answer_prefix in self.final_result:
+                    self.final_answer_occurred = True
+                    # final answer 的内容在 json 中，需要先处理转义（目前仅支持处理换行符：\\n --> \n）以供 markdown 渲染，
+                    # 再剔除 final_answer_suffix；被转义的换行符可能被拆分在相邻的两个 chunk 中，因此同样需要流式处理
+                    # 需要加上特殊的 end_content 才能作为最终的 final_answer_suffix
+                    # TODO: 同步更新 final_result
+                    self.splitter.text_filter = StreamingPatternFilterChain(
+                        [
+                            StreamingPatternFilter({"\\n": "\n"}),
+                            StreamingPatternFilter({final_answer_suffix.replace("\\n", "\n") + agent.end_content: ""}),
+                        ]
+                    )
+                    if not self.final_result.endswith(final_answer_prefix):
+                        # 这种情况下说明最终答案有一小块跟在了 final_answer_prefix 最后一个块的后面
+                        # 需要将这块内容补回来，并将 think 末尾的那段内容截掉
+                        start_index = self.final_result.find(final_answer_prefix)
+                        if start_index == -1:
+                            raise RuntimeError(
+                                f"结果子串提取有误。\nfinal_result: {self.final_result}\n"
+                                f"final_answer_prefix: {final_answer_prefix}\n"
+                            )
+                        end_index = start_index + len(final_answer_prefix)
+                        recall_ret_prefix_content = self.final_result[end_index:]
+                        try:
+                            ret["content"] = ret["content"][: -len(recall_ret_prefix_content)]
+                        except Exception:
+                            raise RuntimeError(
+                                f"子串去除有误。\nret: {ret}\nrecall_ret_prefix_content: {recall_ret_prefix_content}\n"
+                            )
+                        recall_ret = {
+                            "event": EventType.TEXT.value,
+                            "content": recall_ret_prefix_content,
+                            "cover": cover,
+                        }
+                    self.cur_event_type = EventType.TEXT.value
+                    ret["elapsed_time"] = (time.time() - self.agent_think_start_time) * 1000
+                    break
+        return recall_ret
+
+    def finish(self) -> Iterator[Dict]:
+        """event 流正常结束后，产出剩余的 event 以及 done event"""
+        agent = self.agent
+        if self.is_deepseek:
+            if self.is_structured_chat:
+                # 利用 self.end_content 标志跟 final_answer_suffix 拼接后进行尾部去除
+                yield from self.splitter.finish(agent.end_content)
+            else:
+                yield from self.splitter.flush()
+            for think_symbol in agent.think_symbols:
+                self.final_result = self.final_result.replace(think_symbol, "")
+            # 如果 done 之前的最后一个 event 是 think 类型，则说明从 think 内容中解析结论失败，需额外发送一条 text event，
+            # 防止报错：
+            # {\"result\":false,\"data\":null,\"code\":\"1500400\",\"message\":\"content: 该字段不能为空。\"}" }
+            if self.splitter.last_event_type == EventType.THINK.value:
+                # 先发一个确保带 elapsed_time 的 think ret
+                yield {
+                    "event": EventType.THINK.value,
+                    "content": "\n",
+                    "cover": False,
+                    "elapsed_time": (time.time() - self.agent_think_start_time) * 1000,
+                }
+                # 再发一个确保为 text 的 ret
+                _logger.warning(
+                    "Fail to derive the final answer from the thinking process. "
+                    f"The final result is: \n{self.final_result}\n"
+                )
+                yield {
+                    "event": EventType.TEXT.value,
+                    "content": "尝试从思考内容中解析最终结论失败。",
+                    "cover": self.cover,
+                }
+        # cover 为 True 时，final_result 为 stream 结束后需要最终显示的结果，可根据需要重新拼接
+        # cover 为 False 时不进行覆盖
+        yield {
+            "event": EventType.DONE.value,
+            "content": self.final_result,
+            "cover": False,
+        }
+
+    def error(self, exception: Exception) -> Dict:
+        """将异常转换为 error event"""
+        _logger.exception(exception)
+        return {
+            "event": "error",
+            "code": exception.code if hasattr(exception, "code") else 400,
+            "message": exception.response_data() if hasattr(exception, "response_data") else str(exception),
+        }
 
 
 class ToolCallingCommonQAAgent(IntentRecognitionMixin, CommonQAStreamingMixIn, MultiToolCallCommonAgent):
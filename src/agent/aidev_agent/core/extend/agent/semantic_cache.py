@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+from typing import Any, Callable, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel, Field
+
+from aidev_agent.config import settings
+
+_logger = getLogger(__name__)
+
+
+class CachedAnswer(BaseModel):
+    query: str
+    answer: str
+    reference_doc: List[Any] = Field(default_factory=list)
+
+
+class SemanticCacheScope(NamedTuple):
+    """缓存作用域：key 由 agent 配置和知识库内容共同决定，知识库 id 用于按知识库主动失效"""
+
+    key: str
+    knowledge_base_ids: FrozenSet[str]
+
+
+class FlatVectorIndex:
+    """
+    定长的扁平向量索引
+
+    向量归一化后存放在连续的 float32 矩阵中，内积即余弦相似度；写满之后覆盖最早写入的条目。
+    单个作用域内的条目数有限（一般不超过几千），暴力检索一次矩阵乘法即可完成，不需要引入近似检索。
+    矩阵按需成倍扩容，直到 capacity：大多数作用域只有少量条目，不预先按容量分配内存。
+    """
+
+    INITIAL_ROWS = 16
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, self.INITIAL_ROWS), dim), dtype=np.float32)
+        self.payloads: List[Any] = []
+        self.size = 0
+        self._cursor = 0
+
+    def _ensure_capacity(self, size: int):
+        if size > len(self.vectors):
+            vectors = np.zeros((min(max(size, 2 * len(self.vectors)), self.capacity), self.dim), dtype=np.float32)
+            vectors[: self.size] = self.vectors[: self.size]
+            self.vectors = vectors
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def search(self, vector: np.ndarray) -> Tuple[int, float]:
+        if not self.size:
+            return -1, -1.0
+        scores = self.vectors[: self.size] @ vector
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def add(self, vector: np.ndarray, payload: Any) -> int:
+        index = self._cursor
+        if index == self.size:
+            self._ensure_capacity(index + 1)
+            self.payloads.append(payload)
+        else:
+            self.payloads[index] = payload
+        self.vectors[index] = vector
+        self._cursor = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return index
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def _digest(data: Any) -> str:
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存：相似问题直接返回之前的最终答案和引用文档
+
+    每个作用域（agent 配置 + 知识库集合）对应一个独立的向量索引，作用域之间按 LRU 淘汰。
+    知识库内容发生变化时其描述信息（更新时间、文档数等）随之变化，会落到新的作用域中，旧作用域自然被淘汰；
+    也可以通过 invalidate 主动清理某个知识库相关的缓存。
+    """
+
+    def __init__(
+        self,
+        embeddings_factory: Optional[Callable[[], Embeddings]] = None,
+        threshold: float = 0.95,
+        capacity: int = 1024,
+        max_scopes: int = 128,
+        enabled: bool = True,
+    ):
+        self.embeddings_factory = embeddings_factory
+        self.threshold = threshold
+        self.capacity = capacity
+        self.max_scopes = max_scopes
+        self.enabled = enabled and embeddings_factory is not None and capacity > 0 and max_scopes > 0
+        self.hits = 0
+        self.misses = 0
+        self._embeddings: Optional[Embeddings] = None
+        self._scopes: "OrderedDict[str, Tuple[FlatVectorIndex, FrozenSet[str]]]" = OrderedDict()
+        self._lock = Lock()
+
+    @classmethod
+    def from_settings(cls) -> "SemanticAnswerCache":
+        if not (settings.SEMANTIC_CACHE_ENABLED and settings.SEMANTIC_CACHE_EMBEDDING_MODEL):
+            return cls(enabled=False)
+
+        def embeddings_factory():
+            from aidev_agent.core.extend.models.llm_gateway import Embeddings
+
+            return Embeddings.get_setup_instance(model=settings.SEMANTIC_CACHE_EMBEDDING_MODEL)
+
+        return cls(
+            embeddings_factory,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            capacity=settings.SEMANTIC_CACHE_CAPACITY,
+            max_scopes=settings.SEMANTIC_CACHE_MAX_SCOPES,
+        )
+
+    @staticmethod
+    def make_scope(
+        *parts: Any,
+        knowledge_bases: Optional[Sequence[dict]] = None,
+        knowledge_items: Optional[Sequence[dict]] = None,
+    ) -> SemanticCacheScope:
+        knowledge_bases = sorted(knowledge_bases or [], key=lambda kb: str(kb.get("id")))
+        knowledge_items = sorted(knowledge_items or [], key=lambda item: str(item.get("id")))
+        knowledge_base_ids = {str(kb.get("id")) for kb in knowledge_bases}
+        knowledge_base_ids.update(
+            str(item["knowledge_base_id"]) for item in knowledge_items if item.get("knowledge_base_id") is not None
+        )
+        # 知识库使用完整的描述信息参与计算，知识库更新后作用域随之变化
+        key = _digest([list(parts), knowledge_bases, knowledge_items])
+        return SemanticCacheScope(key, frozenset(knowledge_base_ids))
+
+    def _get_embeddings(self) -> Embeddings:
+        if self._embeddings is None:
+            self._embeddings = self.embeddings_factory()
+        return self._embeddings
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def embed(self, query: str) -> Optional[np.ndarray]:
+        if not self.enabled or not query:
+            return None
+        try:
+            embedding = self._get_embeddings().embed_query(query)
+        except Exception as e:  # noqa
+            _logger.warning(f"语义缓存计算 embedding 失败：{e}")
+            return None
+        return self._normalize(embedding)
+
+    async def aembed(self, query: str) -> Optional[np.ndarray]:
+        if not self.enabled or not query:
+            return None
+        try:
+            embedding = await self._get_embeddings().aembed_query(query)
+        except Exception as e:  # noqa
+            _logger.warning(f"语义缓存计算 embedding 失败：{e}")
+            return None
+        return self._normalize(embedding)
+
+    def lookup(self, scope: SemanticCacheScope, vector: Optional[np.ndarray]) -> Optional[CachedAnswer]:
+        if not self.enabled or vector is None:
+            return None
+        with self._lock:
+            entry = self._scopes.get(scope.key)
+            index, score = -1, -1.0
+            if entry is not None and entry[0].dim == vector.shape[0]:
+                self._scopes.move_to_end(scope.key)
+                index, score = entry[0].search(vector)
+            if index < 0 or score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0].payloads[index]
+
+    def add(self, scope: SemanticCacheScope, vector: Optional[np.ndarray], answer: CachedAnswer):
+        if not self.enabled or vector is None:
+            return
+        with self._lock:
+            entry = self._scopes.get(scope.key)
+            if entry is None or entry[0].dim != vector.shape[0]:
+                entry = self._scopes[scope.key] = (
+                    FlatVectorIndex(vector.shape[0], self.capacity),
+                    scope.knowledge_base_ids,
+                )
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope.key)
+            index, score = entry[0].search(vector)
+            if index >= 0 and score >= self.threshold:
+                # 已有足够相似的问题，覆盖其答案即可，不重复占用容量
+                entry[0].vectors[index] = vector
+                entry[0].payloads[index] = answer
+            else:
+                entry[0].add(vector, answer)
+
+    def invalidate(self, knowledge_base_id: Any = None) -> int:
+        """清理与知识库相关的缓存，不指定知识库时清理全部缓存，返回清理的作用域数量"""
+        with self._lock:
+            if knowledge_base_id is None:
+                keys = list(self._scopes)
+            else:
+                keys = [key for key, (_, ids) in self._scopes.items() if str(knowledge_base_id) in ids]
+            for key in keys:
+                del self._scopes[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return sum(len(index) for index, _ in self._scopes.values())
+
+
+semantic_answer_cache = SemanticAnswerCache.from_settings()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class CandidateSet:
+    """
+    多路召回结果的列式表示
+
+    按 uid 去重后的候选知识只保存一份文档引用，各支路的排名和召回分数以矩阵存储（行为候选、列为支路，
+    未召回的位置排名为 -1、分数为 nan），融合打分、阈值分桶和 top-k 选择都在数组上完成，
+    只有最终选中的文档才会被取出。
+
+    :param retrieved_results: 各支路的召回结果，每一路是按排名排序的文档（dict）列表
+    :param keep: 同一 uid 被多次召回时保留哪一次召回的文档，first 为最先出现的，last 为最后出现的；
+        候选的顺序始终为首次出现的顺序
+    """
+
+    def __init__(self, retrieved_results: Sequence[Sequence[Dict[str, Any]]], keep: str = "first"):
+        if keep not in ("first", "last"):
+            raise ValueError(f"keep 只能为 first 或 last，但传入的值为：`{keep}`")
+        positions: Dict[Any, int] = {}
+        self.docs: List[Dict[str, Any]] = []
+        entry_candidates, entry_paths, entry_ranks, entry_scores = [], [], [], []
+        for path, result in enumerate(retrieved_results):
+            for rank, doc in enumerate(result):
+                uid = doc["metadata"]["uid"]
+                position = positions.get(uid)
+                if position is None:
+                    position = positions[uid] = len(self.docs)
+                    self.docs.append(doc)
+                elif keep == "last":
+                    self.docs[position] = doc
+                entry_candidates.append(position)
+                entry_paths.append(path)
+                entry_ranks.append(rank)
+                score = doc["metadata"].get("__score__")
+                entry_scores.append(np.nan if score is None else score)
+
+        self.uids = np.empty(len(positions), dtype=object)
+        self.uids[:] = list(positions)
+        # 每一次召回（同一支路内也可能重复召回）按出现顺序记录，融合时按相同顺序累加，保证与逐条累加的结果一致
+        self._entry_candidates = np.asarray(entry_candidates, dtype=np.intp)
+        self._entry_paths = np.asarray(entry_paths, dtype=np.intp)
+        self._entry_ranks = np.asarray(entry_ranks, dtype=np.intp)
+
+        n_paths = len(retrieved_results)
+        self.ranks = np.full((len(self.docs), n_paths), -1, dtype=np.intp)
+        self.scores = np.full((len(self.docs), n_paths), np.nan)
+        # 同一支路内重复召回时保留排名最靠前的一次，倒序赋值使靠前的覆盖靠后的
+        self.ranks[self._entry_candidates[::-1], self._entry_paths[::-1]] = self._entry_ranks[::-1]
+        self.scores[self._entry_candidates[::-1], self._entry_paths[::-1]] = np.asarray(entry_scores[::-1], dtype=float)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def reciprocal_rank_fusion(self, weights: Sequence[float], k: int = 60) -> np.ndarray:
+        """加权倒数排名融合分数，每一次排名在 k 以内的召回贡献 weight / (rank + 1)"""
+        if len(weights) != self.ranks.shape[1]:
+            raise ValueError("结果列表和权重列表的长度必须相同。")
+        mask = self._entry_ranks < k
+        fusion_scores = np.zeros(len(self.docs))
+        np.add.at(
+            fusion_scores,
+            self._entry_candidates[mask],
+            np.asarray(weights, dtype=float)[self._entry_paths[mask]] / (self._entry_ranks[mask] + 1),
+        )
+        return fusion_scores
+
+    def metadata_scores(self, key: str = "__score__") -> np.ndarray:
+        """保留的文档 metadata 中的分数"""
+        return np.fromiter((doc["metadata"][key] for doc in self.docs), dtype=float, count=len(self.docs))
+
+    def select(self, scores: np.ndarray, topk: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按分数降序取出前 topk 个候选的文档"""
+        return [self.docs[i] for i in topk_indices(scores, topk)]
+
+
+def topk_indices(scores, topk: Optional[int] = None) -> np.ndarray:
+    """
+    按分数降序排列的前 topk 个下标，分数相同时保持原有顺序，与 sorted(..., reverse=True)[:topk] 的结果一致；
+    topk 为 None 时返回全部下标
+    """
+    neg_scores = -np.asarray(scores, dtype=float)
+    if topk is not None:
+        if topk < 0:
+            topk = max(len(neg_scores) + topk, 0)
+        if topk == 0:
+            return np.empty(0, dtype=np.intp)
+        if topk < len(neg_scores):
+            # 先用 argpartition 找到第 topk 大的分数，只对不小于该分数的候选排序
+            kth = neg_scores[np.argpartition(neg_scores, topk - 1)[topk - 1]]
+            candidates = np.flatnonzero(neg_scores <= kth)
+            return candidates[np.argsort(neg_scores[candidates], kind="stable")][:topk]
+    return np.argsort(neg_scores, kind="stable")
+
+
+def bucket_by_thresholds(scores, reject_threshold) -> tuple:
+    """
+    按拒答阈值把分数分为低、中、高相关三档，返回各档的下标：
+    低相关：score < reject_threshold[0]；中相关：reject_threshold[0] <= score < reject_threshold[1]；
+    高相关：score >= reject_threshold[1]
+    """
+    scores = np.asarray(scores, dtype=float)
+    lowly = scores < reject_threshold[0]
+    moderately = ~lowly & (scores >= reject_threshold[0]) & (scores < reject_threshold[1])
+    highly = ~lowly & ~moderately & (scores >= reject_threshold[1])
+    return np.flatnonzero(lowly), np.flatnonzero(moderately), np.flatnonzero(highly)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import os
+from logging import getLogger
+from threading import Lock
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from aidev_agent.config import settings
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+_logger = getLogger(__name__)
+
+
+class OnnxCrossEncoder:
+    """
+    进程内 CPU 推理的 cross-encoder 相关性模型（需要安装 onnxruntime 和 tokenizers）
+
+    模型为导出成 ONNX 格式（可以是量化后的）的 cross-encoder，分词器为对应的 tokenizer.json：
+    - 文本对按长度排序后分批推理，每批只补齐到批内最长的长度（动态补齐），减少补齐带来的无效计算；
+    - 文本对超过 max_seq_length 时截断（优先截断较长的一段）；
+    - 模型只输出一个 logit 时使用 sigmoid 作为分数，输出两个 logit 时使用“相关”类别的 softmax 概率。
+    """
+
+    def __init__(self, session, tokenizer, max_seq_length: int = 512, batch_size: int = 16):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.batch_size = max(1, batch_size)
+        self.input_names = {model_input.name for model_input in session.get_inputs()}
+        padding = tokenizer.padding or {}
+        self.pad_id = padding.get("pad_id", tokenizer.token_to_id("[PAD]") or 0)
+        # 补齐在分批后进行，分词时只截断
+        tokenizer.no_padding()
+        tokenizer.enable_truncation(max_length=max_seq_length, strategy="longest_first")
+
+    @classmethod
+    def from_files(
+        cls,
+        model_path: str,
+        tokenizer_path: Optional[str] = None,
+        max_seq_length: int = 512,
+        batch_size: int = 16,
+        num_threads: int = 0,
+    ) -> "OnnxCrossEncoder":
+        """tokenizer_path 为空时使用模型同目录下的 tokenizer.json；num_threads 为 0 时使用 onnxruntime 的默认线程数"""
+        if onnxruntime is None or Tokenizer is None:
+            raise ImportError(
+                "本地 cross-encoder 需要安装 onnxruntime 和 tokenizers：pip install onnxruntime tokenizers"
+            )
+        options = onnxruntime.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        tokenizer = Tokenizer.from_file(tokenizer_path or os.path.join(os.path.dirname(model_path), "tokenizer.json"))
+        return cls(session, tokenizer, max_seq_length=max_seq_length, batch_size=batch_size)
+
+    def _pad(self, encodings) -> dict:
+        seq_length = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.full((len(encodings), seq_length), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), seq_length), dtype=np.int64)
+        token_type_ids = np.zeros((len(encodings), seq_length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            length = len(encoding.ids)
+            input_ids[row, :length] = encoding.ids
+            attention_mask[row, :length] = encoding.attention_mask
+            token_type_ids[row, :length] = encoding.type_ids
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        return {name: value for name, value in inputs.items() if name in self.input_names}
+
+    @staticmethod
+    def _to_scores(logits: np.ndarray) -> np.ndarray:
+        logits = logits.astype(np.float32).reshape(len(logits), -1)
+        if logits.shape[1] == 1:
+            return 1.0 / (1.0 + np.exp(-logits[:, 0]))
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return probs[:, -1] / probs.sum(axis=1)
+
+    def compute_similarity(self, text_pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not text_pairs:
+            return []
+        encodings = self.tokenizer.encode_batch([tuple(pair) for pair in text_pairs])
+        # 按长度排序后分批，使同一批内的长度接近
+        order = sorted(range(len(encodings)), key=lambda index: len(encodings[index].ids))
+        scores = np.zeros(len(encodings), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            logits = self.session.run(None, self._pad([encodings[index] for index in batch]))[0]
+            scores[batch] = self._to_scores(np.asarray(logits))
+        return scores.tolist()
+
+
+_local_cross_encoder: Optional[OnnxCrossEncoder] = None
+_local_cross_encoder_lock = Lock()
+
+
+def get_local_cross_encoder() -> OnnxCrossEncoder:
+    """按配置加载进程内共享的 cross-encoder，首次使用时加载"""
+    global _local_cross_encoder
+    if _local_cross_encoder is None:
+        with _local_cross_encoder_lock:
+            if _local_cross_encoder is None:
+                if not settings.CROSS_ENCODER_MODEL_PATH:
+                    raise RuntimeError("使用本地 cross-encoder 需要配置 CROSS_ENCODER_MODEL_PATH")
+                _local_cross_encoder = OnnxCrossEncoder.from_files(
+                    settings.CROSS_ENCODER_MODEL_PATH,
+                    settings.CROSS_ENCODER_TOKENIZER_PATH or None,
+                    max_seq_length=settings.CROSS_ENCODER_MAX_SEQ_LENGTH,
+                    batch_size=settings.CROSS_ENCODER_BATCH_SIZE,
+                    num_threads=settings.CROSS_ENCODER_NUM_THREADS,
+                )
+                _logger.info(f"已加载本地 cross-encoder：{settings.CROSS_ENCODER_MODEL_PATH}")
+    return _local_cross_encoder
@@ -16,14 +16,17 @@ We undertake not to change the open source license (MIT license) applicable
 to the current version of the project delivered to anyone in the future.
 """
 
+import asyncio
 import concurrent.futures
-import copy
+import json
 import logging
 import os
-from collections import defaultdict
+import time
 from enum import Enum
+from functools import partial
 from typing import Any, Callable, ClassVar, Dict, List, Set, Tuple
 
+from asgiref.sync import sync_to_async
 from langchain_core.callbacks import Callbacks
 from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
@@ -33,17 +36,32 @@ from langchain_core.tools import BaseTool
 from pydantic import BaseModel
 
 from aidev_agent.api.bk_aidev import BKAidevApi
+from aidev_agent.config import settings
+from aidev_agent.core.extend.intent.candidates import CandidateSet, bucket_by_thresholds
 from aidev_agent.core.extend.intent.prompts import DEFAULT_INTENT_RECOGNITION_PROMPT_TEMPLATES
+from aidev_agent.core.extend.intent.recall_scheduler import RecallScheduler, RecallStage
+from aidev_agent.core.extend.intent.retrieval_plan import RetrievalPlan
 from aidev_agent.core.extend.intent.similarity_model import calculate_similarity
 from aidev_agent.core.extend.intent.utils import (
     HUNYUAN_SPECIFIC_RESPONSE,
+    aconditional_dispatch_custom_event,
+    ainvoke_decorator,
     conditional_dispatch_custom_event,
-    deduplicate_knowledge_chunks,
+    install_sync_fallbacks,
     invoke_decorator,
     is_structured_data,
     retry,
     timeit,
 )
+from aidev_agent.core.extend.models.tokenizer import estimate_num_tokens
+from aidev_agent.core.utils.async_utils import (
+    CancellationToken,
+    get_cancellation_token,
+    reset_cancellation_token,
+    set_cancellation_token,
+    submit_cancellable,
+)
+from aidev_agent.core.utils.cache import recall_cache
 from aidev_agent.utils.module_loading import import_string
 
 logger = logging.getLogger(__name__)
@@ -52,6 +70,17 @@ intent_recognition_executor = concurrent.futures.ThreadPoolExecutor(
     max_workers=int(os.getenv("INTENT_RECOGNITION_EXECUTOR_MAX_WORKERS", "10"))
 )
 
+# 参与融合的知识召回支路，顺序即融合时的顺序；未启用或超时未完成的支路按空结果参与融合
+KNOWLEDGE_RECALL_BRANCHES = (
+    "index_specific",
+    "index_specific_init",
+    "index_specific_translation",
+    "index_specific_keywords",
+    "es_query",
+    "es_keywords",
+    "nature",
+)
+
 
 class IntentStatus(Enum):
     QA_WITH_RETRIEVED_KNOWLEDGE_RESOURCES = "QA_WITH_RETRIEVED_KNOWLEDGE_RESOURCES"
@@ -68,6 +97,7 @@ class Decision(Enum):
 
 class FineGrainedScoreType(Enum):
     LLM = "LLM"
+    LLM_BATCH = "LLM_BATCH"  # 一次 LLM 调用判断多篇知识的相关性
     EXCLUSIVE_SIMILARITY_MODEL = "EXCLUSIVE_SIMILARITY_MODEL"
     EMBEDDING = "EMBEDDING"
 
@@ -81,12 +111,42 @@ class IndependentQueryMode(Enum):
 class IntentRecognition(BaseModel):
     intent_recognition_prompt_templates: ClassVar[Dict[str, Any]] = DEFAULT_INTENT_RECOGNITION_PROMPT_TEMPLATES
     template_one: ClassVar[Set[str]] = set(["你好", "谢谢"])
+    # 有异步版本（a + 方法名）的扩展点，子类只重写同步版本时异步流程也使用子类的逻辑（见 install_sync_fallbacks）
+    sync_fallback_hooks: ClassVar[Tuple[str, ...]] = (
+        "search_knowledge_index_specific",
+        "search_knowledge_index_specific_keywords",
+        "search_knowledge_index_specific_translation",
+        "search_knowledge_nature",
+        "search_knowledge_es_query",
+        "search_knowledge_es_keywords",
+        "search_knowledge_self_query",
+        "extract_query_keywords",
+        "query_translation",
+        "latest_query_classification",
+        "query_rewrite_for_independence",
+        "query_cls_with_resp_or_rewrite",
+        "sum_chat_history_for_query",
+        "calculate_fine_grained_scores",
+        "llm_relevance_determiner",
+        "llm_relevance_determiner_parallel",
+        "llm_batch_relevance_determiner",
+        "llm_batch_relevance_determiner_parallel",
+        "llm_context_compressor",
+        "llm_context_compressor_parallel",
+        "llm_intermediate_step_compressor",
+        "llm_intermediate_step_compressor_parallel",
+        "retrieve_and_parse_knowledge_resource",
+        "query_cls_pipeline",
+        "independent_query_pipeline",
+        "exec_intent_recognition",
+    )
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         parent_factory = getattr(super(cls, cls), "intent_recognition_prompt_templates", {})
         current_factory = getattr(cls, "intent_recognition_prompt_templates", {})
         cls.intent_recognition_prompt_templates = {**parent_factory, **current_factory}
+        install_sync_fallbacks(cls, cls.sync_fallback_hooks)
 
     @property
     def _query_instance(self) -> Callable:
@@ -98,113 +158,108 @@ class IntentRecognition(BaseModel):
             client = BKAidevApi.get_client()
             return client.knowledge_query
 
+    @property
+    def _aquery_instance(self) -> Callable:
+        try:
+            obj = import_string("aidev.resource.knowledge_base.services.KnowledgeQueryService")
+            # 进程内的查询服务会访问数据库，只能在线程中执行
+            return sync_to_async(obj.internal_query)
+        except ImportError:
+            client = BKAidevApi.get_client()
+            return client.aknowledge_query
+
+    @staticmethod
+    def _check_retrieved_docs(docs):
+        for doc in docs:
+            if isinstance(doc, Document):
+                if not hasattr(doc, "metadata"):
+                    raise RuntimeError(f"召回的文档缺少 metadata 字段！\n文档内容为：{doc}\n")
+                if "__score__" not in doc.metadata:
+                    raise RuntimeError(f"召回的文档缺少 __score__ 字段！\n文档内容为：{doc}\n")
+            elif isinstance(doc, dict):
+                if "metadata" not in doc:
+                    raise RuntimeError(f"召回的文档缺少 metadata 字段！\n文档内容为：{doc}\n")
+                if "__score__" not in doc["metadata"]:
+                    raise RuntimeError(f"召回的文档缺少 __score__ 字段！\n文档内容为：{doc}\n")
+            else:
+                raise RuntimeError(f"召回文档格式有误！\n文档内容为：{doc}\n")
+        return docs
+
     def _search_knowledge_by_client(self, data: dict):
         if "knowledge_template_id" in data and data["knowledge_template_id"] is None:
             data.pop("knowledge_template_id")
         try:
             logger.info(f"查询知识库： {data}")
-            result = self._query_instance(data)
-            docs = result["documents"]
-            for doc in docs:
-                if isinstance(doc, Document):
-                    if not hasattr(doc, "metadata"):
-                        raise RuntimeError(f"召回的文档缺少 metadata 字段！\n文档内容为：{doc}\n")
-                    if "__score__" not in doc.metadata:
-                        raise RuntimeError(f"召回的文档缺少 __score__ 字段！\n文档内容为：{doc}\n")
-                elif isinstance(doc, dict):
-                    if "metadata" not in doc:
-                        raise RuntimeError(f"召回的文档缺少 metadata 字段！\n文档内容为：{doc}\n")
-                    if "__score__" not in doc["metadata"]:
-                        raise RuntimeError(f"召回的文档缺少 __score__ 字段！\n文档内容为：{doc}\n")
-                else:
-                    raise RuntimeError(f"召回文档格式有误！\n文档内容为：{doc}\n")
-            return docs
+            return recall_cache.get_or_load(
+                data, lambda: self._check_retrieved_docs(self._query_instance(data)["documents"])
+            )
         except Exception as err:
             logger.error(f"\n\n=====\n>>>>> 知识库查询接口调用出错！\n\ndata 内容为：\n{data}\n\n error: {err}")
             raise
 
-    def _construct_index_query_kwargs(
-        self, index_query_kwargs, query, knowledges, knowledge_type, resource_type, **kwargs
-    ):
-        knowledge_type_to_id_type = {
-            "knowledge_items": "knowledge_id",
-            "knowledge_bases": "knowledge_base_id",
-        }
-        if resource_type == "knowledge":
-            custom_index_name_key = "knowledge_resource_index_names"
-        elif resource_type == "tool":
-            custom_index_name_key = "tool_resource_index_names"
-        else:
-            raise ValueError(f"不支持的 resource 类型：{resource_type}")
-        if knowledges:
-            supported_ids = [knowledge.get("id") for knowledge in knowledges]
-            for knowledge in knowledges:
-                all_index_names = []
-                supported_index_names = []
-                if index_config := knowledge.get("index_config"):
-                    for index_type in ["full_text_indexes", "vector_indexes"]:
-                        if indexes := index_config.get(index_type):
-                            for index in indexes:
-                                if index_name := index.get("index_name"):
-                                    supported_index_names.append(index_name)
-
-                    custom_index_names = kwargs.get(custom_index_name_key, {})
-                    custom_index_names_type = custom_index_names.get(knowledge_type)
-                    if custom_index_names and custom_index_names_type:
-                        if not set(list(custom_index_names_type.keys())).issubset(set(supported_ids)):
-                            raise ValueError(
-                                f"传入的 {knowledge_type} 类型的 ID 有：{supported_ids}，"
-                                f"但传入的 {knowledge_type} 类型的自定义的向量索引 ID 有："
-                                f"{list(custom_index_names_type.keys())}，"
-                                "请确保后者是前者的子集！"
-                            )
-                        if custom_index_names_type_id := custom_index_names_type.get(knowledge.get("id")):
-                            if not set(custom_index_names_type_id).issubset(set(supported_index_names)):
-                                raise ValueError(
-                                    f"{knowledge_type} 类型的知识（库）ID {knowledge.get('id')} "
-                                    f"支持的向量索引有：{supported_index_names}，"
-                                    f"但传入的自定义向量索引为：{custom_index_names_type_id}，"
-                                    "请传入支持的向量索引的子集！"
-                                )
-                            all_index_names = custom_index_names_type_id
-                if not all_index_names:
-                    all_index_names = supported_index_names
-                if not all_index_names:
-                    raise RuntimeError(f"{knowledge_type} 类型的知识（库）ID {knowledge.get('id')} 的索引为空！")
-                index_query_kwargs.extend(
-                    [
-                        {
-                            "index_name": index_name,
-                            "index_value": query,
-                            knowledge_type_to_id_type[knowledge_type]: knowledge["id"],
-                        }
-                        for index_name in all_index_names
-                    ]
-                )
+    async def _asearch_knowledge_by_client(self, data: dict):
+        if "knowledge_template_id" in data and data["knowledge_template_id"] is None:
+            data.pop("knowledge_template_id")
+        try:
+            logger.info(f"查询知识库： {data}")
 
-    @timeit(message="知识库检索（index_specific方式）")
-    def search_knowledge_index_specific(
+            async def aload():
+                result = await self._aquery_instance(data)
+                return self._check_retrieved_docs(result["documents"])
+
+            return await recall_cache.aget_or_load(data, aload)
+        except Exception as err:
+            logger.error(f"\n\n=====\n>>>>> 知识库查询接口调用出错！\n\ndata 内容为：\n{data}\n\n error: {err}")
+            raise
+
+    def _index_specific_query_data(
         self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, resource_type="knowledge", **kwargs
     ):
-        """基于向量检索获取相关文档（index_specific方式）"""
-        index_query_kwargs = []
-        self._construct_index_query_kwargs(
-            index_query_kwargs, query, knowledge_items, "knowledge_items", resource_type=resource_type, **kwargs
-        )
-        self._construct_index_query_kwargs(
-            index_query_kwargs, query, knowledge_bases, "knowledge_bases", resource_type=resource_type, **kwargs
-        )
-        data = {
+        # 优先使用 agent 预先构建的检索计划（见 IntentRecognitionMixin.get_knowledge_retrieval_plan），只需替换 query
+        retrieval_plan = kwargs.get("knowledge_retrieval_plan")
+        if retrieval_plan is None or not retrieval_plan.matches(knowledge_items, knowledge_bases, **kwargs):
+            retrieval_plan = RetrievalPlan.from_kwargs(knowledge_items, knowledge_bases, **kwargs)
+        return {
             "query": query,
             "topk": topk,
-            "index_query_kwargs": index_query_kwargs,
+            "index_query_kwargs": retrieval_plan.index_query_kwargs(query, resource_type),
             "knowledge_template_id": kwargs.get("knowledge_template_id"),
             "with_scalar_data": kwargs.get("with_scalar_data", True),
             "raw": True,  # 知识库查询接口集成了本文件中的重排逻辑，设置为True防止循环重排。下同
             "type": "index_specific",
         }
+
+    def _nature_query_data(self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, **kwargs):
+        return {
+            "query": query,
+            "topk": topk,
+            "knowledge_id": [knowledge["id"] for knowledge in knowledge_items],
+            "knowledge_base_id": [knowledge["id"] for knowledge in knowledge_bases],
+            "knowledge_template_id": kwargs.get("knowledge_template_id"),
+            "with_scalar_data": kwargs.get("with_scalar_data", True),
+            "raw": True,
+            "type": "nature",
+        }
+
+    @timeit(message="知识库检索（index_specific方式）")
+    def search_knowledge_index_specific(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, resource_type="knowledge", **kwargs
+    ):
+        """基于向量检索获取相关文档（index_specific方式）"""
+        data = self._index_specific_query_data(
+            knowledge_items, knowledge_bases, query, topk, resource_type=resource_type, **kwargs
+        )
         return self._search_knowledge_by_client(data)
 
+    @timeit(message="知识库检索（index_specific方式）")
+    async def asearch_knowledge_index_specific(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, resource_type="knowledge", **kwargs
+    ):
+        data = self._index_specific_query_data(
+            knowledge_items, knowledge_bases, query, topk, resource_type=resource_type, **kwargs
+        )
+        return await self._asearch_knowledge_by_client(data)
+
     @timeit(message="知识库检索（index_specific方式，使用提取的关键词）")
     def search_knowledge_index_specific_keywords(
         self, knowledge_items: list[dict], knowledge_bases: list[dict], extracted_keywords, topk, **kwargs
@@ -222,6 +277,22 @@ class IntentRecognition(BaseModel):
         else:
             return []
 
+    @timeit(message="知识库检索（index_specific方式，使用提取的关键词）")
+    async def asearch_knowledge_index_specific_keywords(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], extracted_keywords, topk, **kwargs
+    ):
+        if extracted_keywords:
+            return await self.asearch_knowledge_index_specific(
+                knowledge_items=knowledge_items,
+                knowledge_bases=knowledge_bases,
+                query="\n\n".join(extracted_keywords),
+                topk=topk,
+                disable_timeit=True,
+                **kwargs,
+            )
+        else:
+            return []
+
     @timeit(message="知识库检索（index_specific方式，使用翻译后的中文）")
     def search_knowledge_index_specific_translation(
         self, knowledge_items: list[dict], knowledge_bases: list[dict], translated_query, topk, **kwargs
@@ -239,21 +310,35 @@ class IntentRecognition(BaseModel):
         else:
             return []
 
+    @timeit(message="知识库检索（index_specific方式，使用翻译后的中文）")
+    async def asearch_knowledge_index_specific_translation(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], translated_query, topk, **kwargs
+    ):
+        if translated_query:
+            return await self.asearch_knowledge_index_specific(
+                knowledge_items=knowledge_items,
+                knowledge_bases=knowledge_bases,
+                query=translated_query,
+                topk=topk,
+                disable_timeit=True,
+                **kwargs,
+            )
+        else:
+            return []
+
     @timeit(message="知识库检索（nature方式）")
     def search_knowledge_nature(self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, **kwargs):
         """基于向量检索获取相关文档（nature方式）"""
-        data = {
-            "query": query,
-            "topk": topk,
-            "knowledge_id": [knowledge["id"] for knowledge in knowledge_items],
-            "knowledge_base_id": [knowledge["id"] for knowledge in knowledge_bases],
-            "knowledge_template_id": kwargs.get("knowledge_template_id"),
-            "with_scalar_data": kwargs.get("with_scalar_data", True),
-            "raw": True,
-            "type": "nature",
-        }
+        data = self._nature_query_data(knowledge_items, knowledge_bases, query, topk, **kwargs)
         return self._search_knowledge_by_client(data)
 
+    @timeit(message="知识库检索（nature方式）")
+    async def asearch_knowledge_nature(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, **kwargs
+    ):
+        data = self._nature_query_data(knowledge_items, knowledge_bases, query, topk, **kwargs)
+        return await self._asearch_knowledge_by_client(data)
+
     def _es_client(self):
         raise NotImplementedError
 
@@ -267,73 +352,76 @@ class IntentRecognition(BaseModel):
         """基于ES获取相关文档（ES方式，使用完整query）"""
         raise NotImplementedError
 
+    async def asearch_knowledge_es_query(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, **kwargs
+    ):
+        raise NotImplementedError
+
     @timeit(message="知识库检索（ES方式，使用提取的关键词）")
     def search_knowledge_es_keywords(
         self, knowledge_items: list[dict], knowledge_bases: list[dict], extracted_keywords, topk, **kwargs
     ):
         raise NotImplementedError
 
-    @timeit(message="用户提问关键词提取")
-    @retry(max_retries=5, max_seconds=3600)
-    def extract_query_keywords(self, query, llm, **kwargs):
-        sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "extract_query_keywords_sys_prompt_template"
-        )
-        usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "extract_query_keywords_usr_prompt_template"
-        ).render(query=query)
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
+    async def asearch_knowledge_es_keywords(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], extracted_keywords, topk, **kwargs
+    ):
+        raise NotImplementedError
+
+    def _render_messages(self, template_name, **render_kwargs):
+        """使用 {template_name}_sys_prompt_template 和 {template_name}_usr_prompt_template 构造 LLM 输入"""
+        templates = self.__class__.intent_recognition_prompt_templates
+        return [
+            SystemMessage(content=templates.get(f"{template_name}_sys_prompt_template")),
+            HumanMessage(content=templates.get(f"{template_name}_usr_prompt_template").render(**render_kwargs)),
         ]
-        # TODO: 待确认：并发请求内部无法 dispatch_custom_event，所以无需调用 conditional_dispatch_custom_event
-        invoke_func = invoke_decorator(llm.invoke, llm)
-        resp = invoke_func(messages)
-        resp_content = resp.content
+
+    def _parse_query_keywords(self, resp_content):
         extracted_keywords = resp_content.strip().split("\n")
         extracted_keywords = list(filter(None, extracted_keywords))
         logger.info(f"=====> <extract_query_keywords的结果>：{extracted_keywords}")
         return extracted_keywords
 
-    @timeit(message="用户提问翻译")
+    @timeit(message="用户提问关键词提取")
     @retry(max_retries=5, max_seconds=3600)
-    def query_translation(self, query, llm, **kwargs):
-        sys_prompt = self.__class__.intent_recognition_prompt_templates.get("query_translation_sys_prompt_template")
-        usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "query_translation_usr_prompt_template"
-        ).render(query=query)
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
+    def extract_query_keywords(self, query, llm, **kwargs):
+        messages = self._render_messages("extract_query_keywords", query=query)
         # TODO: 待确认：并发请求内部无法 dispatch_custom_event，所以无需调用 conditional_dispatch_custom_event
         invoke_func = invoke_decorator(llm.invoke, llm)
         resp = invoke_func(messages)
-        resp_content = resp.content
+        return self._parse_query_keywords(resp.content)
+
+    @timeit(message="用户提问关键词提取")
+    @retry(max_retries=5, max_seconds=3600)
+    async def aextract_query_keywords(self, query, llm, **kwargs):
+        messages = self._render_messages("extract_query_keywords", query=query)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        return self._parse_query_keywords(resp.content)
+
+    def _parse_query_translation(self, resp_content):
         logger.info(f"=====> <query_translation的结果>：{resp_content}")
         if resp_content.strip() == "None":
             return None
         else:
             return resp_content
 
-    @timeit(message="意图切换检测")
+    @timeit(message="用户提问翻译")
     @retry(max_retries=5, max_seconds=3600)
-    def latest_query_classification(self, chat_history, query, llm, **kwargs):
-        sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "latest_query_classification_sys_prompt_template"
-        )
-        usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "latest_query_classification_usr_prompt_template"
-        ).render(chat_history=chat_history, query=query)
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
-        conditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+    def query_translation(self, query, llm, **kwargs):
+        messages = self._render_messages("query_translation", query=query)
+        # TODO: 待确认：并发请求内部无法 dispatch_custom_event，所以无需调用 conditional_dispatch_custom_event
         invoke_func = invoke_decorator(llm.invoke, llm)
-        resp = invoke_func(messages, **kwargs)
-        conditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
-        resp_content = resp.content
+        resp = invoke_func(messages)
+        return self._parse_query_translation(resp.content)
+
+    @timeit(message="用户提问翻译")
+    @retry(max_retries=5, max_seconds=3600)
+    async def aquery_translation(self, query, llm, **kwargs):
+        messages = self._render_messages("query_translation", query=query)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        return self._parse_query_translation(resp.content)
+
+    def _parse_latest_query_classification(self, resp_content):
         logger.info(f"=====> <query分类结果>：{resp_content}")
         if "<<<<<new>>>>>" in resp_content:
             return "new"
@@ -344,22 +432,32 @@ class IntentRecognition(BaseModel):
         else:
             return "new"  # 其余所有边缘情况默认直接重新开始
 
+    @timeit(message="意图切换检测")
+    @retry(max_retries=5, max_seconds=3600)
+    def latest_query_classification(self, chat_history, query, llm, **kwargs):
+        messages = self._render_messages("latest_query_classification", chat_history=chat_history, query=query)
+        conditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+        invoke_func = invoke_decorator(llm.invoke, llm)
+        resp = invoke_func(messages, **kwargs)
+        conditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
+        return self._parse_latest_query_classification(resp.content)
+
+    @timeit(message="意图切换检测")
+    @retry(max_retries=5, max_seconds=3600)
+    async def alatest_query_classification(self, chat_history, query, llm, **kwargs):
+        messages = self._render_messages("latest_query_classification", chat_history=chat_history, query=query)
+        await aconditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages, **kwargs)
+        await aconditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
+        return self._parse_latest_query_classification(resp.content)
+
     @timeit(message="独立查询重写")
     @retry(max_retries=5, max_seconds=3600)
     def query_rewrite_for_independence(self, chat_history, query, llm, display=False, **kwargs):
         """
         :param display: 是否将独立查询重写的结果也展示在前端
         """
-        sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "query_rewrite_for_independence_sys_prompt_template"
-        )
-        usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "query_rewrite_for_independence_usr_prompt_template"
-        ).render(chat_history=chat_history, query=query)
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
+        messages = self._render_messages("query_rewrite_for_independence", chat_history=chat_history, query=query)
         if display:
             conditional_dispatch_custom_event(
                 "custom_event",
@@ -383,24 +481,31 @@ class IntentRecognition(BaseModel):
         logger.info(f"=====> <query重写结果>：{resp_content}")
         return resp_content
 
-    @timeit(message="意图切换检测和独立查询重写/直接答复")
+    @timeit(message="独立查询重写")
     @retry(max_retries=5, max_seconds=3600)
-    def query_cls_with_resp_or_rewrite(self, chat_history, query, llm, **kwargs):
-        sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "query_cls_with_resp_or_rewrite_sys_prompt_template"
-        )
-        usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "query_cls_with_resp_or_rewrite_usr_prompt_template"
-        ).render(chat_history=chat_history, query=query)
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
-        conditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
-        invoke_func = invoke_decorator(llm.invoke, llm)
-        resp = invoke_func(messages)
-        conditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
+    async def aquery_rewrite_for_independence(self, chat_history, query, llm, display=False, **kwargs):
+        messages = self._render_messages("query_rewrite_for_independence", chat_history=chat_history, query=query)
+        if display:
+            await aconditional_dispatch_custom_event(
+                "custom_event",
+                {"custom_return_chunk": "结合历史对话信息，您似乎是想问：“"},
+                **kwargs,
+            )
+            resp = await ainvoke_decorator(llm.ainvoke, llm)(messages, **kwargs)
+            await aconditional_dispatch_custom_event(
+                "custom_event",
+                {"custom_return_chunk": "”。接下来我尝试进行回答。\n\n"},
+                **kwargs,
+            )
+        else:
+            await aconditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+            resp = await ainvoke_decorator(llm.ainvoke, llm)(messages, **kwargs)
+            await aconditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
         resp_content = resp.content
+        logger.info(f"=====> <query重写结果>：{resp_content}")
+        return resp_content
+
+    def _parse_query_cls_with_resp_or_rewrite(self, resp_content):
         logger.info(f"=====> <query_cls_with_resp_or_rewrite的结果>：{resp_content}")
         if resp_content.startswith("<<<<<new>>>>>"):
             return {
@@ -429,6 +534,25 @@ class IntentRecognition(BaseModel):
                 "query_cls": "new",
             }  # 其余所有边缘情况默认直接重新开始
 
+    @timeit(message="意图切换检测和独立查询重写/直接答复")
+    @retry(max_retries=5, max_seconds=3600)
+    def query_cls_with_resp_or_rewrite(self, chat_history, query, llm, **kwargs):
+        messages = self._render_messages("query_cls_with_resp_or_rewrite", chat_history=chat_history, query=query)
+        conditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+        invoke_func = invoke_decorator(llm.invoke, llm)
+        resp = invoke_func(messages)
+        conditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
+        return self._parse_query_cls_with_resp_or_rewrite(resp.content)
+
+    @timeit(message="意图切换检测和独立查询重写/直接答复")
+    @retry(max_retries=5, max_seconds=3600)
+    async def aquery_cls_with_resp_or_rewrite(self, chat_history, query, llm, **kwargs):
+        messages = self._render_messages("query_cls_with_resp_or_rewrite", chat_history=chat_history, query=query)
+        await aconditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        await aconditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
+        return self._parse_query_cls_with_resp_or_rewrite(resp.content)
+
     @timeit(message="伪工具类资源描述生成")
     @retry(max_retries=5, max_seconds=3600)
     def gen_pseudo_tool_resource_description(self, query, llm, **kwargs):
@@ -500,23 +624,12 @@ class IntentRecognition(BaseModel):
         if len(searched_docs) != len(weights):
             raise ValueError("结果列表和权重列表的长度必须相同。")
 
-        fusion_scores = defaultdict(float)
-        doc_content = {}
-
-        for result, weight in zip(searched_docs, weights):
-            for rank, doc in enumerate(result):
-                if rank < k:
-                    doc_id = doc["metadata"]["uid"]
-                    fusion_scores[doc_id] += weight / (rank + 1)
-                    if doc_id not in doc_content:
-                        doc_content[doc_id] = doc
-
-        for doc_id, score in fusion_scores.items():
-            doc_content[doc_id]["metadata"]["rrf_score"] = score
-
-        sorted_docs = sorted(doc_content.values(), key=lambda x: x["metadata"]["rrf_score"], reverse=True)
-
-        return sorted_docs
+        # 排名超出 k 的文档不参与融合
+        candidates = CandidateSet([result[:k] for result in searched_docs])
+        fusion_scores = candidates.reciprocal_rank_fusion(weights, k=k)
+        for doc, score in zip(candidates.docs, fusion_scores.tolist()):
+            doc["metadata"]["rrf_score"] = score
+        return candidates.select(fusion_scores)
 
     def calculate_fine_grained_scores(
         self,
@@ -526,9 +639,14 @@ class IntentRecognition(BaseModel):
         context_docs_with_scores,
         **kwargs,
     ):
-        if fine_grained_score_type == FineGrainedScoreType.LLM:
+        if fine_grained_score_type in (FineGrainedScoreType.LLM, FineGrainedScoreType.LLM_BATCH):
             # NOTE: 如果 FineGrainedScoreType 为 LLM，则因为当前只有是/否相关的判断，因此分数只有 1.0 或 0.0
-            fine_grained_scores = self.llm_relevance_determiner_parallel(
+            relevance_determiner = (
+                self.llm_batch_relevance_determiner_parallel
+                if fine_grained_score_type == FineGrainedScoreType.LLM_BATCH
+                else self.llm_relevance_determiner_parallel
+            )
+            fine_grained_scores = relevance_determiner(
                 (
                     kwargs.get("translated_query", query_for_search)
                     if kwargs.get("use_independent_query_in_scores", True)
@@ -541,26 +659,8 @@ class IntentRecognition(BaseModel):
         elif fine_grained_score_type == FineGrainedScoreType.EXCLUSIVE_SIMILARITY_MODEL:
             # 使用专属小模型计算的分数作为最终的细粒度相似度分数
             # TODO: 目前知识类资源和工具类资源是独立使用小模型的，可以考虑在都要计算的情况下，合成一个batch进行计算
-            # NOTE: 如果有 index_content 且是结构化数据则取 index_content，否则才取 page_content（兼容写法）。
-            # 待知识库后台对非结构化数据的处理方式的 index_content 不是默认使用LLM总结后的内容之后，
-            # 可将“且是结构化数据”的逻辑去除。
-            # NOTE: 目前暂不考虑检索返回模板对 page_content 的影响
             fine_grained_scores = calculate_similarity(
-                [
-                    (
-                        (
-                            kwargs.get("translated_query", query_for_search)
-                            if kwargs.get("use_independent_query_in_scores", False)
-                            else kwargs["input"]
-                        ),
-                        (
-                            doc.metadata["index_content"]
-                            if "index_content" in doc.metadata and is_structured_data(doc)
-                            else doc.page_content
-                        ),
-                    )
-                    for doc, _ in context_docs_with_scores
-                ]
+                self._similarity_pairs(query_for_search, context_docs_with_scores, **kwargs)
             )
             fine_grained_scores = [float(fine_grained_score) for fine_grained_score in fine_grained_scores]
         elif fine_grained_score_type == FineGrainedScoreType.EMBEDDING:
@@ -574,118 +674,370 @@ class IntentRecognition(BaseModel):
 
         return fine_grained_scores
 
+    async def acalculate_fine_grained_scores(
+        self,
+        fine_grained_score_type,
+        query_for_search,
+        llm,
+        context_docs_with_scores,
+        **kwargs,
+    ):
+        if fine_grained_score_type in (FineGrainedScoreType.LLM, FineGrainedScoreType.LLM_BATCH):
+            relevance_determiner = (
+                self.allm_batch_relevance_determiner_parallel
+                if fine_grained_score_type == FineGrainedScoreType.LLM_BATCH
+                else self.allm_relevance_determiner_parallel
+            )
+            return await relevance_determiner(
+                (
+                    kwargs.get("translated_query", query_for_search)
+                    if kwargs.get("use_independent_query_in_scores", True)
+                    else kwargs["input"]
+                ),
+                [doc for doc, _ in context_docs_with_scores],
+                llm,
+                **kwargs,
+            )
+        if fine_grained_score_type == FineGrainedScoreType.EXCLUSIVE_SIMILARITY_MODEL:
+            # 小模型推理为 CPU 密集的计算，在线程中执行，不阻塞事件循环
+            fine_grained_scores = await sync_to_async(calculate_similarity, thread_sensitive=False)(
+                self._similarity_pairs(query_for_search, context_docs_with_scores, **kwargs)
+            )
+            return [float(fine_grained_score) for fine_grained_score in fine_grained_scores]
+        # 其余方式（直接使用 emb 分数）只做类型转换，直接执行
+        return self.calculate_fine_grained_scores(
+            fine_grained_score_type, query_for_search, llm, context_docs_with_scores, **kwargs
+        )
+
+    @staticmethod
+    def _similarity_pairs(query_for_search, context_docs_with_scores, **kwargs) -> List[Tuple[str, str]]:
+        """专属小模型的输入：(query, 文档内容) 对"""
+        # NOTE: 如果有 index_content 且是结构化数据则取 index_content，否则才取 page_content（兼容写法）。
+        # 待知识库后台对非结构化数据的处理方式的 index_content 不是默认使用LLM总结后的内容之后，
+        # 可将“且是结构化数据”的逻辑去除。
+        # NOTE: 目前暂不考虑检索返回模板对 page_content 的影响
+        query = (
+            kwargs.get("translated_query", query_for_search)
+            if kwargs.get("use_independent_query_in_scores", False)
+            else kwargs["input"]
+        )
+        return [
+            (
+                query,
+                (
+                    doc.metadata["index_content"]
+                    if "index_content" in doc.metadata and is_structured_data(doc)
+                    else doc.page_content
+                ),
+            )
+            for doc, _ in context_docs_with_scores
+        ]
+
     def separate_docs_by_scores(self, context_docs_with_scores, fine_grained_scores, reject_threshold):
+        # NOTE: doc.dict() 会逐层复制 metadata 中的 dict 和 list，不需要再 deepcopy
         contexts_emb_recalled = []
-        contexts_lowly_relevant = []
-        contexts_moderately_relevant = []
-        contexts_highly_relevant = []
-        for context_doc_with_score, fine_grained_score in zip(context_docs_with_scores, fine_grained_scores):
-            context_doc_with_fine_grained_score = copy.deepcopy(context_doc_with_score[0].dict())
+        for (context_doc, _), fine_grained_score in zip(context_docs_with_scores, fine_grained_scores):
+            context_doc_with_fine_grained_score = context_doc.dict()
             context_doc_with_fine_grained_score["metadata"]["fine_grained_score"] = fine_grained_score
             contexts_emb_recalled.append(context_doc_with_fine_grained_score)
-            if fine_grained_score < reject_threshold[0]:
-                contexts_lowly_relevant.append(context_doc_with_fine_grained_score)
-            elif reject_threshold[0] <= fine_grained_score < reject_threshold[1]:
-                contexts_moderately_relevant.append(context_doc_with_fine_grained_score)
-            elif fine_grained_score >= reject_threshold[1]:
-                contexts_highly_relevant.append(context_doc_with_fine_grained_score)
+        lowly, moderately, highly = bucket_by_thresholds(
+            fine_grained_scores[: len(contexts_emb_recalled)], reject_threshold
+        )
 
         return (
             contexts_emb_recalled,
-            contexts_lowly_relevant,
-            contexts_moderately_relevant,
-            contexts_highly_relevant,
+            [contexts_emb_recalled[i] for i in lowly],
+            [contexts_emb_recalled[i] for i in moderately],
+            [contexts_emb_recalled[i] for i in highly],
         )
 
-    @retry(max_retries=5, max_seconds=3600)
-    def llm_relevance_determiner(self, query, doc, llm, **kwargs):
+    @staticmethod
+    def _relevance_doc_content(doc):
         # NOTE: 如果有 index_content 且是结构化数据则取 index_content，否则才取 page_content（兼容写法）。
         # 待知识库后台对非结构化数据的处理方式的 index_content 不是默认使用LLM总结后的内容之后，
         # 可将“且是结构化数据”的逻辑去除。
         # NOTE: 目前暂不考虑检索返回模板对 page_content 的影响
-        if len(query) > len(kwargs["input"]) and query.endswith(f"\n{kwargs['input']}"):  # 拼接场景
-            his_sum = query[: -(len(kwargs["input"]) + 1)]
-            sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_relevance_determiner_concate_sys_prompt_template"
-            )
-            usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_relevance_determiner_concate_usr_prompt_template"
-            ).render(
-                his_sum=his_sum,
-                query=kwargs["input"],
-                doc=(
-                    doc.metadata["index_content"]
-                    if "index_content" in doc.metadata and is_structured_data(doc)
-                    else doc.page_content
-                ),
-            )
-        else:
-            sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_relevance_determiner_sys_prompt_template"
-            )
-            usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_relevance_determiner_usr_prompt_template"
-            ).render(
-                query=query,
-                doc=(
-                    doc.metadata["index_content"]
-                    if "index_content" in doc.metadata and is_structured_data(doc)
-                    else doc.page_content
-                ),
+        return (
+            doc.metadata["index_content"]
+            if "index_content" in doc.metadata and is_structured_data(doc)
+            else doc.page_content
+        )
+
+    @staticmethod
+    def _split_concated_query(query, **kwargs):
+        """拼接场景下（见 IndependentQueryMode.SUM_AND_CONCATE）拆分出历史对话摘要和用户提问"""
+        if len(query) > len(kwargs["input"]) and query.endswith(f"\n{kwargs['input']}"):
+            return query[: -(len(kwargs["input"]) + 1)], kwargs["input"]
+        return None, query
+
+    def _llm_relevance_determiner_messages(self, query, doc, **kwargs):
+        doc_content = self._relevance_doc_content(doc)
+        his_sum, query = self._split_concated_query(query, **kwargs)
+        if his_sum is not None:
+            return self._render_messages(
+                "llm_relevance_determiner_concate", his_sum=his_sum, query=query, doc=doc_content
             )
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
+        return self._render_messages("llm_relevance_determiner", query=query, doc=doc_content)
+
+    @retry(max_retries=5, max_seconds=3600)
+    def llm_relevance_determiner(self, query, doc, llm, **kwargs):
+        messages = self._llm_relevance_determiner_messages(query, doc, **kwargs)
         # TODO: 待确认：并发请求内部无法 dispatch_custom_event，所以无需调用 conditional_dispatch_custom_event
         invoke_func = invoke_decorator(llm.invoke, llm)
         resp = invoke_func(messages)
         resp_content = resp.content
         return not resp_content.startswith("0")  # 用0来判断，减少误删
 
+    @retry(max_retries=5, max_seconds=3600)
+    async def allm_relevance_determiner(self, query, doc, llm, **kwargs):
+        messages = self._llm_relevance_determiner_messages(query, doc, **kwargs)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        return not resp.content.startswith("0")
+
+    @staticmethod
+    def _relevance_judging_limits(kwargs):
+        deadline = kwargs.get("relevance_deadline", settings.BKAIDEV_RELEVANCE_DEADLINE)
+        early_stop_count = kwargs.get("relevance_early_stop_count", settings.BKAIDEV_RELEVANCE_EARLY_STOP_COUNT)
+        return (deadline if deadline and deadline > 0 else None), early_stop_count
+
+    @staticmethod
+    def _merge_relevances(fusion_docs, relevances, early_stopped):
+        """
+        合并相关性判断结果：
+        - 提前结束时，已确认的相关知识已经足够，其余未完成判断的知识视为不相关；
+        - 超时时，未完成判断的知识使用召回分数（embedding 分数）代替。
+        """
+        results = []
+        for index, doc in enumerate(fusion_docs):
+            if index in relevances:
+                results.append(1.0 if relevances[index] else 0.0)
+            elif early_stopped:
+                results.append(0.0)
+            else:
+                results.append(float(doc.metadata["__score__"]))
+        if len(relevances) < len(fusion_docs):
+            logger.warning(
+                f"相关性判断{'提前结束' if early_stopped else '超时'}，"
+                f"已完成 {len(relevances)}/{len(fusion_docs)} 篇知识的判断"
+            )
+        return results
+
     @timeit(message="使用LLM并发进行query和召回文档相关性判断")
     def llm_relevance_determiner_parallel(self, query, fusion_docs, llm, **kwargs):
+        deadline, early_stop_count = self._relevance_judging_limits(kwargs)
+        # 使用单独的取消令牌提交本批判断，结束时取消未完成的判断：未开始的直接取消，执行中的不再重试
+        parent_token = get_cancellation_token()
+        batch_token = parent_token.child() if parent_token else CancellationToken()
+        reset_token = set_cancellation_token(batch_token)
         try:
-            futures = [
-                intent_recognition_executor.submit(self.llm_relevance_determiner, query, doc, llm, **kwargs)
-                for doc in fusion_docs
-            ]
-            results = [1.0 if future.result() else 0.0 for future in futures]
+            futures = {
+                submit_cancellable(
+                    intent_recognition_executor, self.llm_relevance_determiner, query, doc, llm, **kwargs
+                ): index
+                for index, doc in enumerate(fusion_docs)
+            }
+        finally:
+            reset_cancellation_token(reset_token)
+        try:
+            relevances = {}
+            early_stopped = False
+            end_time = None if deadline is None else time.monotonic() + deadline
+            pending = set(futures)
+            while pending:
+                timeout = None if end_time is None else max(end_time - time.monotonic(), 0)
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for future in done:
+                    relevances[futures[future]] = future.result()
+                if early_stop_count and sum(relevances.values()) >= early_stop_count:
+                    early_stopped = True
+                    break
+            results = self._merge_relevances(fusion_docs, relevances, early_stopped)
+        except Exception:
+            # 如果 LLM 调用失败则不进行过滤
+            results = [1.0] * len(fusion_docs)
+            logger.warning("调用 LLM 来判断提问和知识相关性时失败，因此不进行过滤！")
+        finally:
+            batch_token.cancel()
+        logger.info(f"=====> < llm_relevance_determiner_parallel 的结果>：{results}")
+        return results
+
+    @timeit(message="使用LLM并发进行query和召回文档相关性判断")
+    async def allm_relevance_determiner_parallel(self, query, fusion_docs, llm, **kwargs):
+        deadline, early_stop_count = self._relevance_judging_limits(kwargs)
+        tasks = {
+            asyncio.ensure_future(self.allm_relevance_determiner(query, doc, llm, **kwargs)): index
+            for index, doc in enumerate(fusion_docs)
+        }
+        try:
+            relevances = {}
+            early_stopped = False
+            loop = asyncio.get_running_loop()
+            end_time = None if deadline is None else loop.time() + deadline
+            pending = set(tasks)
+            while pending:
+                timeout = None if end_time is None else max(end_time - loop.time(), 0)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    relevances[tasks[task]] = task.result()
+                if early_stop_count and sum(relevances.values()) >= early_stop_count:
+                    early_stopped = True
+                    break
+            results = self._merge_relevances(fusion_docs, relevances, early_stopped)
         except Exception:
             # 如果 LLM 调用失败则不进行过滤
             results = [1.0] * len(fusion_docs)
             logger.warning("调用 LLM 来判断提问和知识相关性时失败，因此不进行过滤！")
+        finally:
+            for task in tasks:
+                task.cancel()
         logger.info(f"=====> < llm_relevance_determiner_parallel 的结果>：{results}")
         return results
 
+    def _batch_docs_for_relevance(self, fusion_docs, **kwargs):
+        """按数量上限和 token 预算将知识依次分批，单篇超出预算的知识单独一批"""
+        max_docs = kwargs.get("llm_batch_relevance_max_docs", settings.BKAIDEV_LLM_BATCH_RELEVANCE_MAX_DOCS)
+        max_tokens = kwargs.get("llm_batch_relevance_max_tokens", settings.BKAIDEV_LLM_BATCH_RELEVANCE_MAX_TOKENS)
+        batches, batch, batch_tokens = [], [], 0
+        for index, doc in enumerate(fusion_docs):
+            doc_tokens = estimate_num_tokens(self._relevance_doc_content(doc))
+            if batch and (len(batch) >= max_docs or batch_tokens + doc_tokens > max_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(index)
+            batch_tokens += doc_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _llm_batch_relevance_determiner_messages(self, query, docs, **kwargs):
+        his_sum, query = self._split_concated_query(query, **kwargs)
+        return self._render_messages(
+            "llm_batch_relevance_determiner",
+            docs=[self._relevance_doc_content(doc) for doc in docs],
+            his_sum=his_sum,
+            query=query,
+        )
+
+    @staticmethod
+    def _parse_batch_relevances(resp_content, n_docs):
+        """解析 {"编号": 0/1} 格式的判断结果，格式不符或缺少某篇知识的结果时返回 None"""
+        content = resp_content.strip()
+        start, end = content.find("{"), content.rfind("}")
+        try:
+            data = json.loads(content[start : end + 1]) if 0 <= start < end else None
+            if not isinstance(data, dict):
+                raise ValueError
+            relevances = {int(key): int(value) for key, value in data.items()}
+            return [relevances[index] != 0 for index in range(1, n_docs + 1)]
+        except (ValueError, TypeError, KeyError):
+            logger.warning(f"无法解析批量相关性判断的结果：{resp_content}")
+            return None
+
     @retry(max_retries=5, max_seconds=3600)
-    def llm_context_compressor(self, provided_chat_history, query, candidate_context, llm, **kwargs):
+    def llm_batch_relevance_determiner(self, query, docs, llm, **kwargs):
+        """一次 LLM 调用判断多篇知识的相关性，结果无法解析时返回 None"""
+        messages = self._llm_batch_relevance_determiner_messages(query, docs, **kwargs)
+        resp = invoke_decorator(llm.invoke, llm)(messages)
+        return self._parse_batch_relevances(resp.content, len(docs))
+
+    @retry(max_retries=5, max_seconds=3600)
+    async def allm_batch_relevance_determiner(self, query, docs, llm, **kwargs):
+        messages = self._llm_batch_relevance_determiner_messages(query, docs, **kwargs)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        return self._parse_batch_relevances(resp.content, len(docs))
+
+    @staticmethod
+    def _merge_batch_relevances(n_docs, batches, batch_relevances):
+        """
+        合并各批的判断结果，返回 (分数列表, 需要逐篇判断的知识下标)
+        LLM 调用失败的批次不进行过滤，结果无法解析的批次改为逐篇判断
+        """
+        results = [1.0] * n_docs
+        fallback_indexes = []
+        for batch, relevances in zip(batches, batch_relevances):
+            if isinstance(relevances, Exception):
+                logger.warning(f"调用 LLM 批量判断提问和知识相关性时失败，因此不进行过滤！错误：{relevances}")
+            elif relevances is None:
+                fallback_indexes.extend(batch)
+            else:
+                for index, relevance in zip(batch, relevances):
+                    results[index] = 1.0 if relevance else 0.0
+        return results, fallback_indexes
+
+    @timeit(message="使用LLM批量进行query和召回文档相关性判断")
+    def llm_batch_relevance_determiner_parallel(self, query, fusion_docs, llm, **kwargs):
+        batches = self._batch_docs_for_relevance(fusion_docs, **kwargs)
+        futures = [
+            submit_cancellable(
+                intent_recognition_executor,
+                self.llm_batch_relevance_determiner,
+                query,
+                [fusion_docs[index] for index in batch],
+                llm,
+                **kwargs,
+            )
+            for batch in batches
+        ]
+        batch_relevances = []
+        for future in futures:
+            try:
+                batch_relevances.append(future.result())
+            except Exception as e:  # noqa: PERF203
+                batch_relevances.append(e)
+        results, fallback_indexes = self._merge_batch_relevances(len(fusion_docs), batches, batch_relevances)
+        if fallback_indexes:
+            fallback_results = self.llm_relevance_determiner_parallel(
+                query, [fusion_docs[index] for index in fallback_indexes], llm, **kwargs
+            )
+            for index, result in zip(fallback_indexes, fallback_results):
+                results[index] = result
+        logger.info(f"=====> < llm_batch_relevance_determiner_parallel 的结果>：{results}")
+        return results
+
+    @timeit(message="使用LLM批量进行query和召回文档相关性判断")
+    async def allm_batch_relevance_determiner_parallel(self, query, fusion_docs, llm, **kwargs):
+        batches = self._batch_docs_for_relevance(fusion_docs, **kwargs)
+        batch_relevances = await asyncio.gather(
+            *[
+                self.allm_batch_relevance_determiner(query, [fusion_docs[index] for index in batch], llm, **kwargs)
+                for batch in batches
+            ],
+            return_exceptions=True,
+        )
+        results, fallback_indexes = self._merge_batch_relevances(len(fusion_docs), batches, batch_relevances)
+        if fallback_indexes:
+            fallback_results = await self.allm_relevance_determiner_parallel(
+                query, [fusion_docs[index] for index in fallback_indexes], llm, **kwargs
+            )
+            for index, result in zip(fallback_indexes, fallback_results):
+                results[index] = result
+        logger.info(f"=====> < llm_batch_relevance_determiner_parallel 的结果>：{results}")
+        return results
+
+    def _llm_context_compressor_messages(self, provided_chat_history, query, candidate_context, **kwargs):
         # 默认使用 specific 方式。
         compressor_type = kwargs.get("llm_context_compressor_type", "specific")
         if compressor_type == "common":
-            sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_common_compressor_sys_prompt_template"
-            )
-            usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_common_compressor_usr_prompt_template"
-            ).render(content=candidate_context)
+            return self._render_messages("llm_common_compressor", content=candidate_context)
         elif compressor_type == "specific":
-            sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_context_compressor_sys_prompt_template"
-            )
-            usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_context_compressor_usr_prompt_template"
-            ).render(
+            return self._render_messages(
+                "llm_context_compressor",
                 provided_chat_history=provided_chat_history,
                 query=query,
                 candidate_context=candidate_context,
             )
         else:
             raise ValueError(f"不支持的知识库知识压缩方式：{compressor_type}")
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
+
+    @retry(max_retries=5, max_seconds=3600)
+    def llm_context_compressor(self, provided_chat_history, query, candidate_context, llm, **kwargs):
+        messages = self._llm_context_compressor_messages(provided_chat_history, query, candidate_context, **kwargs)
         # TODO: 待确认：并发请求内部无法 dispatch_custom_event，所以无需调用 conditional_dispatch_custom_event
         invoke_func = invoke_decorator(llm.invoke, llm)
         resp = invoke_func(messages)
@@ -695,12 +1047,25 @@ class IntentRecognition(BaseModel):
             resp_content = candidate_context
         return resp_content
 
+    @retry(max_retries=5, max_seconds=3600)
+    async def allm_context_compressor(self, provided_chat_history, query, candidate_context, llm, **kwargs):
+        messages = self._llm_context_compressor_messages(provided_chat_history, query, candidate_context, **kwargs)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        # 如果触发了混元的特殊回复，则不进行压缩
+        return candidate_context if resp.content == HUNYUAN_SPECIFIC_RESPONSE else resp.content
+
     @timeit(message="使用LLM并发进行知识库内容压缩总结")
     def llm_context_compressor_parallel(self, provided_chat_history, query, context, llm, **kwargs):
         try:
             futures = [
-                intent_recognition_executor.submit(
-                    self.llm_context_compressor, provided_chat_history, query, candidate_context, llm, **kwargs
+                submit_cancellable(
+                    intent_recognition_executor,
+                    self.llm_context_compressor,
+                    provided_chat_history,
+                    query,
+                    candidate_context,
+                    llm,
+                    **kwargs,
                 )
                 for candidate_context in context
             ]
@@ -711,8 +1076,22 @@ class IntentRecognition(BaseModel):
             logger.warning("调用 LLM 来对知识库内容进行压缩总结时失败，因此不进行总结！")
         return results
 
-    @retry(max_retries=5, max_seconds=3600)
-    def llm_intermediate_step_compressor(self, provided_chat_history, query, intermediate_step, llm, **kwargs):
+    @timeit(message="使用LLM并发进行知识库内容压缩总结")
+    async def allm_context_compressor_parallel(self, provided_chat_history, query, context, llm, **kwargs):
+        try:
+            results = await asyncio.gather(
+                *[
+                    self.allm_context_compressor(provided_chat_history, query, candidate_context, llm, **kwargs)
+                    for candidate_context in context
+                ]
+            )
+        except Exception:
+            # 如果 LLM 调用失败则不进行总结
+            results = context
+            logger.warning("调用 LLM 来对知识库内容进行压缩总结时失败，因此不进行总结！")
+        return results
+
+    def _llm_intermediate_step_compressor_messages(self, provided_chat_history, query, intermediate_step, **kwargs):
         # 注：如果使用 hunyuan-turbo，使用带query和会话历史的复杂压缩方式效果很差。
         # 例如用户最新提问如下：```今天又有啥大新闻？```"这样的例子，
         # 混元经常直接返回“很抱歉，我还未学习到如何回答这个问题的内容，暂时无法提供相关信息。”
@@ -721,32 +1100,30 @@ class IntentRecognition(BaseModel):
         # NOTE 更新：上述话术可能是触发混元的安全检查导致返回该内容。因此默认还是使用 specific 方式。
         compressor_type = kwargs.get("llm_context_compressor_type", "specific")
         if compressor_type == "common":
-            sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_common_compressor_sys_prompt_template"
-            )
-            usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_common_compressor_usr_prompt_template"
-            ).render(content=str(intermediate_step[1]))
+            return self._render_messages("llm_common_compressor", content=str(intermediate_step[1]))
         elif compressor_type == "specific":
-            sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_intermediate_step_compressor_sys_prompt_template"
-            ).render(
+            templates = self.__class__.intent_recognition_prompt_templates
+            sys_prompt = templates.get("llm_intermediate_step_compressor_sys_prompt_template").render(
                 candidate_tool_name=intermediate_step[0].tool,
             )
-            usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-                "llm_intermediate_step_compressor_usr_prompt_template"
-            ).render(
+            usr_prompt = templates.get("llm_intermediate_step_compressor_usr_prompt_template").render(
                 provided_chat_history=provided_chat_history,
                 query=query,
                 candidate_tool_name=intermediate_step[0].tool,
                 candidate_tool_result=str(intermediate_step[1]),
             )
+            return [
+                SystemMessage(content=sys_prompt),
+                HumanMessage(content=usr_prompt),
+            ]
         else:
             raise ValueError(f"不支持的工具调用结果压缩方式：{compressor_type}")
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
+
+    @retry(max_retries=5, max_seconds=3600)
+    def llm_intermediate_step_compressor(self, provided_chat_history, query, intermediate_step, llm, **kwargs):
+        messages = self._llm_intermediate_step_compressor_messages(
+            provided_chat_history, query, intermediate_step, **kwargs
+        )
         # TODO: 待确认：并发请求内部无法 dispatch_custom_event，所以无需调用 conditional_dispatch_custom_event
         invoke_func = invoke_decorator(llm.invoke, llm)
         resp = invoke_func(messages)
@@ -756,13 +1133,41 @@ class IntentRecognition(BaseModel):
             resp_content = str(intermediate_step[1])
         return resp_content
 
+    @retry(max_retries=5, max_seconds=3600)
+    async def allm_intermediate_step_compressor(self, provided_chat_history, query, intermediate_step, llm, **kwargs):
+        messages = self._llm_intermediate_step_compressor_messages(
+            provided_chat_history, query, intermediate_step, **kwargs
+        )
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        # 如果触发了混元的特殊回复，则不进行压缩
+        return str(intermediate_step[1]) if resp.content == HUNYUAN_SPECIFIC_RESPONSE else resp.content
+
+    def _replace_intermediate_steps(self, intermediate_steps, results):
+        try:
+            for intermediate_step_idx in range(len(intermediate_steps)):
+                if results[intermediate_step_idx] is not None:
+                    intermediate_steps[intermediate_step_idx] = (
+                        intermediate_steps[intermediate_step_idx][0],
+                        results[intermediate_step_idx],
+                    )
+        except Exception as e:
+            logger.warning(
+                f"调用 LLM 来对工具调用结果进行压缩总结时，执行结果解析和替换失败，错误：{e}。因此不进行总结。"
+            )
+
     @timeit(message="使用LLM并发进行工具调用结果压缩总结")
     def llm_intermediate_step_compressor_parallel(
         self, provided_chat_history, query, intermediate_steps, llm, **kwargs
     ):
         futures = {
-            intent_recognition_executor.submit(
-                self.llm_intermediate_step_compressor, provided_chat_history, query, intermediate_step, llm, **kwargs
+            submit_cancellable(
+                intent_recognition_executor,
+                self.llm_intermediate_step_compressor,
+                provided_chat_history,
+                query,
+                intermediate_step,
+                llm,
+                **kwargs,
             ): idx
             for idx, intermediate_step in enumerate(intermediate_steps)
         }
@@ -778,17 +1183,26 @@ class IntentRecognition(BaseModel):
                     )
         except Exception as e:
             logger.warning(f"调用 LLM 来对工具调用结果进行压缩总结时，LLM 调用失败，错误：{e}。因此不进行总结。")
-        try:
-            for intermediate_step_idx in range(len(intermediate_steps)):
-                if results[intermediate_step_idx] is not None:
-                    intermediate_steps[intermediate_step_idx] = (
-                        intermediate_steps[intermediate_step_idx][0],
-                        results[intermediate_step_idx],
-                    )
-        except Exception as e:
-            logger.warning(
-                f"调用 LLM 来对工具调用结果进行压缩总结时，执行结果解析和替换失败，错误：{e}。因此不进行总结。"
-            )
+        self._replace_intermediate_steps(intermediate_steps, results)
+
+    @timeit(message="使用LLM并发进行工具调用结果压缩总结")
+    async def allm_intermediate_step_compressor_parallel(
+        self, provided_chat_history, query, intermediate_steps, llm, **kwargs
+    ):
+        results = await asyncio.gather(
+            *[
+                self.allm_intermediate_step_compressor(provided_chat_history, query, intermediate_step, llm, **kwargs)
+                for intermediate_step in intermediate_steps
+            ],
+            return_exceptions=True,
+        )
+        for idx, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    f"调用 LLM 来对工具调用结果进行压缩总结时，LLM 调用失败，索引 {idx}，错误：{result}。因此该内容不进行总结。"
+                )
+                results[idx] = None
+        self._replace_intermediate_steps(intermediate_steps, results)
 
     @timeit(message="知识库检索（self query方式，使用完整query）")
     @retry(max_retries=5, max_seconds=3600)
@@ -803,6 +1217,9 @@ class IntentRecognition(BaseModel):
         # 这类求总数量的query确实会比较特殊，单条知识会导致LLM觉得不可回答，都返回了个0
         raise NotImplementedError
 
+    async def asearch_knowledge_self_query(self, query_for_search, llm, **kwargs):
+        raise NotImplementedError
+
     @timeit(message="知识类资源粗召+精排")
     def retrieve_and_parse_knowledge_resource(
         self,
@@ -837,144 +1254,27 @@ class IntentRecognition(BaseModel):
             ]
         ):
             raise RuntimeError("请至少选择一种召回方式！")
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            if with_index_specific_search:
-                future_index_specific = executor.submit(
-                    self.search_knowledge_index_specific,
-                    knowledge_items=knowledge_items,
-                    knowledge_bases=knowledge_bases,
-                    query=query_for_search,
-                    topk=knowledge_resource_rough_recall_topk,
-                    **kwargs,
-                )
-            if with_index_specific_search_init and query_for_search != kwargs["input"]:
-                future_index_specific_init = executor.submit(
-                    self.search_knowledge_index_specific,
-                    knowledge_items=knowledge_items,
-                    knowledge_bases=knowledge_bases,
-                    query=kwargs["input"],
-                    topk=knowledge_resource_rough_recall_topk,
-                    **kwargs,
-                )
-            if with_index_specific_search_translation:
-                future_translated_query = executor.submit(
-                    self.query_translation,
-                    query=(
-                        query_for_search
-                        if kwargs.get("use_independent_query_in_translation", False)
-                        else kwargs["input"]
-                    ),
-                    llm=llm,
-                    **kwargs,
-                )
-                translated_query = future_translated_query.result()
-                future_index_specific_translation = executor.submit(
-                    self.search_knowledge_index_specific_translation,
-                    knowledge_items=knowledge_items,
-                    knowledge_bases=knowledge_bases,
-                    translated_query=translated_query,
-                    topk=knowledge_resource_rough_recall_topk,
-                    **kwargs,
-                )
-                if kwargs.get("use_translated_query_in_scores", True) and translated_query:
-                    kwargs["translated_query"] = translated_query
-            if with_es_search_query:
-                future_es_query = executor.submit(
-                    self.search_knowledge_es_query,
-                    knowledge_items=knowledge_items,
-                    knowledge_bases=knowledge_bases,
-                    query=query_for_search,
-                    topk=knowledge_resource_rough_recall_topk,
-                    **kwargs,
-                )
-            if with_index_specific_search_keywords or with_es_search_keywords:
-                future_extracted_keywords = executor.submit(
-                    self.extract_query_keywords,
-                    query=query_for_search,
-                    llm=llm,
-                    **kwargs,
-                )
-            if with_index_specific_search_keywords:
-                future_index_specific_keywords = executor.submit(
-                    self.search_knowledge_index_specific_keywords,
-                    knowledge_items=knowledge_items,
-                    knowledge_bases=knowledge_bases,
-                    extracted_keywords=future_extracted_keywords.result(),
-                    topk=knowledge_resource_rough_recall_topk,
-                    **kwargs,
-                )
-            if with_es_search_keywords:
-                future_es_keywords = executor.submit(
-                    self.search_knowledge_es_keywords,
-                    knowledge_items=knowledge_items,
-                    knowledge_bases=knowledge_bases,
-                    extracted_keywords=future_extracted_keywords.result(),
-                    topk=knowledge_resource_rough_recall_topk,
-                    **kwargs,
-                )
-            # TODO: 去除 nature 分支
-            if with_structured_data:
-                future_nature = executor.submit(
-                    self.search_knowledge_nature,
-                    knowledge_items=knowledge_items,
-                    knowledge_bases=knowledge_bases,
-                    query=query_for_search,
-                    topk=knowledge_resource_rough_recall_topk,
-                    **kwargs,
-                )
-
-            retrieved_results_index_specific = future_index_specific.result() if with_index_specific_search else []
-
-            if with_index_specific_search_init and query_for_search != kwargs["input"]:
-                retrieved_results_index_specific_init = future_index_specific_init.result()
-            else:
-                retrieved_results_index_specific_init = []
-
-            if with_index_specific_search_translation:
-                retrieved_results_index_specific_translation = future_index_specific_translation.result()
-            else:
-                retrieved_results_index_specific_translation = []
-
-            if with_index_specific_search_keywords:
-                retrieved_results_index_specific_keywords = future_index_specific_keywords.result()
-            else:
-                retrieved_results_index_specific_keywords = []
-
-            retrieved_results_es_query = future_es_query.result() if with_es_search_query else []
-
-            retrieved_results_es_keywords = future_es_keywords.result() if with_es_search_keywords else []
-
-            retrieved_results_nature = future_nature.result() if with_structured_data else []
+        recall_results = self._knowledge_recall_scheduler(
+            query_for_search,
+            llm,
+            with_structured_data,
+            with_index_specific_search,
+            with_index_specific_search_init,
+            with_index_specific_search_translation,
+            with_index_specific_search_keywords,
+            with_es_search_query,
+            with_es_search_keywords,
+            knowledge_items,
+            knowledge_bases,
+            knowledge_resource_rough_recall_topk,
+            asynchronous=False,
+            **kwargs,
+        ).run()
+        self._update_translated_query(recall_results, kwargs)
 
-        if with_rrf:
-            fusion_docs = self.weighted_reciprocal_rank_fusion(
-                [
-                    retrieved_results_index_specific,
-                    retrieved_results_index_specific_init,
-                    retrieved_results_index_specific_translation,
-                    retrieved_results_index_specific_keywords,
-                    retrieved_results_es_query,
-                    retrieved_results_es_keywords,
-                    retrieved_results_nature,
-                ],
-                weights=[1.0 / 7] * 7,
-            )
-        else:
-            # NOTE: 推荐使用 with_rrf，否则因为ES支路的score使用该次召回的最大值来归一化的，最高分就是1，
-            # 相当于会更照顾ES支路的召回结果
-            fusion_docs = sorted(
-                deduplicate_knowledge_chunks(
-                    retrieved_results_index_specific
-                    + retrieved_results_index_specific_init
-                    + retrieved_results_index_specific_translation
-                    + retrieved_results_index_specific_keywords
-                    + retrieved_results_es_query
-                    + retrieved_results_es_keywords
-                    + retrieved_results_nature
-                ),
-                key=lambda x: x["metadata"]["__score__"],
-                reverse=True,
-            )
+        fusion_docs = self._fuse_retrieved_results(
+            [recall_results.get(branch, []) for branch in KNOWLEDGE_RECALL_BRANCHES], with_rrf
+        )
 
         # TODO: 这里也可以考虑先使用 rerank 小模型排个序再取 self_query_threshold_top_n 文档来判断 query 是否涉及结构化数据
         # TODO: 待去除 nature 分支后即可正式走以下流程：
@@ -995,6 +1295,214 @@ class IntentRecognition(BaseModel):
             context_docs_with_scores, fine_grained_scores, knowledge_resource_reject_threshold
         )
 
+    @timeit(message="知识类资源粗召+精排")
+    async def aretrieve_and_parse_knowledge_resource(
+        self,
+        query,
+        llm,
+        with_structured_data,
+        with_index_specific_search,
+        with_index_specific_search_init,
+        with_index_specific_search_translation,
+        with_index_specific_search_keywords,
+        with_es_search_query,
+        with_es_search_keywords,
+        with_rrf,
+        knowledge_items,
+        knowledge_bases,
+        knowledge_resource_rough_recall_topk,
+        knowledge_resource_reject_threshold,
+        knowledge_resource_fine_grained_score_type,
+        self_query_threshold_top_n,
+        **kwargs,
+    ):
+        """retrieve_and_parse_knowledge_resource 的异步版本，各路召回通过 asyncio.gather 并发执行"""
+        query_for_search = query
+        if not any(
+            [
+                with_index_specific_search,
+                with_index_specific_search_init,
+                with_index_specific_search_translation,
+                with_index_specific_search_keywords,
+                with_es_search_query,
+                with_es_search_keywords,
+            ]
+        ):
+            raise RuntimeError("请至少选择一种召回方式！")
+        recall_results = await self._knowledge_recall_scheduler(
+            query_for_search,
+            llm,
+            with_structured_data,
+            with_index_specific_search,
+            with_index_specific_search_init,
+            with_index_specific_search_translation,
+            with_index_specific_search_keywords,
+            with_es_search_query,
+            with_es_search_keywords,
+            knowledge_items,
+            knowledge_bases,
+            knowledge_resource_rough_recall_topk,
+            asynchronous=True,
+            **kwargs,
+        ).arun()
+        self._update_translated_query(recall_results, kwargs)
+
+        fusion_docs = self._fuse_retrieved_results(
+            [recall_results.get(branch, []) for branch in KNOWLEDGE_RECALL_BRANCHES], with_rrf
+        )
+
+        if with_structured_data and any([is_structured_data(doc) for doc in fusion_docs[:self_query_threshold_top_n]]):
+            # 在这种情况下需要使用 self-query 模块进行 2 次召回
+            re_retrieved_res = await self.asearch_knowledge_self_query(query_for_search, llm, **kwargs)
+            fusion_docs.extend(re_retrieved_res)
+
+        context_docs_with_scores = [(Document(**item), item["metadata"]["__score__"]) for item in fusion_docs]
+        fine_grained_scores = await self.acalculate_fine_grained_scores(
+            knowledge_resource_fine_grained_score_type,
+            query_for_search,
+            llm,
+            context_docs_with_scores,
+            **kwargs,
+        )
+        return self.separate_docs_by_scores(
+            context_docs_with_scores, fine_grained_scores, knowledge_resource_reject_threshold
+        )
+
+    def _knowledge_recall_scheduler(
+        self,
+        query_for_search,
+        llm,
+        with_structured_data,
+        with_index_specific_search,
+        with_index_specific_search_init,
+        with_index_specific_search_translation,
+        with_index_specific_search_keywords,
+        with_es_search_query,
+        with_es_search_keywords,
+        knowledge_items,
+        knowledge_bases,
+        knowledge_resource_rough_recall_topk,
+        asynchronous=False,
+        **kwargs,
+    ) -> RecallScheduler:
+        """
+        构建多路召回的依赖图：
+        - index_specific / index_specific_init / es_query / nature 直接检索；
+        - translated_query -> index_specific_translation；
+        - extracted_keywords -> index_specific_keywords / es_keywords，关键词只提取一次，两路共用。
+        asynchronous 为 True 时各阶段使用异步版本的方法
+        """
+        prefix = "a" if asynchronous else ""
+        search_kwargs = {
+            "knowledge_items": knowledge_items,
+            "knowledge_bases": knowledge_bases,
+            "topk": knowledge_resource_rough_recall_topk,
+            **kwargs,
+        }
+        stages = []
+        if with_index_specific_search:
+            stages.append(
+                RecallStage(
+                    "index_specific",
+                    partial(
+                        getattr(self, f"{prefix}search_knowledge_index_specific"),
+                        query=query_for_search,
+                        **search_kwargs,
+                    ),
+                )
+            )
+        if with_index_specific_search_init and query_for_search != kwargs["input"]:
+            stages.append(
+                RecallStage(
+                    "index_specific_init",
+                    partial(
+                        getattr(self, f"{prefix}search_knowledge_index_specific"),
+                        query=kwargs["input"],
+                        **search_kwargs,
+                    ),
+                )
+            )
+        if with_index_specific_search_translation:
+            translation_query = (
+                query_for_search if kwargs.get("use_independent_query_in_translation", False) else kwargs["input"]
+            )
+            stages.append(
+                RecallStage(
+                    "translated_query",
+                    partial(getattr(self, f"{prefix}query_translation"), query=translation_query, llm=llm, **kwargs),
+                )
+            )
+            stages.append(
+                RecallStage(
+                    "index_specific_translation",
+                    partial(getattr(self, f"{prefix}search_knowledge_index_specific_translation"), **search_kwargs),
+                    deps=("translated_query",),
+                )
+            )
+        if with_es_search_query:
+            stages.append(
+                RecallStage(
+                    "es_query",
+                    partial(
+                        getattr(self, f"{prefix}search_knowledge_es_query"), query=query_for_search, **search_kwargs
+                    ),
+                )
+            )
+        if with_index_specific_search_keywords or with_es_search_keywords:
+            stages.append(
+                RecallStage(
+                    "extracted_keywords",
+                    partial(
+                        getattr(self, f"{prefix}extract_query_keywords"), query=query_for_search, llm=llm, **kwargs
+                    ),
+                )
+            )
+        if with_index_specific_search_keywords:
+            stages.append(
+                RecallStage(
+                    "index_specific_keywords",
+                    partial(getattr(self, f"{prefix}search_knowledge_index_specific_keywords"), **search_kwargs),
+                    deps=("extracted_keywords",),
+                )
+            )
+        if with_es_search_keywords:
+            stages.append(
+                RecallStage(
+                    "es_keywords",
+                    partial(getattr(self, f"{prefix}search_knowledge_es_keywords"), **search_kwargs),
+                    deps=("extracted_keywords",),
+                )
+            )
+        # TODO: 去除 nature 分支
+        if with_structured_data:
+            stages.append(
+                RecallStage(
+                    "nature",
+                    partial(getattr(self, f"{prefix}search_knowledge_nature"), query=query_for_search, **search_kwargs),
+                )
+            )
+        return RecallScheduler(
+            stages,
+            budget=kwargs.get("knowledge_resource_recall_timeout", settings.BKAIDEV_KNOWLEDGE_RECALL_TIMEOUT),
+        )
+
+    @staticmethod
+    def _update_translated_query(recall_results, kwargs):
+        translated_query = recall_results.get("translated_query")
+        if kwargs.get("use_translated_query_in_scores", True) and translated_query:
+            kwargs["translated_query"] = translated_query
+
+    def _fuse_retrieved_results(self, retrieved_results, with_rrf):
+        if with_rrf:
+            return self.weighted_reciprocal_rank_fusion(
+                retrieved_results,
+                weights=[1.0 / len(retrieved_results)] * len(retrieved_results),
+            )
+        # NOTE: 推荐使用 with_rrf，否则因为ES支路的score使用该次召回的最大值来归一化的，最高分就是1，
+        # 相当于会更照顾ES支路的召回结果
+        candidates = CandidateSet(retrieved_results, keep="last")
+        return candidates.select(candidates.metadata_scores("__score__"))
+
     @timeit(message="工具类资源粗召+精排")
     def retrieve_and_parse_tool_resource(
         self,
@@ -1085,31 +1593,141 @@ class IntentRecognition(BaseModel):
 
         return independent_query
 
-    @retry(max_retries=5, max_seconds=3600)
-    def sum_chat_history_for_query(self, chat_history, query, llm, **kwargs):
-        if not chat_history:
-            return None
-        sys_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "sum_chat_history_for_query_sys_prompt_template"
+    async def aquery_cls_pipeline(
+        self, chat_history, query, llm, merge_query_cls_with_resp_or_rewrite, with_query_cls, **kwargs
+    ):
+        if merge_query_cls_with_resp_or_rewrite:
+            if chat_history:
+                result = await self.aquery_cls_with_resp_or_rewrite(chat_history, query, llm, **kwargs)
+                query_cls = result["query_cls"]
+            else:
+                query_cls = "new"
+
+            if query_cls == "finish":
+                return {
+                    "status": IntentStatus.AGENT_FINISH_WITH_RESPONSE,
+                    "response": result["response"],
+                }
+            elif query_cls == "continue":
+                independent_query = result["rewritten_query"]
+            elif query_cls == "new":
+                independent_query = query
+        else:
+            if chat_history:
+                if with_query_cls:
+                    query_cls = await self.alatest_query_classification(chat_history, query, llm, **kwargs)
+                else:
+                    query_cls = "continue"
+            else:
+                query_cls = "new"
+
+            if query_cls == "finish":
+                return {
+                    "status": IntentStatus.DIRECTLY_RESPOND_BY_AGENT,
+                }
+            elif query_cls == "continue":
+                independent_query = await self.aquery_rewrite_for_independence(chat_history, query, llm, **kwargs)
+            elif query_cls == "new":
+                independent_query = query
+
+        return independent_query
+
+    def _parse_sum_chat_history_for_query(self, resp_content):
+        if resp_content.strip() == "None":
+            return None
+        else:
+            return resp_content
+
+    @retry(max_retries=5, max_seconds=3600)
+    def sum_chat_history_for_query(self, chat_history, query, llm, **kwargs):
+        if not chat_history:
+            return None
+        messages = self._render_messages("sum_chat_history_for_query", chat_history=chat_history, query=query)
+        conditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+        invoke_func = invoke_decorator(llm.invoke, llm)
+        resp = invoke_func(messages)
+        conditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
+        return self._parse_sum_chat_history_for_query(resp.content)
+
+    @retry(max_retries=5, max_seconds=3600)
+    async def asum_chat_history_for_query(self, chat_history, query, llm, **kwargs):
+        if not chat_history:
+            return None
+        messages = self._render_messages("sum_chat_history_for_query", chat_history=chat_history, query=query)
+        await aconditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
+        resp = await ainvoke_decorator(llm.ainvoke, llm)(messages)
+        await aconditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
+        return self._parse_sum_chat_history_for_query(resp.content)
+
+    def independent_query_pipeline(
+        self,
+        independent_query,
+        llm,
+        tools,
+        with_structured_data,
+        with_index_specific_search,
+        with_index_specific_search_init,
+        with_index_specific_search_translation,
+        with_index_specific_search_keywords,
+        with_es_search_query,
+        with_es_search_keywords,
+        with_rrf,
+        knowledge_items: list[dict],
+        knowledge_bases: list[dict],
+        knowledge_resource_rough_recall_topk,
+        knowledge_resource_reject_threshold,
+        knowledge_resource_fine_grained_score_type,
+        self_query_threshold_top_n,
+        do_tool_resource_retrieve,
+        tool_resource_base_ids,
+        tool_resource_rough_recall_topk,
+        tool_resource_reject_threshold,
+        tool_resource_fine_grained_score_type,
+        gen_pseudo_tool_resource_desc,
+        **kwargs,
+    ):
+        # ====================================================================================================
+        # 资源召回和解析
+        # ====================================================================================================
+        # 知识类资源
+        if knowledge_items or knowledge_bases:
+            knowledge_resources = self.retrieve_and_parse_knowledge_resource(
+                query=independent_query,
+                llm=llm,
+                with_structured_data=with_structured_data,
+                with_index_specific_search=with_index_specific_search,
+                with_index_specific_search_init=with_index_specific_search_init,
+                with_index_specific_search_translation=with_index_specific_search_translation,
+                with_index_specific_search_keywords=with_index_specific_search_keywords,
+                with_es_search_query=with_es_search_query,
+                with_es_search_keywords=with_es_search_keywords,
+                with_rrf=with_rrf,
+                knowledge_items=knowledge_items,
+                knowledge_bases=knowledge_bases,
+                knowledge_resource_rough_recall_topk=knowledge_resource_rough_recall_topk,
+                knowledge_resource_reject_threshold=knowledge_resource_reject_threshold,
+                knowledge_resource_fine_grained_score_type=knowledge_resource_fine_grained_score_type,
+                self_query_threshold_top_n=self_query_threshold_top_n,
+                **kwargs,
+            )
+        else:
+            knowledge_resources = (None, None, None, None)
+
+        return self._make_independent_query_decision(
+            independent_query,
+            llm,
+            tools,
+            knowledge_resources,
+            do_tool_resource_retrieve,
+            tool_resource_base_ids,
+            tool_resource_rough_recall_topk,
+            tool_resource_reject_threshold,
+            tool_resource_fine_grained_score_type,
+            gen_pseudo_tool_resource_desc,
+            **kwargs,
         )
-        usr_prompt = self.__class__.intent_recognition_prompt_templates.get(
-            "sum_chat_history_for_query_usr_prompt_template"
-        ).render(chat_history=chat_history, query=query)
-        messages = [
-            SystemMessage(content=sys_prompt),
-            HumanMessage(content=usr_prompt),
-        ]
-        conditional_dispatch_custom_event("custom_event", {"front_end_display": False}, **kwargs)
-        invoke_func = invoke_decorator(llm.invoke, llm)
-        resp = invoke_func(messages)
-        conditional_dispatch_custom_event("custom_event", {"front_end_display": True}, **kwargs)
-        resp_content = resp.content
-        if resp_content.strip() == "None":
-            return None
-        else:
-            return resp_content
 
-    def independent_query_pipeline(
+    async def aindependent_query_pipeline(
         self,
         independent_query,
         llm,
@@ -1136,17 +1754,8 @@ class IntentRecognition(BaseModel):
         gen_pseudo_tool_resource_desc,
         **kwargs,
     ):
-        # ====================================================================================================
-        # 资源召回和解析
-        # ====================================================================================================
-        # 知识类资源
         if knowledge_items or knowledge_bases:
-            (
-                knowledge_resources_emb_recalled,
-                knowledge_resources_lowly_relevant,
-                knowledge_resources_moderately_relevant,
-                knowledge_resources_highly_relevant,
-            ) = self.retrieve_and_parse_knowledge_resource(
+            knowledge_resources = await self.aretrieve_and_parse_knowledge_resource(
                 query=independent_query,
                 llm=llm,
                 with_structured_data=with_structured_data,
@@ -1166,10 +1775,42 @@ class IntentRecognition(BaseModel):
                 **kwargs,
             )
         else:
-            knowledge_resources_emb_recalled = None
-            knowledge_resources_lowly_relevant = None
-            knowledge_resources_moderately_relevant = None
-            knowledge_resources_highly_relevant = None
+            knowledge_resources = (None, None, None, None)
+
+        return self._make_independent_query_decision(
+            independent_query,
+            llm,
+            tools,
+            knowledge_resources,
+            do_tool_resource_retrieve,
+            tool_resource_base_ids,
+            tool_resource_rough_recall_topk,
+            tool_resource_reject_threshold,
+            tool_resource_fine_grained_score_type,
+            gen_pseudo_tool_resource_desc,
+            **kwargs,
+        )
+
+    def _make_independent_query_decision(
+        self,
+        independent_query,
+        llm,
+        tools,
+        knowledge_resources,
+        do_tool_resource_retrieve,
+        tool_resource_base_ids,
+        tool_resource_rough_recall_topk,
+        tool_resource_reject_threshold,
+        tool_resource_fine_grained_score_type,
+        gen_pseudo_tool_resource_desc,
+        **kwargs,
+    ):
+        (
+            knowledge_resources_emb_recalled,
+            knowledge_resources_lowly_relevant,
+            knowledge_resources_moderately_relevant,
+            knowledge_resources_highly_relevant,
+        ) = knowledge_resources
 
         # 工具类资源
         if do_tool_resource_retrieve:
@@ -1197,7 +1838,7 @@ class IntentRecognition(BaseModel):
             tool_resources_lowly_relevant = None
             tool_resources_moderately_relevant = None
             tool_resources_highly_relevant = None
-            candidate_tools = copy.deepcopy(tools)
+            candidate_tools = list(tools)
 
         # ====================================================================================================
         # 进行决策
@@ -1223,6 +1864,45 @@ class IntentRecognition(BaseModel):
             "knowledge_resources_moderately_relevant": knowledge_resources_moderately_relevant,
         }
 
+    def _fast_track_intent_recognition(self, query, intent_code, retrieved_knowledge_resources):
+        """无需召回即可确定意图的情况，返回意图识别结果；否则返回 None，继续走正常通道"""
+        # ====================================================================================================
+        # 如果带历史检索上下文，则说明用户的意图非常明确，需设置工具列表为空，且直接使用该上下文进行回答
+        # ====================================================================================================
+        if retrieved_knowledge_resources:
+            return {
+                "status": IntentStatus.QA_WITH_RETRIEVED_KNOWLEDGE_RESOURCES,
+                "retrieved_knowledge_resources": retrieved_knowledge_resources,
+            }
+
+        # ====================================================================================================
+        # 为【无需history的】且可通过3种特殊意图识别方式判断的query提供快速单跳通道
+        # ====================================================================================================
+        # NOTE:
+        # 下述3种快速单跳通道，根据跳至的意图类别的不同，后续走的逻辑分支更不相同，需要每种都去特殊支持。例如：
+        # 假设是跳至某个具体的工具，则直接调用LLM进行工具参数生成，然后调用工具即可
+        # 假设是跳至某个智能工单查证场景这种特殊的通道，则调用对应的分类小模型，然后进行工单查证
+        # 假设是跳至某个特殊的知识库索引，则可能是调用对应的索引进行召回，然后进行LLM问答
+        if intent_code:
+            intent = self.intent_recognition_by_code(intent_code)
+            raise NotImplementedError("需要根据该具体的intent设定进行后续对应处理逻辑的实现")
+        intent = self.intent_recognition_by_template(query)
+        if intent:
+            raise NotImplementedError("需要根据该具体的intent设定进行后续对应处理逻辑的实现")
+        intent = self.intent_recognition_by_exclusive_model(query)
+        if intent:
+            raise NotImplementedError("需要根据该具体的intent设定进行后续对应处理逻辑的实现")
+
+        # ====================================================================================================
+        # 快速单跳通道的实际实现例子
+        # ====================================================================================================
+        intent = self.intent_recognition_by_template_one(query)
+        if intent == "directly_respond":
+            return {
+                "status": IntentStatus.DIRECTLY_RESPOND_BY_AGENT,
+            }
+        return None
+
     @timeit(message="意图识别总流程")
     def exec_intent_recognition(
         self,
@@ -1335,41 +2015,9 @@ class IntentRecognition(BaseModel):
                 **kwargs,
             )
 
-        # ====================================================================================================
-        # 如果带历史检索上下文，则说明用户的意图非常明确，需设置工具列表为空，且直接使用该上下文进行回答
-        # ====================================================================================================
-        if retrieved_knowledge_resources:
-            return {
-                "status": IntentStatus.QA_WITH_RETRIEVED_KNOWLEDGE_RESOURCES,
-                "retrieved_knowledge_resources": retrieved_knowledge_resources,
-            }
-
-        # ====================================================================================================
-        # 为【无需history的】且可通过3种特殊意图识别方式判断的query提供快速单跳通道
-        # ====================================================================================================
-        # NOTE:
-        # 下述3种快速单跳通道，根据跳至的意图类别的不同，后续走的逻辑分支更不相同，需要每种都去特殊支持。例如：
-        # 假设是跳至某个具体的工具，则直接调用LLM进行工具参数生成，然后调用工具即可
-        # 假设是跳至某个智能工单查证场景这种特殊的通道，则调用对应的分类小模型，然后进行工单查证
-        # 假设是跳至某个特殊的知识库索引，则可能是调用对应的索引进行召回，然后进行LLM问答
-        if intent_code:
-            intent = self.intent_recognition_by_code(intent_code)
-            raise NotImplementedError("需要根据该具体的intent设定进行后续对应处理逻辑的实现")
-        intent = self.intent_recognition_by_template(query)
-        if intent:
-            raise NotImplementedError("需要根据该具体的intent设定进行后续对应处理逻辑的实现")
-        intent = self.intent_recognition_by_exclusive_model(query)
-        if intent:
-            raise NotImplementedError("需要根据该具体的intent设定进行后续对应处理逻辑的实现")
-
-        # ====================================================================================================
-        # 快速单跳通道的实际实现例子
-        # ====================================================================================================
-        intent = self.intent_recognition_by_template_one(query)
-        if intent == "directly_respond":
-            return {
-                "status": IntentStatus.DIRECTLY_RESPOND_BY_AGENT,
-            }
+        fast_track_results = self._fast_track_intent_recognition(query, intent_code, retrieved_knowledge_resources)
+        if fast_track_results is not None:
+            return fast_track_results
 
         # ====================================================================================================
         # 正常通道
@@ -1422,3 +2070,120 @@ class IntentRecognition(BaseModel):
             gen_pseudo_tool_resource_desc,
             **kwargs,
         )
+
+    @timeit(message="意图识别总流程")
+    async def aexec_intent_recognition(
+        self,
+        query: str,
+        llm: BaseChatModel,
+        tools: List[BaseTool],
+        callbacks: Callbacks = None,
+        chat_history: List = None,
+        intent_code: str = None,
+        with_query_cls: bool = True,
+        force_process_by_agent: bool = False,
+        with_structured_data: bool = False,
+        with_index_specific_search: bool = True,
+        with_index_specific_search_init: bool = True,
+        with_index_specific_search_translation: bool = False,
+        with_index_specific_search_keywords: bool = False,
+        with_es_search_query: bool = False,
+        with_es_search_keywords: bool = False,
+        with_rrf: bool = True,
+        knowledge_items: List[dict] = [],
+        knowledge_bases: List[dict] = [],
+        knowledge_resource_rough_recall_topk: int = 10,
+        knowledge_resource_reject_threshold: Tuple[float, float] = (0.0001, 0.1),
+        knowledge_resource_fine_grained_score_type: FineGrainedScoreType = FineGrainedScoreType.LLM,
+        self_query_threshold_top_n: int = 0,
+        tool_resource_base_ids: List[int] = [],
+        tool_resource_rough_recall_topk: int = 10,
+        tool_resource_reject_threshold: Tuple[float, float] = (0.25, 0.75),
+        tool_resource_fine_grained_score_type: FineGrainedScoreType = FineGrainedScoreType.EXCLUSIVE_SIMILARITY_MODEL,
+        tool_count_threshold: int = 10000,
+        gen_pseudo_tool_resource_desc: bool = True,
+        retrieved_knowledge_resources: List = None,
+        merge_query_cls_with_resp_or_rewrite: bool = False,
+        independent_query_mode: IndependentQueryMode = IndependentQueryMode.SUM_AND_CONCATE,
+        **kwargs,
+    ):
+        """
+        exec_intent_recognition 的异步版本，参数含义相同
+
+        LLM 调用使用 llm.ainvoke，知识库查询使用异步接口，多路召回和并发判断使用 asyncio.gather，不占用线程池
+        """
+        if callbacks:
+            _set_config_context({"callbacks": callbacks})
+
+        if force_process_by_agent:
+            return await self.aindependent_query_pipeline(
+                query,
+                None,
+                [],
+                with_structured_data,
+                with_index_specific_search,
+                with_index_specific_search_init,
+                with_index_specific_search_translation,
+                with_index_specific_search_keywords,
+                with_es_search_query,
+                with_es_search_keywords,
+                with_rrf,
+                knowledge_items,
+                knowledge_bases,
+                knowledge_resource_rough_recall_topk,
+                knowledge_resource_reject_threshold,
+                knowledge_resource_fine_grained_score_type,
+                self_query_threshold_top_n,
+                False,
+                None,
+                None,
+                None,
+                None,
+                None,
+                **kwargs,
+            )
+
+        fast_track_results = self._fast_track_intent_recognition(query, intent_code, retrieved_knowledge_resources)
+        if fast_track_results is not None:
+            return fast_track_results
+
+        do_tool_resource_retrieve = tool_resource_base_ids and len(tools) > tool_count_threshold
+        res = query
+        if knowledge_items or knowledge_bases or do_tool_resource_retrieve:
+            if independent_query_mode == IndependentQueryMode.REWRITE:
+                res = await self.aquery_cls_pipeline(
+                    chat_history, query, llm, merge_query_cls_with_resp_or_rewrite, with_query_cls, **kwargs
+                )
+            elif independent_query_mode == IndependentQueryMode.SUM_AND_CONCATE:
+                sum_res = await self.asum_chat_history_for_query(chat_history, query, llm, **kwargs)
+                if sum_res:
+                    res = f"{sum_res}\n{query}"
+
+        if isinstance(res, dict) and "status" in res:
+            return res
+        return await self.aindependent_query_pipeline(
+            res,
+            llm,
+            tools,
+            with_structured_data,
+            with_index_specific_search,
+            with_index_specific_search_init,
+            with_index_specific_search_translation,
+            with_index_specific_search_keywords,
+            with_es_search_query,
+            with_es_search_keywords,
+            with_rrf,
+            knowledge_items,
+            knowledge_bases,
+            knowledge_resource_rough_recall_topk,
+            knowledge_resource_reject_threshold,
+            knowledge_resource_fine_grained_score_type,
+            self_query_threshold_top_n,
+            do_tool_resource_retrieve,
+            tool_resource_base_ids,
+            tool_resource_rough_recall_topk,
+            tool_resource_reject_threshold,
+            tool_resource_fine_grained_score_type,
+            gen_pseudo_tool_resource_desc,
+            **kwargs,
+        )
@@ -180,6 +180,20 @@ llm_relevance_determiner_concate_usr_prompt_template = env.from_string(
     """给你的历史对话内容摘要如下：```{{his_sum}}```\n\n\n候选文档如下：```{{doc}}```\n\n\n用户最新提问如下：```{{query}}```"""
 )
 
+llm_batch_relevance_determiner_sys_prompt_template = """给你一个用户提问和若干个带编号的候选文档，
+你负责逐个判断每个候选文档的内容是否可以回答用户提问（部分回答也可以）。
+如果可以回答或者可以部分回答，该文档的判断结果为数字1
+如果完全不可以回答，该文档的判断结果为数字0
+如果还给你提供了历史对话内容摘要，它只用于帮助你理解用户提问的意思（也可能并没有帮助，此时直接忽略即可）。
+请以 JSON 格式返回所有候选文档的判断结果，key 为候选文档编号，value 为判断结果，例如：{"1": 1, "2": 0, "3": 1}
+必须对每个候选文档都给出判断结果，永远只返回 JSON 即可，不要返回其他任何内容！
+"""
+llm_batch_relevance_determiner_usr_prompt_template = env.from_string(
+    """{% for doc in docs %}候选文档 {{ loop.index }} 如下：```{{doc}}```\n\n\n{% endfor %}"""
+    """{% if his_sum %}历史对话内容摘要如下：```{{his_sum}}```\n\n\n{% endif %}"""
+    """用户提问如下：```{{query}}```"""
+)
+
 llm_context_compressor_sys_prompt_template = """给你一个用户最新提问和一个候选文档，
 你负责判断候选文档内容是否可以回答用户最新提问（部分回答也可以）。
 1. 如果可以，请根据用户最新提问对候选文档内容中可以回答用户最新提问的那部分内容进行摘要总结并返回。
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from aidev_agent.core.utils.async_utils import submit_cancellable
+
+logger = logging.getLogger(__name__)
+
+
+class RecallStage(NamedTuple):
+    """
+    召回流程中的一个阶段
+
+    :param name: 阶段名称，同时也是其结果传给下游阶段时使用的参数名
+    :param func: 阶段的执行函数，依赖阶段的结果以关键字参数传入；异步调度时需返回 awaitable
+    :param deps: 依赖的阶段名称
+    """
+
+    name: str
+    func: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+
+
+class RecallScheduler:
+    """
+    多路召回的依赖图调度器
+
+    每个阶段在其依赖的阶段全部完成后立即开始执行，例如翻译完成后马上发起翻译后的检索，不需要等待其它支路；
+    设置了整体耗时预算时，超时后不再等待未完成的阶段，取消它们并只返回已完成阶段的结果。
+    阶段抛出的异常会直接抛给调用方。
+    """
+
+    def __init__(self, stages: Sequence[RecallStage], budget: Optional[float] = None):
+        names = set()
+        for stage in stages:
+            if stage.name in names:
+                raise ValueError(f"召回阶段名称重复：{stage.name}")
+            # 依赖的阶段必须先声明，保证不会出现环
+            if unknown_deps := [dep for dep in stage.deps if dep not in names]:
+                raise ValueError(f"召回阶段 {stage.name} 依赖的阶段 {unknown_deps} 不存在或未在其之前声明")
+            names.add(stage.name)
+        self.stages = list(stages)
+        self.budget = budget if budget and budget > 0 else None
+        # 因超时而未完成的阶段
+        self.unfinished: List[str] = []
+
+    def _pop_ready_stages(self, pending: List[RecallStage], results: Dict[str, Any]) -> List[RecallStage]:
+        ready = [stage for stage in pending if all(dep in results for dep in stage.deps)]
+        for stage in ready:
+            pending.remove(stage)
+        return ready
+
+    def _finish(self, results: Dict[str, Any], timed_out: bool) -> Dict[str, Any]:
+        self.unfinished = [stage.name for stage in self.stages if stage.name not in results] if timed_out else []
+        if self.unfinished:
+            logger.warning(f"召回超过耗时预算 {self.budget}s，放弃未完成的阶段：{self.unfinished}")
+        return results
+
+    def run(self) -> Dict[str, Any]:
+        """在线程池中执行各阶段，返回已完成阶段的结果"""
+        pending = list(self.stages)
+        results: Dict[str, Any] = {}
+        futures: Dict[concurrent.futures.Future, RecallStage] = {}
+        deadline = None if self.budget is None else time.monotonic() + self.budget
+        timed_out = False
+        executor = concurrent.futures.ThreadPoolExecutor()
+        try:
+            while True:
+                for stage in self._pop_ready_stages(pending, results):
+                    kwargs = {dep: results[dep] for dep in stage.deps}
+                    futures[submit_cancellable(executor, stage.func, **kwargs)] = stage
+                if not futures:
+                    break
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                done, _ = concurrent.futures.wait(
+                    futures, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                if not done:
+                    timed_out = True
+                    break
+                for future in done:
+                    results[futures.pop(future).name] = future.result()
+        finally:
+            # 已经开始执行的线程无法中断，不再等待其结束
+            executor.shutdown(wait=not futures, cancel_futures=True)
+        return self._finish(results, timed_out)
+
+    async def arun(self) -> Dict[str, Any]:
+        """在当前事件循环中并发执行各阶段，返回已完成阶段的结果"""
+        pending = list(self.stages)
+        results: Dict[str, Any] = {}
+        tasks: Dict[asyncio.Future, RecallStage] = {}
+        loop = asyncio.get_running_loop()
+        deadline = None if self.budget is None else loop.time() + self.budget
+        timed_out = False
+        try:
+            while True:
+                for stage in self._pop_ready_stages(pending, results):
+                    kwargs = {dep: results[dep] for dep in stage.deps}
+                    tasks[asyncio.ensure_future(stage.func(**kwargs))] = stage
+                if not tasks:
+                    break
+                timeout = None if deadline is None else max(deadline - loop.time(), 0)
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    timed_out = True
+                    break
+                for task in done:
+                    results[tasks.pop(task).name] = task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks)
+        return self._finish(results, timed_out)
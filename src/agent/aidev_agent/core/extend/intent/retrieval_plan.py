@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+KNOWLEDGE_TYPE_TO_ID_TYPE = {
+    "knowledge_items": "knowledge_id",
+    "knowledge_bases": "knowledge_base_id",
+}
+RESOURCE_TYPE_TO_INDEX_NAMES_KEY = {
+    "knowledge": "knowledge_resource_index_names",
+    "tool": "tool_resource_index_names",
+}
+
+
+def _same(a, b) -> bool:
+    # 为空时（None、[]、{}）视为相同
+    return a is b or (not a and not b)
+
+
+class RetrievalPlan:
+    """
+    index_specific 检索的检索计划：每个知识（库）解析后使用的索引名称
+
+    解析 index_config、校验自定义索引只需要做一次，之后每次检索只替换 query，
+    同一轮对话的多路召回（原始 query、改写后的 query、翻译、关键词）以及同一个 agent 的后续对话都可以复用。
+    按资源类型在首次检索时解析，校验不通过时在检索时报错，与不使用检索计划时一致。
+
+    :param knowledge_items: 知识列表
+    :param knowledge_bases: 知识库列表
+    :param custom_index_names: 自定义的索引名称，即 {"knowledge": kwargs["knowledge_resource_index_names"], ...}
+    """
+
+    def __init__(
+        self,
+        knowledge_items: Optional[List[dict]],
+        knowledge_bases: Optional[List[dict]],
+        custom_index_names: Optional[Dict[str, Any]] = None,
+    ):
+        self.knowledge_items = knowledge_items
+        self.knowledge_bases = knowledge_bases
+        self.custom_index_names = custom_index_names or {}
+        # resource_type -> [(index_name, id_type, id), ...]
+        self._indexes: Dict[str, List[Tuple[str, str, Any]]] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_kwargs(cls, knowledge_items, knowledge_bases, **kwargs) -> "RetrievalPlan":
+        return cls(
+            knowledge_items,
+            knowledge_bases,
+            {resource_type: kwargs.get(key) for resource_type, key in RESOURCE_TYPE_TO_INDEX_NAMES_KEY.items()},
+        )
+
+    def matches(self, knowledge_items, knowledge_bases, **kwargs) -> bool:
+        """是否为同一批知识（库）和自定义索引构建的检索计划，按对象是否相同判断"""
+        return (
+            _same(self.knowledge_items, knowledge_items)
+            and _same(self.knowledge_bases, knowledge_bases)
+            and all(
+                _same(self.custom_index_names.get(resource_type), kwargs.get(key))
+                for resource_type, key in RESOURCE_TYPE_TO_INDEX_NAMES_KEY.items()
+            )
+        )
+
+    def index_query_kwargs(self, query: str, resource_type: str = "knowledge") -> List[dict]:
+        indexes = self._indexes.get(resource_type)
+        if indexes is None:
+            with self._lock:
+                indexes = self._indexes.get(resource_type)
+                if indexes is None:
+                    indexes = self._indexes[resource_type] = self._resolve(resource_type)
+        return [
+            {"index_name": index_name, "index_value": query, id_type: knowledge_id}
+            for index_name, id_type, knowledge_id in indexes
+        ]
+
+    def _resolve(self, resource_type: str) -> List[Tuple[str, str, Any]]:
+        if resource_type not in RESOURCE_TYPE_TO_INDEX_NAMES_KEY:
+            raise ValueError(f"不支持的 resource 类型：{resource_type}")
+        custom_index_names = self.custom_index_names.get(resource_type) or {}
+        indexes = []
+        for knowledge_type, knowledges in [
+            ("knowledge_items", self.knowledge_items),
+            ("knowledge_bases", self.knowledge_bases),
+        ]:
+            if knowledges:
+                indexes.extend(self._resolve_knowledges(knowledges, knowledge_type, custom_index_names))
+        return indexes
+
+    @staticmethod
+    def _resolve_knowledges(knowledges, knowledge_type, custom_index_names):
+        supported_ids = [knowledge.get("id") for knowledge in knowledges]
+        custom_index_names_type = custom_index_names.get(knowledge_type)
+        indexes = []
+        for knowledge in knowledges:
+            all_index_names = []
+            supported_index_names = []
+            if index_config := knowledge.get("index_config"):
+                for index_type in ["full_text_indexes", "vector_indexes"]:
+                    if index_list := index_config.get(index_type):
+                        for index in index_list:
+                            if index_name := index.get("index_name"):
+                                supported_index_names.append(index_name)
+
+                if custom_index_names_type:
+                    if not set(custom_index_names_type.keys()).issubset(set(supported_ids)):
+                        raise ValueError(
+                            f"传入的 {knowledge_type} 类型的 ID 有：{supported_ids}，"
+                            f"但传入的 {knowledge_type} 类型的自定义的向量索引 ID 有："
+                            f"{list(custom_index_names_type.keys())}，"
+                            "请确保后者是前者的子集！"
+                        )
+                    if custom_index_names_type_id := custom_index_names_type.get(knowledge.get("id")):
+                        if not set(custom_index_names_type_id).issubset(set(supported_index_names)):
+                            raise ValueError(
+                                f"{knowledge_type} 类型的知识（库）ID {knowledge.get('id')} "
+                                f"支持的向量索引有：{supported_index_names}，"
+                                f"但传入的自定义向量索引为：{custom_index_names_type_id}，"
+                                "请传入支持的向量索引的子集！"
+                            )
+                        all_index_names = custom_index_names_type_id
+            if not all_index_names:
+                all_index_names = supported_index_names
+            if not all_index_names:
+                raise RuntimeError(f"{knowledge_type} 类型的知识（库）ID {knowledge.get('id')} 的索引为空！")
+            id_type = KNOWLEDGE_TYPE_TO_ID_TYPE[knowledge_type]
+            indexes.extend((index_name, id_type, knowledge["id"]) for index_name in all_index_names)
+        return indexes
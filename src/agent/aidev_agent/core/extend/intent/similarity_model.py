@@ -18,8 +18,10 @@ to the current version of the project delivered to anyone in the future.
 
 from typing import List, Tuple
 
+from aidev_agent.config import settings
 from aidev_agent.core.utils.model_management.registry import RegistryPluginMixIn
 
+from .cross_encoder import get_local_cross_encoder
 from .utils import timeit
 
 reg = RegistryPluginMixIn()
@@ -30,8 +32,9 @@ def calculate_similarity(
     text_pairs: List[Tuple[str, str]],
     similarity_model_gpu_cls: str = "model.self_host.similarity_model.SimilarityModel",
 ) -> List[float]:
-    similarity_model_gpu = reg.get_registered_object(service_name=similarity_model_gpu_cls)
-    if text_pairs:
-        return similarity_model_gpu.compute_similarity(text_pairs)
-    else:
+    if not text_pairs:
         return []
+    if settings.SIMILARITY_MODEL_BACKEND == "local":
+        return get_local_cross_encoder().compute_similarity(text_pairs)
+    similarity_model_gpu = reg.get_registered_object(service_name=similarity_model_gpu_cls)
+    return similarity_model_gpu.compute_similarity(text_pairs)
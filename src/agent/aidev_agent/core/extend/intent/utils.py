@@ -16,18 +16,24 @@ We undertake not to change the open source license (MIT license) applicable
 to the current version of the project delivered to anyone in the future.
 """
 
+import asyncio
 import logging
 import os
 import time
 import traceback
 from functools import wraps
 
-from langchain_core.callbacks.manager import dispatch_custom_event
+import numpy as np
+from asgiref.sync import sync_to_async
+from langchain_core.callbacks.manager import adispatch_custom_event, dispatch_custom_event
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, SystemMessage
 
 from aidev_agent.config import settings
+from aidev_agent.core.extend.intent.candidates import topk_indices
 from aidev_agent.core.extend.models.llm_gateway import ChatModel
+from aidev_agent.core.utils.async_utils import get_cancellation_token
+from aidev_agent.core.utils.cache import llm_response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +56,19 @@ def is_structured_data(doc):
 
 def timeit(message=""):
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if kwargs.pop("disable_timeit", False):
+                    return await func(*args, **kwargs)
+                st_time = time.time()
+                result = await func(*args, **kwargs)
+                logger.info(f"=====> {message}耗时 ({func.__name__}): {time.time() - st_time:.2f}s")
+                return result
+
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             if not kwargs.pop("disable_timeit", False):
@@ -66,23 +85,48 @@ def timeit(message=""):
     return decorator
 
 
+def _should_retry(try_cnt, start_time, max_retries, max_seconds):
+    logger.info(
+        f"\n\n=====\n>>>>> 执行出错，重试中。当前尝试次数: {try_cnt}。"
+        f"详细错误情况：\n{traceback.format_exc()}\n=====\n\n"
+    )
+    # 如果达到最大重试次数或者超过最大时间限制，最后一次重试的异常将被抛出。
+    # 这样可以确保在所有重试都失败的情况下，异常会被正确地抛出并处理。
+    return try_cnt < max_retries and (time.time() - start_time) < max_seconds
+
+
 def retry(max_retries=5, max_seconds=1800):
     def _retry(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try_cnt = 0
+                start_time = time.time()
+                while True:
+                    if cancellation_token := get_cancellation_token():
+                        cancellation_token.raise_if_cancelled()
+                    try:
+                        try_cnt += 1
+                        return await func(*args, **kwargs)
+                    except Exception:  # noqa: PERF203
+                        if not _should_retry(try_cnt, start_time, max_retries, max_seconds):
+                            raise
+
+            return async_wrapper
+
         def wrapper(*args, **kwargs):
             try_cnt = 0
             start_time = time.time()
             while try_cnt < max_retries and (time.time() - start_time) < max_seconds:
+                # 请求已被取消时不再发起新的调用
+                if cancellation_token := get_cancellation_token():
+                    cancellation_token.raise_if_cancelled()
                 try:
                     try_cnt += 1
                     return func(*args, **kwargs)
                 except Exception:  # noqa: PERF203
-                    logger.info(
-                        f"\n\n=====\n>>>>> 执行出错，重试中。当前尝试次数: {try_cnt}。"
-                        f"详细错误情况：\n{traceback.format_exc()}\n=====\n\n"
-                    )
-                    if try_cnt >= max_retries or (time.time() - start_time) >= max_seconds:
-                        # 如果达到最大重试次数或者超过最大时间限制，最后一次重试的异常将被抛出。
-                        # 这样可以确保在所有重试都失败的情况下，异常会被正确地抛出并处理。
+                    if not _should_retry(try_cnt, start_time, max_retries, max_seconds):
                         raise
                     continue
 
@@ -91,6 +135,27 @@ def retry(max_retries=5, max_seconds=1800):
     return _retry
 
 
+def _sync_fallback(sync_name, is_classmethod=False):
+    async def fallback(self, *args, **kwargs):
+        # 不绑定到固定的线程，并发调用（如 asyncio.gather）时可以并行执行
+        return await sync_to_async(getattr(self, sync_name), thread_sensitive=False)(*args, **kwargs)
+
+    fallback.__name__ = fallback.__qualname__ = f"a{sync_name}"
+    return classmethod(fallback) if is_classmethod else fallback
+
+
+def install_sync_fallbacks(cls, hooks):
+    """
+    异步流程只调用 a* 方法：子类只重写了同步方法、没有同时重写对应的异步方法时，
+    异步方法改为在线程中执行子类的同步方法，避免异步流程绕过子类的逻辑。在 __init_subclass__ 中调用
+    :param hooks: 同步方法名，对应的异步方法名为 a + 同步方法名
+    """
+    for sync_name in hooks:
+        async_name = f"a{sync_name}"
+        if sync_name in cls.__dict__ and async_name not in cls.__dict__:
+            setattr(cls, async_name, _sync_fallback(sync_name, isinstance(cls.__dict__[sync_name], classmethod)))
+
+
 def deduplicate_tools(candidate_tools):
     return list({tool.name: tool for tool in candidate_tools}.values())
 
@@ -112,15 +177,19 @@ def conditional_dispatch_custom_event(name, data, **kwargs):
         dispatch_custom_event(name, data)
 
 
+async def aconditional_dispatch_custom_event(name, data, **kwargs):
+    if kwargs.get("enable_custom_event", True):
+        await adispatch_custom_event(name, data)
+
+
 def filter_and_select_topk(items, score_threshold, topk):
+    scores = np.fromiter(
+        (item.get("metadata", {}).get("fine_grained_score", 0) for item in items), dtype=float, count=len(items)
+    )
+    selected = np.arange(len(items))
     if score_threshold:
-        filtered_items = [
-            item for item in items if item.get("metadata", {}).get("fine_grained_score", 0) >= score_threshold
-        ]
-    else:
-        filtered_items = items
-    sorted_items = sorted(filtered_items, key=lambda x: x["metadata"]["fine_grained_score"], reverse=True)
-    return sorted_items[:topk]
+        selected = np.flatnonzero(scores >= score_threshold)
+    return [items[selected[i]] for i in topk_indices(scores[selected], topk)]
 
 
 def remove_thinking_process(resp_content):
@@ -146,36 +215,67 @@ def query_clarification_enabled(llm, kwargs):
     return llm.model_name == "gpt-4o" or "deepseek" in llm.model_name or "qwq" in llm.model_name
 
 
+def _prepare_invoke(llm, messages):
+    """
+    意图识别内部中间步骤调用 LLM 前的处理，返回实际使用的 LLM（为 None 时表示使用原本的 LLM）
+    """
+    # 根据 https://huggingface.co/deepseek-ai/DeepSeek-R1#usage-recommendations 的建议：
+    # Avoid adding a system prompt; all instructions should be contained within the user prompt.
+    # NOTE: 目前假设只有第 1 个 message 才可能是 SystemMessage
+    if (
+        is_deepseek_r1_series_models(llm)
+        and isinstance(messages[0], SystemMessage)
+        and isinstance(messages[-1], HumanMessage)
+    ):
+        messages[-1] = HumanMessage(content=f"{messages[0].content}\n\n{messages[-1].content}")
+        del messages[0]
+    # 如果设置了 INTENT_RECOGNITION_GLOBAL_LLM_MODEL_NAME，则将意图识别内部所有中间步骤的 LLM 调用模型
+    # 改成该环境变量所指定的 LLM 模型。目前设置为 hunyuan
+    if global_llm_model_name := os.getenv("INTENT_RECOGNITION_GLOBAL_LLM_MODEL_NAME", settings.SUMMARY_MODEL):
+        return ChatModel.get_setup_instance(
+            model=global_llm_model_name,
+            streaming=True,
+        )
+    return None
+
+
+def _finish_invoke(llm, messages, result, **kwargs):
+    if kwargs.get("llm_input_output"):
+        kwargs["llm_input_output"][llm.model_name]["input"].append(messages)
+        kwargs["llm_input_output"][llm.model_name]["output"].append(result.content)
+    if is_deepseek_r1_series_models(llm):
+        # deepseek-r1 系列模型会有 think 过程，在使用结果的时候需要去除
+        result.content = remove_thinking_process(result.content)
+    return result
+
+
 def invoke_decorator(invoke_func, llm):
     def wrapper(*args, **kwargs):
-        # 根据 https://huggingface.co/deepseek-ai/DeepSeek-R1#usage-recommendations 的建议：
-        # Avoid adding a system prompt; all instructions should be contained within the user prompt.
-        # NOTE: 目前假设只有第 1 个 message 才可能是 SystemMessage
-        if (
-            is_deepseek_r1_series_models(llm)
-            and isinstance(args[0][0], SystemMessage)
-            and isinstance(args[0][-1], HumanMessage)
-        ):
-            args[0][-1] = HumanMessage(content=f"{args[0][0].content}\n\n{args[0][-1].content}")
-            del args[0][0]
-        # 如果设置了 INTENT_RECOGNITION_GLOBAL_LLM_MODEL_NAME，则将意图识别内部所有中间步骤的 LLM 调用模型
-        # 改成该环境变量所指定的 LLM 模型。目前设置为 hunyuan
-        if global_llm_model_name := os.getenv("INTENT_RECOGNITION_GLOBAL_LLM_MODEL_NAME", settings.SUMMARY_MODEL):
-            global_llm = ChatModel.get_setup_instance(
-                model=global_llm_model_name,
-                streaming=True,
-            )
-            invoke_func_to_use = global_llm.invoke
-        else:
-            invoke_func_to_use = invoke_func
-        result = invoke_func_to_use(*args)
-        if kwargs.get("llm_input_output"):
-            kwargs["llm_input_output"][llm.model_name]["input"].append(args[0])
-            kwargs["llm_input_output"][llm.model_name]["output"].append(result.content)
-        if is_deepseek_r1_series_models(llm):
-            # deepseek-r1 系列模型会有 think 过程，在使用结果的时候需要去除
-            result.content = remove_thinking_process(result.content)
-        return result
+        global_llm = _prepare_invoke(llm, args[0])
+        invoke_func_to_use = global_llm.invoke if global_llm else invoke_func
+        llm_to_use = global_llm or llm
+        # 相同模型、相同输入的辅助调用直接使用缓存的结果（需开启 LLM_RESPONSE_CACHE_ENABLED）
+        result = llm_response_cache.get(llm_to_use, args[0])
+        if result is None:
+            result = invoke_func_to_use(*args)
+            llm_response_cache.set(llm_to_use, args[0], result)
+        return _finish_invoke(llm, args[0], result, **kwargs)
+
+    return wrapper
+
+
+def ainvoke_decorator(ainvoke_func, llm):
+    """invoke_decorator 的异步版本，ainvoke_func 为 llm.ainvoke"""
+
+    async def wrapper(*args, **kwargs):
+        global_llm = _prepare_invoke(llm, args[0])
+        ainvoke_func_to_use = global_llm.ainvoke if global_llm else ainvoke_func
+        llm_to_use = global_llm or llm
+        result = await llm_response_cache.aget(llm_to_use, args[0])
+        if result is None:
+            result = await ainvoke_func_to_use(*args)
+            await llm_response_cache.aset(llm_to_use, args[0], result)
+        return _finish_invoke(llm, args[0], result, **kwargs)
 
     return wrapper
 
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import asyncio
+from logging import getLogger
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from aidev_agent.config import settings
+
+try:
+    import h2  # noqa
+except ImportError:
+    h2 = None
+
+_logger = getLogger(__name__)
+
+
+class PoolMetrics:
+    """连接池使用情况：请求总数、当前/最大并发请求数，以及并发请求数达到连接上限（需要排队等待连接）的次数"""
+
+    def __init__(self, max_connections: Optional[int]):
+        self.max_connections = max_connections
+        self.requests_total = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.saturated_total = 0
+        self._lock = Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.max_connections and self.in_flight >= self.max_connections:
+                self.saturated_total += 1
+            self.requests_total += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            "requests_total": self.requests_total,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "saturated_total": self.saturated_total,
+        }
+
+
+class _MeteredSyncStream(httpx.SyncByteStream):
+    """响应体读取完毕并关闭后才释放计数，流式响应在整个读取过程中都占用连接"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if self._release:
+                self._release()
+                self._release = None
+
+
+class _MeteredAsyncStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release:
+                self._release()
+                self._release = None
+
+
+class MeteredTransport(httpx.BaseTransport):
+    """记录连接池使用情况的同步 transport"""
+
+    def __init__(self, metrics: PoolMetrics, **transport_kwargs):
+        self.metrics = metrics
+        self._transport = httpx.HTTPTransport(**transport_kwargs)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.acquire()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self.metrics.release()
+            raise
+        response.stream = _MeteredSyncStream(response.stream, self.metrics.release)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class MeteredAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    记录连接池使用情况的异步 transport
+
+    异步连接只能在创建它的事件循环中使用，而同一个客户端可能被不同线程中的事件循环使用（如 async_to_sync），
+    因此为每个事件循环分别维护连接池。
+    """
+
+    def __init__(self, metrics: PoolMetrics, **transport_kwargs):
+        self.metrics = metrics
+        self._transport_kwargs = transport_kwargs
+        self._transports: "WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = WeakKeyDictionary()
+        self._lock = Lock()
+
+    def _get_transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            with self._lock:
+                transport = self._transports.get(loop)
+                if transport is None:
+                    transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._transport_kwargs)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.acquire()
+        try:
+            response = await self._get_transport().handle_async_request(request)
+        except BaseException:
+            self.metrics.release()
+            raise
+        response.stream = _MeteredAsyncStream(response.stream, self.metrics.release)
+        return response
+
+    async def aclose(self):
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class HttpClientPool:
+    """
+    进程内共享的 httpx 客户端池，按 base_url 区分
+
+    ChatModel、Embeddings 每次请求都会重新创建，共享底层的 httpx 客户端后可以复用 keep-alive 连接，
+    避免每次对话都重新建立 TCP/TLS 连接；安装了 h2 时可以开启 HTTP/2。
+    鉴权请求头（default_headers）由 openai 客户端在每次请求时带上，与连接无关，
+    不同用户/应用的鉴权信息共用同一个客户端，客户端数量只与 base_url 的数量有关。
+    """
+
+    def __init__(
+        self,
+        http2: bool = False,
+        max_connections: Optional[int] = 100,
+        max_keepalive_connections: Optional[int] = 20,
+        keepalive_expiry: Optional[float] = 30.0,
+    ):
+        if http2 and h2 is None:
+            _logger.info("未安装 h2，LLM 网关客户端使用 HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._clients: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self._metrics: Dict[str, Tuple[PoolMetrics, PoolMetrics]] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_settings(cls) -> "HttpClientPool":
+        return cls(
+            http2=settings.LLM_HTTP2,
+            max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    @staticmethod
+    def make_key(base_url: str) -> str:
+        return base_url.rstrip("/")
+
+    def get_clients(self, base_url: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        key = self.make_key(base_url)
+        clients = self._clients.get(key)
+        if clients is None:
+            with self._lock:
+                clients = self._clients.get(key)
+                if clients is None:
+                    clients = self._create_clients(key)
+        return clients
+
+    def _create_clients(self, key: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        transport_kwargs = dict(http2=self.http2, limits=self.limits)
+        sync_metrics = PoolMetrics(self.limits.max_connections)
+        async_metrics = PoolMetrics(self.limits.max_connections)
+        sync_client = DefaultHttpxClient(transport=MeteredTransport(sync_metrics, **transport_kwargs))
+        async_client = DefaultAsyncHttpxClient(transport=MeteredAsyncTransport(async_metrics, **transport_kwargs))
+        self._metrics[key] = (sync_metrics, async_metrics)
+        self._clients[key] = (sync_client, async_client)
+        return sync_client, async_client
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各客户端的连接池使用情况，key 为 base_url"""
+        return {
+            base_url: {"sync": sync_metrics.as_dict(), "async": async_metrics.as_dict()}
+            for base_url, (sync_metrics, async_metrics) in list(self._metrics.items())
+        }
+
+    def close(self):
+        """关闭同步客户端；异步客户端的连接随事件循环释放"""
+        with self._lock:
+            for sync_client, _ in self._clients.values():
+                sync_client.close()
+            self._clients.clear()
+            self._metrics.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+http_client_pool = HttpClientPool.from_settings()
@@ -17,11 +17,9 @@ to the current version of the project delivered to anyone in the future.
 """
 
 import json
-import os
-from typing import Optional, Type, Union
+from typing import List, Optional, Type, Union
 
 import openai
-import requests
 from langchain_core.messages import AIMessageChunk, BaseMessage
 from langchain_core.outputs import ChatGenerationChunk, ChatResult
 from langchain_openai.chat_models import ChatOpenAI as RawChatOpenAI
@@ -31,6 +29,9 @@ from pydantic import BaseModel, model_validator
 
 from aidev_agent.config import settings
 
+from .http_client import http_client_pool
+from .tokenizer import RemoteTokenizer, tokenizer_registry
+
 
 class ApiGwMixin(BaseModel):
     @classmethod
@@ -49,6 +50,11 @@ class ApiGwMixin(BaseModel):
             kwargs["default_headers"].update({"X-Bkapi-Authorization": json.dumps(auth_headers)})
         else:
             kwargs["default_headers"] = {"X-Bkapi-Authorization": json.dumps(auth_headers)}
+        # 复用进程内共享的 httpx 客户端，避免每次请求都重新建立连接
+        if settings.LLM_HTTP_POOL_ENABLED and not any(
+            kwargs.get(key) for key in ("http_client", "http_async_client", "openai_proxy")
+        ):
+            kwargs["http_client"], kwargs["http_async_client"] = http_client_pool.get_clients(base_url)
         return cls(**kwargs)
 
 
@@ -66,34 +72,48 @@ class ChatModel(RawChatOpenAI, ApiGwMixin):
             values["api_key"] = "empty"
         return values
 
+    def _get_encoding_model(self):
+        """优先使用按模型系列注册的本地分词器（见 tokenizer.tokenizer_registry），没有时退回 tiktoken"""
+        tokenizer = tokenizer_registry.get(self.model_name)
+        if tokenizer is None:
+            return super()._get_encoding_model()
+        # 消息格式的额外开销沿用 gpt-3.5-turbo 的估算方式
+        return "gpt-3.5-turbo", tokenizer
+
+    def get_remote_tokenizer(self) -> RemoteTokenizer:
+        kwargs = {}
+        # 远程分词不可用时，有本地分词器则使用本地分词器统计，否则估算
+        if tokenizer := tokenizer_registry.get(self.model_name):
+            kwargs["fallback"] = lambda text: len(tokenizer.encode(text))
+        return RemoteTokenizer.from_base_url(self.openai_api_base, self.default_headers, **kwargs)
+
     def get_num_tokens(self, text: str) -> int:
         if not self.remote_tokenizer:
             return super().get_num_tokens(text)
-        data = dict(
-            prompts=[
-                dict(
-                    model=self.model_name,
-                    prompt=text,
-                    max_tokens=self.max_tokens or 1024,
-                    max_content_length=self.max_content_length,
-                )
-            ]
-        )
-        endpoint = os.path.join(self.openai_api_base, "api/token_check")
-        resp = requests.post(
-            endpoint,
-            headers=self.default_headers,
-            json=data,
+        return self.get_num_tokens_batch([text])[0]
+
+    def get_num_tokens_batch(self, texts: List[str]) -> List[int]:
+        """统计多段文本的 token 数，使用远程分词时在一次请求中完成"""
+        if not self.remote_tokenizer:
+            return [super(ChatModel, self).get_num_tokens(text) for text in texts]
+        return self.get_remote_tokenizer().count(
+            texts,
+            model=self.model_name,
+            max_tokens=self.max_tokens or 1024,
+            max_content_length=self.max_content_length,
         )
-        resp.raise_for_status()
-        result = resp.json()
-        return result["prompts"][0]["tokenCount"]
 
     def get_num_tokens_from_messages(self, messages: list[BaseMessage]) -> int:
         if not self.remote_tokenizer:
             return super().get_num_tokens_from_messages(messages)
-        messages_dict = [_convert_message_to_dict(m) for m in messages]
-        return self.get_num_tokens(json.dumps(messages_dict))
+        return self.get_num_tokens_from_messages_batch([messages])[0]
+
+    def get_num_tokens_from_messages_batch(self, messages_list: List[List[BaseMessage]]) -> List[int]:
+        """分别统计多组消息的 token 数，使用远程分词时在一次请求中完成"""
+        if not self.remote_tokenizer:
+            return [super(ChatModel, self).get_num_tokens_from_messages(messages) for messages in messages_list]
+        texts = [json.dumps([_convert_message_to_dict(m) for m in messages]) for messages in messages_list]
+        return self.get_num_tokens_batch(texts)
 
     def _create_chat_result(
         self,
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import base64
+import math
+import os
+import re
+import time
+from logging import getLogger
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Protocol
+
+import requests
+import tiktoken
+from requests.adapters import HTTPAdapter
+
+from aidev_agent.config import settings
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+_logger = getLogger(__name__)
+
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+
+
+def estimate_num_tokens(text: str) -> int:
+    """
+    本地估算 token 数：非 ASCII 字符（中文等）按每个字符 1 个 token，其余按每 3 个字符 1 个 token
+    估算结果通常略偏大，用于 token 限制检查时更安全
+    """
+    non_ascii = len(_NON_ASCII_RE.findall(text))
+    return non_ascii + math.ceil((len(text) - non_ascii) / 3)
+
+
+class RemoteTokenizer:
+    """
+    远程分词接口（api/token_check）的客户端
+
+    - 同一个接口地址复用同一个连接池
+    - 接口本身支持传入 prompts 列表，多段文本在一次请求中完成统计
+    - 请求失败或超时后改用本地统计（fallback），并在冷却时间内不再请求
+    """
+
+    _sessions: Dict[str, requests.Session] = {}
+    _sessions_lock = Lock()
+    # 各接口地址恢复请求的时间，模型实例按请求创建，因此按接口地址共享
+    _unavailable_until: Dict[str, float] = {}
+
+    def __init__(
+        self,
+        endpoint: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        cooldown: Optional[float] = None,
+        fallback: Callable[[str], int] = estimate_num_tokens,
+    ):
+        self.endpoint = endpoint
+        self.headers = headers or {}
+        self.timeout = timeout or settings.REMOTE_TOKENIZER_TIMEOUT
+        self.batch_size = batch_size or settings.REMOTE_TOKENIZER_BATCH_SIZE
+        self.cooldown = settings.REMOTE_TOKENIZER_COOLDOWN if cooldown is None else cooldown
+        # 远程分词不可用时的本地统计方式
+        self.fallback = fallback
+
+    @classmethod
+    def from_base_url(cls, base_url: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> "RemoteTokenizer":
+        return cls(os.path.join(base_url, "api/token_check"), headers, **kwargs)
+
+    @classmethod
+    def get_session(cls, endpoint: str) -> requests.Session:
+        session = cls._sessions.get(endpoint)
+        if session is None:
+            with cls._sessions_lock:
+                session = cls._sessions.get(endpoint)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    cls._sessions[endpoint] = session
+        return session
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._unavailable_until.get(self.endpoint, 0.0)
+
+    def count(
+        self,
+        texts: List[str],
+        model: str,
+        max_tokens: int = 1024,
+        max_content_length: Optional[int] = None,
+    ) -> List[int]:
+        """统计多段文本的 token 数，返回结果与 texts 一一对应"""
+        counts: List[int] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start : start + self.batch_size]
+            counts.extend(self._count_batch(batch, model, max_tokens, max_content_length))
+        return counts
+
+    def _count_batch(
+        self,
+        texts: List[str],
+        model: str,
+        max_tokens: int,
+        max_content_length: Optional[int],
+    ) -> List[int]:
+        if not self.available:
+            return [self.fallback(text) for text in texts]
+        data = dict(
+            prompts=[
+                dict(model=model, prompt=text, max_tokens=max_tokens, max_content_length=max_content_length)
+                for text in texts
+            ]
+        )
+        try:
+            resp = self.get_session(self.endpoint).post(
+                self.endpoint,
+                headers=self.headers,
+                json=data,
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+            return [prompt["tokenCount"] for prompt in resp.json()["prompts"]]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            self._unavailable_until[self.endpoint] = time.monotonic() + self.cooldown
+            _logger.warning(f"远程分词接口调用失败，{self.cooldown} 秒内改用本地统计 token 数：{e}")
+            return [self.fallback(text) for text in texts]
+
+
+class LocalTokenizer(Protocol):
+    """本地分词器，与 tiktoken.Encoding 的 encode 接口保持一致"""
+
+    def encode(self, text: str) -> List[int]: ...
+
+
+class HFTokenizer:
+    """HuggingFace tokenizer.json 格式的分词器（需要安装 tokenizers）"""
+
+    def __init__(self, tokenizer: "Tokenizer"):
+        self._tokenizer = tokenizer
+
+    @classmethod
+    def from_file(cls, path: str) -> "HFTokenizer":
+        if Tokenizer is None:
+            raise ImportError("加载 tokenizer.json 需要安装 tokenizers：pip install tokenizers")
+        return cls(Tokenizer.from_file(path))
+
+    def encode(self, text: str) -> List[int]:
+        return self._tokenizer.encode(text, add_special_tokens=False).ids
+
+
+# cl100k_base 的预分词规则，本地 tiktoken BPE 文件默认使用
+CL100K_PAT_STR = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+
+
+def load_tiktoken_file(path: str, pat_str: str = CL100K_PAT_STR) -> tiktoken.Encoding:
+    """加载 tiktoken BPE 文件（每行为 base64 编码的 token 及其序号）"""
+    with open(path, "rb") as f:
+        mergeable_ranks = {
+            base64.b64decode(token): int(rank) for token, rank in (line.split() for line in f if line.strip())
+        }
+    name = os.path.splitext(os.path.basename(path))[0]
+    return tiktoken.Encoding(name, pat_str=pat_str, mergeable_ranks=mergeable_ranks, special_tokens={})
+
+
+def load_tokenizer_file(path: str) -> LocalTokenizer:
+    """根据文件格式加载本地分词器：*.json 为 HuggingFace tokenizer.json，其余按 tiktoken BPE 文件处理"""
+    if path.endswith(".json"):
+        return HFTokenizer.from_file(path)
+    return load_tiktoken_file(path)
+
+
+class TokenizerRegistry:
+    """
+    本地分词器注册表：按模型名称前缀（最长匹配）选择分词器
+
+    分词器在首次使用时加载，之后在进程内所有线程之间共享（tiktoken 和 tokenizers 的 encode 都是线程安全的）；
+    加载失败或没有匹配的分词器时返回 None，由调用方退回默认的分词方式。
+    """
+
+    # 默认识别的模型系列，在 LOCAL_TOKENIZER_DIR 下查找 <系列>/tokenizer.json、<系列>.json 或 <系列>.tiktoken
+    DEFAULT_MODEL_FAMILIES = ("hunyuan", "deepseek", "qwen")
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Optional[LocalTokenizer]]] = {}
+        self._tokenizers: Dict[str, Optional[LocalTokenizer]] = {}
+        self._lock = Lock()
+
+    def register(self, prefix: str, loader: Callable[[], Optional[LocalTokenizer]]):
+        with self._lock:
+            self._loaders[prefix] = loader
+            self._tokenizers.pop(prefix, None)
+
+    def register_file(self, prefix: str, path: str):
+        self.register(prefix, lambda: load_tokenizer_file(path))
+
+    def register_dir(self, tokenizer_dir: str, families=DEFAULT_MODEL_FAMILIES):
+        """为各模型系列注册 tokenizer_dir 下的分词器文件，文件在首次使用时才查找"""
+        for family in families:
+            self.register(family, lambda family=family: self._load_from_dir(tokenizer_dir, family))
+
+    @staticmethod
+    def _load_from_dir(tokenizer_dir: str, family: str) -> Optional[LocalTokenizer]:
+        for filename in (os.path.join(family, "tokenizer.json"), f"{family}.json", f"{family}.tiktoken"):
+            path = os.path.join(tokenizer_dir, filename)
+            if os.path.isfile(path):
+                return load_tokenizer_file(path)
+        return None
+
+    def match(self, model_name: str) -> Optional[str]:
+        prefixes = [prefix for prefix in self._loaders if model_name.startswith(prefix)]
+        return max(prefixes, key=len) if prefixes else None
+
+    def get(self, model_name: Optional[str]) -> Optional[LocalTokenizer]:
+        prefix = self.match(model_name or "")
+        if prefix is None:
+            return None
+        if prefix in self._tokenizers:
+            return self._tokenizers[prefix]
+        with self._lock:
+            if prefix not in self._tokenizers:
+                try:
+                    self._tokenizers[prefix] = self._loaders[prefix]()
+                except Exception as e:  # noqa
+                    _logger.warning(f"加载模型 {prefix} 的本地分词器失败，使用默认分词方式：{e}")
+                    self._tokenizers[prefix] = None
+            return self._tokenizers[prefix]
+
+
+def get_default_tokenizer_registry() -> TokenizerRegistry:
+    registry = TokenizerRegistry()
+    if settings.LOCAL_TOKENIZER_DIR:
+        registry.register_dir(settings.LOCAL_TOKENIZER_DIR)
+    for prefix, path in (settings.LOCAL_TOKENIZERS or {}).items():
+        registry.register_file(prefix, path)
+    return registry
+
+
+tokenizer_registry = get_default_tokenizer_registry()
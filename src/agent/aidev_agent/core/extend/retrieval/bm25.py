@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import math
+from collections import Counter
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+
+class BM25Index:
+    """
+    BM25 倒排索引，支持增量添加和删除
+
+    文档以槽位（slot）标识，由调用方分配；倒排表为 词 -> {slot: 词频}，检索时按查询词的倒排表在分数数组上累加。
+    每个词的倒排表会缓存为 numpy 数组，该词所在的文档变化时失效。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lens = np.zeros(0, dtype=np.float32)
+        self.num_docs = 0
+        self.total_len = 0
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def add(self, slot: int, tokens: Sequence[str]):
+        if slot in self._doc_terms:
+            self.remove(slot)
+        counts = Counter(tokens)
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[slot] = count
+            self._arrays.pop(term, None)
+        if slot >= len(self.doc_lens):
+            self.doc_lens = np.concatenate(
+                [self.doc_lens, np.zeros(max(slot + 1, 2 * len(self.doc_lens)) - len(self.doc_lens), np.float32)]
+            )
+        self.doc_lens[slot] = len(tokens)
+        self._doc_terms[slot] = tuple(counts)
+        self.num_docs += 1
+        self.total_len += len(tokens)
+
+    def remove(self, slot: int):
+        terms = self._doc_terms.pop(slot, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self.postings[term]
+            del posting[slot]
+            if not posting:
+                del self.postings[term]
+            self._arrays.pop(term, None)
+        self.num_docs -= 1
+        self.total_len -= int(self.doc_lens[slot])
+        self.doc_lens[slot] = 0
+
+    def _posting_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings[term]
+            arrays = self._arrays[term] = (
+                np.fromiter(posting.keys(), dtype=np.intp, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float32, count=len(posting)),
+            )
+        return arrays
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def scores(self, tokens: Sequence[str], size: int) -> np.ndarray:
+        """各槽位（0 ~ size-1）的 BM25 分数，不包含查询词的文档为 0"""
+        scores = np.zeros(size, dtype=np.float32)
+        if not self.num_docs:
+            return scores
+        avg_len = self.total_len / self.num_docs or 1.0
+        for term, query_count in Counter(tokens).items():
+            if term not in self.postings:
+                continue
+            slots, tfs = self._posting_arrays(term)
+            norms = self.k1 * (1 - self.b + self.b * self.doc_lens[slots] / avg_len)
+            scores[slots] += query_count * self.idf(term) * tfs * (self.k1 + 1) / (tfs + norms)
+        return scores
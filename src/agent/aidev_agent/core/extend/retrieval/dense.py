@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+
+
+def block_scores(vectors: np.ndarray, rows: np.ndarray, query_vector: np.ndarray, block_size: int = 8192) -> np.ndarray:
+    """
+    指定行（升序）与查询向量的内积：按块转换为 float32 后做矩阵-向量乘法，由 numpy 底层的 BLAS 使用 SIMD 指令完成；
+    连续的行直接切片（内存映射时只读取对应的页），否则只取出需要的行
+    """
+    scores = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), block_size):
+        block = rows[start : start + block_size]
+        contiguous = block[-1] - block[0] + 1 == len(block)
+        block_vectors = vectors[block[0] : block[-1] + 1] if contiguous else vectors[block]
+        scores[start : start + len(block)] = block_vectors.astype(np.float32) @ query_vector
+    return scores
+
+
+class DenseIndex:
+    """
+    float16 向量矩阵，行号即文档槽位（slot）
+
+    向量归一化后以 float16 存放，内积即余弦相似度，内存/磁盘占用是 float32 的一半；
+    指定 path 时矩阵保存在 .npy 文件中并以内存映射方式打开，重启后无需重新计算 embedding，
+    容量不足时按倍数扩容（写入新文件后替换）。检索时只计算候选槽位（见 block_scores）。
+    """
+
+    # 每块 8192 行，768 维时转换后的 float32 块约 24MB
+    BLOCK_SIZE = 8192
+
+    def __init__(self, dim: int, path: Optional[str] = None, capacity: int = 1024):
+        self.dim = dim
+        self.path = path
+        if path and os.path.exists(path):
+            self.vectors = np.load(path, mmap_mode="r+")
+            if self.vectors.dtype != np.float16 or self.vectors.shape[1] != dim:
+                raise ValueError(
+                    f"向量文件 {path} 的格式为 {self.vectors.dtype}{self.vectors.shape}，与维度 {dim} 不符"
+                )
+        else:
+            self.vectors = self._allocate(max(capacity, 1))
+
+    @property
+    def capacity(self) -> int:
+        return self.vectors.shape[0]
+
+    def _allocate(self, capacity: int, source: Optional[np.ndarray] = None) -> np.ndarray:
+        if not self.path:
+            vectors = np.zeros((capacity, self.dim), dtype=np.float16)
+            if source is not None:
+                vectors[: len(source)] = source
+            return vectors
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        vectors = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float16, shape=(capacity, self.dim))
+        if source is not None:
+            vectors[: len(source)] = source
+        vectors.flush()
+        del vectors
+        os.replace(tmp_path, self.path)
+        return np.load(self.path, mmap_mode="r+")
+
+    def _ensure_capacity(self, size: int):
+        if size > self.capacity:
+            old = self.vectors
+            self.vectors = self._allocate(max(size, 2 * self.capacity), source=old)
+
+    @staticmethod
+    def normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def set(self, slot: int, vector):
+        self._ensure_capacity(slot + 1)
+        self.vectors[slot] = self.normalize(vector)
+
+    def remove(self, slot: int):
+        if slot < self.capacity:
+            self.vectors[slot] = 0
+
+    def scores(self, query_vector, slots: np.ndarray) -> np.ndarray:
+        """查询向量与指定槽位（升序）的余弦相似度"""
+        return block_scores(self.vectors, slots, self.normalize(query_vector), self.BLOCK_SIZE)
+
+    def flush(self):
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import json
+import os
+import uuid
+from logging import getLogger
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from langchain_core.embeddings import Embeddings
+
+from aidev_agent.config import settings
+from aidev_agent.core.extend.intent.candidates import CandidateSet, topk_indices
+from aidev_agent.core.extend.retrieval.bm25 import BM25Index
+from aidev_agent.core.extend.retrieval.dense import DenseIndex
+from aidev_agent.core.extend.retrieval.tokenizer import tokenize
+
+_logger = getLogger(__name__)
+
+
+class LocalRetriever:
+    """
+    进程内的混合检索：BM25 倒排索引 + float16 向量矩阵，用于离线/边缘部署等无法访问 AIDev 知识库接口的场景
+
+    文档格式与知识库接口返回的一致：{"page_content": ..., "metadata": {"uid": ..., "knowledge_base_id": ..., ...}}，
+    检索结果的 metadata 中带有 __score__：BM25 分数按该次检索的最大值归一化（与 ES 支路一致），向量检索为余弦相似度。
+    没有配置 embeddings 时只能使用 BM25 检索。
+
+    指定 path 时，文档保存在 docs.json，向量保存在内存映射的 vectors.npy 中，调用 save 后持久化，再次创建时自动加载。
+
+    :param embeddings: 计算向量的 embedding 模型
+    :param path: 索引目录
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        path: Optional[str] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.embeddings = embeddings
+        self.path = path
+        self.bm25 = BM25Index(k1=k1, b=b)
+        self.dense: Optional[DenseIndex] = None
+        # 槽位 -> 文档，已删除的槽位为 None，添加文档时优先复用
+        self.docs: List[Optional[Dict[str, Any]]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._slots: Dict[Any, int] = {}
+        self._free_slots: List[int] = []
+        self._slots_by_knowledge: Dict[tuple, Set[int]] = {}
+        self._lock = Lock()
+        if path and os.path.exists(os.path.join(path, "docs.json")):
+            self._load()
+
+    @classmethod
+    def from_settings(cls) -> "LocalRetriever":
+        embeddings = None
+        if settings.LOCAL_RETRIEVAL_EMBEDDING_MODEL:
+            from aidev_agent.core.extend.models.llm_gateway import Embeddings as GatewayEmbeddings
+
+            embeddings = GatewayEmbeddings.get_setup_instance(model=settings.LOCAL_RETRIEVAL_EMBEDDING_MODEL)
+        return cls(embeddings, path=settings.LOCAL_RETRIEVAL_DIR or None)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def _vectors_path(self) -> Optional[str]:
+        return os.path.join(self.path, "vectors.npy") if self.path else None
+
+    def _load(self):
+        with open(os.path.join(self.path, "docs.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        if data["dim"] and os.path.exists(self._vectors_path):
+            self.dense = DenseIndex(data["dim"], path=self._vectors_path)
+        for slot, doc in enumerate(data["docs"]):
+            self._ensure_slot(slot)
+            if doc is None:
+                self._free_slots.append(slot)
+            else:
+                self._index(slot, doc)
+
+    def save(self):
+        if not self.path:
+            raise ValueError("没有指定索引目录，无法保存")
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            if self.dense is not None:
+                self.dense.flush()
+            data = {"dim": self.dense.dim if self.dense else None, "docs": self.docs}
+            tmp_path = os.path.join(self.path, "docs.json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, os.path.join(self.path, "docs.json"))
+
+    def _ensure_slot(self, slot: int):
+        while len(self.docs) <= slot:
+            self.docs.append(None)
+        if slot >= len(self._alive):
+            self._alive = np.concatenate(
+                [self._alive, np.zeros(max(slot + 1, 2 * len(self._alive)) - len(self._alive), bool)]
+            )
+
+    @staticmethod
+    def _knowledge_keys(doc: Dict[str, Any]) -> List[tuple]:
+        metadata = doc["metadata"]
+        return [
+            (id_type, metadata[id_type])
+            for id_type in ("knowledge_base_id", "knowledge_id")
+            if metadata.get(id_type) is not None
+        ]
+
+    def _index(self, slot: int, doc: Dict[str, Any], vector=None):
+        self.docs[slot] = doc
+        self._alive[slot] = True
+        self._slots[doc["metadata"]["uid"]] = slot
+        for key in self._knowledge_keys(doc):
+            self._slots_by_knowledge.setdefault(key, set()).add(slot)
+        self.bm25.add(slot, tokenize(doc.get("page_content", "")))
+        if vector is not None:
+            if self.dense is None:
+                self.dense = DenseIndex(len(vector), path=self._vectors_path, capacity=max(1024, len(self.docs)))
+            self.dense.set(slot, vector)
+
+    def _unindex(self, slot: int):
+        doc = self.docs[slot]
+        for key in self._knowledge_keys(doc):
+            self._slots_by_knowledge[key].discard(slot)
+        del self._slots[doc["metadata"]["uid"]]
+        self.bm25.remove(slot)
+        if self.dense is not None:
+            self.dense.remove(slot)
+        self.docs[slot] = None
+        self._alive[slot] = False
+        self._free_slots.append(slot)
+
+    def add_documents(self, docs: Sequence[Dict[str, Any]]) -> List[Any]:
+        """添加文档，uid 已存在时覆盖；没有 uid 的文档会自动生成。返回各文档的 uid"""
+        docs = [
+            {"page_content": doc.get("page_content", ""), "metadata": dict(doc.get("metadata") or {})} for doc in docs
+        ]
+        for doc in docs:
+            doc["metadata"].setdefault("uid", uuid.uuid4().hex)
+        vectors = [None] * len(docs)
+        if self.embeddings is not None and docs:
+            vectors = self.embeddings.embed_documents([doc["page_content"] for doc in docs])
+        with self._lock:
+            for doc, vector in zip(docs, vectors):
+                slot = self._slots.get(doc["metadata"]["uid"])
+                if slot is not None:
+                    self._unindex(slot)
+                slot = self._free_slots.pop() if self._free_slots else len(self.docs)
+                self._ensure_slot(slot)
+                self._index(slot, doc, vector)
+        return [doc["metadata"]["uid"] for doc in docs]
+
+    def delete(self, uids: Iterable[Any]):
+        with self._lock:
+            for uid in uids:
+                slot = self._slots.get(uid)
+                if slot is not None:
+                    self._unindex(slot)
+
+    def _candidate_mask(self, knowledge_base_ids=None, knowledge_ids=None) -> np.ndarray:
+        """参与检索的槽位：未删除，且指定了知识库/知识时属于其中之一"""
+        mask = self._alive[: len(self.docs)].copy()
+        if knowledge_base_ids is None and knowledge_ids is None:
+            return mask
+        selected = np.zeros(len(self.docs), dtype=bool)
+        for id_type, ids in [("knowledge_base_id", knowledge_base_ids), ("knowledge_id", knowledge_ids)]:
+            for knowledge_id in ids or []:
+                slots = self._slots_by_knowledge.get((id_type, knowledge_id))
+                if slots:
+                    selected[list(slots)] = True
+        return mask & selected
+
+    def _select(self, scores: np.ndarray, candidates: np.ndarray, topk: int, normalize: bool = False):
+        """从候选槽位中按分数取出前 topk 篇文档，返回的文档为副本"""
+        selected = candidates[topk_indices(scores[candidates], topk)]
+        max_score = float(scores[selected[0]]) if normalize and len(selected) else 1.0
+        return [
+            {
+                "page_content": self.docs[slot]["page_content"],
+                "metadata": {**self.docs[slot]["metadata"], "__score__": float(scores[slot]) / max_score},
+            }
+            for slot in selected
+        ]
+
+    def search_bm25(self, query: str, topk: int, knowledge_base_ids=None, knowledge_ids=None) -> List[Dict[str, Any]]:
+        """
+        BM25 检索，分数按最大值归一化；knowledge_base_ids、knowledge_ids 均为 None 时检索全部文档，
+        否则只检索属于其中任一知识库/知识的文档
+        """
+        tokens = tokenize(query)
+        with self._lock:
+            scores = self.bm25.scores(tokens, len(self.docs))
+            candidates = np.flatnonzero(self._candidate_mask(knowledge_base_ids, knowledge_ids) & (scores > 0))
+            return self._select(scores, candidates, topk, normalize=True)
+
+    def _search_dense(self, query_vector, topk, knowledge_base_ids, knowledge_ids):
+        with self._lock:
+            if self.dense is None:
+                return []
+            candidates = np.flatnonzero(self._candidate_mask(knowledge_base_ids, knowledge_ids))
+            if not len(candidates):
+                return []
+            scores = np.zeros(len(self.docs), dtype=np.float32)
+            scores[candidates] = self.dense.scores(query_vector, candidates)
+            return self._select(scores, candidates, topk)
+
+    def search_dense(self, query: str, topk: int, knowledge_base_ids=None, knowledge_ids=None) -> List[Dict[str, Any]]:
+        """向量检索，没有配置 embeddings 时返回空列表"""
+        if self.embeddings is None:
+            return []
+        return self._search_dense(self.embeddings.embed_query(query), topk, knowledge_base_ids, knowledge_ids)
+
+    async def asearch_dense(
+        self, query: str, topk: int, knowledge_base_ids=None, knowledge_ids=None
+    ) -> List[Dict[str, Any]]:
+        if self.embeddings is None:
+            return []
+        query_vector = await self.embeddings.aembed_query(query)
+        # 打分与排序的耗时随文档数增长，且需要持有检索器的锁，在线程中执行，不阻塞事件循环
+        return await sync_to_async(self._search_dense, thread_sensitive=False)(
+            query_vector, topk, knowledge_base_ids, knowledge_ids
+        )
+
+    def search(
+        self, query: str, topk: int, knowledge_base_ids=None, knowledge_ids=None, k: int = 60
+    ) -> List[Dict[str, Any]]:
+        """混合检索：BM25 与向量检索的结果按倒数排名融合，__score__ 为融合分数；没有配置 embeddings 时等同于 BM25 检索"""
+        results = [
+            self.search_bm25(query, topk, knowledge_base_ids, knowledge_ids),
+            self.search_dense(query, topk, knowledge_base_ids, knowledge_ids),
+        ]
+        return self._fuse(results, topk, k)
+
+    @staticmethod
+    def _fuse(results, topk, k):
+        candidates = CandidateSet([result for result in results if result])
+        fusion_scores = candidates.reciprocal_rank_fusion([1.0] * len(candidates.ranks.T), k=k)
+        docs = []
+        for index in topk_indices(fusion_scores, topk):
+            doc = candidates.docs[index]
+            doc["metadata"]["__score__"] = float(fusion_scores[index])
+            docs.append(doc)
+        return docs
+
+
+_local_retriever: Optional[LocalRetriever] = None
+_local_retriever_lock = Lock()
+
+
+def get_local_retriever() -> LocalRetriever:
+    """按配置创建的进程内检索器（单例），LOCAL_RETRIEVAL_DIR 下有已保存的索引时自动加载"""
+    global _local_retriever
+    if _local_retriever is None:
+        with _local_retriever_lock:
+            if _local_retriever is None:
+                _local_retriever = LocalRetriever.from_settings()
+    return _local_retriever
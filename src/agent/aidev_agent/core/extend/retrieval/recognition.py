@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+from typing import Any, Callable, List, Optional
+
+from asgiref.sync import sync_to_async
+
+from aidev_agent.config import settings
+from aidev_agent.core.extend.intent.intent_recognition import IntentRecognition
+from aidev_agent.core.extend.intent.utils import timeit
+from aidev_agent.core.extend.retrieval.hybrid import LocalRetriever, get_local_retriever
+from aidev_agent.core.extend.retrieval.vector_store import MmapVectorStore, VectorSearchMode, get_vector_store
+from aidev_agent.core.utils.cache import RecallCache
+
+
+def _knowledge_filters(knowledge_items: Optional[List[dict]], knowledge_bases: Optional[List[dict]]) -> dict:
+    """检索范围：没有指定任何知识（库）时检索全部本地文档"""
+    if not knowledge_items and not knowledge_bases:
+        return {}
+    return {
+        "knowledge_base_ids": [knowledge["id"] for knowledge in knowledge_bases or []],
+        "knowledge_ids": [knowledge["id"] for knowledge in knowledge_items or []],
+    }
+
+
+def _query_filters(data: dict) -> dict:
+    """知识库查询接口参数中的检索范围"""
+    filters = {"knowledge_base_ids": [], "knowledge_ids": []}
+    for id_type, knowledge_id in RecallCache.knowledge_ids(data):
+        filters[f"{id_type}s"].append(knowledge_id)
+    return filters if any(filters.values()) else {}
+
+
+class LocalIntentRecognition(IntentRecognition):
+    """
+    使用进程内混合检索（见 LocalRetriever）的意图识别，不依赖 AIDev 知识库接口：
+    - index_specific / nature 方式：向量检索，没有配置 embeddings 时使用 BM25；
+    - ES 方式（完整 query / 提取的关键词）：BM25。
+    多路召回的结果仍然由 weighted_reciprocal_rank_fusion 融合。
+    使用时替换 agent 的意图识别实例：CommonQAAgent.intent_recognition_instance = LocalIntentRecognition()
+
+    :param local_retriever: 使用的检索器，为 None 时使用按配置创建的单例（见 get_local_retriever）
+    """
+
+    local_retriever: Optional[Any] = None
+
+    @property
+    def retriever(self) -> LocalRetriever:
+        # 检索器定义了 __len__，没有文档时为假值，不能用 or 判断
+        return self.local_retriever if self.local_retriever is not None else get_local_retriever()
+
+    def _local_query(self, data: dict) -> dict:
+        """按知识库查询接口的参数在本地检索，返回格式与接口一致"""
+        retriever = self.retriever
+        search = retriever.search_dense if retriever.embeddings is not None else retriever.search_bm25
+        return {"documents": search(data["query"], data["topk"], **_query_filters(data))}
+
+    @property
+    def _query_instance(self) -> Callable:
+        return self._local_query
+
+    @property
+    def _aquery_instance(self) -> Callable:
+        async def aquery(data):
+            retriever = self.retriever
+            if retriever.embeddings is None:
+                # BM25 打分的耗时随文档数增长，在线程中执行，不阻塞事件循环
+                return await sync_to_async(self._local_query, thread_sensitive=False)(data)
+            # 计算 query 向量需要请求 embedding 模型，使用异步接口；打分在线程中执行
+            documents = await retriever.asearch_dense(data["query"], data["topk"], **_query_filters(data))
+            return {"documents": documents}
+
+        return aquery
+
+    def _es_client(self):
+        return self.retriever
+
+    @timeit(message="知识库检索（本地 BM25，使用完整query）")
+    def search_knowledge_es_query(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, **kwargs
+    ):
+        """基于本地 BM25 获取相关文档（对应 ES 方式，使用完整query）"""
+        return self._es_client().search_bm25(query, topk, **_knowledge_filters(knowledge_items, knowledge_bases))
+
+    async def asearch_knowledge_es_query(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], query, topk, **kwargs
+    ):
+        # BM25 打分的耗时随文档数增长，在线程中执行，不阻塞事件循环
+        return await sync_to_async(self.search_knowledge_es_query, thread_sensitive=False)(
+            knowledge_items, knowledge_bases, query, topk, **kwargs
+        )
+
+    @timeit(message="知识库检索（本地 BM25，使用提取的关键词）")
+    def search_knowledge_es_keywords(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], extracted_keywords, topk, **kwargs
+    ):
+        if not extracted_keywords:
+            return []
+        return self._es_client().search_bm25(
+            " ".join(extracted_keywords), topk, **_knowledge_filters(knowledge_items, knowledge_bases)
+        )
+
+    async def asearch_knowledge_es_keywords(
+        self, knowledge_items: list[dict], knowledge_bases: list[dict], extracted_keywords, topk, **kwargs
+    ):
+        return await sync_to_async(self.search_knowledge_es_keywords, thread_sensitive=False)(
+            knowledge_items, knowledge_bases, extracted_keywords, topk, **kwargs
+        )
+
+
+class VectorStoreIntentRecognition(IntentRecognition):
+    """
+    index_specific / nature 方式的知识库查询改为在内存映射的向量存储（见 MmapVectorStore）中检索的意图识别，
+    ES 方式仍然请求知识库接口（完全离线时使用 LocalIntentRecognition）。
+    使用时替换 agent 的意图识别实例：CommonQAAgent.intent_recognition_instance = VectorStoreIntentRecognition()
+
+    :param vector_store: 使用的向量存储，为 None 时使用按配置创建的单例（见 get_vector_store）
+    :param search_mode: 暴力检索或 IVF，为 None 时使用配置 VECTOR_STORE_SEARCH_MODE
+    :param nprobe: IVF 方式检索的聚类数量，为 None 时使用配置 VECTOR_STORE_IVF_NPROBE
+    """
+
+    vector_store: Optional[Any] = None
+    search_mode: Optional[VectorSearchMode] = None
+    nprobe: Optional[int] = None
+
+    @property
+    def store(self) -> MmapVectorStore:
+        # 向量存储定义了 __len__，没有文档时为假值，不能用 or 判断
+        return self.vector_store if self.vector_store is not None else get_vector_store()
+
+    def _search_kwargs(self, data: dict) -> dict:
+        return {
+            "mode": self.search_mode or VectorSearchMode(settings.VECTOR_STORE_SEARCH_MODE),
+            "nprobe": self.nprobe or settings.VECTOR_STORE_IVF_NPROBE,
+            **_query_filters(data),
+        }
+
+    @property
+    def _query_instance(self) -> Callable:
+        def query(data):
+            return {"documents": self.store.search(data["query"], data["topk"], **self._search_kwargs(data))}
+
+        return query
+
+    @property
+    def _aquery_instance(self) -> Callable:
+        async def aquery(data):
+            # 计算 query 向量需要请求 embedding 模型，使用异步接口；打分在线程中执行（见 MmapVectorStore.asearch）
+            documents = await self.store.asearch(data["query"], data["topk"], **self._search_kwargs(data))
+            return {"documents": documents}
+
+        return aquery
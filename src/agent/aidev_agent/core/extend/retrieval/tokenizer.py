@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import re
+from typing import List
+
+try:
+    import jieba
+except ImportError:
+    jieba = None
+
+# 英文/数字按单词切分（保留 1.2.3、bk-aidev 这类写法），中文按连续的汉字切分
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*|[一-鿿]+")
+
+
+def _is_cjk(char: str) -> bool:
+    return "一" <= char <= "鿿"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25 使用的分词：安装了 jieba 时使用 jieba 的搜索引擎模式分词，
+    否则中文按相邻两个汉字切分（单个汉字自成一词），英文/数字按单词切分，统一转为小写，去掉标点和空白
+    """
+    text = (text or "").lower()
+    if jieba is not None:
+        return [token for token in jieba.lcut_for_search(text) if _TOKEN_PATTERN.search(token)]
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        if not _is_cjk(word[0]) or len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
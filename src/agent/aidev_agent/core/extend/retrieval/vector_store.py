@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import json
+import mmap
+import os
+from contextlib import contextmanager
+from enum import Enum
+from logging import getLogger
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from langchain_core.embeddings import Embeddings
+
+from aidev_agent.config import settings
+from aidev_agent.core.extend.intent.candidates import topk_indices
+from aidev_agent.core.extend.retrieval.dense import block_scores
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_logger = getLogger(__name__)
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.bin"
+RECORDS_FILE = "records.bin"
+METADATA_FILE = "metadata.jsonl"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ASSIGNMENTS_FILE = "ivf_assignments.bin"
+LOCK_FILE = "writer.lock"
+
+# 偏移表：每行一条定长记录，指向元数据文件中的一行；int8 存储时 scale 为该行的量化系数；
+# 知识库/知识 id 直接放在偏移表中，按范围过滤时不需要解析元数据（没有时为 -1）
+RECORD_DTYPE = np.dtype(
+    [
+        ("meta_offset", "<i8"),
+        ("meta_length", "<i4"),
+        ("scale", "<f4"),
+        ("knowledge_base_id", "<i8"),
+        ("knowledge_id", "<i8"),
+    ]
+)
+ASSIGNMENT_DTYPE = np.dtype("<i4")
+VECTOR_DTYPES = {"float16": np.dtype("<f2"), "int8": np.dtype("i1")}
+
+
+class VectorSearchMode(Enum):
+    BRUTE_FORCE = "BRUTE_FORCE"  # 计算范围内的所有向量
+    IVF = "IVF"  # 倒排文件：只计算距离 query 最近的 nprobe 个聚类中的向量，结果为近似的
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def _optional_id(value) -> int:
+    return -1 if value is None else int(value)
+
+
+class MmapVectorStore:
+    """
+    内存映射、只追加的知识片段向量存储，目录下的文件：
+    - header.json：向量维度、存储类型（float16/int8）和 embedding 模型；
+    - vectors.bin：定长的向量块，向量归一化后存储，int8 为逐行对称量化；
+    - records.bin：偏移表（见 RECORD_DTYPE），行数以该文件为准；
+    - metadata.jsonl：元数据旁路文件，每行一个文档（page_content 和 metadata）；
+    - ivf_centroids.npy / ivf_assignments.bin：调用 train_ivf 后生成的聚类中心和每行所属的聚类。
+
+    读取时各文件以只读方式内存映射，同一台机器上的多个 gunicorn worker 共用一份 page cache，而不是各自加载一份。
+    写入只在文件末尾追加，偏移表的记录最后写入，读取方在检索前检查偏移表的大小，变大时重新映射即可看到新数据，
+    写入过程中不会读到不完整的行；写入中断时残留的数据在下一次写入前截掉。
+    多个进程同时写入时通过文件锁（fcntl）串行。不支持删除和修改。
+
+    :param path: 存储目录
+    :param embeddings: 写入和检索时计算向量的 embedding 模型
+    :param dim: 向量维度，新建存储时使用，为 None 时取第一次写入的向量维度
+    :param dtype: 新建存储时的向量存储类型，float16 或 int8；已有存储以 header.json 为准
+    """
+
+    BLOCK_SIZE = 8192
+
+    def __init__(
+        self,
+        path: str,
+        embeddings: Optional[Embeddings] = None,
+        dim: Optional[int] = None,
+        dtype: str = "float16",
+    ):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"不支持的向量存储类型：{dtype}")
+        self.path = path
+        self.embeddings = embeddings
+        self.dim = dim
+        self.dtype = dtype
+        self.model = getattr(embeddings, "model", None)
+        self._count = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._records: np.ndarray = np.zeros(0, dtype=RECORD_DTYPE)
+        self._metadata: Optional[mmap.mmap] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._centroids_mtime: Optional[float] = None
+        # 倒排表：按聚类排序的行号及每个聚类的起止位置，覆盖前 _ivf_count 行
+        self._ivf_rows = np.zeros(0, dtype=np.int64)
+        self._ivf_bounds = np.zeros(1, dtype=np.int64)
+        self._ivf_count = 0
+        self._lock = Lock()
+        self._header_loaded = False
+        os.makedirs(path, exist_ok=True)
+        self.refresh()
+
+    @classmethod
+    def from_settings(cls) -> "MmapVectorStore":
+        embeddings = None
+        if settings.VECTOR_STORE_EMBEDDING_MODEL:
+            from aidev_agent.core.extend.models.llm_gateway import Embeddings as GatewayEmbeddings
+
+            embeddings = GatewayEmbeddings.get_setup_instance(model=settings.VECTOR_STORE_EMBEDDING_MODEL)
+        return cls(settings.VECTOR_STORE_DIR, embeddings, dtype=settings.VECTOR_STORE_DTYPE)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def ivf_trained(self) -> bool:
+        return self._centroids is not None
+
+    # ---------------------------------------------------------------- 读取
+
+    def refresh(self):
+        """其它进程追加了数据或重新训练了 IVF 时，重新映射各文件"""
+        with self._lock:
+            self._refresh()
+
+    def _load_header(self):
+        """存储可能在创建实例之后才由其它进程写入第一批数据"""
+        header_path = self._file(HEADER_FILE)
+        if self._header_loaded or not os.path.exists(header_path):
+            return
+        with open(header_path) as f:
+            header = json.load(f)
+        self.dim, self.dtype, self.model = header["dim"], header["dtype"], header.get("model")
+        self._header_loaded = True
+
+    def _refresh(self):
+        self._load_header()
+        records_path = self._file(RECORDS_FILE)
+        count = os.path.getsize(records_path) // RECORD_DTYPE.itemsize if os.path.exists(records_path) else 0
+        if count != self._count:
+            self._records = np.memmap(records_path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+            self._vectors = np.memmap(
+                self._file(VECTORS_FILE), dtype=VECTOR_DTYPES[self.dtype], mode="r", shape=(count, self.dim)
+            )
+            with open(self._file(METADATA_FILE), "rb") as f:
+                self._metadata = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._count = count
+        self._refresh_ivf()
+
+    def _refresh_ivf(self):
+        centroids_path = self._file(IVF_CENTROIDS_FILE)
+        if not os.path.exists(centroids_path):
+            return
+        mtime = os.stat(centroids_path).st_mtime_ns
+        if mtime != self._centroids_mtime:
+            self._centroids = np.load(centroids_path)
+            self._centroids_mtime = mtime
+            self._ivf_count = 0
+        if self._ivf_count == self._count:
+            return
+        # 追加的行在写入时已分配好聚类，这里只重建倒排表；训练过程中分配文件可能还短于偏移表，未覆盖的行在检索时按暴力方式计算
+        assignments_path = self._file(IVF_ASSIGNMENTS_FILE)
+        n_assigned = os.path.getsize(assignments_path) // ASSIGNMENT_DTYPE.itemsize
+        self._ivf_count = min(n_assigned, self._count)
+        assignments = np.memmap(assignments_path, dtype=ASSIGNMENT_DTYPE, mode="r", shape=(n_assigned,))
+        assignments = assignments[: self._ivf_count]
+        self._ivf_rows = np.argsort(assignments, kind="stable")
+        self._ivf_bounds = np.searchsorted(assignments[self._ivf_rows], np.arange(len(self._centroids) + 1))
+
+    def _maybe_refresh(self):
+        records_path = self._file(RECORDS_FILE)
+        if os.path.exists(records_path) and os.path.getsize(records_path) // RECORD_DTYPE.itemsize != self._count:
+            self._refresh()
+        elif self._centroids is not None or os.path.exists(self._file(IVF_CENTROIDS_FILE)):
+            self._refresh_ivf()
+
+    def get_documents(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        """按行号读取元数据"""
+        documents = []
+        for row in rows:
+            record = self._records[row]
+            offset, length = int(record["meta_offset"]), int(record["meta_length"])
+            documents.append(json.loads(self._metadata[offset : offset + length]))
+        return documents
+
+    def _candidate_rows(self, knowledge_base_ids=None, knowledge_ids=None) -> np.ndarray:
+        if knowledge_base_ids is None and knowledge_ids is None:
+            return np.arange(self._count)
+        selected = np.zeros(self._count, dtype=bool)
+        for field, ids in [("knowledge_base_id", knowledge_base_ids), ("knowledge_id", knowledge_ids)]:
+            if ids:
+                selected |= np.isin(self._records[field], [int(i) for i in ids])
+        return np.flatnonzero(selected)
+
+    def _ivf_rows_for(self, query_vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """距离 query 最近的 nprobe 个聚类中的行，加上还没有分配聚类的行（升序）"""
+        nearest = topk_indices(self._centroids @ query_vector, nprobe)
+        rows = [self._ivf_rows[self._ivf_bounds[i] : self._ivf_bounds[i + 1]] for i in nearest]
+        rows.append(np.arange(self._ivf_count, self._count))
+        return np.sort(np.concatenate(rows))
+
+    def search_by_vector(
+        self,
+        query_vector: Sequence[float],
+        topk: int,
+        knowledge_base_ids=None,
+        knowledge_ids=None,
+        mode: VectorSearchMode = VectorSearchMode.BRUTE_FORCE,
+        nprobe: int = 8,
+    ) -> List[Dict[str, Any]]:
+        """
+        余弦相似度检索，结果按相似度降序，metadata 中带有 __score__。
+        IVF 方式在没有训练时退化为暴力检索。
+        """
+        with self._lock:
+            self._maybe_refresh()
+            if not self._count:
+                return []
+            query = np.asarray(query_vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            rows = self._candidate_rows(knowledge_base_ids, knowledge_ids)
+            if mode == VectorSearchMode.IVF and self._centroids is not None:
+                rows = np.intersect1d(rows, self._ivf_rows_for(query, nprobe), assume_unique=True)
+            if not len(rows):
+                return []
+            scores = block_scores(self._vectors, rows, query, self.BLOCK_SIZE)
+            if self.dtype == "int8":
+                scores *= self._records["scale"][rows]
+            selected = topk_indices(scores, topk)
+            documents = self.get_documents(rows[selected])
+        for document, score in zip(documents, scores[selected].tolist()):
+            document["metadata"]["__score__"] = score
+        return documents
+
+    def search(self, query: str, topk: int, **kwargs) -> List[Dict[str, Any]]:
+        """参数见 search_by_vector"""
+        return self.search_by_vector(self.embeddings.embed_query(query), topk, **kwargs)
+
+    async def asearch(self, query: str, topk: int, **kwargs) -> List[Dict[str, Any]]:
+        query_vector = await self.embeddings.aembed_query(query)
+        # 打分的耗时随向量数增长，且可能触发从磁盘读取（缺页）和重新加载文件，在线程中执行，不阻塞事件循环
+        return await sync_to_async(self.search_by_vector, thread_sensitive=False)(query_vector, topk, **kwargs)
+
+    # ---------------------------------------------------------------- 写入
+
+    @contextmanager
+    def _write_lock(self):
+        """写入方之间互斥（跨进程），文件关闭时释放锁"""
+        with open(self._file(LOCK_FILE), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _write_header(self):
+        header_path = self._file(HEADER_FILE)
+        if os.path.exists(header_path):
+            # 可能由其它进程创建
+            with open(header_path) as f:
+                header = json.load(f)
+            if (header["dim"], header["dtype"]) != (self.dim, self.dtype):
+                raise ValueError(f"向量维度或存储类型与存储中的不一致：{header}")
+            return
+        self._header_loaded = True
+        tmp_path = f"{header_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "model": self.model}, f)
+        os.replace(tmp_path, header_path)
+
+    def _truncate_uncommitted(self):
+        """
+        截掉偏移表之外的数据：写入方在写完偏移表之前中断时，其余文件末尾会残留未提交的数据，
+        后续追加的数据必须紧接在已提交的行之后，否则行号与向量/元数据错位。在写锁内调用
+        """
+        records_path = self._file(RECORDS_FILE)
+        count = os.path.getsize(records_path) // RECORD_DTYPE.itemsize if os.path.exists(records_path) else 0
+        metadata_size = 0
+        if count:
+            with open(records_path, "rb") as f:
+                f.seek((count - 1) * RECORD_DTYPE.itemsize)
+                last = np.frombuffer(f.read(RECORD_DTYPE.itemsize), dtype=RECORD_DTYPE)[0]
+            metadata_size = int(last["meta_offset"]) + int(last["meta_length"]) + 1
+        row_size = self.dim * VECTOR_DTYPES[self.dtype].itemsize
+        for name, size in [
+            (RECORDS_FILE, count * RECORD_DTYPE.itemsize),
+            (VECTORS_FILE, count * row_size),
+            (METADATA_FILE, metadata_size),
+            (IVF_ASSIGNMENTS_FILE, count * ASSIGNMENT_DTYPE.itemsize),
+        ]:
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                _logger.warning(f"MmapVectorStore: 截掉 {path} 末尾未提交的 {os.path.getsize(path) - size} 字节")
+                os.truncate(path, size)
+
+    def _encode(self, vectors: np.ndarray):
+        """归一化后按存储类型编码，返回 (存储的向量, 每行的量化系数)"""
+        vectors = _normalize_rows(vectors)
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=ASSIGNMENT_DTYPE)
+        for start in range(0, len(vectors), self.BLOCK_SIZE):
+            block = vectors[start : start + self.BLOCK_SIZE].astype(np.float32)
+            assignments[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def add_vectors(self, vectors: Sequence[Sequence[float]], documents: Sequence[Dict[str, Any]]) -> int:
+        """
+        追加向量和对应的文档（格式与知识库接口返回的一致：{"page_content": ..., "metadata": {...}}），返回追加的行数。
+        已训练 IVF 时同时为新行分配聚类
+        """
+        if len(vectors) != len(documents):
+            raise ValueError("向量与文档的数量不一致")
+        if not len(documents):
+            return 0
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._load_header()
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度不一致：{vectors.shape[1]} != {self.dim}")
+        encoded, scales = self._encode(vectors)
+
+        with self._write_lock():
+            self._write_header()
+            self._truncate_uncommitted()
+            lines = [json.dumps(document, ensure_ascii=False).encode("utf-8") + b"\n" for document in documents]
+            lengths = np.array([len(line) for line in lines], dtype=np.int64)
+            metadatas = [document.get("metadata") or {} for document in documents]
+            records = np.zeros(len(documents), dtype=RECORD_DTYPE)
+            records["meta_length"] = lengths - 1
+            records["scale"] = scales
+            records["knowledge_base_id"] = [_optional_id(metadata.get("knowledge_base_id")) for metadata in metadatas]
+            records["knowledge_id"] = [_optional_id(metadata.get("knowledge_id")) for metadata in metadatas]
+            with open(self._file(METADATA_FILE), "ab") as f:
+                records["meta_offset"] = f.tell() + np.cumsum(lengths) - lengths
+                f.write(b"".join(lines))
+            with open(self._file(VECTORS_FILE), "ab") as f:
+                f.write(encoded.tobytes())
+            centroids_path = self._file(IVF_CENTROIDS_FILE)
+            if os.path.exists(centroids_path):
+                with open(self._file(IVF_ASSIGNMENTS_FILE), "ab") as f:
+                    f.write(self._assign(vectors, np.load(centroids_path)).tobytes())
+            # 偏移表最后写入：读取方以其行数为准
+            with open(self._file(RECORDS_FILE), "ab") as f:
+                f.write(records.tobytes())
+        self.refresh()
+        return len(documents)
+
+    def add_documents(
+        self, documents: Sequence[Dict[str, Any]], embeddings: Optional[Embeddings] = None, batch_size: int = 100
+    ) -> int:
+        """按批计算 page_content 的向量后追加，默认使用创建时指定的 embeddings"""
+        embeddings = embeddings or self.embeddings
+        if embeddings is None:
+            raise ValueError("没有指定 embedding 模型，无法计算向量")
+        model = getattr(embeddings, "model", None)
+        if self.model and model and model != self.model:
+            # 不同模型的向量不可比较
+            raise ValueError(f"embedding 模型与存储中的不一致：{model} != {self.model}")
+        self.model = self.model or model
+        total = 0
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start : start + batch_size]
+            vectors = embeddings.embed_documents([document["page_content"] for document in batch])
+            total += self.add_vectors(vectors, batch)
+        return total
+
+    def train_ivf(
+        self, n_lists: Optional[int] = None, n_iter: int = 10, sample_size: Optional[int] = None, seed: int = 0
+    ):
+        """
+        在已有向量上训练 IVF（球面 k-means），并为所有行分配聚类。之后追加的行在写入时分配，
+        数据分布变化较大时可以重新训练。
+        :param n_lists: 聚类数量，默认为 4 * sqrt(行数)
+        :param sample_size: 参与训练的采样行数，默认为每个聚类 64 行
+        """
+        self.refresh()
+        if not self._count:
+            raise ValueError("存储中没有向量，无法训练 IVF")
+        with self._write_lock():
+            self._truncate_uncommitted()
+            self.refresh()
+            count = self._count
+            n_lists = min(n_lists or max(1, int(4 * np.sqrt(count))), count)
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(count, min(sample_size or 64 * n_lists, count), replace=False))
+            sample = _normalize_rows(self._vectors[sample_rows].astype(np.float32))
+            centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+            for _ in range(n_iter):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                # 按聚类排序后分段求和（np.add.at 在二维数组上很慢）
+                order = np.argsort(assignments, kind="stable")
+                starts = np.searchsorted(assignments[order], np.arange(n_lists))
+                nonempty = np.flatnonzero(np.bincount(assignments, minlength=n_lists))
+                sums = np.zeros_like(centroids)
+                sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty])
+                empty = np.setdiff1d(np.arange(n_lists), nonempty)
+                sums[empty] = sample[rng.choice(len(sample), len(empty))]
+                centroids = _normalize_rows(sums)
+
+            # 分配文件整体替换后再替换聚类中心：读取方以聚类中心文件的修改时间判断是否需要重新加载
+            assignments_path = self._file(IVF_ASSIGNMENTS_FILE)
+            with open(f"{assignments_path}.tmp", "wb") as f:
+                f.write(self._assign(self._vectors, centroids).tobytes())
+            os.replace(f"{assignments_path}.tmp", assignments_path)
+            centroids_path = self._file(IVF_CENTROIDS_FILE)
+            with open(f"{centroids_path}.tmp", "wb") as f:
+                np.save(f, centroids.astype(np.float32))
+            os.replace(f"{centroids_path}.tmp", centroids_path)
+        self.refresh()
+        _logger.info(f"MmapVectorStore: 完成 IVF 训练，{count} 行，{n_lists} 个聚类")
+
+
+_vector_store: Optional[MmapVectorStore] = None
+_vector_store_lock = Lock()
+
+
+def get_vector_store() -> MmapVectorStore:
+    """按配置（VECTOR_STORE_DIR）创建的向量存储（单例）"""
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = MmapVectorStore.from_settings()
+    return _vector_store
@@ -10,79 +10,399 @@ specific language governing permissions and limitations under the License.
 """
 
 import asyncio
+import contextlib
+import contextvars
+import os
 import queue
+import threading
+import weakref
+from concurrent.futures import Executor, Future
+from logging import getLogger
 from threading import Thread
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Callable, List, Optional
 
+from aidev_agent.config import settings
 from aidev_agent.utils import Empty
 
+logger = getLogger(__name__)
 
-async def async_generator_with_timeout(
-    gen: AsyncGenerator, timeout: Optional[int | float], max_wait_rounds: int = 10
-) -> AsyncGenerator:
-    try:
+
+_NOTHING = object()
+
+
+class HeartbeatStream:
+    """
+    带心跳的异步流适配器
+
+    由一个常驻的驱动任务迭代底层生成器，并通过单个槽位将数据交给消费方；
+    消费方等待超过 timeout 仍未拿到数据时产出一次 Empty 作为心跳，连续 max_wait_rounds 次心跳后仍无数据则超时。
+    整个流只有一个驱动任务和一个复用的定时器，不会为每条数据或每次心跳创建新的任务。
+    应通过 aclose（如 contextlib.aclosing）结束；消费方未关闭就丢弃流时，由 __del__ 取消驱动任务和定时器，
+    为此驱动任务只持有流的弱引用，不会让流一直存活。
+    """
+
+    def __init__(self, gen: AsyncGenerator, timeout: Optional[int | float], max_wait_rounds: int = 10):
+        self._gen = gen
+        self.timeout = timeout
+        self.max_wait_rounds = max_wait_rounds
+        # 指标：心跳次数、数据条数、相邻两条数据之间的最大间隔（秒）
+        self.heartbeat_count = 0
+        self.item_count = 0
+        self.max_gap = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pump: Optional[asyncio.Task] = None
+        self._slot: Any = _NOTHING
+        self._slot_taken: Optional[asyncio.Future] = None
+        self._waiter: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._wait_started: Optional[float] = None
+        self._last_item_at: Optional[float] = None
+        self._heartbeat_due = False
+        self._idle_rounds = 0
+        self._done = False
+        self._error: Optional[BaseException] = None
+
+    @property
+    def metrics(self) -> dict:
+        return {"heartbeat_count": self.heartbeat_count, "item_count": self.item_count, "max_gap": self.max_gap}
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._last_item_at = self._loop.time()
+            self._pump = self._loop.create_task(_run_heartbeat_pump(weakref.ref(self), self._gen))
         while True:
-            tasks = [asyncio.create_task(gen.__anext__()), asyncio.create_task(asyncio.sleep(timeout))]
-            for _ in range(max_wait_rounds):
-                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-                if tasks[0] in done:
-                    result = tasks[0].result()
-                    yield result
-                    break
-                else:
-                    tasks[1] = asyncio.create_task(asyncio.sleep(timeout))
-                    yield Empty
-            else:
+            if self._slot is not _NOTHING:
+                return self._take_item()
+            if self._done:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                raise StopAsyncIteration
+            if self._idle_rounds >= self.max_wait_rounds:
                 raise TimeoutError("生成器超时")
-    except StopAsyncIteration:
-        return
+            if self._heartbeat_due:
+                self._heartbeat_due = False
+                self._idle_rounds += 1
+                self.heartbeat_count += 1
+                self._wait_started = None
+                return Empty
+            if self._wait_started is None:
+                self._wait_started = self._loop.time()
+            self._arm_timer()
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
 
+    def _take_item(self):
+        item, self._slot = self._slot, _NOTHING
+        if not self._slot_taken.done():
+            self._slot_taken.set_result(None)
+        now = self._loop.time()
+        self.max_gap = max(self.max_gap, now - self._last_item_at)
+        self._last_item_at = now
+        self.item_count += 1
+        self._idle_rounds = 0
+        self._wait_started = None
+        self._heartbeat_due = False
+        return item
 
-def async_to_sync_generator(async_gen, loop=None):
-    data_queue = queue.Queue()
+    def _put_item(self, item) -> asyncio.Future:
+        self._slot = item
+        self._slot_taken = self._loop.create_future()
+        self._wake()
+        return self._slot_taken
+
+    def _finish(self, error: Optional[BaseException] = None):
+        self._error = error
+        self._done = True
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _arm_timer(self):
+        if self.timeout is None or self._timer is not None:
+            return
+        delay = self._wait_started + self.timeout - self._loop.time()
+        self._timer = self._loop.call_later(max(delay, 0), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        if self._waiter is None or self._wait_started is None:
+            # 消费方没有在等待数据，等其下次等待时再重新计时
+            return
+        if self._loop.time() - self._wait_started >= self.timeout:
+            self._heartbeat_due = True
+            self._wake()
+        else:
+            self._arm_timer()
+
+    async def aclose(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pump is not None and not self._pump.done():
+            # 连同底层生成器一起取消，避免其在后台继续运行
+            self._pump.cancel()
+            await asyncio.wait([self._pump])
+        await self._gen.aclose()
+
+    def __del__(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._pump is not None and not self._pump.done() and not self._loop.is_closed():
+            # 消费方未调用 aclose 就丢弃了流，取消驱动任务，由其关闭底层生成器
+            self._pump.cancel()
+
+
+async def _run_heartbeat_pump(stream_ref: "weakref.ref[HeartbeatStream]", gen: AsyncGenerator):
+    """HeartbeatStream 的驱动任务，只在交付数据时临时取得流的强引用"""
     error = None
-    new_loop_created = False
+    try:
+        async for item in gen:
+            stream = stream_ref()
+            if stream is None:
+                break
+            slot_taken = stream._put_item(item)
+            del stream
+            await slot_taken
+    except Exception as e:
+        error = e
+    finally:
+        stream = stream_ref()
+        if stream is not None:
+            stream._finish(error)
+        else:
+            await gen.aclose()
+
+
+def async_generator_with_timeout(
+    gen: AsyncGenerator, timeout: Optional[int | float], max_wait_rounds: int = 10
+) -> HeartbeatStream:
+    return HeartbeatStream(gen, timeout=timeout, max_wait_rounds=max_wait_rounds)
+
+
+class CancellationToken:
+    """
+    请求级的取消令牌
+
+    请求被取消（如 SSE 客户端断开）时调用 cancel，依次执行注册的回调，例如取消线程池中尚未开始执行的任务；
+    同步执行的流程可以在关键步骤前调用 raise_if_cancelled 提前退出。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def add_callback(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:  # noqa: PERF203
+                logger.exception("执行取消回调失败")
+
+    def child(self) -> "CancellationToken":
+        """创建子令牌：本令牌取消时子令牌随之取消，子令牌也可以单独取消而不影响本令牌"""
+        token = CancellationToken()
+        self.add_callback(token.cancel)
+        return token
+
+    def raise_if_cancelled(self) -> None:
+        if self._cancelled:
+            raise asyncio.CancelledError("请求已被取消")
+
 
-    # 判断是否使用现有循环
-    if loop is None:
-        loop = asyncio.new_event_loop()
-        new_loop_created = True
+_cancellation_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "aidev_cancellation_token", default=None
+)
+
+
+def get_cancellation_token() -> Optional[CancellationToken]:
+    return _cancellation_token.get()
+
+
+def set_cancellation_token(token: Optional[CancellationToken]) -> contextvars.Token:
+    return _cancellation_token.set(token)
+
+
+def reset_cancellation_token(reset_token: contextvars.Token) -> None:
+    # 异步生成器可能在其他上下文中被关闭，此时无需还原
+    with contextlib.suppress(ValueError):
+        _cancellation_token.reset(reset_token)
+
+
+def _run_with_cancellation_token(token: CancellationToken, fn: Callable, *args, **kwargs):
+    token.raise_if_cancelled()
+    set_cancellation_token(token)
+    return fn(*args, **kwargs)
+
+
+def submit_cancellable(executor: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """
+    提交任务到线程池，并关联当前上下文中的取消令牌：
+    请求被取消时尚未开始执行的任务会被直接取消，已开始执行的任务中也可以感知到取消状态
+    """
+    token = get_cancellation_token()
+    if token is None:
+        return executor.submit(fn, *args, **kwargs)
+    # 在全新的上下文中执行，只传递取消令牌，不带入调用方的其它上下文
+    future = executor.submit(contextvars.Context().run, _run_with_cancellation_token, token, fn, *args, **kwargs)
+    token.add_callback(future.cancel)
+    return future
+
+
+class EventLoopPool:
+    """
+    长期存活的后台事件循环池
+
+    同步调用方将协程提交到池中的事件循环上运行，避免每次调用都新建事件循环和线程。
+    每个事件循环独占一个 daemon 线程，按当前承载的任务数选择最空闲的事件循环。
+    """
+
+    def __init__(self, size: int, name: str = "aidev-event-loop"):
+        self.size = max(1, size)
+        self.name = name
+        self._lock = threading.Lock()
+        self._loops: List[asyncio.AbstractEventLoop] = []
+        self._threads: List[Thread] = []
+        self._loads: List[int] = []
+        self._pid: Optional[int] = None
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def _ensure_started(self) -> None:
+        # fork 之后子进程中的线程已不存在，需要重新创建
+        if self._loops and self._pid == os.getpid():
+            return
+        self._loops, self._threads, self._loads = [], [], []
+        for index in range(self.size):
+            loop = asyncio.new_event_loop()
+            thread = Thread(target=self._run_loop, args=(loop,), name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._loops.append(loop)
+            self._threads.append(thread)
+            self._loads.append(0)
+        self._pid = os.getpid()
+
+    def acquire(self) -> asyncio.AbstractEventLoop:
+        """获取当前负载最低的事件循环，使用完毕后需调用 release 归还"""
+        with self._lock:
+            self._ensure_started()
+            index = min(range(self.size), key=self._loads.__getitem__)
+            self._loads[index] += 1
+            return self._loops[index]
+
+    def release(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            for index, each in enumerate(self._loops):
+                if each is loop:
+                    self._loads[index] = max(0, self._loads[index] - 1)
+                    break
+
+    @property
+    def loads(self) -> List[int]:
+        with self._lock:
+            return list(self._loads)
+
+    def shutdown(self, timeout: float = 1) -> None:
+        with self._lock:
+            for loop in self._loops:
+                loop.call_soon_threadsafe(loop.stop)
+            for thread in self._threads:
+                thread.join(timeout=timeout)
+            self._loops, self._threads, self._loads = [], [], []
+            self._pid = None
+
+
+event_loop_pool = EventLoopPool(size=settings.ASYNC_TO_SYNC_EVENT_LOOP_POOL_SIZE)
+
+_ITEM, _ERROR, _END = "item", "error", "end"
+
+
+def async_to_sync_generator(async_gen, loop=None, max_queue_size: int = settings.ASYNC_TO_SYNC_MAX_QUEUE_SIZE):
+    """
+    将异步生成器转换为同步生成器
+
+    未指定 loop 时，异步生成器会被提交到共享的后台事件循环池上运行，并沿用调用方的 contextvars 上下文。
+    异步侧每产出一条数据需先获得一个额度，同步侧取走数据后再归还，以此实现背压；
+    同步侧提前结束（close 或被回收）时，会取消异步侧的消费任务并关闭异步生成器。
+    """
+    data_queue = queue.Queue()
+    pooled = loop is None
+    if pooled:
+        loop = event_loop_pool.acquire()
+    task_holder = {}
 
-    # 定义异步消费任务
     async def consume_async():
-        nonlocal error
+        credits = asyncio.Semaphore(max_queue_size)
+        task_holder["credits"] = credits
         try:
             async for item in async_gen:
-                data_queue.put(item)
+                await credits.acquire()
+                data_queue.put((_ITEM, item))
         except Exception as e:
-            error = e
+            data_queue.put((_ERROR, e))
         finally:
-            data_queue.put(None)  # 结束信号
+            aclose = getattr(async_gen, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            data_queue.put((_END, None))
 
-    # 线程运行函数（仅当需要新线程时启动）
-    def run_loop():
-        asyncio.set_event_loop(loop)
-        loop.run_forever()
+    def create_task():
+        task = loop.create_task(consume_async())
+        task_holder["task"] = task
+        if pooled:
+            task.add_done_callback(lambda _: event_loop_pool.release(loop))
 
-    # 根据循环状态决定是否启动新线程
-    if not loop.is_running() and new_loop_created:
-        event_loop_thread = Thread(target=run_loop, daemon=True)
-        event_loop_thread.start()
-
-    # 提交异步任务到指定循环
-    asyncio.run_coroutine_threadsafe(consume_async(), loop)
+    # 在调用方上下文的副本中创建任务，保证 contextvars 能够传递到异步侧
+    loop.call_soon_threadsafe(create_task, context=contextvars.copy_context())
 
+    finished = False
     try:
         while True:
-            item = data_queue.get()
-            if item is None:
-                if error is not None:
-                    raise error
+            kind, value = data_queue.get()
+            if kind == _END:
+                finished = True
                 break
-            yield item
+            if kind == _ERROR:
+                finished = True
+                raise value
+            loop.call_soon_threadsafe(task_holder["credits"].release)
+            yield value
     finally:
-        # 仅清理自己创建的循环
-        if new_loop_created:
-            loop.call_soon_threadsafe(loop.stop)
-            if event_loop_thread.is_alive():
-                event_loop_thread.join(timeout=1)
+        if not finished:
+            # 同步侧提前结束，取消异步侧任务（会沿着 await 链路一直取消到底层请求）
+            loop.call_soon_threadsafe(_cancel_task, task_holder)
+
+
+def _cancel_task(task_holder: dict) -> None:
+    task = task_holder.get("task")
+    if task is not None and not task.done():
+        task.cancel()
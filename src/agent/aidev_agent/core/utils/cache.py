@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from logging import getLogger
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Sequence, Union
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from cachetools import TTLCache
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import AIMessage, BaseMessage
+
+from aidev_agent.config import settings
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_logger = getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """缓存后端：保存字符串，过期时间（秒）为 None 时使用后端的默认设置"""
+
+    # 读写是否有磁盘/网络 I/O：异步调用方需要放到线程中执行，避免阻塞事件循环
+    blocking: bool = True
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内 LRU 缓存，超过容量时淘汰最久未使用的条目，过期条目自动淘汰"""
+
+    blocking = False
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 3600):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        # NOTE: TTLCache 的过期时间对所有条目统一，忽略单独设置的 ttl
+        with self._lock:
+            self._cache[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """基于 SQLite 的磁盘缓存，同一台机器上的多个进程可以共享"""
+
+    def __init__(self, path: str, ttl: int = 3600):
+        self.ttl = ttl
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        expires_at = time.time() + (ttl or self.ttl)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, value, expires_at))
+
+    def evict_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+
+class RedisCacheBackend(CacheBackend):
+    """Redis 缓存，client 可以是任意兼容 redis-py 的 get/set/scan_iter/delete 接口的客户端"""
+
+    def __init__(self, client: Any, prefix: str = "aidev:cache:", ttl: int = 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCacheBackend":
+        if redis is None:
+            raise ImportError("使用 Redis 缓存需要安装 redis：pip install redis")
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode()
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self.client.set(self.prefix + key, value, ex=ttl or self.ttl)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def get_cache_backend(url: str, maxsize: int = 1024, ttl: int = 3600) -> CacheBackend:
+    """
+    根据地址创建缓存后端：
+    - memory:// 进程内 LRU 缓存
+    - sqlite:///path/to/cache.db 磁盘缓存
+    - redis://host:port/db Redis 缓存
+    """
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return MemoryCacheBackend(maxsize=maxsize, ttl=ttl)
+    if scheme == "sqlite":
+        return SQLiteCacheBackend(url[len("sqlite://") :], ttl=ttl)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisCacheBackend.from_url(url, ttl=ttl)
+    raise ValueError(f"不支持的缓存后端：{url}")
+
+
+async def _run_backend_io(backend: Optional[CacheBackend], func: Callable, *args):
+    """异步调用方执行缓存读写：后端会阻塞时在线程中执行"""
+    if backend is not None and backend.blocking:
+        return await sync_to_async(func, thread_sensitive=False)(*args)
+    return func(*args)
+
+
+class LLMResponseCache:
+    """
+    LLM 响应缓存，key 为 (模型, 消息内容的摘要, temperature)
+
+    用于意图识别中的辅助 LLM 调用（关键词提取、query 改写、相关性判断、上下文压缩等），
+    同一个 agent 下不同用户的这些调用经常完全相同，命中缓存时直接返回结果，不再请求 LLM。
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled and backend is not None
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @classmethod
+    def from_settings(cls) -> "LLMResponseCache":
+        if not settings.LLM_RESPONSE_CACHE_ENABLED:
+            return cls(enabled=False)
+        backend = get_cache_backend(
+            settings.LLM_RESPONSE_CACHE_BACKEND,
+            maxsize=settings.LLM_RESPONSE_CACHE_MAXSIZE,
+            ttl=settings.LLM_RESPONSE_CACHE_TTL,
+        )
+        return cls(backend)
+
+    @staticmethod
+    def make_key(llm: BaseLanguageModel, messages: Union[str, Sequence[BaseMessage]]) -> str:
+        if isinstance(messages, str):
+            prompt = messages
+        else:
+            prompt = [
+                [message.type, message.content] if isinstance(message, BaseMessage) else message for message in messages
+            ]
+        data = [getattr(llm, "model_name", None) or type(llm).__name__, prompt, getattr(llm, "temperature", None)]
+        content = json.dumps(data, ensure_ascii=False, default=str)
+        return "llm:" + hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, llm: BaseLanguageModel, messages: Union[str, Sequence[BaseMessage]]) -> Optional[AIMessage]:
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(self.make_key(llm, messages))
+        except Exception as e:  # noqa
+            _logger.warning(f"读取 LLM 响应缓存失败：{e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return AIMessage(**json.loads(value))
+
+    def set(self, llm: BaseLanguageModel, messages: Union[str, Sequence[BaseMessage]], message: BaseMessage):
+        if not self.enabled:
+            return
+        value = json.dumps(
+            {"content": message.content, "additional_kwargs": message.additional_kwargs},
+            ensure_ascii=False,
+            default=str,
+        )
+        try:
+            self.backend.set(self.make_key(llm, messages), value)
+        except Exception as e:  # noqa
+            _logger.warning(f"写入 LLM 响应缓存失败：{e}")
+
+    async def aget(self, llm: BaseLanguageModel, messages: Union[str, Sequence[BaseMessage]]) -> Optional[AIMessage]:
+        if not self.enabled:
+            return None
+        return await _run_backend_io(self.backend, self.get, llm, messages)
+
+    async def aset(self, llm: BaseLanguageModel, messages: Union[str, Sequence[BaseMessage]], message: BaseMessage):
+        if self.enabled:
+            await _run_backend_io(self.backend, self.set, llm, messages, message)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+llm_response_cache = LLMResponseCache.from_settings()
+
+
+class RecallCache:
+    """
+    知识库召回结果缓存，key 为查询参数（知识库/知识、索引、query、topk 等）和所涉及知识（库）的版本
+
+    同一轮对话中同一个 query 经常被多路召回重复检索，重试时又会再检索一遍；命中缓存时直接返回结果。
+    相同查询并发进行时只有一个调用方真正请求知识库，其余调用方等待并共用其结果（single-flight）。
+    知识（库）内容更新后调用 invalidate 更新其版本，之前缓存的召回结果随之失效。
+    """
+
+    ID_TYPES = ("knowledge_base_id", "knowledge_id")
+
+    def __init__(self, backend: Optional[CacheBackend] = None, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled and backend is not None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = Lock()
+        self._flights: Dict[str, concurrent.futures.Future] = {}
+
+    @classmethod
+    def from_settings(cls) -> "RecallCache":
+        if not settings.RECALL_CACHE_ENABLED:
+            return cls(enabled=False)
+        backend = get_cache_backend(
+            settings.RECALL_CACHE_BACKEND,
+            maxsize=settings.RECALL_CACHE_MAXSIZE,
+            ttl=settings.RECALL_CACHE_TTL,
+        )
+        return cls(backend)
+
+    @classmethod
+    def knowledge_ids(cls, data: dict) -> list:
+        """查询参数中涉及的知识（库），index_specific 方式在 index_query_kwargs 中，nature 方式为 id 列表"""
+        ids = set()
+        for index_query in data.get("index_query_kwargs") or []:
+            ids.update((id_type, index_query[id_type]) for id_type in cls.ID_TYPES if id_type in index_query)
+        for id_type in cls.ID_TYPES:
+            if isinstance(data.get(id_type), list):
+                ids.update((id_type, knowledge_id) for knowledge_id in data[id_type])
+        return sorted(ids, key=str)
+
+    @staticmethod
+    def _version_key(id_type: str, knowledge_id: Any) -> str:
+        return f"recall:version:{id_type}:{knowledge_id}"
+
+    def make_key(self, data: dict) -> str:
+        # NOTE: 版本和缓存条目使用相同的过期时间，版本过期时此前的条目也已过期，不会误命中
+        versions = [
+            [id_type, knowledge_id, self.backend.get(self._version_key(id_type, knowledge_id))]
+            for id_type, knowledge_id in self.knowledge_ids(data)
+        ]
+        content = json.dumps([data, versions], ensure_ascii=False, sort_keys=True, default=str)
+        return "recall:" + hashlib.sha256(content.encode()).hexdigest()
+
+    def invalidate(self, knowledge_base_ids: Iterable = (), knowledge_ids: Iterable = ()):
+        """知识（库）更新后的失效钩子：更新对应的版本；不指定任何 id 时清空全部缓存"""
+        if self.backend is None:
+            return
+        knowledge_base_ids, knowledge_ids = list(knowledge_base_ids), list(knowledge_ids)
+        if not knowledge_base_ids and not knowledge_ids:
+            self.backend.clear()
+            return
+        for id_type, ids in zip(self.ID_TYPES, [knowledge_base_ids, knowledge_ids]):
+            for knowledge_id in ids:
+                self.backend.set(self._version_key(id_type, knowledge_id), uuid.uuid4().hex)
+
+    def _get(self, data: dict):
+        """返回 (key, 缓存的结果)，读取缓存失败时 key 为 None，不使用缓存"""
+        try:
+            key = self.make_key(data)
+            value = self.backend.get(key)
+        except Exception as e:  # noqa
+            _logger.warning(f"读取召回结果缓存失败：{e}")
+            return None, None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return key, None
+            self.hits += 1
+        return key, json.loads(value)
+
+    def _set(self, key: str, value: str):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:  # noqa
+            _logger.warning(f"写入召回结果缓存失败：{e}")
+
+    def _join_flight(self, key: str):
+        """返回 (flight, 是否为发起方)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = concurrent.futures.Future()
+            return flight, True
+
+    def _finish_flight(self, key: str, flight: concurrent.futures.Future, value=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(value)
+
+    def _land(self, key: str, flight: concurrent.futures.Future, result):
+        value = json.dumps(result, ensure_ascii=False, default=str)
+        self._set(key, value)
+        self._finish_flight(key, flight, value)
+        return result
+
+    def get_or_load(self, data: dict, loader: Callable[[], Any]):
+        """
+        读取缓存的召回结果，未命中时调用 loader 检索并写入缓存。
+        每次返回的都是独立的副本，调用方可以放心修改其中的文档
+        """
+        if not self.enabled:
+            return loader()
+        key, result = self._get(data)
+        if key is None:
+            return loader()
+        if result is not None:
+            return result
+        flight, leader = self._join_flight(key)
+        if not leader:
+            # 发起方被取消时没有结果，自行检索
+            value = flight.result()
+            return json.loads(value) if value is not None else loader()
+        try:
+            result = loader()
+        except Exception as err:
+            self._finish_flight(key, flight, error=err)
+            raise
+        except BaseException:
+            self._finish_flight(key, flight)
+            raise
+        return self._land(key, flight, result)
+
+    async def aget_or_load(self, data: dict, loader: Callable[[], Awaitable[Any]]):
+        """get_or_load 的异步版本，与同步调用方共用进行中的检索；读写缓存后端在需要时放到线程中执行"""
+        if not self.enabled:
+            return await loader()
+        key, result = await _run_backend_io(self.backend, self._get, data)
+        if key is None:
+            return await loader()
+        if result is not None:
+            return result
+        flight, leader = self._join_flight(key)
+        if not leader:
+            value = await asyncio.wrap_future(flight)
+            return json.loads(value) if value is not None else await loader()
+        try:
+            result = await loader()
+        except Exception as err:
+            self._finish_flight(key, flight, error=err)
+            raise
+        except BaseException:
+            self._finish_flight(key, flight)
+            raise
+        return await _run_backend_io(self.backend, self._land, key, flight, result)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+
+
+recall_cache = RecallCache.from_settings()
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import json
+import math
+import re
+import time
+from contextlib import aclosing, closing
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from typing import Any, AsyncGenerator, Callable, ClassVar, Dict, Generator, Iterable, Iterator, List, Optional, Set
+
+from aidev_agent.config import settings
+from aidev_agent.core.utils.async_utils import HeartbeatStream
+from aidev_agent.utils import Empty
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _utf8_len(text: str) -> int:
+    """返回字符串按 UTF-8 编码后的字节数，纯 ASCII 时不需要实际编码"""
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+class StreamingPatternFilter:
+    """
+    流式文本的模式替换器
+
+    按照最左最长的原则将文本中出现的模式替换为对应的内容（替换为空串即为剔除），模式可以跨越多个 chunk。
+    只有可能是某个模式前缀的尾部内容会被暂存下来等待后续 chunk，暂存长度不超过最长模式的长度，
+    因此每个 chunk 的处理开销只与 chunk 本身和模式长度有关，与已经处理过的内容多少无关。
+    """
+
+    def __init__(self, replacements: Dict[str, str]):
+        self.replacements = {pattern: value for pattern, value in replacements.items() if pattern}
+        patterns = sorted(self.replacements, key=len, reverse=True)
+        # 按长度降序组成的多选正则，在同一位置上优先匹配最长的模式
+        self._regex = re.compile("|".join(re.escape(pattern) for pattern in patterns)) if patterns else None
+        self._prefixes = {pattern[:size] for pattern in patterns for size in range(1, len(pattern))}
+        self._max_prefix_len = max((len(pattern) for pattern in patterns), default=1) - 1
+        # 暂存内容只可能从模式的首字符开始，先用正则定位候选位置，避免逐个位置切片比较
+        first_chars = {prefix[0] for prefix in self._prefixes}
+        self._first_char_regex = (
+            re.compile("[" + "".join(re.escape(c) for c in first_chars) + "]") if first_chars else None
+        )
+        self._buffer = ""
+        self.hit_count = 0
+
+    @property
+    def pending(self) -> str:
+        """暂存中、尚未输出的内容"""
+        return self._buffer
+
+    def feed(self, text: str) -> str:
+        """输入一个 chunk，返回已经可以确定的输出内容"""
+        if self._regex is None:
+            return text
+        buffer = self._buffer + text
+        hold_from = self._hold_from(buffer, 0)
+        pieces = []
+        last_end = 0
+        for match in self._regex.finditer(buffer):
+            if match.start() >= hold_from:
+                # 从这里开始可能会匹配到更长的模式，需要等待后续内容
+                break
+            pieces.append(buffer[last_end : match.start()])
+            pieces.append(self.replacements[match.group()])
+            last_end = match.end()
+            self.hit_count += 1
+        if last_end > hold_from:
+            # 命中的模式跨过了暂存的起始位置，需要对剩余的内容重新计算
+            hold_from = self._hold_from(buffer, last_end)
+        pieces.append(buffer[last_end:hold_from])
+        self._buffer = buffer[hold_from:]
+        return "".join(pieces)
+
+    def flush(self) -> str:
+        """输入结束，输出暂存的全部内容"""
+        buffer, self._buffer = self._buffer, ""
+        if self._regex is None or not buffer:
+            return buffer
+        return self._regex.sub(self._replace, buffer)
+
+    def _replace(self, match: re.Match) -> str:
+        self.hit_count += 1
+        return self.replacements[match.group()]
+
+    def _hold_from(self, buffer: str, start: int) -> int:
+        """返回 buffer[start:] 中可能是某个模式前缀的最长尾部的起始位置"""
+        length = len(buffer)
+        if self._first_char_regex is None:
+            return length
+        pos = max(start, length - self._max_prefix_len)
+        while match := self._first_char_regex.search(buffer, pos):
+            if buffer[match.start() :] in self._prefixes:
+                return match.start()
+            pos = match.start() + 1
+        return length
+
+
+class StreamingPatternFilterChain:
+    """依次经过多个 StreamingPatternFilter 处理"""
+
+    def __init__(self, filters: Iterable[StreamingPatternFilter]):
+        self.filters = list(filters)
+
+    @property
+    def pending(self) -> str:
+        return "".join(each.pending for each in self.filters)
+
+    def feed(self, text: str) -> str:
+        for each in self.filters:
+            text = each.feed(text)
+        return text
+
+    def flush(self) -> str:
+        text = ""
+        for each in self.filters:
+            text = each.feed(text) + each.flush() if text else each.flush()
+        return text
+
+
+class ChunkCoalescer:
+    """
+    合并连续的同类型内容 event（text/think），减少流式输出的帧数
+
+    只有仅包含 event/content/cover 的 text/think event 会被合并，合并后的 event 保留第一条的 cover。
+    遇到 event 类型切换、cover 为 True、带 elapsed_time 等额外字段的 event 以及其他类型的 event 时，
+    先输出已经合并的内容，再原样输出当前 event；流结束时输出剩余内容。
+    合并内容的长度（按 UTF-8 编码后的字节数计算）达到 max_bytes，或者最早的 chunk 等待超过 max_delay_ms 时也会输出；
+    max_delay_ms 为 0 时不做合并，max_bytes 为 0 时不限制长度。
+    """
+
+    MERGEABLE_EVENTS: ClassVar[Set[str]] = {"text", "think"}
+    MERGEABLE_KEYS: ClassVar[Set[str]] = {"event", "content", "cover"}
+
+    def __init__(self, max_delay_ms: int = 0, max_bytes: int = 0):
+        self.max_delay = max_delay_ms / 1000
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_delay > 0
+
+    def coalesce(self, rets: Generator[Dict, None, None]) -> Generator[Dict, None, None]:
+        if not self.enabled:
+            yield from rets
+            return
+        buffer = _ChunkBuffer(self)
+        with closing(rets):
+            for ret in rets:
+                yield from buffer.add(ret)
+        yield from buffer.flush()
+
+    async def acoalesce(self, rets: AsyncGenerator[Dict, None]) -> AsyncGenerator[Dict, None]:
+        if not self.enabled:
+            async with aclosing(rets):
+                async for ret in rets:
+                    yield ret
+            return
+        buffer = _ChunkBuffer(self)
+        # 借助 HeartbeatStream 在超过 max_delay 没有新 event 时得到一次 Empty，以便按时输出已经合并的内容
+        async with aclosing(HeartbeatStream(rets, timeout=self.max_delay, max_wait_rounds=math.inf)) as stream:
+            async for ret in stream:
+                for each in buffer.flush() if ret is Empty else buffer.add(ret):
+                    yield each
+        for each in buffer.flush():
+            yield each
+
+    def is_mergeable(self, ret: Dict) -> bool:
+        return (
+            ret.get("event") in self.MERGEABLE_EVENTS
+            and type(ret.get("content")) is str
+            and ret.keys() <= self.MERGEABLE_KEYS
+        )
+
+
+class _ChunkBuffer:
+    def __init__(self, coalescer: ChunkCoalescer):
+        self.coalescer = coalescer
+        self._head: Optional[Dict] = None
+        self._contents: List[str] = []
+        self._size = 0
+        self._first_at = 0.0
+
+    def add(self, ret: Dict) -> Iterator[Dict]:
+        if not self.coalescer.is_mergeable(ret):
+            yield from self.flush()
+            yield ret
+            return
+        if self._head is not None and (ret["event"] != self._head["event"] or ret.get("cover")):
+            yield from self.flush()
+        now = time.monotonic()
+        if self._head is None:
+            self._head = ret
+            self._first_at = now
+        self._contents.append(ret["content"])
+        self._size += _utf8_len(ret["content"])
+        max_bytes = self.coalescer.max_bytes
+        if (max_bytes and self._size >= max_bytes) or now - self._first_at >= self.coalescer.max_delay:
+            yield from self.flush()
+
+    def flush(self) -> Iterator[Dict]:
+        if self._head is None:
+            return
+        ret = {**self._head, "content": "".join(self._contents)} if len(self._contents) > 1 else self._head
+        self._head = None
+        self._contents = []
+        self._size = 0
+        yield ret
+
+
+def orjson_dumps(obj: Any) -> str:
+    try:
+        return orjson.dumps(obj).decode()
+    except TypeError:
+        # orjson 不支持的类型（如超过 64 位的整数）交给 json 处理，保持与 json.dumps 相同的行为
+        return json.dumps(obj)
+
+
+class SSEEncoder:
+    """
+    将 event 编码为 SSE 帧
+
+    只包含 event/content（以及 cover）的内容 event 占了流式输出的绝大部分，这类 event 使用预先拼好的模板，
+    只需要对 content 做一次字符串转义，输出与 json.dumps 完全一致；其他 event 交给 dumps 处理。
+    """
+
+    DONE_FRAME = "data: [DONE]\n\n"
+
+    def __init__(self, dumps: Callable[[Any], str] = json.dumps):
+        self.dumps = dumps
+        self._content_prefixes: Dict[str, str] = {}
+
+    def encode(self, ret: Dict) -> str:
+        content = ret.get("content")
+        event = ret.get("event")
+        if type(content) is str and type(event) is str:
+            size = len(ret)
+            if size == 2:
+                return self._content_prefix(event) + encode_basestring_ascii(content) + "}\n\n"
+            if size == 3 and type(cover := ret.get("cover")) is bool:
+                suffix = ', "cover": true}\n\n' if cover else ', "cover": false}\n\n'
+                return self._content_prefix(event) + encode_basestring_ascii(content) + suffix
+        return f"data: {self.dumps(ret)}\n\n"
+
+    def _content_prefix(self, event: str) -> str:
+        if (prefix := self._content_prefixes.get(event)) is None:
+            prefix = self._content_prefixes[event] = f'data: {{"event": {encode_basestring_ascii(event)}, "content": '
+        return prefix
+
+
+@lru_cache(maxsize=None)
+def get_sse_encoder(backend: str = "") -> SSEEncoder:
+    """获取 SSE 帧编码器，默认按照 settings.SSE_JSON_BACKEND 选择 json 库"""
+    backend = backend or settings.SSE_JSON_BACKEND
+    if backend == "orjson" and orjson is not None:
+        return SSEEncoder(dumps=orjson_dumps)
+    return SSEEncoder()
+
+
+class SSEFrameBatcher:
+    """
+    将多个 SSE 帧合并为一次输出，减少小帧带来的系统调用和代理开销
+
+    每个帧本身保持不变，只是多个帧拼接后一起发送。累计长度达到 max_bytes（按 UTF-8 编码后的字节数计算），
+    或者最早的帧等待超过 max_delay_ms 时发送；max_bytes 为 0 时不做合并。
+    同步模式下只能在下一帧到达时检查等待时间，异步模式下没有新帧到达时也会按时发送。
+    """
+
+    def __init__(self, max_bytes: int = 0, max_delay_ms: int = 0):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_ms / 1000
+
+    @classmethod
+    def from_settings(cls) -> "SSEFrameBatcher":
+        return cls(max_bytes=settings.SSE_BATCH_MAX_BYTES or 0, max_delay_ms=settings.SSE_BATCH_MAX_DELAY_MS or 0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def batch(self, frames: Generator[str, None, None]) -> Generator[str, None, None]:
+        if not self.enabled:
+            yield from frames
+            return
+        buffer = _FrameBuffer(self.max_bytes, self.max_delay)
+        with closing(frames):
+            for frame in frames:
+                if (ready := buffer.add(frame)) is not None:
+                    yield ready
+        if (ready := buffer.flush()) is not None:
+            yield ready
+
+    async def abatch(self, frames: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        if not self.enabled:
+            async with aclosing(frames):
+                async for frame in frames:
+                    yield frame
+            return
+        buffer = _FrameBuffer(self.max_bytes, self.max_delay)
+        # 借助 HeartbeatStream 在超过 max_delay 没有新帧时得到一次 Empty，以便按时发送已经缓存的帧
+        async with aclosing(
+            HeartbeatStream(frames, timeout=self.max_delay or None, max_wait_rounds=math.inf)
+        ) as stream:
+            async for frame in stream:
+                ready = buffer.flush() if frame is Empty else buffer.add(frame)
+                if ready is not None:
+                    yield ready
+        if (ready := buffer.flush()) is not None:
+            yield ready
+
+
+class _FrameBuffer:
+    def __init__(self, max_bytes: int, max_delay: float):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._frames = []
+        self._size = 0
+        self._first_at: Optional[float] = None
+
+    def add(self, frame: str) -> Optional[str]:
+        now = time.monotonic()
+        if self._first_at is None:
+            self._first_at = now
+        self._frames.append(frame)
+        self._size += _utf8_len(frame)
+        if self._size >= self.max_bytes or now - self._first_at >= self.max_delay:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        if not self._frames:
+            return None
+        ready = "".join(self._frames)
+        self._frames.clear()
+        self._size = 0
+        self._first_at = None
+        return ready
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+TencentBlueKing is pleased to support the open source community by making
+蓝鲸智云 - AIDev (BlueKing - AIDev) available.
+Copyright (C) 2025 THL A29 Limited,
+a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+We undertake not to change the open source license (MIT license) applicable
+to the current version of the project delivered to anyone in the future.
+"""
+
+import hashlib
+import json
+from threading import RLock
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from asgiref.sync import sync_to_async
+from cachetools import LRUCache
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.token_buffer import ConversationTokenBufferMemory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import BaseMessage
+
+from aidev_agent.config import settings
+
+
+def token_model_key(llm: BaseLanguageModel) -> Tuple:
+    """决定分词结果的模型配置，配置相同的模型实例共享 token 计数"""
+    remote_tokenizer = getattr(llm, "remote_tokenizer", False)
+    return (
+        type(llm),
+        getattr(llm, "model_name", None),
+        getattr(llm, "tiktoken_model_name", None),
+        llm.custom_get_token_ids,
+        remote_tokenizer,
+        getattr(llm, "openai_api_base", None) if remote_tokenizer else None,
+    )
+
+
+def message_digest(message: BaseMessage) -> str:
+    """消息内容的摘要：只包含参与 token 计数的字段"""
+    data = [
+        message.type,
+        message.content,
+        message.name,
+        message.additional_kwargs,
+        getattr(message, "tool_calls", None),
+        getattr(message, "tool_call_id", None),
+    ]
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+class TokenCounter:
+    """
+    按消息缓存 token 数
+
+    多条消息的 token 数 = 请求的固定开销 + 每条消息的 token 数，
+    因此同一批消息增删、压缩其中一部分时，只需要对新的消息分词，其余消息直接命中缓存。
+    NOTE: 使用远程分词（remote_tokenizer）时，逐条统计会比整体统计多出少量分隔符的 token，结果略偏大。
+    异步接口（a 开头的方法）在线程中分词，查询缓存仍在当前线程中完成，全部命中时不需要切换线程。
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache: LRUCache = LRUCache(maxsize=maxsize)
+        self._overheads: Dict[Hashable, int] = {}
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache.maxsize > 0
+
+    def overhead(self, llm: BaseLanguageModel) -> int:
+        """与消息无关的固定开销（如 OpenAI 格式中每次回复的引导 token）"""
+        model_key = token_model_key(llm)
+        overhead = self._overheads.get(model_key)
+        if overhead is None:
+            overhead = self._overheads[model_key] = llm.get_num_tokens_from_messages([])
+        return overhead
+
+    def count_message(self, llm: BaseLanguageModel, message: BaseMessage) -> int:
+        """单条消息的 token 数，不包含固定开销"""
+        return self.count_each(llm, [message])[0]
+
+    def count_each(self, llm: BaseLanguageModel, messages: Sequence[BaseMessage]) -> List[int]:
+        """
+        逐条统计消息的 token 数，不包含固定开销
+        未命中缓存的消息在模型支持 get_num_tokens_from_messages_batch 时一次统计完成（如远程分词只需一次请求）
+        """
+        if not self.enabled:
+            return self._count_each(llm, messages)
+        keys, counts, missing = self._lookup(llm, messages)
+        if not missing:
+            return counts
+        # 分词可能比较耗时（远程分词时为 HTTP 请求），不在锁内执行
+        missing_counts = self._count_each(llm, [messages[idx] for idx in missing])
+        return self._store(keys, counts, missing, missing_counts)
+
+    async def acount_each(self, llm: BaseLanguageModel, messages: Sequence[BaseMessage]) -> List[int]:
+        """count_each 的异步版本：未命中缓存的消息在线程中分词，不阻塞事件循环"""
+        acount_each = sync_to_async(self._count_each, thread_sensitive=False)
+        if not self.enabled:
+            return await acount_each(llm, messages)
+        keys, counts, missing = self._lookup(llm, messages)
+        if not missing:
+            return counts
+        missing_counts = await acount_each(llm, [messages[idx] for idx in missing])
+        return self._store(keys, counts, missing, missing_counts)
+
+    def _lookup(
+        self, llm: BaseLanguageModel, messages: Sequence[BaseMessage]
+    ) -> Tuple[List[Hashable], List[Optional[int]], List[int]]:
+        """查询缓存，返回每条消息的缓存 key、已缓存的 token 数以及未命中缓存的消息下标"""
+        model_key = token_model_key(llm)
+        keys = [(model_key, message_digest(message)) for message in messages]
+        with self._lock:
+            counts = [self._cache.get(key) for key in keys]
+            missing = [idx for idx, count in enumerate(counts) if count is None]
+            self.hits += len(counts) - len(missing)
+            self.misses += len(missing)
+        return keys, counts, missing
+
+    def _store(
+        self, keys: List[Hashable], counts: List[Optional[int]], missing: List[int], missing_counts: List[int]
+    ) -> List[int]:
+        with self._lock:
+            for idx, count in zip(missing, missing_counts):
+                counts[idx] = self._cache[keys[idx]] = count
+        return counts
+
+    def _count_each(self, llm: BaseLanguageModel, messages: Sequence[BaseMessage]) -> List[int]:
+        overhead = self.overhead(llm)
+        count_batch = getattr(llm, "get_num_tokens_from_messages_batch", None)
+        if count_batch is not None:
+            counts = count_batch([[message] for message in messages])
+        else:
+            counts = [llm.get_num_tokens_from_messages([message]) for message in messages]
+        return [count - overhead for count in counts]
+
+    def count_messages(self, llm: BaseLanguageModel, messages: Sequence[BaseMessage]) -> int:
+        if not self.enabled:
+            return llm.get_num_tokens_from_messages(list(messages))
+        return self.overhead(llm) + sum(self.count_each(llm, messages))
+
+    async def acount_message(self, llm: BaseLanguageModel, message: BaseMessage) -> int:
+        """count_message 的异步版本"""
+        return (await self.acount_each(llm, [message]))[0]
+
+    async def acount_messages(self, llm: BaseLanguageModel, messages: Sequence[BaseMessage]) -> int:
+        """count_messages 的异步版本"""
+        if not self.enabled:
+            return await sync_to_async(llm.get_num_tokens_from_messages, thread_sensitive=False)(list(messages))
+        counts = await self.acount_each(llm, messages)
+        if token_model_key(llm) not in self._overheads:
+            # 固定开销同样需要分词，尚未统计过时在线程中统计
+            await sync_to_async(self.overhead, thread_sensitive=False)(llm)
+        return self.overhead(llm) + sum(counts)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._overheads.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+token_counter = TokenCounter(maxsize=settings.TOKEN_COUNT_CACHE_SIZE)
+
+
+class CachedTokenBufferMemory(ConversationTokenBufferMemory):
+    """
+    使用按消息缓存的 token 计数的 ConversationTokenBufferMemory
+    裁剪会话历史时逐条扣减被移除消息的 token 数，而不是每移除一条就重新统计整个列表
+    """
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        BaseChatMemory.save_context(self, inputs, outputs)
+        self.prune()
+
+    def prune(self) -> List[BaseMessage]:
+        """从最早的消息开始移除，直到不超过 max_token_limit，返回被移除的消息"""
+        buffer = self.chat_memory.messages
+        counts = token_counter.count_each(self.llm, buffer)
+        curr_buffer_length = token_counter.overhead(self.llm) + sum(counts)
+        pruned_count = 0
+        while curr_buffer_length > self.max_token_limit and pruned_count < len(buffer):
+            curr_buffer_length -= counts[pruned_count]
+            pruned_count += 1
+        pruned_memory = buffer[:pruned_count]
+        del buffer[:pruned_count]
+        return pruned_memory
@@ -1,11 +1,11 @@
-import json
 import re
 from collections import deque
+from contextlib import aclosing, closing
 from logging import getLogger
 from time import time
-from typing import Any, ClassVar, Generator, Optional
+from typing import Any, AsyncGenerator, ClassVar, Generator, Iterator, Optional
 
-from langchain.memory.token_buffer import ConversationTokenBufferMemory
+from asgiref.sync import sync_to_async
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.language_models import BaseChatModel
@@ -18,6 +18,8 @@ from pydantic import BaseModel, Field
 
 from aidev_agent.core.agent.multimodal import EnhancedAgentExecutor
 from aidev_agent.core.extend.agent.qa import CommonQAAgent
+from aidev_agent.core.utils.streaming import ChunkCoalescer, SSEEncoder, SSEFrameBatcher, get_sse_encoder
+from aidev_agent.core.utils.token_counter import CachedTokenBufferMemory
 from aidev_agent.enums import PromptRole, StreamEventType
 from aidev_agent.exceptions import AgentException
 from aidev_agent.services.pydantic_models import ChatPrompt
@@ -29,6 +31,10 @@ class ExecuteKwargs(BaseModel):
     stream: bool = False
     stream_timeout: int = 30
     passthrough_input: bool = False
+    # 流式输出时合并连续的同类型内容 chunk：最长等待时间（毫秒），为 0 时不合并
+    coalesce_max_delay_ms: int = 0
+    # 合并后单个 chunk 的最大长度（按 UTF-8 编码后的字节数计算），为 0 时不限制
+    coalesce_max_bytes: int = 0
 
 
 class ChatCompletionAgent(BaseModel):
@@ -133,64 +139,162 @@ class ChatCompletionAgent(BaseModel):
         # 执行agent操作
         messages = self.convert_history_to_messages()
         if self.is_run_by_agent():
-            return self._execute_by_agent(messages, stream=execute_kwargs.stream)
+            return self._execute_by_agent(
+                messages,
+                stream=execute_kwargs.stream,
+                coalescer=self.get_chunk_coalescer(execute_kwargs),
+            )
         if execute_kwargs.stream:
-            return self._stream(messages)
+            return self._stream(messages, coalescer=self.get_chunk_coalescer(execute_kwargs))
         return self._invoke(messages)
 
-    def _execute_by_agent(self, messages: list[BaseMessage], stream: bool = False):
+    async def aexecute(self, execute_kwargs: ExecuteKwargs) -> dict | AsyncGenerator[str, None]:
+        """execute 的原生 asyncio 版本，流式时返回异步生成器，全程运行在调用方的事件循环上"""
+        if execute_kwargs.stream:
+            return self.astream(execute_kwargs)
+        messages = self.convert_history_to_messages()
+        if self.is_run_by_agent():
+            return await self._aexecute_by_agent(messages)
+        return await self._ainvoke(messages)
+
+    async def astream(self, execute_kwargs: ExecuteKwargs | None = None) -> AsyncGenerator[str, None]:
+        """流式执行，直接产出 SSE 帧，可用于 ASGI 的 StreamingHttpResponse"""
+        messages = self.convert_history_to_messages()
+        coalescer = self.get_chunk_coalescer(execute_kwargs or ExecuteKwargs(stream=True))
+        if self.is_run_by_agent():
+            agent_e, cfg = await self._aget_agent(messages)
+            frames = agent_e.agent.astream_standard_event(
+                agent_e, cfg, {"input": messages[-1].content}, timeout=self.HEARTBEATS_INTERVAL, coalescer=coalescer
+            )
+        else:
+            frames = self._astream(messages, coalescer=coalescer)
+        async with aclosing(frames):
+            async for frame in frames:
+                yield frame
+
+    def _execute_by_agent(
+        self, messages: list[BaseMessage], stream: bool = False, coalescer: ChunkCoalescer | None = None
+    ):
         agent_e, cfg = self._get_agent(messages)
         if stream:
             return agent_e.agent.stream_standard_event(
-                agent_e, cfg, {"input": messages[-1].content}, timeout=self.HEARTBEATS_INTERVAL
+                agent_e, cfg, {"input": messages[-1].content}, timeout=self.HEARTBEATS_INTERVAL, coalescer=coalescer
             )
         else:
             result = agent_e.invoke({"input": messages[-1].content}, cfg)
             return result.get("output", "")
 
-    def _stream(self, messages: list[BaseMessage]) -> Generator[str, None, None]:
+    async def _aexecute_by_agent(self, messages: list[BaseMessage]):
+        agent_e, cfg = await self._aget_agent(messages)
+        result = await agent_e.ainvoke({"input": messages[-1].content}, cfg)
+        return result.get("output", "")
+
+    def get_sse_encoder(self) -> SSEEncoder:
+        return get_sse_encoder()
+
+    def get_sse_frame_batcher(self) -> SSEFrameBatcher:
+        return SSEFrameBatcher.from_settings()
+
+    def get_chunk_coalescer(self, execute_kwargs: ExecuteKwargs) -> ChunkCoalescer:
+        return ChunkCoalescer(
+            max_delay_ms=execute_kwargs.coalesce_max_delay_ms, max_bytes=execute_kwargs.coalesce_max_bytes
+        )
+
+    def _stream(
+        self, messages: list[BaseMessage], coalescer: ChunkCoalescer | None = None
+    ) -> Generator[str, None, None]:
         # 流式处理
+        yield from self.get_sse_frame_batcher().batch(self._iter_stream_frames(messages, coalescer))
+
+    async def _astream(
+        self, messages: list[BaseMessage], coalescer: ChunkCoalescer | None = None
+    ) -> AsyncGenerator[str, None]:
+        # 异步流式处理
+        frames = self.get_sse_frame_batcher().abatch(self._aiter_stream_frames(messages, coalescer))
+        async with aclosing(frames):
+            async for frame in frames:
+                yield frame
+
+    def _iter_stream_frames(
+        self, messages: list[BaseMessage], coalescer: ChunkCoalescer | None = None
+    ) -> Generator[str, None, None]:
+        encoder = self.get_sse_encoder()
+        with closing((coalescer or ChunkCoalescer()).coalesce(self._iter_stream_rets(messages))) as rets:
+            for ret in rets:
+                yield encoder.encode(ret)
+        yield encoder.DONE_FRAME
+
+    async def _aiter_stream_frames(
+        self, messages: list[BaseMessage], coalescer: ChunkCoalescer | None = None
+    ) -> AsyncGenerator[str, None]:
+        encoder = self.get_sse_encoder()
+        async with aclosing((coalescer or ChunkCoalescer()).acoalesce(self._aiter_stream_rets(messages))) as rets:
+            async for ret in rets:
+                yield encoder.encode(ret)
+        yield encoder.DONE_FRAME
+
+    def _iter_stream_rets(self, messages: list[BaseMessage]) -> Generator[dict, None, None]:
+        q = deque(maxlen=self.MAX_Q_LENGTH)
+        try:
+            # 客户端断开时关闭底层的流式请求
+            with closing(self.chat_model.stream(input=messages)) as chunks:
+                for each in chunks:
+                    yield from self._handle_stream_chunk(each, q)
+            yield from self._flush_stream_q(q)
+        except Exception as exception:
+            yield self._stream_error_ret(exception)
+
+    async def _aiter_stream_rets(self, messages: list[BaseMessage]) -> AsyncGenerator[dict, None]:
         q = deque(maxlen=self.MAX_Q_LENGTH)
         try:
-            for each in self.chat_model.stream(input=messages):
-                if self.first_chunk and not each.content and not each.additional_kwargs.get("reasoning_content"):
-                    continue
-                event_type = (
-                    StreamEventType.THINK if each.additional_kwargs.get("reasoning_content") else StreamEventType.TEXT
-                )
-                if self.last_event_type == StreamEventType.NO and event_type == StreamEventType.THINK:
-                    self.elapsed[0] = time()
-                if self.last_event_type == StreamEventType.THINK and event_type == StreamEventType.TEXT:
-                    self.elapsed[1] = time()
-                self.last_event_type = event_type
-                self.first_chunk = False
-                ret = {
-                    "event": event_type.value,
-                    "content": each.content
-                    if event_type == StreamEventType.TEXT
-                    else each.additional_kwargs.get("reasoning_content", ""),
-                }
-                if not self.has_think and ret["event"] == StreamEventType.THINK.value and ret["content"].strip():
-                    self.has_think = True
-                q.append(ret)
-                if len(q) == self.MAX_Q_LENGTH:
-                    # 如果没有think内容则不输出think
-                    ret = self._pop_q_get_ret(q)
-                    if ret:
-                        yield f"data: {json.dumps(ret)}\n\n"
-            while q:
-                ret = self._pop_q_get_ret(q)
-                if ret:
-                    yield f"data: {json.dumps(ret)}\n\n"
+            async with aclosing(self.chat_model.astream(input=messages)) as chunks:
+                async for each in chunks:
+                    for ret in self._handle_stream_chunk(each, q):
+                        yield ret
+            for ret in self._flush_stream_q(q):
+                yield ret
         except Exception as exception:
-            ret = {
-                "event": StreamEventType.ERROR.value,
-                "code": exception.code if hasattr(exception, "code") else 400,
-                "message": exception.response_data() if hasattr(exception, "response_data") else str(exception),
-            }
-            logger.exception(exception)
-            yield f"data: {json.dumps(ret)}\n\n"
-        yield "data: [DONE]\n\n"
+            yield self._stream_error_ret(exception)
+
+    def _handle_stream_chunk(self, each: BaseMessage, q: deque) -> Iterator[dict]:
+        """处理单个流式 chunk，产出可以发送的 ret"""
+        if self.first_chunk and not each.content and not each.additional_kwargs.get("reasoning_content"):
+            return
+        event_type = StreamEventType.THINK if each.additional_kwargs.get("reasoning_content") else StreamEventType.TEXT
+        if self.last_event_type == StreamEventType.NO and event_type == StreamEventType.THINK:
+            self.elapsed[0] = time()
+        if self.last_event_type == StreamEventType.THINK and event_type == StreamEventType.TEXT:
+            self.elapsed[1] = time()
+        self.last_event_type = event_type
+        self.first_chunk = False
+        ret = {
+            "event": event_type.value,
+            "content": each.content
+            if event_type == StreamEventType.TEXT
+            else each.additional_kwargs.get("reasoning_content", ""),
+        }
+        if not self.has_think and ret["event"] == StreamEventType.THINK.value and ret["content"].strip():
+            self.has_think = True
+        q.append(ret)
+        if len(q) == self.MAX_Q_LENGTH:
+            # 如果没有think内容则不输出think
+            ret = self._pop_q_get_ret(q)
+            if ret:
+                yield ret
+
+    def _flush_stream_q(self, q: deque) -> Iterator[dict]:
+        while q:
+            ret = self._pop_q_get_ret(q)
+            if ret:
+                yield ret
+
+    def _stream_error_ret(self, exception: Exception) -> dict:
+        logger.exception(exception)
+        return {
+            "event": StreamEventType.ERROR.value,
+            "code": exception.code if hasattr(exception, "code") else 400,
+            "message": exception.response_data() if hasattr(exception, "response_data") else str(exception),
+        }
 
     def _pop_q_get_ret(self, q):
         ret = q.popleft()
@@ -204,6 +308,13 @@ class ChatCompletionAgent(BaseModel):
     def _invoke(self, messages: list[BaseMessage]) -> dict:
         # 非流式
         result = self.chat_model.invoke(input=messages)
+        return self._format_invoke_result(result)
+
+    async def _ainvoke(self, messages: list[BaseMessage]) -> dict:
+        result = await self.chat_model.ainvoke(input=messages)
+        return self._format_invoke_result(result)
+
+    def _format_invoke_result(self, result: BaseMessage) -> dict:
         message_dict = _convert_message_to_dict(result)
         return {
             "choices": [{"delta": message_dict}],
@@ -226,6 +337,10 @@ class ChatCompletionAgent(BaseModel):
             callbacks=self.callbacks,
         )
 
+    async def _aget_agent(self, messages: list[BaseMessage]) -> tuple[EnhancedAgentExecutor, RunnableConfig]:
+        # 创建 agent（缓存未命中时构建组件、计算对话历史的 token 数，可能请求远程分词接口）在线程中执行，不阻塞事件循环
+        return await sync_to_async(self._get_agent, thread_sensitive=False)(messages)
+
     def get_memory_window(
         self,
         memory=None,
@@ -234,7 +349,7 @@ class ChatCompletionAgent(BaseModel):
         """返回window内可以保留的有效条目数"""
         history = ChatMessageHistory()
         history.add_messages(self.chat_history)
-        memory = memory or ConversationTokenBufferMemory(
+        memory = memory or CachedTokenBufferMemory(
             memory_key="chat_history",
             return_messages=True,
             input_key="input",
@@ -0,0 +1,89 @@
+"""
+单轮对话中工具、prompt、kwargs 拷贝的基准测试：对比深拷贝与写时复制
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+分配内存的峰值记录在 benchmark 结果的 extra_info 中
+"""
+
+import tracemalloc
+from copy import deepcopy
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import StructuredTool
+
+from aidev_agent.core.agent.overlay import snapshot_kwargs, with_tool_flags
+from aidev_agent.core.extend.intent.prompts import general_qa_prompt_structured_chat
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+
+def _make_tool(i):
+    def query(city: str, date: str) -> str:
+        return "晴"
+
+    return StructuredTool.from_function(query, name=f"query_{i}", description=f"查询天气的工具 {i}")
+
+
+TOOLS = [_make_tool(i) for i in range(20)]
+KWARGS = {
+    "input": "明天深圳天气怎么样?",
+    "chat_history": [HumanMessage(content="你好" * 200), AIMessage(content="你好，有什么可以帮你" * 200)] * 10,
+    "context": ["知识库内容" * 200] * 10,
+    "knowledge_bases": [{"id": i, "name": f"知识库 {i}"} for i in range(5)],
+}
+# 单轮对话中 agent plan 的次数
+PLAN_STEPS = 3
+
+
+def legacy_copy():
+    """原有实现：构建 executor、保存意图识别结果、每轮 plan 都进行深拷贝"""
+    tools = deepcopy(TOOLS)
+    for tool in tools:
+        tool.handle_validation_error = True
+        tool.handle_tool_error = True
+    prompt = deepcopy(general_qa_prompt_structured_chat)
+    candidate_tools = deepcopy(deepcopy(tools))
+    results = {"prompt": deepcopy(prompt), "candidate_tools": deepcopy(candidate_tools), "kwargs": deepcopy(KWARGS)}
+    prompts = [deepcopy(results["prompt"]) for _ in range(PLAN_STEPS)]
+    return tools, prompts, results
+
+
+def overlay_copy():
+    """写时复制：只在属性不一致时生成覆盖层，共享不会被原地修改的对象"""
+    tools = [with_tool_flags(tool, handle_validation_error=True, handle_tool_error=True) for tool in TOOLS]
+    prompt = general_qa_prompt_structured_chat
+    candidate_tools = list(tools)
+    results = {"prompt": prompt, "candidate_tools": list(candidate_tools), "kwargs": snapshot_kwargs(KWARGS)}
+    prompts = [results["prompt"] for _ in range(PLAN_STEPS)]
+    return tools, prompts, results
+
+
+def _allocated_bytes(func):
+    """执行过程中新分配内存的峰值"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def test_same_result():
+    legacy_tools, legacy_prompts, legacy_results = legacy_copy()
+    tools, prompts, results = overlay_copy()
+    assert [tool.model_dump() for tool in legacy_tools] == [tool.model_dump() for tool in tools]
+    assert [prompt.messages for prompt in legacy_prompts] == [prompt.messages for prompt in prompts]
+    assert legacy_results["kwargs"] == results["kwargs"]
+    assert _allocated_bytes(overlay_copy) < _allocated_bytes(legacy_copy)
+
+
+def test_legacy_copy(benchmark: FixtureType.benchmark):
+    benchmark.extra_info["allocated_bytes"] = _allocated_bytes(legacy_copy)
+    benchmark(legacy_copy)
+
+
+def test_overlay_copy(benchmark: FixtureType.benchmark):
+    benchmark.extra_info["allocated_bytes"] = _allocated_bytes(overlay_copy)
+    benchmark(overlay_copy)
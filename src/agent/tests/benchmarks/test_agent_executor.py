@@ -0,0 +1,43 @@
+"""
+agent 构建的基准测试：对比每次重新构建与复用缓存的不可变组件
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import pytest
+from langchain_core.tools import StructuredTool
+
+from aidev_agent.core.agent.cache import agent_component_cache
+from aidev_agent.core.extend.agent.qa import CommonQAAgent
+from aidev_agent.core.extend.models.llm_gateway import ChatModel
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+
+def _make_tool(i):
+    def query(city: str, date: str) -> str:
+        return "晴"
+
+    return StructuredTool.from_function(query, name=f"query_{i}", description=f"查询天气的工具 {i}")
+
+
+LLM = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost")
+TOOLS = [_make_tool(i) for i in range(20)]
+
+
+def get_agent_executor():
+    return CommonQAAgent.get_agent_executor(llm=LLM, knowledge_llm=LLM, extra_tools=TOOLS, role_prompt="你是一个助手")
+
+
+def get_agent_executor_without_cache():
+    agent_component_cache.clear()
+    return get_agent_executor()
+
+
+def test_get_agent_executor_without_cache(benchmark: FixtureType.benchmark):
+    benchmark(get_agent_executor_without_cache)
+
+
+def test_get_agent_executor(benchmark: FixtureType.benchmark):
+    get_agent_executor()
+    benchmark(get_agent_executor)
@@ -0,0 +1,46 @@
+"""
+多路召回结果融合的基准测试：6 路召回、每路 topk 为 100 时的加权 RRF 融合、阈值分桶与 top-k 选择
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import random
+
+import pytest
+from langchain_core.documents import Document
+
+from aidev_agent.core.extend.intent.intent_recognition import IntentRecognition
+from aidev_agent.core.extend.intent.utils import filter_and_select_topk
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+N_PATHS = 6
+TOPK = 100
+
+
+def retrieved_results():
+    rnd = random.Random(0)
+    return [
+        [
+            {
+                "page_content": f"文档 {uid}",
+                "metadata": {"uid": str(uid), "__score__": rnd.random(), "path": f"{uid}.md"},
+            }
+            for uid in rnd.sample(range(TOPK * 3), TOPK)
+        ]
+        for _ in range(N_PATHS)
+    ]
+
+
+def fuse_and_select(recognition, results):
+    fusion_docs = recognition._fuse_retrieved_results(results, with_rrf=True)
+    context_docs_with_scores = [(Document(**item), item["metadata"]["__score__"]) for item in fusion_docs]
+    fine_grained_scores = [item["metadata"]["rrf_score"] for item in fusion_docs]
+    emb_recalled, *_ = recognition.separate_docs_by_scores(context_docs_with_scores, fine_grained_scores, (0.05, 0.1))
+    return filter_and_select_topk(emb_recalled, 0.01, 20)
+
+
+def test_fuse_and_select(benchmark: FixtureType.benchmark):
+    recognition = IntentRecognition()
+    benchmark.extra_info["docs_per_round"] = N_PATHS * TOPK
+    benchmark(fuse_and_select, recognition, retrieved_results())
@@ -0,0 +1,54 @@
+"""
+细粒度相关性打分的基准测试：对比进程内 CPU cross-encoder 与逐篇调用 LLM 判断的吞吐
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+cross-encoder 需要安装 onnxruntime、tokenizers 并配置 CROSS_ENCODER_MODEL_PATH；
+LLM 判断需要配置 LLM 网关相关的环境变量，模型可通过 BENCHMARK_RELEVANCE_LLM 指定
+"""
+
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from aidev_agent.config import settings
+from aidev_agent.core.extend.intent.cross_encoder import OnnxCrossEncoder
+from aidev_agent.core.extend.intent.intent_recognition import IntentRecognition
+from aidev_agent.core.extend.models.llm_gateway import ChatModel
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+QUERY = "蓝鲸平台如何部署？"
+# 与默认的召回数量 BKAIDEV_TOP_K 一致
+DOCS = [f"第 {i} 篇文档：蓝鲸平台的部署需要先准备好机器和域名，" * 10 for i in range(settings.BKAIDEV_TOP_K)]
+
+
+@pytest.mark.skipif(not settings.CROSS_ENCODER_MODEL_PATH, reason="没有配置 CROSS_ENCODER_MODEL_PATH，跳过该测试")
+def test_cross_encoder(benchmark: FixtureType.benchmark):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    encoder = OnnxCrossEncoder.from_files(
+        settings.CROSS_ENCODER_MODEL_PATH,
+        settings.CROSS_ENCODER_TOKENIZER_PATH or None,
+        max_seq_length=settings.CROSS_ENCODER_MAX_SEQ_LENGTH,
+        batch_size=settings.CROSS_ENCODER_BATCH_SIZE,
+        num_threads=settings.CROSS_ENCODER_NUM_THREADS,
+    )
+    pairs = [(QUERY, doc) for doc in DOCS]
+    encoder.compute_similarity(pairs)
+    benchmark.extra_info["docs_per_round"] = len(pairs)
+    benchmark(encoder.compute_similarity, pairs)
+
+
+@pytest.mark.skipif(
+    not all([settings.LLM_GW_ENDPOINT, settings.APP_CODE, settings.SECRET_KEY]),
+    reason="没有配置足够的环境变量,跳过该测试",
+)
+def test_llm_relevance_determiner(benchmark: FixtureType.benchmark):
+    llm = ChatModel.get_setup_instance(model=os.getenv("BENCHMARK_RELEVANCE_LLM", "hunyuan-turbos"))
+    docs = [Document(page_content=doc, metadata={"__score__": 1.0}) for doc in DOCS]
+    recognition = IntentRecognition()
+    benchmark.extra_info["docs_per_round"] = len(docs)
+    benchmark.pedantic(
+        recognition.llm_relevance_determiner_parallel, args=(QUERY, docs, llm), kwargs={"input": QUERY}, rounds=3
+    )
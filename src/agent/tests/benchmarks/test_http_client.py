@@ -0,0 +1,32 @@
+"""
+LLM 网关模型实例创建的基准测试：对比每次新建 httpx 客户端与复用进程内共享的客户端
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import pytest
+
+from aidev_agent.config import settings
+from aidev_agent.core.extend.models.llm_gateway import ChatModel
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+
+def get_chat_model():
+    return ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost")
+
+
+@pytest.fixture
+def disable_http_pool():
+    settings.set("LLM_HTTP_POOL_ENABLED", False)
+    yield
+    settings.set("LLM_HTTP_POOL_ENABLED", True)
+
+
+def test_get_chat_model_without_pool(benchmark: FixtureType.benchmark, disable_http_pool):
+    benchmark(get_chat_model)
+
+
+def test_get_chat_model(benchmark: FixtureType.benchmark):
+    get_chat_model()
+    benchmark(get_chat_model)
@@ -0,0 +1,58 @@
+"""
+进程内混合检索的基准测试：20000 篇文档、768 维向量时 BM25 检索、float16 向量检索和混合检索的耗时
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import random
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from aidev_agent.core.extend.retrieval.hybrid import LocalRetriever
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+N_DOCS = 20000
+DIM = 768
+WORDS = ["蓝鲸", "部署", "升级", "监控", "告警", "日志", "容器", "作业", "配置", "权限", "网关", "数据库", "agent"]
+
+
+class RandomEmbeddings(Embeddings):
+    def __init__(self):
+        self.rng = np.random.default_rng(0)
+
+    def embed_documents(self, texts):
+        return self.rng.standard_normal((len(texts), DIM), dtype=np.float32)
+
+    def embed_query(self, text):
+        return self.rng.standard_normal(DIM, dtype=np.float32)
+
+
+@pytest.fixture(scope="module")
+def retriever():
+    rnd = random.Random(0)
+    retriever = LocalRetriever(RandomEmbeddings())
+    retriever.add_documents(
+        [
+            {
+                "page_content": "".join(rnd.choices(WORDS, k=rnd.randint(20, 200))),
+                "metadata": {"uid": str(i), "knowledge_base_id": i % 50},
+            }
+            for i in range(N_DOCS)
+        ]
+    )
+    return retriever
+
+
+def test_search_bm25(benchmark: FixtureType.benchmark, retriever):
+    benchmark(retriever.search_bm25, "蓝鲸如何部署监控告警", 100)
+
+
+def test_search_dense(benchmark: FixtureType.benchmark, retriever):
+    benchmark(retriever.search_dense, "蓝鲸如何部署监控告警", 100)
+
+
+def test_search_hybrid(benchmark: FixtureType.benchmark, retriever):
+    benchmark(retriever.search, "蓝鲸如何部署监控告警", 100, knowledge_base_ids=list(range(10)))
@@ -0,0 +1,46 @@
+"""
+index_specific 检索参数构建的基准测试：一个 agent 绑定 60 个知识库（各 4 个索引，部分配置了自定义索引），
+对比每次检索都解析 index_config 与复用预先构建的检索计划
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import pytest
+
+from aidev_agent.core.extend.intent.intent_recognition import IntentRecognition
+from aidev_agent.core.extend.intent.retrieval_plan import RetrievalPlan
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+N_KNOWLEDGE_BASES = 60
+KNOWLEDGE_BASES = [
+    {
+        "id": i,
+        "index_config": {
+            "full_text_indexes": [{"index_name": "full_text"}],
+            "vector_indexes": [{"index_name": name} for name in ["content", "title", "summary"]],
+        },
+    }
+    for i in range(N_KNOWLEDGE_BASES)
+]
+CUSTOM_INDEX_NAMES = {"knowledge_bases": {i: ["content", "title"] for i in range(0, N_KNOWLEDGE_BASES, 2)}}
+# 一轮对话中 index_specific 检索的 query：独立 query、原始 query、翻译后的 query、关键词
+QUERIES = ["蓝鲸如何部署？", "怎么部署", "How to deploy BlueKing?", "蓝鲸\n\n部署"]
+
+
+def build_query_data(recognition, **kwargs):
+    return [
+        recognition._index_specific_query_data(
+            [], KNOWLEDGE_BASES, query, 10, knowledge_resource_index_names=CUSTOM_INDEX_NAMES, **kwargs
+        )
+        for query in QUERIES
+    ]
+
+
+def test_without_retrieval_plan(benchmark: FixtureType.benchmark):
+    benchmark(build_query_data, IntentRecognition())
+
+
+def test_with_retrieval_plan(benchmark: FixtureType.benchmark):
+    plan = RetrievalPlan.from_kwargs([], KNOWLEDGE_BASES, knowledge_resource_index_names=CUSTOM_INDEX_NAMES)
+    benchmark(build_query_data, IntentRecognition(), knowledge_retrieval_plan=plan)
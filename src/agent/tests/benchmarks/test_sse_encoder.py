@@ -0,0 +1,36 @@
+"""
+SSE 帧编码的基准测试：对比 f-string + json.dumps 与 SSEEncoder
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import json
+
+import pytest
+
+from aidev_agent.core.utils.streaming import get_sse_encoder
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+EVENTS = [{"event": "text", "content": "流式输出的内容"[: i % 7 + 1], "cover": False} for i in range(1000)]
+
+
+def run_json_dumps(events):
+    return [f"data: {json.dumps(ret)}\n\n" for ret in events]
+
+
+def run_sse_encoder(events):
+    encoder = get_sse_encoder()
+    return [encoder.encode(ret) for ret in events]
+
+
+def test_same_result():
+    assert run_json_dumps(EVENTS) == run_sse_encoder(EVENTS)
+
+
+def test_json_dumps(benchmark: FixtureType.benchmark):
+    benchmark(run_json_dumps, EVENTS)
+
+
+def test_sse_encoder(benchmark: FixtureType.benchmark):
+    benchmark(run_sse_encoder, EVENTS)
@@ -0,0 +1,103 @@
+"""
+think/text 流式过滤的基准测试：对比原先基于缓冲队列重新拼接匹配的实现与 ThinkTextSplitter
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+from collections import deque
+from copy import deepcopy
+
+import pytest
+
+from aidev_agent.core.extend.agent.qa import CommonQAStreamingMixIn, EventType, ThinkTextSplitter
+from aidev_agent.core.utils.streaming import StreamingPatternFilter
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+MAX_CACHE_LENGTH = 50
+THINK_SYMBOLS = CommonQAStreamingMixIn.think_symbols
+
+
+def _make_events(num_tokens):
+    events = [{"event": EventType.THINK.value, "content": "<think>\n", "cover": False}]
+    events.extend({"event": EventType.THINK.value, "content": "思考", "cover": False} for _ in range(num_tokens))
+    events.append({"event": EventType.THINK.value, "content": "\n</think>\n", "cover": False})
+    events.extend({"event": EventType.TEXT.value, "content": "回答", "cover": False} for _ in range(num_tokens))
+    return events
+
+
+def _legacy_common_filter(cache, filter_symbols, event_type):
+    """原先 CommonQAStreamingMixIn.common_filter 的实现（保留以作对比）"""
+    hit = False
+    recall_event = None
+    combined_content = "".join(
+        [item["content"] for item in cache if "content" in item and item.get("event") == event_type]
+    )
+    for symbol in filter_symbols:
+        if symbol in combined_content:
+            combined_content = combined_content.replace(symbol, "")
+            hit = True
+            break
+    if hit and combined_content:
+        recall_event = {"event": event_type, "content": combined_content, "cover": False}
+    return hit, recall_event
+
+
+def _legacy_cache_filter(cache):
+    """原先 CommonQAStreamingMixIn.cache_filter 针对 think 标识位的实现（保留以作对比）"""
+    think_event_filter_symbols = deepcopy(THINK_SYMBOLS)
+    hit_think, recall_event_think = _legacy_common_filter(cache, think_event_filter_symbols, EventType.THINK.value)
+    if hit_think:
+        remain_events = []
+        have_appended_recall_event_think = False
+        for event in list(deepcopy(cache)):
+            if event.get("event") == EventType.THINK.value:
+                if recall_event_think and not have_appended_recall_event_think:
+                    remain_events.append(recall_event_think)
+                    have_appended_recall_event_think = True
+            else:
+                remain_events.append(event)
+        cache = deque(remain_events)
+    return cache
+
+
+def run_legacy(events):
+    outputs = []
+    cache = deque(maxlen=MAX_CACHE_LENGTH)
+    for ret in events:
+        cache.append(dict(ret))
+        cache = _legacy_cache_filter(cache)
+        if len(cache) == MAX_CACHE_LENGTH:
+            outputs.append(cache.popleft())
+    outputs.extend(cache)
+    return outputs
+
+
+def run_splitter(events):
+    splitter = ThinkTextSplitter(StreamingPatternFilter({symbol: "" for symbol in THINK_SYMBOLS}))
+    outputs = []
+    for ret in events:
+        outputs.extend(splitter.process(ret))
+    outputs.extend(splitter.flush())
+    return outputs
+
+
+def _contents(outputs, event_type):
+    return "".join(ret["content"] for ret in outputs if ret["event"] == event_type)
+
+
+EVENTS = _make_events(2000)
+
+
+def test_same_result():
+    legacy, splitter = run_legacy(EVENTS), run_splitter(EVENTS)
+    for event_type in (EventType.THINK.value, EventType.TEXT.value):
+        assert _contents(legacy, event_type) == _contents(splitter, event_type)
+
+
+def test_legacy_cache_filter(benchmark: FixtureType.benchmark):
+    benchmark(run_legacy, EVENTS)
+
+
+def test_think_text_splitter(benchmark: FixtureType.benchmark):
+    benchmark(run_splitter, EVENTS)
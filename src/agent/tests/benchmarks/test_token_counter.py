@@ -0,0 +1,56 @@
+"""
+会话历史裁剪的基准测试：对比每移除一条消息就重新统计整个列表与按消息缓存 token 数
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import warnings
+
+import pytest
+from langchain.memory.token_buffer import ConversationTokenBufferMemory
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from aidev_agent.core.utils.token_counter import CachedTokenBufferMemory, token_counter
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+LLM = GenericFakeChatModel(messages=iter([]), custom_get_token_ids=lambda text: list(text.encode()))
+MESSAGES = [
+    HumanMessage(content=f"第 {i} 个问题：" + "明天深圳天气怎么样?" * 20)
+    if i % 2 == 0
+    else AIMessage(content=f"第 {i} 个回答：" + "明天深圳晴，气温 25 度。" * 20)
+    for i in range(100)
+]
+
+
+def prune(memory_cls):
+    history = ChatMessageHistory()
+    history.add_messages(MESSAGES)
+    memory = memory_cls(chat_memory=history, llm=LLM, max_token_limit=4096, return_messages=True)
+    memory.save_context({"input": "今天呢?"}, {"output": "今天也是晴天。"})
+    return memory.buffer
+
+
+def test_same_result():
+    assert prune(ConversationTokenBufferMemory) == prune(CachedTokenBufferMemory)
+
+
+def test_prune_by_recounting(benchmark: FixtureType.benchmark):
+    benchmark(prune, ConversationTokenBufferMemory)
+
+
+def test_prune_with_cached_counts(benchmark: FixtureType.benchmark):
+    prune(CachedTokenBufferMemory)
+    benchmark(prune, CachedTokenBufferMemory)
+
+
+def test_prune_with_cold_cache(benchmark: FixtureType.benchmark):
+    def prune_with_cold_cache():
+        token_counter.clear()
+        return prune(CachedTokenBufferMemory)
+
+    benchmark(prune_with_cold_cache)
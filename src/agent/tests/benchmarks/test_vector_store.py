@@ -0,0 +1,56 @@
+"""
+内存映射向量存储的基准测试：100000 个 768 维知识片段时暴力检索（float16/int8）与 IVF 检索的耗时
+需要安装 pytest-benchmark，执行：pytest tests/benchmarks --benchmark-only
+"""
+
+import numpy as np
+import pytest
+
+from aidev_agent.core.extend.retrieval.vector_store import MmapVectorStore, VectorSearchMode
+from tests.typing import FixtureType
+
+pytest.importorskip("pytest_benchmark")
+
+N_CHUNKS = 100000
+DIM = 768
+N_LISTS = 256
+
+
+def clustered_vectors(rng, n):
+    """围绕若干中心分布的向量，近似真实 embedding 的聚类结构"""
+    centers = np.random.default_rng(0).standard_normal((64, DIM), dtype=np.float32)
+    return centers[rng.integers(0, len(centers), n)] + rng.standard_normal((n, DIM), dtype=np.float32)
+
+
+@pytest.fixture(scope="module", params=["float16", "int8"])
+def store(request, tmp_path_factory):
+    rng = np.random.default_rng(0)
+    store = MmapVectorStore(str(tmp_path_factory.mktemp(request.param)), dim=DIM, dtype=request.param)
+    for start in range(0, N_CHUNKS, 10000):
+        documents = [
+            {"page_content": f"片段 {i}", "metadata": {"uid": str(i), "knowledge_base_id": i % 50}}
+            for i in range(start, start + 10000)
+        ]
+        store.add_vectors(clustered_vectors(rng, len(documents)), documents)
+    store.train_ivf(n_lists=N_LISTS)
+    return store
+
+
+@pytest.fixture(scope="module")
+def query():
+    return clustered_vectors(np.random.default_rng(1), 1)[0]
+
+
+def test_search_brute_force(benchmark: FixtureType.benchmark, store, query):
+    benchmark(store.search_by_vector, query, 100)
+
+
+def test_search_brute_force_filtered(benchmark: FixtureType.benchmark, store, query):
+    """只检索 2 个知识库（约 4% 的片段）"""
+    benchmark(store.search_by_vector, query, 100, knowledge_base_ids=[1, 2])
+
+
+def test_search_ivf(benchmark: FixtureType.benchmark, store, query):
+    brute_force = {doc["metadata"]["uid"] for doc in store.search_by_vector(query, 100)}
+    docs = benchmark(store.search_by_vector, query, 100, mode=VectorSearchMode.IVF, nprobe=8)
+    benchmark.extra_info["recall"] = len({doc["metadata"]["uid"] for doc in docs} & brute_force) / len(brute_force)
@@ -0,0 +1,85 @@
+import pytest
+from langchain_core.tools import StructuredTool
+
+from aidev_agent.core.agent.agents import get_beijing_now
+from aidev_agent.core.agent.cache import AgentComponentCache, agent_component_cache, llm_fingerprint
+from aidev_agent.core.extend.agent.qa import CommonQAAgent
+from aidev_agent.core.extend.models.llm_gateway import ChatModel
+
+
+def get_weather(city: str) -> str:
+    """查询城市天气"""
+    return "晴"
+
+
+def _get_agent_executor(model="hunyuan-turbos", base_url="http://localhost", role_prompt="你是一个助手"):
+    llm = ChatModel.get_setup_instance(model=model, base_url=base_url)
+    return CommonQAAgent.get_agent_executor(
+        llm=llm,
+        knowledge_llm=llm,
+        extra_tools=[StructuredTool.from_function(get_weather)],
+        role_prompt=role_prompt,
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_agent_component_cache():
+    agent_component_cache.clear()
+    yield
+    agent_component_cache.clear()
+
+
+class TestAgentComponentCache:
+    """测试 agent 不可变组件的缓存"""
+
+    @pytest.mark.parametrize("model", ["hunyuan-turbos", "deepseek-r1"])
+    def test_reuse_components(self, model):
+        """相同配置的请求复用 runnable 和 prompt 模板，请求相关的状态每次重新创建"""
+        executor_1, _ = _get_agent_executor(model)
+        executor_2, _ = _get_agent_executor(model)
+
+        assert agent_component_cache.hits == 1
+        assert executor_1.agent is not executor_2.agent
+        assert executor_1.memory is not executor_2.memory
+        assert executor_1.agent.raw_runnable is executor_2.agent.raw_runnable
+        assert executor_1.agent.chat_prompt_template is executor_2.agent.chat_prompt_template
+        # 工具实例仍然使用当前请求传入的
+        assert executor_1.agent.tools[-1] is not executor_2.agent.tools[-1]
+
+    def test_different_config(self):
+        """模型配置或角色提示词不同时不能复用"""
+        executor, _ = _get_agent_executor()
+        assert _get_agent_executor(base_url="http://127.0.0.1")[0].agent.raw_runnable is not executor.agent.raw_runnable
+        assert _get_agent_executor(role_prompt="其他角色")[0].agent.raw_runnable is not executor.agent.raw_runnable
+        assert agent_component_cache.hits == 0
+
+    def test_beijing_now_not_frozen(self):
+        """缓存的 prompt 中的北京时间在格式化时取值"""
+        executor, _ = _get_agent_executor("deepseek-r1")
+        prompt = executor.agent.raw_runnable.steps[1]
+        assert prompt.partial_variables["beijing_now"] is get_beijing_now
+
+    def test_llm_fingerprint(self):
+        llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost")
+        assert llm_fingerprint(llm) == llm_fingerprint(llm.model_copy())
+        assert llm_fingerprint(llm) != llm_fingerprint(llm.model_copy(update={"temperature": 0.1}))
+
+    def test_llm_tags_and_metadata(self):
+        """tags 和 metadata 绑定在缓存的 runnable 上，不同时不能复用"""
+        executor, _ = _get_agent_executor()
+        for update in [{"tags": ["session-2"]}, {"metadata": {"session_id": "2"}}]:
+            llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost").model_copy(
+                update=update
+            )
+            other = CommonQAAgent.get_agent_executor(
+                llm=llm,
+                knowledge_llm=llm,
+                extra_tools=[StructuredTool.from_function(get_weather)],
+                role_prompt="你是一个助手",
+            )[0]
+            assert other.agent.raw_runnable is not executor.agent.raw_runnable
+        assert agent_component_cache.hits == 0
+
+    def test_disabled(self):
+        cache = AgentComponentCache(maxsize=0)
+        assert cache.get_or_create("key", object) is not cache.get_or_create("key", object)
@@ -0,0 +1,50 @@
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import StructuredTool
+
+from aidev_agent.core.agent.overlay import snapshot_kwargs, with_tool_flags
+from aidev_agent.core.extend.agent.qa import CommonQAAgent
+from aidev_agent.core.extend.models.llm_gateway import ChatModel
+
+
+def get_weather(city: str) -> str:
+    """查询城市天气"""
+    return "晴"
+
+
+class TestOverlay:
+    """测试工具、prompt、kwargs 的写时复制"""
+
+    def test_with_tool_flags(self):
+        """属性不一致时生成覆盖层，原工具不变；属性一致时直接复用"""
+        tool = StructuredTool.from_function(get_weather)
+        overlay = with_tool_flags(tool, handle_validation_error=True, handle_tool_error=True)
+
+        assert overlay is not tool
+        assert overlay.handle_validation_error is True and overlay.handle_tool_error is True
+        assert tool.handle_validation_error is False and tool.handle_tool_error is False
+        assert overlay.args_schema is tool.args_schema
+        assert with_tool_flags(overlay, handle_validation_error=True, handle_tool_error=True) is overlay
+
+    def test_snapshot_kwargs(self):
+        """修改返回值中的列表、字典不影响快照"""
+        kwargs = {"input": "你好", "chat_history": [HumanMessage(content="a"), HumanMessage(content="b")], "extra": {}}
+        snapshot = snapshot_kwargs(kwargs)
+        kwargs["chat_history"].pop(0)
+        kwargs["extra"]["context"] = ["知识"]
+        kwargs["context"] = []
+
+        assert [msg.content for msg in snapshot["chat_history"]] == ["a", "b"]
+        assert snapshot["extra"] == {}
+        assert "context" not in snapshot
+
+    def test_structured_chat_agent_does_not_mutate_tools(self):
+        """structured chat agent 通过覆盖层设置工具的错误处理，不修改调用方传入的工具"""
+        llm = ChatModel.get_setup_instance(model="deepseek-r1", base_url="http://localhost")
+        tool = StructuredTool.from_function(get_weather)
+        executor, _ = CommonQAAgent.get_agent_executor(llm=llm, knowledge_llm=llm, extra_tools=[tool])
+
+        executor_tool = executor.agent.tools[-1]
+        assert executor_tool.name == tool.name
+        assert executor_tool.handle_validation_error is True
+        assert tool.handle_validation_error is False
+        assert executor.tools[-1] is executor_tool
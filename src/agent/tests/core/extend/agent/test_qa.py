@@ -0,0 +1,29 @@
+import threading
+from types import SimpleNamespace
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from aidev_agent.core.extend.agent.qa import IntentRecognitionMixin
+
+
+class TokenLimitAgent(IntentRecognitionMixin):
+    """每条会话历史计 10 个 token，并记录统计 token 数时所在的线程"""
+
+    def format_and_check_token_length(self, llm, chat_prompt_template, candidate_tools, intermediate_steps, kwargs):
+        kwargs["threads"].append(threading.get_ident())
+        return len(kwargs["chat_history"]) * 10, SimpleNamespace(messages=[])
+
+
+async def test_aensure_agent_token_limit_off_loop():
+    """异步流程在线程中格式化 prompt 和统计 token 数，按优先级抛除会话历史"""
+    kwargs = {
+        "chat_history": ["1", "2", "3"],
+        "threads": [],
+        "token_limit_margin": 28000 - 10,
+        "enable_custom_event": False,
+    }
+    prompt = ChatPromptTemplate.from_messages([("human", "{query}")])
+    await TokenLimitAgent().aensure_agent_token_limit(None, prompt, [], [], [], kwargs)
+    assert kwargs["chat_history"] == ["3"]
+    assert len(kwargs["threads"]) == 3
+    assert threading.get_ident() not in kwargs["threads"]
@@ -0,0 +1,175 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+from langchain_core.agents import AgentFinish
+from langchain_core.embeddings import Embeddings
+
+from aidev_agent.core.extend.agent.qa import CommonQAAgent, IntentRecognitionMixin
+from aidev_agent.core.extend.agent.semantic_cache import CachedAnswer, FlatVectorIndex, SemanticAnswerCache
+from aidev_agent.core.extend.intent.intent_recognition import IntentStatus
+from aidev_agent.core.extend.models.llm_gateway import ChatModel
+from aidev_agent.core.utils.local import request_local
+
+
+class CharEmbeddings(Embeddings):
+    """按字符计数的 embedding，字面上相近的问题相似度高"""
+
+    vocab = "蓝鲸如何部署升级配置安装平台？?"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        counter = Counter(text)
+        return [float(counter[char]) for char in self.vocab] + [1.0]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+KNOWLEDGE_BASES = [{"id": 1, "name": "运维手册", "updated_at": "2025-01-01"}]
+
+
+@pytest.fixture
+def cache():
+    embeddings = CharEmbeddings()
+    return SemanticAnswerCache(lambda: embeddings, threshold=0.95, capacity=4, max_scopes=2)
+
+
+@pytest.fixture
+def clean_request_local():
+    yield
+    for key in ("semantic_cache_query", "intent_recognition_results", "current_user_store"):
+        if hasattr(request_local, key):
+            delattr(request_local, key)
+
+
+class TestSemanticAnswerCache:
+    def test_lookup(self, cache):
+        scope = cache.make_scope("agent", knowledge_bases=KNOWLEDGE_BASES)
+        cache.add(scope, cache.embed("蓝鲸如何部署？"), CachedAnswer(query="蓝鲸如何部署？", answer="答案"))
+
+        assert cache.lookup(scope, cache.embed("蓝鲸如何部署?")) is None
+        assert cache.lookup(scope, cache.embed("蓝鲸如何部署？")).answer == "答案"
+        assert cache.lookup(scope, cache.embed("蓝鲸平台如何升级配置？")) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_threshold(self, cache):
+        scope = cache.make_scope("agent")
+        cache.add(scope, cache.embed("蓝鲸如何部署？"), CachedAnswer(query="蓝鲸如何部署？", answer="答案"))
+        cache.threshold = 0.85
+        assert cache.lookup(scope, cache.embed("蓝鲸如何部署?")).answer == "答案"
+
+    def test_scope(self, cache):
+        """不同 agent 配置、知识库更新后都不会命中"""
+        scope = cache.make_scope("agent", knowledge_bases=KNOWLEDGE_BASES)
+        vector = cache.embed("蓝鲸如何部署？")
+        cache.add(scope, vector, CachedAnswer(query="蓝鲸如何部署？", answer="答案"))
+
+        assert cache.make_scope("agent", knowledge_bases=[dict(KNOWLEDGE_BASES[0])]) == scope
+        assert cache.lookup(cache.make_scope("other", knowledge_bases=KNOWLEDGE_BASES), vector) is None
+        updated = [{**KNOWLEDGE_BASES[0], "updated_at": "2025-02-01"}]
+        assert cache.lookup(cache.make_scope("agent", knowledge_bases=updated), vector) is None
+
+    def test_invalidate(self, cache):
+        vector = cache.embed("蓝鲸如何部署？")
+        scope_1 = cache.make_scope("agent", knowledge_bases=KNOWLEDGE_BASES)
+        scope_2 = cache.make_scope("agent", knowledge_items=[{"id": 3, "knowledge_base_id": 2}])
+        cache.add(scope_1, vector, CachedAnswer(query="q", answer="1"))
+        cache.add(scope_2, vector, CachedAnswer(query="q", answer="2"))
+
+        assert cache.invalidate(1) == 1
+        assert cache.lookup(scope_1, vector) is None
+        assert cache.lookup(scope_2, vector).answer == "2"
+        assert cache.invalidate() == 1
+        assert len(cache) == 0
+
+    def test_capacity(self, cache):
+        scope = cache.make_scope("agent")
+        queries = ["蓝", "鲸鲸", "部署", "升级", "配置"]
+        for query in queries:
+            cache.add(scope, cache.embed(query), CachedAnswer(query=query, answer=query))
+        # 相同问题覆盖原有答案，不占用容量
+        cache.add(scope, cache.embed("配置"), CachedAnswer(query="配置", answer="新答案"))
+
+        assert len(cache) == 4
+        assert cache.lookup(scope, cache.embed("蓝")) is None
+        assert cache.lookup(scope, cache.embed("配置")).answer == "新答案"
+
+        for name in ("a", "b", "c"):
+            cache.add(cache.make_scope(name), cache.embed("蓝"), CachedAnswer(query="蓝", answer=name))
+        assert cache.lookup(scope, cache.embed("部署")) is None
+        assert cache.lookup(cache.make_scope("c"), cache.embed("蓝")).answer == "c"
+
+    def test_disabled(self):
+        cache = SemanticAnswerCache(enabled=True)
+        assert not cache.enabled
+        assert cache.embed("蓝鲸") is None
+
+    def test_flat_vector_index(self):
+        index = FlatVectorIndex(dim=2, capacity=2)
+        assert index.search(np.array([1.0, 0.0], dtype=np.float32)) == (-1, -1.0)
+        index.add(np.array([1.0, 0.0], dtype=np.float32), "x")
+        index.add(np.array([0.0, 1.0], dtype=np.float32), "y")
+        assert index.search(np.array([0.6, 0.8], dtype=np.float32)) == (1, pytest.approx(0.8))
+
+    def test_flat_vector_index_growth(self):
+        """矩阵按需扩容，写满容量后覆盖最早写入的条目"""
+        index = FlatVectorIndex(dim=2, capacity=40)
+        assert index.vectors.shape == (FlatVectorIndex.INITIAL_ROWS, 2)
+        for i in range(45):
+            index.add(np.array([np.cos(i), np.sin(i)], dtype=np.float32), i)
+        assert index.vectors.shape == (40, 2)
+        assert len(index) == 40
+        assert index.payloads[:5] == [40, 41, 42, 43, 44]
+        assert index.payloads[index.search(np.array([np.cos(20), np.sin(20)], dtype=np.float32))[0]] == 20
+
+
+def test_agent_semantic_cache(cache, clean_request_local, monkeypatch):
+    """首次回答基于知识库的问题后写入缓存，相似问题直接返回缓存的答案和引用文档"""
+    monkeypatch.setattr(IntentRecognitionMixin, "semantic_answer_cache", cache)
+    llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost")
+    executor, _ = CommonQAAgent.get_agent_executor(llm=llm, knowledge_llm=llm, role_prompt="你是一个助手")
+    agent = executor.agent
+    kwargs = {
+        "input": "蓝鲸如何部署？",
+        "chat_history": [],
+        "knowledge_bases": KNOWLEDGE_BASES,
+        "enable_custom_event": False,
+    }
+
+    assert agent.semantic_cache_pipeline([], kwargs) is None
+    request_local.intent_recognition_results = {
+        "kwargs": {"recog_results": {"status": IntentStatus.QA_WITH_RETRIEVED_KNOWLEDGE_RESOURCES}}
+    }
+    request_local.current_user_store = {"reference_doc": [{"path": "部署.md"}]}
+    agent.save_semantic_cache(AgentFinish(return_values={"output": "答案"}, log=""), [])
+    assert len(cache) == 1
+
+    del request_local.intent_recognition_results
+    request_local.current_user_store = {}
+    result = agent.semantic_cache_pipeline([], kwargs)
+    assert result.return_values["output"] == "答案"
+    assert request_local.current_user_store["reference_doc"] == [{"path": "部署.md"}]
+
+    # 有对话历史时不使用缓存
+    assert agent.semantic_cache_pipeline([], {**kwargs, "chat_history": [("human", "你好")]}) is None
+
+
+async def test_agent_asemantic_cache(cache, clean_request_local, monkeypatch):
+    """异步 plan 流程使用相同的缓存"""
+    monkeypatch.setattr(IntentRecognitionMixin, "semantic_answer_cache", cache)
+    llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost")
+    executor, _ = CommonQAAgent.get_agent_executor(llm=llm, knowledge_llm=llm, role_prompt="你是一个助手")
+    agent = executor.agent
+    kwargs = {"input": "蓝鲸如何部署？", "chat_history": [], "enable_custom_event": False}
+
+    assert await agent.asemantic_cache_pipeline([], kwargs) is None
+    scope, vector, query = request_local.semantic_cache_query
+    assert np.allclose(vector, cache.embed(query))
+    cache.add(scope, vector, CachedAnswer(query=query, answer="答案"))
+
+    result = await agent.acustom_plan([], **kwargs)
+    assert result.return_values["output"] == "答案"
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from aidev_agent.core.extend.intent.candidates import CandidateSet, bucket_by_thresholds, topk_indices
+from aidev_agent.core.extend.intent.intent_recognition import IntentRecognition
+from aidev_agent.core.extend.intent.utils import filter_and_select_topk
+
+
+def make_doc(uid, score, path=0):
+    return {"page_content": uid, "metadata": {"uid": uid, "__score__": score, "path": path}}
+
+
+RETRIEVED_RESULTS = [
+    [make_doc("a", 0.9), make_doc("b", 0.8), make_doc("c", 0.7)],
+    [make_doc("c", 0.95, 1), make_doc("d", 0.6, 1), make_doc("a", 0.5, 1)],
+]
+
+
+def test_candidate_set():
+    candidates = CandidateSet(RETRIEVED_RESULTS)
+    assert candidates.uids.tolist() == ["a", "b", "c", "d"]
+    assert candidates.ranks.tolist() == [[0, 2], [1, -1], [2, 0], [-1, 1]]
+    assert np.isnan(candidates.scores[1, 1])
+    assert [doc["metadata"]["path"] for doc in candidates.docs] == [0, 0, 0, 1]
+    assert [doc["metadata"]["path"] for doc in CandidateSet(RETRIEVED_RESULTS, keep="last").docs] == [1, 0, 1, 1]
+    assert candidates.reciprocal_rank_fusion([1.0, 1.0]).tolist() == [1 + 1 / 3, 1 / 2, 1 / 3 + 1, 1 / 2]
+    assert candidates.reciprocal_rank_fusion([1.0, 1.0], k=1).tolist() == [1.0, 0.0, 1.0, 0.0]
+    with pytest.raises(ValueError):
+        candidates.reciprocal_rank_fusion([1.0])
+
+
+def test_weighted_reciprocal_rank_fusion():
+    """融合结果按分数降序、分数相同时按首次召回的顺序排列，排名超出 k 的文档不参与融合"""
+    fusion_docs = IntentRecognition().weighted_reciprocal_rank_fusion(RETRIEVED_RESULTS, [0.5, 0.5], k=2)
+    assert [(doc["page_content"], doc["metadata"]["rrf_score"]) for doc in fusion_docs] == [
+        ("a", 0.5),
+        ("c", 0.5),
+        ("b", 0.25),
+        ("d", 0.25),
+    ]
+    # 保留最先召回的文档
+    assert fusion_docs[1] is RETRIEVED_RESULTS[1][0]
+
+
+@pytest.mark.parametrize("topk", [None, 0, 1, 2, 3, 10, -1])
+def test_topk_indices(topk):
+    scores = [0.5, 1.0, 0.5, 0.2, 1.0, 0.5]
+    expected = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:topk]
+    assert topk_indices(scores, topk).tolist() == expected
+
+
+def test_filter_and_select_topk():
+    items = [{"metadata": {"fine_grained_score": score}, "id": i} for i, score in enumerate([0.3, 0.9, 0.1, 0.9])]
+    assert [item["id"] for item in filter_and_select_topk(items, 0.2, 2)] == [1, 3]
+    assert [item["id"] for item in filter_and_select_topk(items, None, 10)] == [1, 3, 0, 2]
+    assert filter_and_select_topk([], 0.2, 2) == []
+
+
+def test_bucket_by_thresholds():
+    lowly, moderately, highly = bucket_by_thresholds([0.1, 0.5, 0.9, 0.3, 0.6], (0.3, 0.6))
+    assert (lowly.tolist(), moderately.tolist(), highly.tolist()) == ([0], [1, 3], [2, 4])
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from aidev_agent.config import settings
+from aidev_agent.core.extend.intent import cross_encoder
+from aidev_agent.core.extend.intent.cross_encoder import OnnxCrossEncoder
+from aidev_agent.core.extend.intent.similarity_model import calculate_similarity
+
+
+class FakeTokenizer:
+    """按字符分词，[CLS] query [SEP] doc [SEP]"""
+
+    padding = {"pad_id": 9}
+
+    def no_padding(self):
+        self.padding = None
+
+    def enable_truncation(self, max_length, strategy):
+        self.max_length = max_length
+
+    def token_to_id(self, token):
+        return None
+
+    def encode_batch(self, pairs):
+        encodings = []
+        for query, doc in pairs:
+            ids = ([101] + [ord(c) for c in query] + [102] + [ord(c) for c in doc] + [102])[: self.max_length]
+            type_ids = [0] * (len(query) + 2) + [1] * (len(doc) + 1)
+            encodings.append(SimpleNamespace(ids=ids, attention_mask=[1] * len(ids), type_ids=type_ids[: len(ids)]))
+        return encodings
+
+
+class FakeSession:
+    """分数为有效 token 数，记录每批输入的形状"""
+
+    def __init__(self, input_names=("input_ids", "attention_mask")):
+        self.input_names = input_names
+        self.batches = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name=name) for name in self.input_names]
+
+    def run(self, output_names, inputs):
+        assert set(inputs) == set(self.input_names)
+        self.batches.append(inputs["input_ids"].shape)
+        return [inputs["attention_mask"].sum(axis=1, keepdims=True).astype(np.float32) - 5]
+
+
+def test_compute_similarity():
+    session = FakeSession()
+    encoder = OnnxCrossEncoder(session, FakeTokenizer(), max_seq_length=8, batch_size=2)
+    pairs = [("q", "long doc"), ("q", "a"), ("q", "ab"), ("q", "abc")]
+    scores = encoder.compute_similarity(pairs)
+
+    # 按长度排序后分批，每批补齐到批内最长；超过 max_seq_length 的截断
+    assert session.batches == [(2, 6), (2, 8)]
+    lengths = np.array([8, 5, 6, 7], dtype=np.float32)
+    assert scores == pytest.approx((1 / (1 + np.exp(-(lengths - 5)))).tolist())
+    assert encoder.pad_id == 9
+    assert encoder.compute_similarity([]) == []
+
+
+def test_two_class_logits():
+    assert OnnxCrossEncoder._to_scores(np.array([[0.0, 0.0], [0.0, np.log(3)]])) == pytest.approx([0.5, 0.75])
+
+
+def test_calculate_similarity_local(monkeypatch):
+    session = FakeSession(input_names=("input_ids", "attention_mask", "token_type_ids"))
+    monkeypatch.setattr(cross_encoder, "_local_cross_encoder", OnnxCrossEncoder(session, FakeTokenizer()))
+    settings.set("SIMILARITY_MODEL_BACKEND", "local")
+    try:
+        assert calculate_similarity([("q", "doc")]) == pytest.approx([1 / (1 + np.exp(-2))])
+    finally:
+        settings.set("SIMILARITY_MODEL_BACKEND", "remote")
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from copy import deepcopy
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from aidev_agent.core.extend.intent.intent_recognition import (
+    Decision,
+    FineGrainedScoreType,
+    IntentRecognition,
+    IntentStatus,
+)
+from aidev_agent.core.extend.intent.utils import retry, timeit
+from aidev_agent.core.utils.cache import MemoryCacheBackend, RecallCache
+
+
+class FakeChatModel(FakeListChatModel):
+    """所有请求都返回相同的回复：相关性判断为相关，压缩结果原样返回"""
+
+    model_name: str = "fake-model"
+    responses: list = ["1"]
+
+
+KNOWLEDGE_BASES = [{"id": 1, "index_config": {"vector_indexes": [{"index_name": "full_text"}]}}]
+DOCUMENTS = [
+    {"page_content": "蓝鲸部署文档", "metadata": {"__score__": 0.9, "uid": "1", "path": "部署.md"}},
+    {"page_content": "蓝鲸升级文档", "metadata": {"__score__": 0.8, "uid": "2", "path": "升级.md"}},
+]
+
+
+class FakeIntentRecognition(IntentRecognition):
+    sync_queries: list = []
+    async_queries: list = []
+
+    @property
+    def _query_instance(self):
+        def query(data):
+            self.sync_queries.append(data)
+            return {"documents": deepcopy(DOCUMENTS)}
+
+        return query
+
+    @property
+    def _aquery_instance(self):
+        async def aquery(data):
+            self.async_queries.append(data)
+            return {"documents": deepcopy(DOCUMENTS)}
+
+        return aquery
+
+
+@pytest.fixture
+def recognition():
+    return FakeIntentRecognition()
+
+
+async def test_aexec_intent_recognition(recognition):
+    """异步版本与同步版本的识别结果一致，且查询参数相同"""
+    kwargs = {
+        "input": "蓝鲸如何部署？",
+        "knowledge_bases": KNOWLEDGE_BASES,
+        "knowledge_resource_fine_grained_score_type": FineGrainedScoreType.LLM,
+        "knowledge_resource_reject_threshold": (0.5, 0.5),
+        "enable_custom_event": False,
+    }
+    sync_results = recognition.exec_intent_recognition("蓝鲸如何部署？", FakeChatModel(), [], **kwargs)
+    async_results = await recognition.aexec_intent_recognition("蓝鲸如何部署？", FakeChatModel(), [], **kwargs)
+
+    assert async_results["status"] == sync_results["status"] == IntentStatus.PROCESS_BY_AGENT
+    assert async_results["decision"] == sync_results["decision"] == Decision.PRIVATE_QA
+    assert async_results["knowledge_resources_highly_relevant"] == sync_results["knowledge_resources_highly_relevant"]
+    assert recognition.async_queries == recognition.sync_queries
+
+
+async def test_aexec_intent_recognition_fast_track(recognition):
+    """直接提供召回结果时不查询知识库"""
+    docs = [{"page_content": "文档", "metadata": {"__score__": 1.0}}]
+    results = await recognition.aexec_intent_recognition(
+        "蓝鲸如何部署？", FakeChatModel(), [], retrieved_knowledge_resources=docs
+    )
+    assert results["status"] == IntentStatus.QA_WITH_RETRIEVED_KNOWLEDGE_RESOURCES
+    assert not recognition.async_queries
+
+
+async def test_async_decorators():
+    """retry 和 timeit 支持协程函数，重试过程不阻塞事件循环"""
+    calls = []
+
+    @timeit(message="test")
+    @retry(max_retries=3, max_seconds=10)
+    async def flaky():
+        calls.append(threading.get_ident())
+        if len(calls) < 3:
+            raise ValueError("flaky")
+        await asyncio.sleep(0)
+        return "ok"
+
+    assert asyncio.iscoroutinefunction(flaky)
+    assert await flaky() == "ok"
+    assert calls == [threading.get_ident()] * 3
+
+
+class SlowRelevanceRecognition(IntentRecognition):
+    """内容以 slow 开头的知识需要很久才能得到相关性判断结果"""
+
+    def llm_relevance_determiner(self, query, doc, llm, **kwargs):
+        if doc.page_content.startswith("slow"):
+            time.sleep(1)
+        return not doc.page_content.endswith("irrelevant")
+
+    async def allm_relevance_determiner(self, query, doc, llm, **kwargs):
+        if doc.page_content.startswith("slow"):
+            await asyncio.sleep(1)
+        return not doc.page_content.endswith("irrelevant")
+
+
+RELEVANCE_DOCS = [
+    Document(page_content="fast", metadata={"__score__": 0.9}),
+    Document(page_content="fast irrelevant", metadata={"__score__": 0.8}),
+    Document(page_content="slow", metadata={"__score__": 0.05}),
+]
+
+
+@pytest.mark.parametrize(
+    "options,expected",
+    [
+        # 超时未完成判断的知识使用召回分数
+        ({"relevance_deadline": 0.2}, [1.0, 0.0, 0.05]),
+        # 确认相关的知识足够时提前结束，其余视为不相关
+        ({"relevance_early_stop_count": 1}, [1.0, 0.0, 0.0]),
+    ],
+)
+async def test_relevance_determiner_deadline(options, expected):
+    recognition = SlowRelevanceRecognition()
+    kwargs = {"input": "query", **options}
+
+    start = time.monotonic()
+    assert recognition.llm_relevance_determiner_parallel("query", RELEVANCE_DOCS, None, **kwargs) == expected
+    assert await recognition.allm_relevance_determiner_parallel("query", RELEVANCE_DOCS, None, **kwargs) == expected
+    assert time.monotonic() - start < 0.9
+
+
+class RelevanceJudgeChatModel(BaseChatModel):
+    """按知识内容是否以 irrelevant 结尾给出相关性判断；broken 为 True 时批量判断返回无法解析的结果"""
+
+    model_name: str = "fake-model"
+    broken: bool = False
+    prompts: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-relevance-judge"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = messages[-1].content
+        self.prompts.append(content)
+        docs = re.findall(r"候选文档 (\d+) 如下：```(.*?)```", content, re.S)
+        if docs:
+            reply = (
+                "无法判断" if self.broken else json.dumps({i: int(not doc.endswith("irrelevant")) for i, doc in docs})
+            )
+        else:
+            reply = "0" if "irrelevant```" in content else "1"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+
+BATCH_DOCS = [
+    Document(page_content=content, metadata={"__score__": 0.5})
+    for content in ["部署", "升级 irrelevant", "配置", "安装 irrelevant", "监控"]
+]
+
+
+@pytest.mark.parametrize(
+    "options,n_prompts",
+    [
+        ({"llm_batch_relevance_max_docs": 2}, 3),
+        # 每篇知识都超出 token 预算，各自一批
+        ({"llm_batch_relevance_max_tokens": 1}, 5),
+        ({}, 1),
+    ],
+)
+async def test_llm_batch_relevance_determiner(options, n_prompts):
+    recognition = IntentRecognition()
+    expected = [1.0, 0.0, 1.0, 0.0, 1.0]
+    kwargs = {"input": "query", **options}
+
+    llm = RelevanceJudgeChatModel()
+    assert recognition.llm_batch_relevance_determiner_parallel("query", BATCH_DOCS, llm, **kwargs) == expected
+    assert len(llm.prompts) == n_prompts
+
+    llm = RelevanceJudgeChatModel()
+    assert await recognition.allm_batch_relevance_determiner_parallel("query", BATCH_DOCS, llm, **kwargs) == expected
+    assert len(llm.prompts) == n_prompts
+
+
+async def test_llm_batch_relevance_determiner_fallback():
+    """批量判断的结果无法解析时改为逐篇判断"""
+    recognition = IntentRecognition()
+    llm = RelevanceJudgeChatModel(broken=True)
+    results = await recognition.allm_batch_relevance_determiner_parallel("query", BATCH_DOCS, llm, input="query")
+    assert results == [1.0, 0.0, 1.0, 0.0, 1.0]
+    assert len(llm.prompts) == 1 + len(BATCH_DOCS)
+
+    assert recognition._parse_batch_relevances('```json\n{"1": 1, "2": 0}\n```', 2) == [True, False]
+    assert recognition._parse_batch_relevances('{"1": 1}', 2) is None
+
+
+async def test_search_knowledge_with_recall_cache(recognition, mocker):
+    """开启召回结果缓存后，相同的查询只请求一次知识库，同步和异步调用共用缓存"""
+    mocker.patch("aidev_agent.core.extend.intent.intent_recognition.recall_cache", RecallCache(MemoryCacheBackend()))
+    search_kwargs = {"knowledge_items": [], "knowledge_bases": KNOWLEDGE_BASES, "query": "蓝鲸如何部署？", "topk": 10}
+    assert recognition.search_knowledge_index_specific(**search_kwargs) == DOCUMENTS
+    assert await recognition.asearch_knowledge_index_specific(**search_kwargs) == DOCUMENTS
+    assert recognition.search_knowledge_index_specific(**{**search_kwargs, "topk": 20}) == DOCUMENTS
+    assert len(recognition.sync_queries) == 2
+    assert not recognition.async_queries
+
+
+class SyncOnlyRecognition(IntentRecognition):
+    """只重写同步版本的扩展点"""
+
+    def search_knowledge_es_query(self, knowledge_items, knowledge_bases, query, topk, **kwargs):
+        return [{"page_content": query, "metadata": {"thread": threading.get_ident()}}]
+
+    def llm_relevance_determiner(self, query, doc, llm, **kwargs):
+        return not doc.page_content.endswith("irrelevant")
+
+
+async def test_async_hooks_fall_back_to_sync_overrides():
+    """子类只重写同步方法时，异步流程在线程中执行子类的同步方法"""
+    recognition = SyncOnlyRecognition()
+    docs = await recognition.asearch_knowledge_es_query([], [], "query", 10)
+    assert docs[0]["page_content"] == "query"
+    assert docs[0]["metadata"]["thread"] != threading.get_ident()
+    relevances = await recognition.allm_relevance_determiner_parallel("query", RELEVANCE_DOCS[:2], None, input="query")
+    assert relevances == [1.0, 0.0]
+    # 基类没有被修改，同时重写了异步方法的子类不受影响
+    with pytest.raises(NotImplementedError):
+        await IntentRecognition().asearch_knowledge_es_query([], [], "query", 10)
+    assert SlowRelevanceRecognition.allm_relevance_determiner is not IntentRecognition.allm_relevance_determiner
+
+
+async def test_acalculate_similarity_scores_off_loop(mocker):
+    """专属小模型的分数在线程中计算，不阻塞事件循环"""
+    threads = []
+
+    def fake_similarity(pairs):
+        threads.append(threading.get_ident())
+        return [len(doc) for _, doc in pairs]
+
+    mocker.patch("aidev_agent.core.extend.intent.intent_recognition.calculate_similarity", side_effect=fake_similarity)
+    docs_with_scores = [(doc, 0.5) for doc in RELEVANCE_DOCS[:2]]
+    scores = await IntentRecognition().acalculate_fine_grained_scores(
+        FineGrainedScoreType.EXCLUSIVE_SIMILARITY_MODEL, "query", None, docs_with_scores, input="query"
+    )
+    assert scores == [float(len(doc.page_content)) for doc, _ in docs_with_scores]
+    assert threads and threads[0] != threading.get_ident()
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from aidev_agent.core.extend.intent.recall_scheduler import RecallScheduler, RecallStage
+
+
+def test_invalid_stages():
+    with pytest.raises(ValueError):
+        RecallScheduler([RecallStage("a", lambda: 1), RecallStage("a", lambda: 2)])
+    with pytest.raises(ValueError):
+        RecallScheduler([RecallStage("b", lambda a: a, deps=("a",)), RecallStage("a", lambda: 1)])
+
+
+def test_run():
+    """下游阶段在其依赖完成后立即开始，不等待其它支路"""
+    slow_started = threading.Event()
+    release_slow = threading.Event()
+    events = []
+
+    def slow():
+        slow_started.set()
+        release_slow.wait(5)
+        return ["slow"]
+
+    def translate():
+        slow_started.wait(5)
+        return "query"
+
+    def search(translated_query):
+        events.append("search")
+        release_slow.set()
+        return [translated_query]
+
+    results = RecallScheduler(
+        [
+            RecallStage("slow", slow),
+            RecallStage("translated_query", translate),
+            RecallStage("translation", search, deps=("translated_query",)),
+        ]
+    ).run()
+    assert results == {"slow": ["slow"], "translated_query": "query", "translation": ["query"]}
+    assert events == ["search"]
+
+
+def test_run_budget():
+    """超过耗时预算时只返回已完成阶段的结果，未开始的下游阶段不再执行"""
+    called = []
+    scheduler = RecallScheduler(
+        [
+            RecallStage("fast", lambda: ["fast"]),
+            RecallStage("keywords", lambda: time.sleep(0.5) or ["k"]),
+            RecallStage("keywords_search", lambda keywords: called.append(keywords), deps=("keywords",)),
+        ],
+        budget=0.1,
+    )
+    start = time.monotonic()
+    assert scheduler.run() == {"fast": ["fast"]}
+    assert time.monotonic() - start < 0.4
+    assert scheduler.unfinished == ["keywords", "keywords_search"]
+    time.sleep(0.5)
+    assert not called
+
+
+def test_run_error():
+    def fail():
+        raise RuntimeError("error")
+
+    with pytest.raises(RuntimeError):
+        RecallScheduler([RecallStage("a", fail), RecallStage("b", lambda: 1)]).run()
+
+
+async def test_arun_budget():
+    """异步调度：依赖按名称传入，超时后取消未完成的任务"""
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def keywords():
+        return ["a", "b"]
+
+    async def search(extracted_keywords):
+        return extracted_keywords[:1]
+
+    scheduler = RecallScheduler(
+        [
+            RecallStage("slow", slow),
+            RecallStage("extracted_keywords", keywords),
+            RecallStage("keywords", search, deps=("extracted_keywords",)),
+        ],
+        budget=0.1,
+    )
+    assert await scheduler.arun() == {"extracted_keywords": ["a", "b"], "keywords": ["a"]}
+    assert scheduler.unfinished == ["slow"]
+    assert cancelled == ["slow"]
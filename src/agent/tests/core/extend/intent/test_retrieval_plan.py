@@ -0,0 +1,60 @@
+import pytest
+
+from aidev_agent.core.extend.intent.intent_recognition import IntentRecognition
+from aidev_agent.core.extend.intent.retrieval_plan import RetrievalPlan
+
+KNOWLEDGE_ITEMS = [{"id": 1, "index_config": {"vector_indexes": [{"index_name": "content"}]}}]
+KNOWLEDGE_BASES = [
+    {
+        "id": 2,
+        "index_config": {
+            "full_text_indexes": [{"index_name": "full_text"}],
+            "vector_indexes": [{"index_name": "content"}, {"index_name": "title"}],
+        },
+    }
+]
+
+
+def test_index_query_kwargs():
+    plan = RetrievalPlan.from_kwargs(
+        KNOWLEDGE_ITEMS,
+        KNOWLEDGE_BASES,
+        knowledge_resource_index_names={"knowledge_bases": {2: ["title"]}},
+    )
+    assert plan.index_query_kwargs("部署") == [
+        {"index_name": "content", "index_value": "部署", "knowledge_id": 1},
+        {"index_name": "title", "index_value": "部署", "knowledge_base_id": 2},
+    ]
+    # 不同资源类型使用各自的自定义索引
+    assert [kwargs["index_name"] for kwargs in plan.index_query_kwargs("部署", "tool")] == [
+        "content",
+        "full_text",
+        "content",
+        "title",
+    ]
+    with pytest.raises(ValueError):
+        plan.index_query_kwargs("部署", "unknown")
+
+
+def test_invalid_custom_index_names():
+    plan = RetrievalPlan.from_kwargs([], KNOWLEDGE_BASES, knowledge_resource_index_names={"knowledge_bases": {3: []}})
+    with pytest.raises(ValueError):
+        plan.index_query_kwargs("部署")
+    with pytest.raises(RuntimeError):
+        RetrievalPlan([{"id": 1}], []).index_query_kwargs("部署")
+
+
+def test_index_specific_query_data():
+    """检索时复用同一批知识（库）的检索计划，知识（库）变化时重新解析"""
+    recognition = IntentRecognition()
+    plan = RetrievalPlan.from_kwargs(KNOWLEDGE_ITEMS, KNOWLEDGE_BASES)
+    plan._indexes["knowledge"] = [("cached", "knowledge_id", 1)]
+    data = recognition._index_specific_query_data(
+        KNOWLEDGE_ITEMS, KNOWLEDGE_BASES, "部署", 10, knowledge_retrieval_plan=plan
+    )
+    assert data["index_query_kwargs"] == [{"index_name": "cached", "index_value": "部署", "knowledge_id": 1}]
+
+    data = recognition._index_specific_query_data(
+        KNOWLEDGE_ITEMS, list(KNOWLEDGE_BASES), "部署", 10, knowledge_retrieval_plan=plan
+    )
+    assert len(data["index_query_kwargs"]) == 4
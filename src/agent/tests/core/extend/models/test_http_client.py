@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from aidev_agent.core.extend.models.http_client import HttpClientPool
+from aidev_agent.core.extend.models.llm_gateway import ChatModel, Embeddings
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestHttpClientPool:
+    """测试 LLM 网关 httpx 客户端池"""
+
+    def test_share_clients(self):
+        """相同 base_url 的模型实例共享 httpx 客户端"""
+        llm_1 = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost/pool")
+        llm_2 = ChatModel.get_setup_instance(model="deepseek-r1", base_url="http://localhost/pool")
+        embeddings = Embeddings.get_setup_instance(model="bge-m3", base_url="http://localhost/pool")
+        other = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost/other")
+
+        assert llm_1.http_client is llm_2.http_client is embeddings.http_client
+        assert llm_1.http_async_client is llm_2.http_async_client
+        assert llm_1.root_client._client is llm_1.http_client
+        assert other.http_client is not llm_1.http_client
+
+    def test_auth_headers_not_in_key(self, mocker):
+        """不同的鉴权信息共用同一个客户端，鉴权请求头仍然由各自的 openai 客户端带上"""
+        pool = HttpClientPool()
+        mocker.patch("aidev_agent.core.extend.models.llm_gateway.http_client_pool", pool)
+        llm_1 = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost/pool")
+        llm_2 = ChatModel.get_setup_instance(
+            model="hunyuan-turbos", base_url="http://localhost/pool", auth_headers={"bk_app_code": "other"}
+        )
+        assert llm_1.http_client is llm_2.http_client
+        assert len(pool) == 1
+        assert "other" in llm_2.root_client.default_headers["X-Bkapi-Authorization"]
+        assert "other" not in llm_1.root_client.default_headers["X-Bkapi-Authorization"]
+
+    def test_explicit_client(self):
+        http_client = httpx.Client()
+        llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost", http_client=http_client)
+        assert llm.http_client is http_client
+
+    def test_metrics(self, server_url):
+        pool = HttpClientPool(http2=False, max_connections=1)
+        sync_client, async_client = pool.get_clients(server_url)
+
+        assert sync_client.get(server_url).json() == {"ok": True}
+
+        async def request():
+            return (await async_client.get(server_url)).json()
+
+        # 同一个异步客户端可以在不同的事件循环中使用
+        assert asyncio.run(request()) == {"ok": True}
+        assert asyncio.run(request()) == {"ok": True}
+
+        (key, metrics), *_ = pool.metrics().items()
+        assert key == server_url
+        assert metrics["sync"]["requests_total"] == 1
+        assert metrics["async"]["requests_total"] == 2
+        assert metrics["sync"]["in_flight"] == metrics["async"]["in_flight"] == 0
+        pool.close()
+
+    def test_saturation(self, server_url):
+        pool = HttpClientPool(http2=False, max_connections=1)
+        sync_client, _ = pool.get_clients(server_url)
+
+        with sync_client.stream("GET", server_url):
+            # 第一个流式请求仍在读取时，第二个请求需要等待连接
+            thread = threading.Thread(target=sync_client.get, args=(server_url,))
+            thread.start()
+            thread.join(timeout=0.2)
+        thread.join()
+
+        metrics = next(iter(pool.metrics().values()))["sync"]
+        assert metrics["max_in_flight"] == 2
+        assert metrics["saturated_total"] == 1
+        pool.close()
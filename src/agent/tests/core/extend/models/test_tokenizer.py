@@ -0,0 +1,130 @@
+import base64
+
+import pytest
+import requests
+from langchain_core.messages import AIMessage, HumanMessage
+
+from aidev_agent.core.extend.models.llm_gateway import ChatModel
+from aidev_agent.core.extend.models.tokenizer import RemoteTokenizer, TokenizerRegistry, estimate_num_tokens
+from tests.typing import FixtureType
+
+
+def _token_check_response(mocker, lengths):
+    resp = mocker.MagicMock()
+    resp.json.return_value = {"prompts": [{"tokenCount": length} for length in lengths]}
+    return resp
+
+
+@pytest.fixture
+def post(mocker: FixtureType.mocker):
+    """按文本长度返回 token 数的远程分词接口"""
+    RemoteTokenizer._unavailable_until.clear()
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        return _token_check_response(mocker, [len(prompt["prompt"]) for prompt in json["prompts"]])
+
+    yield mocker.patch.object(requests.Session, "post", side_effect=fake_post)
+    RemoteTokenizer._unavailable_until.clear()
+
+
+class TestRemoteTokenizer:
+    """测试远程分词客户端"""
+
+    def test_count_in_batches(self, post):
+        tokenizer = RemoteTokenizer("http://localhost/api/token_check", batch_size=2)
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+        assert tokenizer.count(texts, model="hunyuan-turbos") == [1, 2, 3, 4, 5]
+        assert post.call_count == 3
+        assert RemoteTokenizer.get_session(tokenizer.endpoint) is RemoteTokenizer.get_session(tokenizer.endpoint)
+
+    def test_fallback_on_timeout(self, post):
+        """请求超时后改用本地估算，冷却时间内不再请求"""
+        post.side_effect = requests.Timeout()
+        tokenizer = RemoteTokenizer("http://localhost/api/token_check", cooldown=60)
+
+        assert tokenizer.count(["你好", "hello world"], model="hunyuan-turbos") == [2, 4]
+        assert tokenizer.count(["你好"], model="hunyuan-turbos") == [2]
+        assert post.call_count == 1
+        assert not RemoteTokenizer("http://localhost/api/token_check").available
+
+    def test_estimate_num_tokens(self):
+        assert estimate_num_tokens("") == 0
+        assert estimate_num_tokens("明天深圳天气怎么样?") == 10
+
+
+class TestChatModelRemoteTokenizer:
+    """测试 ChatModel 使用远程分词"""
+
+    def test_get_num_tokens_batch(self, post):
+        llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost", remote_tokenizer=True)
+
+        assert llm.get_num_tokens("hello") == 5
+        assert llm.get_num_tokens_batch(["a", "bb", "ccc"]) == [1, 2, 3]
+        assert post.call_count == 2
+        assert post.call_args.args[0] == "http://localhost/api/token_check"
+
+    def test_get_num_tokens_from_messages_batch(self, post):
+        llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost", remote_tokenizer=True)
+        messages_list = [[HumanMessage(content="你好")], [HumanMessage(content="你好"), AIMessage(content="好的")]]
+
+        counts = llm.get_num_tokens_from_messages_batch(messages_list)
+        assert counts == [llm.get_num_tokens_from_messages(messages) for messages in messages_list]
+        assert post.call_count == 3
+
+
+@pytest.fixture
+def tiktoken_file(tmp_path):
+    """单字节 token 以及“你”的 BPE 合并规则"""
+    ranks = [bytes([i]) for i in range(256)] + ["你".encode()[:2], "你".encode()]
+    path = tmp_path / "hunyuan.tiktoken"
+    path.write_bytes(
+        b"\n".join(base64.b64encode(token) + b" " + str(rank).encode() for rank, token in enumerate(ranks))
+    )
+    return path
+
+
+class TestTokenizerRegistry:
+    """测试本地分词器注册表"""
+
+    def test_load_from_dir(self, tiktoken_file):
+        registry = TokenizerRegistry()
+        registry.register_dir(str(tiktoken_file.parent))
+
+        tokenizer = registry.get("hunyuan-turbos")
+        assert tokenizer.encode("你好") == [257, *"好".encode()]
+        assert registry.get("hunyuan-t1") is tokenizer
+        # 没有对应文件或没有匹配的前缀
+        assert registry.get("deepseek-r1") is None
+        assert registry.get("gpt-4o") is None
+
+    def test_longest_prefix(self, tiktoken_file):
+        registry = TokenizerRegistry()
+        registry.register("hunyuan", lambda: "hunyuan")
+        registry.register("hunyuan-t1", lambda: "hunyuan-t1")
+        assert registry.get("hunyuan-t1-latest") == "hunyuan-t1"
+        assert registry.get("hunyuan-turbos") == "hunyuan"
+
+    def test_load_failure(self, tmp_path):
+        registry = TokenizerRegistry()
+        registry.register_file("qwen", str(tmp_path / "missing.tiktoken"))
+        assert registry.get("qwen-max") is None
+
+    def test_chat_model_uses_registry(self, tiktoken_file, mocker: FixtureType.mocker):
+        registry = TokenizerRegistry()
+        registry.register_file("hunyuan", str(tiktoken_file))
+        mocker.patch("aidev_agent.core.extend.models.llm_gateway.tokenizer_registry", registry)
+        llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost")
+
+        assert llm.get_num_tokens("你好") == 4
+        assert llm.get_num_tokens_from_messages([HumanMessage(content="你")]) == 3 + len("user") + 1 + 3
+
+    def test_remote_fallback_uses_registry(self, tiktoken_file, post, mocker: FixtureType.mocker):
+        """远程分词不可用时优先使用本地分词器"""
+        registry = TokenizerRegistry()
+        registry.register_file("hunyuan", str(tiktoken_file))
+        mocker.patch("aidev_agent.core.extend.models.llm_gateway.tokenizer_registry", registry)
+        post.side_effect = requests.ConnectionError()
+        llm = ChatModel.get_setup_instance(model="hunyuan-turbos", base_url="http://localhost", remote_tokenizer=True)
+
+        assert llm.get_num_tokens_batch(["你好", "你"]) == [4, 1]
@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from aidev_agent.core.extend.intent.intent_recognition import IntentRecognition
+from aidev_agent.core.extend.retrieval import tokenizer
+from aidev_agent.core.extend.retrieval.bm25 import BM25Index
+from aidev_agent.core.extend.retrieval.dense import DenseIndex
+from aidev_agent.core.extend.retrieval.hybrid import LocalRetriever
+from aidev_agent.core.extend.retrieval.recognition import LocalIntentRecognition
+
+VOCAB = ["部署", "升级", "监控", "告警"]
+
+
+class KeywordEmbeddings(Embeddings):
+    """按关键词出现次数构造向量，便于断言向量检索的结果"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [text.count(word) + 0.01 for word in VOCAB]
+
+
+DOCS = [
+    {"page_content": "蓝鲸平台部署指南：部署前准备机器", "metadata": {"uid": "1", "knowledge_base_id": 1}},
+    {"page_content": "蓝鲸平台升级说明", "metadata": {"uid": "2", "knowledge_base_id": 1}},
+    {"page_content": "监控告警配置", "metadata": {"uid": "3", "knowledge_base_id": 2}},
+    {"page_content": "告警通知与部署检查", "metadata": {"uid": "4", "knowledge_id": 10}},
+]
+
+
+def test_tokenize(mocker):
+    mocker.patch.object(tokenizer, "jieba", None)
+    assert tokenizer.tokenize("蓝鲸 BK-AIDev v1.2 的部署！") == ["蓝鲸", "bk-aidev", "v1.2", "的部", "部署"]
+    assert tokenizer.tokenize("装") == ["装"]
+
+
+def test_bm25_incremental():
+    index = BM25Index()
+    index.add(0, ["部署", "蓝鲸"])
+    index.add(1, ["升级", "蓝鲸", "蓝鲸"])
+    scores = index.scores(["部署"], 2)
+    assert scores[0] > 0 and scores[1] == 0
+    index.remove(0)
+    assert "部署" not in index.postings
+    assert (len(index), index.total_len) == (1, 3)
+    index.add(0, ["升级"])
+    scores = index.scores(["升级"], 2)
+    # 文档越短，相同词频的得分越高
+    assert scores[0] > scores[1] > 0
+
+
+def test_dense_index_mmap(tmp_path):
+    path = str(tmp_path / "vectors.npy")
+    index = DenseIndex(2, path=path, capacity=1)
+    index.set(0, [1.0, 0.0])
+    index.set(2, [1.0, 1.0])
+    assert index.capacity >= 3
+    index.flush()
+
+    index = DenseIndex(2, path=path)
+    assert index.vectors.dtype == np.float16
+    np.testing.assert_allclose(index.scores([1.0, 0.0], np.arange(3)), [1.0, 0.0, 0.7071], atol=1e-3)
+    np.testing.assert_allclose(index.scores([1.0, 0.0], np.array([0, 2])), [1.0, 0.7071], atol=1e-3)
+    with pytest.raises(ValueError):
+        DenseIndex(3, path=path)
+
+
+def test_local_retriever(tmp_path):
+    retriever = LocalRetriever(KeywordEmbeddings(), path=str(tmp_path))
+    assert retriever.add_documents(DOCS) == ["1", "2", "3", "4"]
+
+    docs = retriever.search_bm25("如何部署", 10)
+    assert [doc["metadata"]["uid"] for doc in docs] == ["1", "4"]
+    assert docs[0]["metadata"]["__score__"] == 1.0
+    assert [doc["metadata"]["uid"] for doc in retriever.search_bm25("部署", 10, knowledge_base_ids=[1])] == ["1"]
+    assert [doc["metadata"]["uid"] for doc in retriever.search_dense("告警", 2)] == ["3", "4"]
+    assert [doc["metadata"]["uid"] for doc in retriever.search("部署", 10, knowledge_ids=[10])] == ["4"]
+
+    # 增量删除、覆盖，删除的槽位被复用
+    retriever.delete(["1"])
+    retriever.add_documents([{"page_content": "蓝鲸平台升级与部署", "metadata": {"uid": "2", "knowledge_base_id": 1}}])
+    assert len(retriever) == 3
+    assert [doc["metadata"]["uid"] for doc in retriever.search_bm25("部署", 10, knowledge_base_ids=[1])] == ["2"]
+    retriever.save()
+
+    reloaded = LocalRetriever(KeywordEmbeddings(), path=str(tmp_path))
+    assert len(reloaded) == 3
+    assert reloaded.search_dense("升级", 1)[0]["metadata"]["uid"] == "2"
+    assert [doc["metadata"]["uid"] for doc in reloaded.search_bm25("告警", 10)] == ["3", "4"]
+
+
+async def test_local_intent_recognition():
+    """本地检索接入意图识别的召回流程：index_specific 走向量检索，ES 支路走 BM25，再经 RRF 融合"""
+    retriever = LocalRetriever(KeywordEmbeddings())
+    retriever.add_documents(DOCS)
+    recognition = LocalIntentRecognition(local_retriever=retriever)
+    knowledge_bases = [{"id": 1, "index_config": {"vector_indexes": [{"index_name": "content"}]}}]
+    kwargs = {"knowledge_items": [], "knowledge_bases": knowledge_bases, "query": "如何部署", "topk": 10}
+
+    docs = recognition.search_knowledge_index_specific(**kwargs)
+    assert [doc["metadata"]["uid"] for doc in docs] == ["1", "2"]
+    assert await recognition.asearch_knowledge_index_specific(**kwargs) == docs
+    es_docs = await recognition.asearch_knowledge_es_query(**{**kwargs, "knowledge_bases": []})
+    assert [doc["metadata"]["uid"] for doc in es_docs] == ["1", "4"]
+    assert recognition.search_knowledge_es_keywords([], knowledge_bases, extracted_keywords=[], topk=10) == []
+
+    fusion_docs = IntentRecognition().weighted_reciprocal_rank_fusion([docs, es_docs], [0.5, 0.5])
+    assert [doc["metadata"]["uid"] for doc in fusion_docs] == ["1", "2", "4"]
+
+
+async def test_local_search_off_loop(mocker):
+    """异步检索在线程中打分，不阻塞事件循环"""
+    retriever = LocalRetriever(KeywordEmbeddings())
+    recognition = LocalIntentRecognition(local_retriever=retriever)
+    threads = []
+
+    def record_thread(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return []
+
+    mocker.patch.object(retriever, "_search_dense", side_effect=record_thread)
+    mocker.patch.object(retriever, "search_bm25", side_effect=record_thread)
+
+    await retriever.asearch_dense("部署", 10)
+    await recognition.asearch_knowledge_es_query([], [], "部署", 10)
+    await recognition.asearch_knowledge_es_keywords([], [], ["部署"], 10)
+    assert len(threads) == 3
+    assert threading.get_ident() not in threads
@@ -0,0 +1,121 @@
+import threading
+
+import numpy as np
+import pytest
+
+from aidev_agent.core.extend.retrieval.recognition import VectorStoreIntentRecognition
+from aidev_agent.core.extend.retrieval.vector_store import MmapVectorStore, VectorSearchMode
+from tests.core.extend.retrieval.test_local_retriever import DOCS, KeywordEmbeddings
+
+
+def random_documents(n, dim, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    documents = [
+        {"page_content": f"片段 {i}", "metadata": {"uid": str(i), "knowledge_base_id": i % 3}} for i in range(n)
+    ]
+    return vectors, documents
+
+
+def exact_uids(vectors, query, topk, rows=None):
+    rows = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+    normalized = vectors[rows] / np.linalg.norm(vectors[rows], axis=1, keepdims=True)
+    return [str(i) for i in rows[np.argsort(-(normalized @ query))[:topk]]]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_brute_force(tmp_path, dtype):
+    vectors, documents = random_documents(300, 16)
+    store = MmapVectorStore(str(tmp_path), dim=16, dtype=dtype)
+    assert store.search_by_vector(vectors[0], 5) == []
+    store.add_vectors(vectors[:200], documents[:200])
+    # 另一个实例（如另一个 worker）映射同一目录，追加后检索前自动重新映射
+    reader = MmapVectorStore(str(tmp_path))
+    assert (len(reader), reader.dtype) == (200, dtype)
+    store.add_vectors(vectors[200:], documents[200:])
+
+    query = vectors[7] / np.linalg.norm(vectors[7])
+    docs = reader.search_by_vector(query, 5)
+    assert [doc["metadata"]["uid"] for doc in docs] == exact_uids(vectors, query, 5)
+    assert docs[0]["page_content"] == "片段 7"
+    assert docs[0]["metadata"]["__score__"] == pytest.approx(1.0, abs=1e-2)
+
+    rows = [i for i in range(300) if i % 3 == 1]
+    docs = reader.search_by_vector(query, 5, knowledge_base_ids=[1])
+    assert [doc["metadata"]["uid"] for doc in docs] == exact_uids(vectors, query, 5, rows)
+    assert reader.search_by_vector(query, 5, knowledge_ids=[1]) == []
+    with pytest.raises(ValueError):
+        store.add_vectors(vectors[:1, :8], documents[:1])
+
+
+def test_interrupted_write(tmp_path, mocker):
+    """写入方在写偏移表之前中断，残留的数据不影响之后写入的行"""
+    store = MmapVectorStore(str(tmp_path), dim=4)
+    store.add_vectors([[1, 0, 0, 0]], [{"page_content": "a", "metadata": {}}])
+    real_open = open
+
+    def failing_open(path, *args, **kwargs):
+        if path.endswith("records.bin"):
+            raise OSError("disk full")
+        return real_open(path, *args, **kwargs)
+
+    mocker.patch("builtins.open", failing_open)
+    with pytest.raises(OSError):
+        store.add_vectors([[0, 1, 0, 0]], [{"page_content": "b", "metadata": {}}])
+    mocker.stopall()
+
+    store = MmapVectorStore(str(tmp_path))
+    assert len(store) == 1
+    store.add_vectors([[0, 0, 1, 0]], [{"page_content": "c", "metadata": {}}])
+    docs = store.search_by_vector([0, 0, 1, 0], 1)
+    assert docs[0]["page_content"] == "c"
+    assert docs[0]["metadata"]["__score__"] == pytest.approx(1.0, abs=1e-3)
+    assert [doc["page_content"] for doc in store.get_documents(range(len(store)))] == ["a", "c"]
+
+
+def test_ivf(tmp_path):
+    vectors, documents = random_documents(2000, 16)
+    store = MmapVectorStore(str(tmp_path))
+    store.add_vectors(vectors[:1500], documents[:1500])
+    query = vectors[1800] / np.linalg.norm(vectors[1800])
+    # 没有训练时退化为暴力检索
+    assert store.search_by_vector(query, 10, mode=VectorSearchMode.IVF) == store.search_by_vector(query, 10)
+
+    store.train_ivf(n_lists=20)
+    # 训练后追加的行在写入时分配聚类
+    store.add_vectors(vectors[1500:], documents[1500:])
+    reader = MmapVectorStore(str(tmp_path))
+    assert reader.ivf_trained
+    brute_force = reader.search_by_vector(query, 10)
+    assert reader.search_by_vector(query, 10, mode=VectorSearchMode.IVF, nprobe=20) == brute_force
+    docs = reader.search_by_vector(query, 10, mode=VectorSearchMode.IVF, nprobe=4)
+    assert docs[0]["metadata"]["uid"] == "1800"
+    assert len({doc["metadata"]["uid"] for doc in docs} & {doc["metadata"]["uid"] for doc in brute_force}) >= 5
+
+
+async def test_vector_store_intent_recognition(tmp_path):
+    store = MmapVectorStore(str(tmp_path), KeywordEmbeddings())
+    assert store.add_documents(DOCS, batch_size=3) == 4
+    recognition = VectorStoreIntentRecognition(vector_store=store, search_mode=VectorSearchMode.BRUTE_FORCE)
+    knowledge_bases = [{"id": 1, "index_config": {"vector_indexes": [{"index_name": "content"}]}}]
+    kwargs = {"knowledge_items": [], "knowledge_bases": knowledge_bases, "query": "如何部署", "topk": 10}
+
+    docs = recognition.search_knowledge_index_specific(**kwargs)
+    assert [doc["metadata"]["uid"] for doc in docs] == ["1", "2"]
+    assert await recognition.asearch_knowledge_index_specific(**kwargs) == docs
+
+
+async def test_asearch_off_loop(tmp_path, mocker):
+    """异步检索在线程中打分，不阻塞事件循环"""
+    store = MmapVectorStore(str(tmp_path), KeywordEmbeddings())
+    store.add_documents(DOCS)
+    threads = []
+    search_by_vector = store.search_by_vector
+
+    def record_thread(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return search_by_vector(*args, **kwargs)
+
+    mocker.patch.object(store, "search_by_vector", side_effect=record_thread)
+    docs = await store.asearch("如何部署", 1)
+    assert docs[0]["metadata"]["uid"] == "1"
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,232 @@
+import asyncio
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from aidev_agent.core.utils.async_utils import (
+    CancellationToken,
+    EventLoopPool,
+    async_generator_with_timeout,
+    async_to_sync_generator,
+    event_loop_pool,
+    get_cancellation_token,
+    reset_cancellation_token,
+    set_cancellation_token,
+    submit_cancellable,
+)
+from aidev_agent.utils import Empty
+
+
+async def _counter(n, produced=None, closed=None, delay=0.0):
+    try:
+        for i in range(n):
+            if delay:
+                await asyncio.sleep(delay)
+            if produced is not None:
+                produced.append(i)
+            yield i
+    finally:
+        if closed is not None:
+            closed.set()
+
+
+class TestAsyncToSyncGenerator:
+    """测试 async_to_sync_generator"""
+
+    def test_items_in_order(self):
+        """按顺序产出全部数据"""
+        assert list(async_to_sync_generator(_counter(100))) == list(range(100))
+
+    def test_reuse_event_loop_threads(self):
+        """多次调用复用事件循环池中的线程"""
+        list(async_to_sync_generator(_counter(1)))
+        thread_count = threading.active_count()
+        for _ in range(20):
+            list(async_to_sync_generator(_counter(3)))
+        assert threading.active_count() == thread_count
+        # 任务结束后的回调在事件循环线程中异步执行
+        for _ in range(100):
+            if sum(event_loop_pool.loads) == 0:
+                break
+            time.sleep(0.01)
+        assert sum(event_loop_pool.loads) == 0
+
+    def test_backpressure(self):
+        """异步侧最多领先同步侧 max_queue_size 条数据"""
+        produced = []
+        gen = async_to_sync_generator(_counter(1000, produced=produced), max_queue_size=4)
+        assert next(gen) == 0
+        time.sleep(0.1)
+        assert len(produced) <= 6
+        gen.close()
+
+    def test_early_close_cancels_async_generator(self):
+        """同步侧提前结束时关闭异步生成器"""
+        closed = threading.Event()
+        gen = async_to_sync_generator(_counter(10**6, closed=closed, delay=0.01))
+        assert next(gen) == 0
+        gen.close()
+        assert closed.wait(timeout=2)
+
+    def test_raise_error(self):
+        """异步侧的异常在同步侧抛出"""
+
+        async def broken():
+            yield 1
+            raise ValueError("boom")
+
+        gen = async_to_sync_generator(broken())
+        assert next(gen) == 1
+        with pytest.raises(ValueError):
+            next(gen)
+
+    def test_propagate_contextvars(self):
+        """调用方的 contextvars 传递到异步侧"""
+        import contextvars
+
+        var = contextvars.ContextVar("var", default=None)
+        var.set("caller")
+
+        async def read_var():
+            yield var.get()
+
+        assert list(async_to_sync_generator(read_var())) == ["caller"]
+
+
+class TestHeartbeatStream:
+    """测试带心跳的异步流适配器"""
+
+    async def test_heartbeat_and_metrics(self):
+        """等待超时时产出心跳，并统计心跳次数和最大间隔"""
+
+        async def slow():
+            yield 1
+            await asyncio.sleep(0.12)
+            yield 2
+
+        stream = async_generator_with_timeout(slow(), timeout=0.05)
+        items = [item async for item in stream]
+        assert items[0] == 1 and items[-1] == 2
+        assert items.count(Empty) == stream.heartbeat_count == 2
+        assert stream.item_count == 2
+        assert stream.max_gap >= 0.12
+
+    async def test_timeout(self):
+        """连续心跳次数超过上限后抛出超时"""
+
+        async def hang():
+            await asyncio.sleep(3600)
+            yield 1
+
+        stream = async_generator_with_timeout(hang(), timeout=0.01, max_wait_rounds=2)
+        with pytest.raises(TimeoutError):
+            async for _ in stream:
+                pass
+        await stream.aclose()
+
+    async def test_no_task_per_item(self):
+        """迭代过程中不会为每条数据创建新的任务"""
+        task_counts = set()
+        async for _ in async_generator_with_timeout(_counter(200), timeout=1):
+            task_counts.add(len(asyncio.all_tasks()))
+        assert len(task_counts) == 1
+
+    async def test_raise_error(self):
+        """底层生成器的异常透传给消费方"""
+
+        async def broken():
+            yield 1
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            async for _ in async_generator_with_timeout(broken(), timeout=1):
+                pass
+
+    async def test_dropped_stream_cancels_pump(self):
+        """未调用 aclose 就丢弃流时，驱动任务被取消并关闭底层生成器"""
+        closed = asyncio.Event()
+
+        async def endless():
+            try:
+                while True:
+                    yield 1
+                    await asyncio.sleep(0)
+            finally:
+                closed.set()
+
+        stream = async_generator_with_timeout(endless(), timeout=1)
+        assert await stream.__anext__() == 1
+        del stream
+        gc.collect()
+        await asyncio.wait_for(closed.wait(), timeout=1)
+
+
+class TestCancellation:
+    """测试同步侧提前结束时的端到端取消"""
+
+    def test_close_cancels_pending_anext(self):
+        """心跳包装下的底层生成器在等待数据时被取消"""
+        closed = threading.Event()
+
+        async def slow():
+            try:
+                yield 1
+                await asyncio.sleep(3600)
+                yield 2
+            finally:
+                closed.set()
+
+        gen = async_to_sync_generator(async_generator_with_timeout(slow(), timeout=0.01))
+        assert next(gen) == 1
+        assert next(gen) is Empty
+        gen.close()
+        assert closed.wait(timeout=2)
+
+    def test_cancel_pending_futures(self):
+        """取消令牌会取消线程池中尚未开始执行的任务"""
+        token = CancellationToken()
+        reset_token = set_cancellation_token(token)
+        started = threading.Event()
+        release = threading.Event()
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                running = submit_cancellable(executor, lambda: started.set() or release.wait(2))
+                pending = submit_cancellable(executor, lambda: "never")
+                assert started.wait(timeout=2)
+                token.cancel()
+                release.set()
+                assert pending.cancelled()
+                assert running.result() is True
+        finally:
+            reset_cancellation_token(reset_token)
+
+    def test_cancelled_token_in_worker(self):
+        """线程池中的任务可以感知到取消状态"""
+        token = CancellationToken()
+        reset_token = set_cancellation_token(token)
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = submit_cancellable(
+                    executor, lambda: time.sleep(0.1) or get_cancellation_token().raise_if_cancelled()
+                )
+                token.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    future.result()
+        finally:
+            reset_cancellation_token(reset_token)
+
+
+def test_event_loop_pool_least_loaded():
+    """事件循环池选择负载最低的事件循环"""
+    pool = EventLoopPool(size=2)
+    try:
+        first = pool.acquire()
+        second = pool.acquire()
+        assert first is not second
+        pool.release(first)
+        assert pool.acquire() is first
+    finally:
+        pool.shutdown()
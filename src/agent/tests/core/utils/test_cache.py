@@ -0,0 +1,241 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from aidev_agent.core.extend.intent.utils import ainvoke_decorator, invoke_decorator
+from aidev_agent.core.utils.cache import (
+    LLMResponseCache,
+    MemoryCacheBackend,
+    RecallCache,
+    RedisCacheBackend,
+    SQLiteCacheBackend,
+    get_cache_backend,
+)
+from tests.typing import FixtureType
+
+
+class FakeChatModel(GenericFakeChatModel):
+    model_name: str = "hunyuan-turbos"
+    temperature: float = 0
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def scan_iter(self, match):
+        return [key for key in self.data if key.startswith(match.rstrip("*"))]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class ThreadRecordingSQLiteBackend(SQLiteCacheBackend):
+    """记录每次读写所在的线程"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, value, ttl=None):
+        self.threads.add(threading.get_ident())
+        super().set(key, value, ttl)
+
+
+class TestCacheBackend:
+    """测试缓存后端"""
+
+    def test_memory_lru(self):
+        backend = MemoryCacheBackend(maxsize=2)
+        backend.set("a", "1")
+        backend.set("b", "2")
+        backend.get("a")
+        backend.set("c", "3")
+        assert backend.get("a") == "1"
+        assert backend.get("b") is None
+        assert len(backend) == 2
+
+    def test_sqlite(self, tmp_path):
+        path = str(tmp_path / "cache" / "llm.db")
+        SQLiteCacheBackend(path).set("a", "1")
+        backend = SQLiteCacheBackend(path)
+        assert backend.get("a") == "1"
+
+        backend.set("expired", "1", ttl=-1)
+        assert backend.get("expired") is None
+        backend.clear()
+        assert backend.get("a") is None
+
+    def test_redis(self):
+        client = FakeRedis()
+        backend = RedisCacheBackend(client, prefix="test:")
+        backend.set("a", "1")
+        assert client.data == {"test:a": "1"}
+        assert backend.get("a") == "1"
+        backend.clear()
+        assert backend.get("a") is None
+
+    def test_get_cache_backend(self, tmp_path):
+        assert isinstance(get_cache_backend("memory://"), MemoryCacheBackend)
+        assert isinstance(get_cache_backend(f"sqlite://{tmp_path}/llm.db"), SQLiteCacheBackend)
+        with pytest.raises(ValueError):
+            get_cache_backend("mysql://localhost")
+
+
+class TestLLMResponseCache:
+    """测试意图识别辅助 LLM 调用的响应缓存"""
+
+    @pytest.fixture
+    def response_cache(self, mocker: FixtureType.mocker):
+        response_cache = LLMResponseCache(MemoryCacheBackend())
+        mocker.patch("aidev_agent.core.extend.intent.utils.llm_response_cache", response_cache)
+        return response_cache
+
+    def test_invoke_with_cache(self, response_cache):
+        """相同的输入只请求一次 LLM"""
+        llm = FakeChatModel(messages=iter([AIMessage(content="关键词1\n关键词2")]))
+        invoke_func = invoke_decorator(llm.invoke, llm)
+
+        first = invoke_func([SystemMessage(content="提取关键词"), HumanMessage(content="明天深圳天气怎么样?")])
+        second = invoke_func([SystemMessage(content="提取关键词"), HumanMessage(content="明天深圳天气怎么样?")])
+
+        assert second.content == first.content == "关键词1\n关键词2"
+        assert (response_cache.hits, response_cache.misses) == (1, 1)
+
+    async def test_ainvoke_with_blocking_backend(self, mocker: FixtureType.mocker, tmp_path):
+        """磁盘/网络缓存后端的读写放到线程中执行，不阻塞事件循环"""
+        backend = ThreadRecordingSQLiteBackend(str(tmp_path / "cache.db"))
+        response_cache = LLMResponseCache(backend)
+        mocker.patch("aidev_agent.core.extend.intent.utils.llm_response_cache", response_cache)
+        llm = FakeChatModel(messages=iter([AIMessage(content="关键词")]))
+        ainvoke_func = ainvoke_decorator(llm.ainvoke, llm)
+
+        assert (await ainvoke_func([HumanMessage(content="你好")])).content == "关键词"
+        assert (await ainvoke_func([HumanMessage(content="你好")])).content == "关键词"
+        assert (response_cache.hits, response_cache.misses) == (1, 1)
+        assert backend.threads and threading.get_ident() not in backend.threads
+
+    def test_key(self):
+        messages = [HumanMessage(content="你好")]
+        key = LLMResponseCache.make_key(FakeChatModel(messages=iter([])), messages)
+        assert key == LLMResponseCache.make_key(FakeChatModel(messages=iter([])), [HumanMessage(content="你好")])
+        assert key != LLMResponseCache.make_key(FakeChatModel(messages=iter([]), temperature=0.7), messages)
+        assert key != LLMResponseCache.make_key(FakeChatModel(messages=iter([]), model_name="deepseek-r1"), messages)
+        assert key != LLMResponseCache.make_key(FakeChatModel(messages=iter([])), [HumanMessage(content="您好")])
+
+    def test_disabled(self):
+        response_cache = LLMResponseCache(enabled=False)
+        llm = FakeChatModel(messages=iter([]))
+        response_cache.set(llm, [HumanMessage(content="你好")], AIMessage(content="你好"))
+        assert response_cache.get(llm, [HumanMessage(content="你好")]) is None
+
+
+class TestRecallCache:
+    """测试知识库召回结果缓存"""
+
+    DATA = {
+        "query": "蓝鲸如何部署？",
+        "topk": 10,
+        "index_query_kwargs": [{"index_name": "full_text", "index_value": "蓝鲸如何部署？", "knowledge_base_id": 1}],
+    }
+
+    def test_get_or_load(self):
+        recall_cache = RecallCache(MemoryCacheBackend())
+        calls = []
+
+        def load():
+            calls.append(1)
+            return [{"page_content": "部署", "metadata": {"__score__": 0.9}}]
+
+        first = recall_cache.get_or_load(self.DATA, load)
+        first[0]["metadata"]["rrf_score"] = 1.0
+        second = recall_cache.get_or_load(dict(self.DATA), load)
+        assert second == [{"page_content": "部署", "metadata": {"__score__": 0.9}}]
+        assert recall_cache.get_or_load({**self.DATA, "topk": 20}, load) == second
+        assert (len(calls), recall_cache.hits, recall_cache.misses) == (2, 1, 2)
+
+    def test_invalidate(self):
+        recall_cache = RecallCache(MemoryCacheBackend())
+        recall_cache.get_or_load(self.DATA, lambda: ["old"])
+        recall_cache.invalidate(knowledge_base_ids=[2])
+        assert recall_cache.get_or_load(self.DATA, lambda: ["new"]) == ["old"]
+        recall_cache.invalidate(knowledge_base_ids=[1])
+        assert recall_cache.get_or_load(self.DATA, lambda: ["new"]) == ["new"]
+        recall_cache.invalidate()
+        assert recall_cache.get_or_load(self.DATA, lambda: ["newer"]) == ["newer"]
+
+    def test_single_flight(self):
+        """并发的相同查询只检索一次，出错时所有调用方都收到异常且不写入缓存"""
+        recall_cache = RecallCache(MemoryCacheBackend())
+        calls = []
+
+        def load():
+            calls.append(1)
+            time.sleep(0.2)
+            return ["doc"]
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(recall_cache.get_or_load(self.DATA, load))) for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [["doc"]] * 5
+        assert (len(calls), recall_cache.coalesced) == (1, 4)
+
+        def fail():
+            raise RuntimeError("error")
+
+        with pytest.raises(RuntimeError):
+            recall_cache.get_or_load({**self.DATA, "topk": 1}, fail)
+        assert recall_cache.get_or_load({**self.DATA, "topk": 1}, lambda: ["doc"]) == ["doc"]
+
+    async def test_aget_or_load(self):
+        recall_cache = RecallCache(MemoryCacheBackend())
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return ["doc"]
+
+        results = await asyncio.gather(*[recall_cache.aget_or_load(self.DATA, load) for _ in range(3)])
+        assert results == [["doc"]] * 3
+        assert await recall_cache.aget_or_load(self.DATA, load) == ["doc"]
+        assert (len(calls), recall_cache.coalesced, recall_cache.hits) == (1, 2, 1)
+
+    async def test_aget_or_load_with_blocking_backend(self, tmp_path):
+        backend = ThreadRecordingSQLiteBackend(str(tmp_path / "cache.db"))
+        recall_cache = RecallCache(backend)
+
+        async def load():
+            await asyncio.sleep(0.1)
+            return ["doc"]
+
+        results = await asyncio.gather(*[recall_cache.aget_or_load(self.DATA, load) for _ in range(3)])
+        assert results == [["doc"]] * 3
+        assert await recall_cache.aget_or_load(self.DATA, load) == ["doc"]
+        assert (recall_cache.coalesced, recall_cache.hits) == (2, 1)
+        assert backend.threads and threading.get_ident() not in backend.threads
+
+    def test_disabled(self):
+        recall_cache = RecallCache(enabled=False)
+        assert recall_cache.get_or_load(self.DATA, lambda: ["a"]) == ["a"]
+        assert recall_cache.get_or_load(self.DATA, lambda: ["b"]) == ["b"]
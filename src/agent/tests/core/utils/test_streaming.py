@@ -0,0 +1,186 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from aidev_agent.core.utils.streaming import (
+    ChunkCoalescer,
+    SSEEncoder,
+    SSEFrameBatcher,
+    StreamingPatternFilter,
+    StreamingPatternFilterChain,
+    get_sse_encoder,
+)
+
+
+def _split(text, seed):
+    rnd = random.Random(seed)
+    chunks, i = [], 0
+    while i < len(text):
+        n = rnd.randint(1, 5)
+        chunks.append(text[i : i + n])
+        i += n
+    return chunks
+
+
+def _run(pattern_filter, chunks):
+    return "".join(pattern_filter.feed(chunk) for chunk in chunks) + pattern_filter.flush()
+
+
+class TestStreamingPatternFilter:
+    """测试 StreamingPatternFilter"""
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_same_as_replace(self, seed):
+        """任意切分方式下结果都与整体替换一致"""
+        text = "<think>\n好的，我想想\n</think>\n答案是 <think 不完整\n</think>\n结束"
+        replacements = {"<think>\n": "", "\n</think>\n": ""}
+        pattern_filter = StreamingPatternFilter(replacements)
+        assert _run(pattern_filter, _split(text, seed)) == "好的，我想想答案是 <think 不完整结束"
+        assert pattern_filter.hit_count == 3
+
+    def test_keep_content_after_symbol(self):
+        """标识位被拆分时，后面跟着的内容需要保留"""
+        pattern_filter = StreamingPatternFilter({"<think>\n": ""})
+        assert [pattern_filter.feed(chunk) for chunk in ["<th", "in", "k>", "\n好的"]] == ["", "", "", "好的"]
+
+    def test_bounded_pending(self):
+        """只暂存可能是模式前缀的尾部内容"""
+        pattern_filter = StreamingPatternFilter({"\n</think>\n": ""})
+        assert pattern_filter.feed("a" * 1000 + "\n</th") == "a" * 1000
+        assert pattern_filter.pending == "\n</th"
+        assert pattern_filter.feed("ink>") == ""
+        assert pattern_filter.feed("!") == "\n</think>!"
+        assert pattern_filter.pending == ""
+
+    def test_longest_match(self):
+        """同一位置优先匹配最长的模式"""
+        pattern_filter = StreamingPatternFilter({"```": "A", '```json\n{"': "B"})
+        assert _run(pattern_filter, ["``", "`js", 'on\n{"x', "``` y"]) == "BxA y"
+
+    def test_chain(self):
+        """先处理转义，再剔除后缀"""
+        chain = StreamingPatternFilterChain(
+            [StreamingPatternFilter({"\\n": "\n"}), StreamingPatternFilter({'"\n}\n```<end>': ""})]
+        )
+        chunks = ["第一行", "\\", "n第二行", '"', "\\n}\\", "n``", "`", "<end>"]
+        assert _run(chain, chunks) == "第一行\n第二行"
+
+
+class TestSSEEncoder:
+    """测试 SSEEncoder"""
+
+    @pytest.mark.parametrize(
+        "ret",
+        [
+            {"event": "text", "content": '你好\n"world"\\'},
+            {"event": "think", "content": "", "cover": True},
+            {"event": "text", "content": "a", "cover": False},
+            {"event": "think", "content": "\n", "cover": False, "elapsed_time": 12.5},
+            {"event": "reference_doc", "documents": [{"title": "文档"}], "cover": False},
+            {"event": "error", "code": 400, "message": "出错了"},
+            {"content": "a", "cover": None},
+        ],
+    )
+    def test_same_as_json_dumps(self, ret):
+        """与 json.dumps 的输出一致"""
+        assert SSEEncoder().encode(ret) == f"data: {json.dumps(ret)}\n\n"
+        frame = get_sse_encoder("orjson").encode(ret)
+        assert frame.startswith("data: ") and frame.endswith("\n\n")
+        assert json.loads(frame[len("data: ") : -2]) == ret
+
+
+def _frames(n):
+    for i in range(n):
+        yield f"data: {i}\n\n"
+
+
+class TestSSEFrameBatcher:
+    """测试 SSEFrameBatcher"""
+
+    def test_disabled(self):
+        assert list(SSEFrameBatcher().batch(_frames(3))) == list(_frames(3))
+
+    def test_batch_by_bytes(self):
+        """合并后的内容不变，每次输出至少达到 max_bytes"""
+        batches = list(SSEFrameBatcher(max_bytes=30, max_delay_ms=60_000).batch(_frames(20)))
+        assert "".join(batches) == "".join(_frames(20))
+        assert all(len(each) >= 30 for each in batches[:-1])
+        assert len(batches) < 20
+
+    def test_batch_by_utf8_bytes(self):
+        """按 UTF-8 编码后的字节数计算长度"""
+        frames = ["data: 你好\n\n"] * 3
+        batches = list(SSEFrameBatcher(max_bytes=28, max_delay_ms=60_000).batch(frame for frame in frames))
+        assert batches == ["".join(frames[:2]), frames[2]]
+
+    async def test_abatch_flush_by_delay(self):
+        """没有新帧到达时按时发送已缓存的帧"""
+
+        async def slow_frames():
+            yield "data: 1\n\n"
+            await asyncio.sleep(0.2)
+            yield "data: 2\n\n"
+
+        received = []
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async for batch in SSEFrameBatcher(max_bytes=1024, max_delay_ms=20).abatch(slow_frames()):
+            received.append((batch, loop.time() - start))
+        assert [batch for batch, _ in received] == ["data: 1\n\n", "data: 2\n\n"]
+        assert received[0][1] < 0.15
+
+
+class TestChunkCoalescer:
+    """测试 ChunkCoalescer"""
+
+    def test_merge_and_flush(self):
+        """合并连续的同类型 chunk，遇到类型切换、elapsed_time、其他 event 时立即输出"""
+        rets = [
+            {"event": "text", "content": "正在思考...", "cover": False},
+            {"event": "think", "content": "想", "cover": True},
+            {"event": "think", "content": "一想", "cover": False},
+            {"event": "think", "content": "\n", "cover": False, "elapsed_time": 10},
+            {"event": "text", "content": "答", "cover": False},
+            {"event": "text", "content": "案", "cover": False},
+            {"event": "reference_doc", "documents": [], "cover": False},
+            {"event": "text", "content": "。", "cover": False},
+        ]
+        assert list(ChunkCoalescer(max_delay_ms=60_000).coalesce(ret for ret in rets)) == [
+            {"event": "text", "content": "正在思考...", "cover": False},
+            {"event": "think", "content": "想一想", "cover": True},
+            {"event": "think", "content": "\n", "cover": False, "elapsed_time": 10},
+            {"event": "text", "content": "答案", "cover": False},
+            {"event": "reference_doc", "documents": [], "cover": False},
+            {"event": "text", "content": "。", "cover": False},
+        ]
+
+    def test_merge_by_utf8_bytes(self):
+        """合并内容按 UTF-8 编码后的字节数达到 max_bytes 时输出"""
+        rets = [{"event": "text", "content": "你好"} for _ in range(3)]
+        assert list(ChunkCoalescer(max_delay_ms=60_000, max_bytes=12).coalesce(ret for ret in rets)) == [
+            {"event": "text", "content": "你好你好"},
+            {"event": "text", "content": "你好"},
+        ]
+
+    def test_disabled(self):
+        rets = [{"event": "text", "content": str(i)} for i in range(3)]
+        assert list(ChunkCoalescer().coalesce(ret for ret in rets)) == rets
+
+    async def test_acoalesce_flush_by_delay(self):
+        """没有新 chunk 到达时按时输出已经合并的内容"""
+
+        async def slow_rets():
+            yield {"event": "text", "content": "a"}
+            yield {"event": "text", "content": "b"}
+            await asyncio.sleep(0.2)
+            yield {"event": "text", "content": "c"}
+
+        received = []
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        async for ret in ChunkCoalescer(max_delay_ms=20).acoalesce(slow_rets()):
+            received.append((ret["content"], loop.time() - start))
+        assert [content for content, _ in received] == ["ab", "c"]
+        assert received[0][1] < 0.15
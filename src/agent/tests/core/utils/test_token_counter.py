@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from aidev_agent.core.utils.token_counter import CachedTokenBufferMemory, TokenCounter, token_counter
+
+
+class CountingChatModel(GenericFakeChatModel):
+    """按字符分词，并记录分词调用次数"""
+
+    calls: int = 0
+
+    def get_num_tokens_from_messages(self, messages, tools=None) -> int:
+        self.calls += 1
+        return 3 + sum(len(message.content) + 4 for message in messages)
+
+
+class BatchCountingChatModel(CountingChatModel):
+    batch_calls: int = 0
+
+    def get_num_tokens_from_messages_batch(self, messages_list):
+        self.batch_calls += 1
+        return [self.get_num_tokens_from_messages(messages) for messages in messages_list]
+
+
+def _make_llm():
+    return CountingChatModel(messages=iter([]))
+
+
+MESSAGES = [HumanMessage(content="你好" * i) if i % 2 else AIMessage(content="好的" * i) for i in range(1, 11)]
+
+
+@pytest.fixture(autouse=True)
+def clear_token_counter():
+    token_counter.clear()
+    yield
+    token_counter.clear()
+
+
+class TestTokenCounter:
+    """测试按消息缓存的 token 计数"""
+
+    def test_count_messages(self):
+        """结果与整体统计一致，重复统计时命中缓存"""
+        llm = _make_llm()
+        assert token_counter.count_messages(llm, MESSAGES) == llm.get_num_tokens_from_messages(MESSAGES)
+
+        expected = llm.get_num_tokens_from_messages(MESSAGES[1:])
+        llm.calls = 0
+        assert token_counter.count_messages(llm, MESSAGES[1:]) == expected
+        assert llm.calls == 0
+        assert token_counter.hits == len(MESSAGES) - 1
+
+    def test_count_messages_with_default_tokenizer(self):
+        """使用模型默认的分词逻辑时结果与整体统计一致"""
+        llm = GenericFakeChatModel(messages=iter([]), custom_get_token_ids=lambda text: list(range(len(text))))
+        assert token_counter.count_messages(llm, MESSAGES) == llm.get_num_tokens_from_messages(MESSAGES)
+
+    def test_count_missing_in_batch(self):
+        """未命中缓存的消息在一次调用中统计"""
+        llm = BatchCountingChatModel(messages=iter([]))
+        assert token_counter.count_messages(llm, MESSAGES) == llm.get_num_tokens_from_messages(MESSAGES)
+        assert llm.batch_calls == 1
+
+    async def test_acount_messages(self):
+        """异步接口在线程中分词，结果与同步接口一致并共享缓存"""
+        llm = _make_llm()
+        threads = []
+        get_num_tokens_from_messages = llm.get_num_tokens_from_messages
+
+        def record_thread(messages, tools=None):
+            threads.append(threading.get_ident())
+            return get_num_tokens_from_messages(messages, tools)
+
+        object.__setattr__(llm, "get_num_tokens_from_messages", record_thread)
+        assert await token_counter.acount_messages(llm, MESSAGES) == get_num_tokens_from_messages(MESSAGES)
+        assert threads and threading.get_ident() not in threads
+
+        threads.clear()
+        assert await token_counter.acount_message(llm, MESSAGES[0]) == token_counter.count_message(llm, MESSAGES[0])
+        assert not threads
+
+    def test_lru_eviction(self):
+        counter = TokenCounter(maxsize=4)
+        counter.count_messages(_make_llm(), MESSAGES)
+        assert len(counter) == 4
+
+    def test_disabled(self):
+        llm = _make_llm()
+        counter = TokenCounter(maxsize=0)
+        assert counter.count_messages(llm, MESSAGES) == llm.get_num_tokens_from_messages(MESSAGES)
+        assert len(counter) == 0
+
+
+class TestCachedTokenBufferMemory:
+    """测试逐条扣减 token 数的会话历史裁剪"""
+
+    def test_prune(self):
+        llm = _make_llm()
+        history = ChatMessageHistory()
+        history.add_messages(MESSAGES)
+        memory = CachedTokenBufferMemory(chat_memory=history, llm=llm, max_token_limit=60, return_messages=True)
+
+        memory.save_context({"input": "问题"}, {"output": "回答"})
+
+        buffer = memory.buffer
+        assert llm.get_num_tokens_from_messages(buffer) <= 60
+        assert llm.get_num_tokens_from_messages([MESSAGES[-1], *buffer]) > 60
+        assert buffer[-1].content == "回答"
@@ -1,4 +1,10 @@
+import json
+import threading
+
 import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
 from aidev_agent.api.bk_aidev import BKAidevApi
 from aidev_agent.config import settings
 from aidev_agent.core.extend.models.llm_gateway import ChatModel
@@ -53,3 +59,64 @@ def test_common_agent_chat_streaming(add_session):
     )
     for each in agent.execute(ExecuteKwargs(stream=True)):
         print(each)
+
+
+def _fake_chat_agent(content: str) -> ChatCompletionAgent:
+    return ChatCompletionAgent(
+        chat_model=GenericFakeChatModel(messages=iter([AIMessage(content=content)])),
+        chat_history=[ChatPrompt(role="user", content="你好")],
+    )
+
+
+class TestChatCompletionAgentAsync:
+    """测试 ChatCompletionAgent 的原生 asyncio 执行路径"""
+
+    async def test_astream_matches_stream(self):
+        """astream 与同步 stream 产出相同的 SSE 帧"""
+        content = "hello world from async stream"
+        sync_frames = list(_fake_chat_agent(content).execute(ExecuteKwargs(stream=True)))
+        async_frames = [frame async for frame in _fake_chat_agent(content).astream(ExecuteKwargs(stream=True))]
+
+        assert async_frames == sync_frames
+        assert async_frames[-1] == "data: [DONE]\n\n"
+        texts = [json.loads(frame[len("data: ") :])["content"] for frame in async_frames[:-1]]
+        assert "".join(texts) == content
+
+    async def test_aexecute(self):
+        """aexecute 非流式返回结果，流式返回异步生成器"""
+        result = await _fake_chat_agent("hello").aexecute(ExecuteKwargs(stream=False))
+        assert result["choices"][0]["delta"]["content"] == "hello"
+
+        gen = await _fake_chat_agent("hello").aexecute(ExecuteKwargs(stream=True))
+        assert [frame async for frame in gen][-1] == "data: [DONE]\n\n"
+
+    async def test_coalesce_chunks(self):
+        """开启合并后帧数减少，内容不变"""
+        content = "hello world from async stream"
+        execute_kwargs = ExecuteKwargs(stream=True, coalesce_max_delay_ms=60_000, coalesce_max_bytes=10)
+        sync_frames = list(_fake_chat_agent(content).execute(execute_kwargs))
+        async_frames = [frame async for frame in _fake_chat_agent(content).astream(execute_kwargs)]
+
+        assert async_frames == sync_frames
+        texts = [json.loads(frame[len("data: ") :])["content"] for frame in async_frames[:-1]]
+        assert "".join(texts) == content
+        assert all(len(text) >= 10 for text in texts[:-1])
+        assert len(texts) < len(list(_fake_chat_agent(content).execute(ExecuteKwargs(stream=True)))) - 1
+
+    async def test_aexecute_by_agent_off_loop(self, mocker):
+        """创建 agent 在线程中执行，不阻塞事件循环"""
+        threads = []
+
+        class FakeExecutor:
+            async def ainvoke(self, inputs, config):
+                return {"output": inputs["input"]}
+
+        def get_agent(messages):
+            threads.append(threading.get_ident())
+            return FakeExecutor(), {}
+
+        agent = _fake_chat_agent("hello")
+        agent.knowledge_bases = [{"id": 1}]
+        mocker.patch.object(agent, "_get_agent", get_agent)
+        assert await agent.aexecute(ExecuteKwargs(stream=False)) == "你好"
+        assert threads and threads[0] != threading.get_ident()